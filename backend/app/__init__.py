@@ -12,7 +12,6 @@ from flask_migrate import Migrate  # type: ignore[import-untyped]
 from flask_cors import CORS  # type: ignore[import-untyped]
 from flask_jwt_extended import JWTManager
 from config import config
-import matplotlib
 
 # 初始化扩展
 db: Any = SQLAlchemy()
@@ -51,9 +50,6 @@ def create_app(config_name=None):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
-    # 设置matplotlib后端
-    matplotlib.use(app.config["MATPLOTLIB_BACKEND"])
-
     # 初始化扩展
     db.init_app(app)
     migrate.init_app(app, db)
@@ -107,9 +103,41 @@ def create_app(config_name=None):
     # 注册错误处理
     register_error_handlers(app)
 
+    # 日汇总表维护钩子与命令行
+    register_daily_rollup(app)
+
+    # AI 任务队列与后台数据导入的独立执行命令
+    register_ai_job_commands(app)
+    register_ai_job_workers(app)
+    register_import_job_commands(app)
+
+    # 阶段区间索引的缓存失效钩子
+    from app.services.stage_index import register_stage_index_listeners
+
+    register_stage_index_listeners()
+
+    # AI 上下文聚合备忘的缓存失效钩子
+    from app.services.ai_context_cache import register_ai_context_listeners
+
+    register_ai_context_listeners()
+
+    # 增量导出的数据变更日志钩子
+    from app.services.change_log import register_change_log_listeners
+
+    register_change_log_listeners()
+
+    # 效率分写后队列：登记脏键的事务提交后唤醒
+    from app.services.efficiency_writer import register_efficiency_writer_listeners
+
+    register_efficiency_writer_listeners()
+
     # JWT回调函数
     register_jwt_callbacks(app)
 
+    # 绘图与预测依赖默认在首次使用时加载；gunicorn --preload 时可在 fork 前预先导入
+    if app.config.get("PRELOAD_HEAVY_MODULES"):
+        preload_heavy_modules(app)
+
     # 健康检查端点
     @app.route("/health")
     def health_check():
@@ -142,6 +170,25 @@ def create_app(config_name=None):
     return app
 
 
+def preload_heavy_modules(app=None):
+    """
+    预先导入 matplotlib、sklearn、statsmodels。
+
+    默认这些依赖在首次绘图/预测时才导入，避免每个 worker 启动时承担导入开销；
+    使用 gunicorn --preload 时在 master 中调用，fork 出的 worker 共享已导入的模块。
+    也可在 gunicorn 配置的 on_starting 钩子里直接调用。
+    """
+    from app.services.chart_plotter import load_pyplot
+    from app.services.forecast_service import load_model_dependencies
+
+    backend = app.config["MATPLOTLIB_BACKEND"] if app is not None else None
+    load_pyplot(backend)
+    available = load_model_dependencies()
+    if app is not None:
+        app.logger.info("Preloaded heavy modules: %s", available)
+    return available
+
+
 def setup_logging(app):
     """配置日志"""
     from pythonjsonlogger import jsonlogger
@@ -195,6 +242,83 @@ def register_blueprints(app):
     app.register_blueprint(mottos.bp, url_prefix="/api/mottos")
     app.register_blueprint(leaderboard.bp, url_prefix="/api/leaderboard")
     app.register_blueprint(ai.bp, url_prefix="/api/ai")
+
+
+def register_daily_rollup(app):
+    """注册 daily_rollup 的增量维护钩子与 flask rebuild-daily-rollup 修复命令"""
+    import click
+    from app.services.rollup_service import (
+        rebuild_daily_rollup,
+        register_daily_rollup_listeners,
+    )
+
+    register_daily_rollup_listeners()
+
+    @app.cli.command("rebuild-daily-rollup")
+    @click.option("--user-id", type=int, default=None, help="只重建指定用户")
+    def rebuild_daily_rollup_command(user_id):
+        """从 log_entry 全量重建 daily_rollup"""
+        rows = rebuild_daily_rollup(user_id)
+        click.echo(f"daily_rollup rebuilt: {rows} rows")
+
+
+def register_ai_job_workers(app):
+    """应用收到请求时拉起进程内的 AI 任务执行线程，续跑重启前遗留的任务"""
+    from app.services.ai_planner.jobs import start_ai_job_workers
+
+    @app.before_request
+    def ensure_ai_job_workers():
+        start_ai_job_workers()
+
+
+def register_ai_job_commands(app):
+    """注册 flask run-ai-jobs：在独立进程中执行 AI 任务队列"""
+    import time
+
+    import click
+
+    @app.cli.command("run-ai-jobs")
+    @click.option("--once", is_flag=True, help="执行完当前到期的任务后退出")
+    @click.option("--poll", type=float, default=None, help="队列为空时的轮询间隔（秒）")
+    def run_ai_jobs_command(once, poll):
+        """领取并执行 ai_job 表中的待执行任务"""
+        from app.services.ai_planner.jobs import run_ai_jobs
+
+        poll = poll if poll is not None else float(app.config.get("AI_JOB_POLL_SECONDS") or 1.0)
+        while True:
+            executed = run_ai_jobs()
+            if once:
+                click.echo(f"ai jobs executed: {executed}")
+                return
+            if not executed:
+                time.sleep(poll)
+
+
+def register_import_job_commands(app):
+    """注册 flask run-import-jobs：在独立进程中执行后台数据导入任务"""
+    import time
+
+    import click
+
+    @app.cli.command("run-import-jobs")
+    @click.option("--once", is_flag=True, help="执行完当前可领取的任务后退出")
+    @click.option("--poll", type=float, default=None, help="队列为空时的轮询间隔（秒）")
+    def run_import_jobs_command(once, poll):
+        """领取并执行 data_import_job 表中的导入任务（含租约过期需续跑的任务）"""
+        from app.services.import_jobs import run_import_jobs
+
+        poll = poll if poll is not None else float(
+            app.config.get("IMPORT_JOB_POLL_SECONDS") or 2.0
+        )
+        while True:
+            executed = run_import_jobs()
+            if once:
+                click.echo(f"import jobs executed: {executed}")
+                return
+            if not executed:
+                time.sleep(poll)
+
+
 def register_error_handlers(app):
     """注册错误处理器"""
 
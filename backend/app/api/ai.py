@@ -2,7 +2,9 @@
 AI assistant endpoints for analysis and planning.
 """
 
-from flask import Blueprint, jsonify, request
+import json
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from app.services.ai_planner_service import (
@@ -11,9 +13,15 @@ from app.services.ai_planner_service import (
     generate_analysis,
     generate_briefing,
     generate_plan,
+    get_ai_job,
+    iter_ai_job_events,
+    list_ai_jobs,
     list_chat_messages,
     list_chat_sessions,
     list_history,
+    retry_ai_job,
+    stream_chat_message,
+    submit_ai_job,
 )
 
 bp = Blueprint("ai", __name__)
@@ -46,6 +54,19 @@ def _parse_request_payload():
     return scope, date_str, stage_id
 
 
+def _payload_flag(name: str) -> bool:
+    """
+    请求体中的布尔开关：
+    - refresh=true 跳过简报响应缓存，强制重新生成；
+    - async=true 把生成放入任务队列，立即返回任务状态。
+    """
+    payload = request.get_json(silent=True) or {}
+    value = payload.get(name)
+    if isinstance(value, str):
+        return value.strip().lower() in {"1", "true", "yes"}
+    return bool(value)
+
+
 def _parse_chat_request_payload():
     payload = request.get_json(silent=True) or {}
     scope = str(payload.get("scope") or "global").lower()
@@ -80,42 +101,136 @@ def _parse_chat_request_payload():
     return session_id, scope, date_str, stage_id, content
 
 
-@bp.route("/analysis", methods=["POST"])
-@jwt_required()
-def create_analysis():
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _insight_params(scope, date_str, stage_id) -> dict:
+    return {
+        "scope": scope,
+        "date_str": date_str,
+        "stage_id": stage_id,
+        "refresh": _payload_flag("refresh"),
+    }
+
+
+def _generate_or_enqueue(kind: str, generate):
+    """async=true 时入队并返回 202 与任务状态，否则在请求内同步生成。"""
     user_id = get_jwt_identity()
     try:
         scope, date_str, stage_id = _parse_request_payload()
-        result = generate_analysis(user_id, scope, date_str, stage_id)
+        params = _insight_params(scope, date_str, stage_id)
+        if _payload_flag("async"):
+            job = submit_ai_job(user_id, kind, params)
+            return jsonify({"success": True, "data": job}), 202
+        result = generate(user_id, **params)
         return jsonify({"success": True, "data": result}), 200
     except AIPlannerError as exc:
         return jsonify({"success": False, "message": str(exc)}), 400
 
 
+@bp.route("/analysis", methods=["POST"])
+@jwt_required()
+def create_analysis():
+    return _generate_or_enqueue("analysis", generate_analysis)
+
+
 @bp.route("/briefing", methods=["POST"])
 @jwt_required()
 def create_briefing():
+    return _generate_or_enqueue("briefing", generate_briefing)
+
+
+@bp.route("/plan", methods=["POST"])
+@jwt_required()
+def create_plan():
+    return _generate_or_enqueue("plan", generate_plan)
+
+
+@bp.route("/jobs", methods=["POST"])
+@jwt_required()
+def create_ai_job():
+    """
+    入队一个 AI 任务，返回可轮询的任务状态。
+
+    kind 默认为 bundle（一次生成简报、分析与规划），
+    也可以是 briefing / analysis / plan / chat，请求体与对应的同步接口一致。
+    """
     user_id = get_jwt_identity()
+    payload = request.get_json(silent=True) or {}
+    kind = str(payload.get("kind") or "bundle").lower()
     try:
-        scope, date_str, stage_id = _parse_request_payload()
-        result = generate_briefing(user_id, scope, date_str, stage_id)
-        return jsonify({"success": True, "data": result}), 200
+        if kind == "chat":
+            session_id, scope, date_str, stage_id, content = _parse_chat_request_payload()
+            params = {
+                "session_id": session_id,
+                "scope": scope,
+                "date_str": date_str,
+                "stage_id": stage_id,
+                "content": content,
+            }
+        else:
+            params = _insight_params(*_parse_request_payload())
+        job = submit_ai_job(user_id, kind, params)
+        return jsonify({"success": True, "data": job}), 202
     except AIPlannerError as exc:
         return jsonify({"success": False, "message": str(exc)}), 400
 
 
-@bp.route("/plan", methods=["POST"])
+@bp.route("/jobs", methods=["GET"])
 @jwt_required()
-def create_plan():
+def get_ai_jobs():
     user_id = get_jwt_identity()
     try:
-        scope, date_str, stage_id = _parse_request_payload()
-        result = generate_plan(user_id, scope, date_str, stage_id)
-        return jsonify({"success": True, "data": result}), 200
+        limit = int(request.args.get("limit", 20))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "limit 参数必须为整数"}), 400
+    state = request.args.get("state") or None
+    return jsonify({"success": True, "data": list_ai_jobs(user_id, state, limit)}), 200
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_ai_job_status(job_id: str):
+    user_id = get_jwt_identity()
+    try:
+        return jsonify({"success": True, "data": get_ai_job(user_id, job_id)}), 200
+    except AIPlannerError as exc:
+        return jsonify({"success": False, "message": str(exc)}), 404
+
+
+@bp.route("/jobs/<job_id>/retry", methods=["POST"])
+@jwt_required()
+def retry_ai_job_endpoint(job_id: str):
+    """把失败或进入死信的任务重新入队。"""
+    user_id = get_jwt_identity()
+    try:
+        return jsonify({"success": True, "data": retry_ai_job(user_id, job_id)}), 202
     except AIPlannerError as exc:
         return jsonify({"success": False, "message": str(exc)}), 400
 
 
+@bp.route("/jobs/<job_id>/events", methods=["GET"])
+@jwt_required()
+def stream_ai_job_events(job_id: str):
+    """以 Server-Sent Events 推送任务进度：progress* → done / error。"""
+    user_id = get_jwt_identity()
+    try:
+        events = iter_ai_job_events(user_id, job_id)
+    except AIPlannerError as exc:
+        return jsonify({"success": False, "message": str(exc)}), 404
+
+    def _generate():
+        for event, data in events:
+            yield _sse_event(event, data)
+
+    return Response(
+        stream_with_context(_generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @bp.route("/history", methods=["GET"])
 @jwt_required()
 def get_history():
@@ -166,7 +281,30 @@ def send_chat_message():
     user_id = get_jwt_identity()
     try:
         session_id, scope, date_str, stage_id, content = _parse_chat_request_payload()
-        data = create_chat_message(
+        params = {
+            "session_id": session_id,
+            "scope": scope,
+            "date_str": date_str,
+            "stage_id": stage_id,
+            "content": content,
+        }
+        if _payload_flag("async"):
+            job = submit_ai_job(user_id, "chat", params)
+            return jsonify({"success": True, "data": job}), 202
+        data = create_chat_message(user_id, **params)
+        return jsonify({"success": True, "data": data}), 200
+    except AIPlannerError as exc:
+        return jsonify({"success": False, "message": str(exc)}), 400
+
+
+@bp.route("/chat/messages/stream", methods=["POST"])
+@jwt_required()
+def stream_chat_message_events():
+    """以 Server-Sent Events 推送回答：start → delta* → done / error。"""
+    user_id = get_jwt_identity()
+    try:
+        session_id, scope, date_str, stage_id, content = _parse_chat_request_payload()
+        events = stream_chat_message(
             user_id,
             session_id=session_id,
             scope=scope,
@@ -174,10 +312,19 @@ def send_chat_message():
             stage_id=stage_id,
             content=content,
         )
-        return jsonify({"success": True, "data": data}), 200
     except AIPlannerError as exc:
         return jsonify({"success": False, "message": str(exc)}), 400
 
+    def _generate():
+        for event, data in events:
+            yield _sse_event(event, data)
+
+    return Response(
+        stream_with_context(_generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @bp.route("/chat/sessions", methods=["GET"])
 @jwt_required()
@@ -6,6 +6,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import Category, SubCategory, LogEntry
+from app.services.change_log import record_changes
+from app.services.rollup_service import refresh_daily_rollup
 
 bp = Blueprint("categories", __name__)
 
@@ -288,10 +290,25 @@ def merge_subcategory(subcategory_id):
     target_name = target_subcategory.name
 
     try:
+        touched_buckets = (
+            db.session.query(LogEntry.stage_id, LogEntry.log_date)
+            .filter(LogEntry.subcategory_id == subcategory_id)
+            .distinct()
+            .all()
+        )
+        moved_ids = [
+            row.id
+            for row in db.session.query(LogEntry.id).filter(
+                LogEntry.subcategory_id == subcategory_id
+            )
+        ]
         moved_records = LogEntry.query.filter_by(subcategory_id=subcategory_id).update(
             {"subcategory_id": target_subcategory_id},
             synchronize_session=False,
         )
+        # 批量 UPDATE 绕过了 ORM 钩子，需要显式重算受影响的日汇总并记录增量变更
+        refresh_daily_rollup(touched_buckets)
+        record_changes(current_user_id, LogEntry.__tablename__, moved_ids)
         db.session.delete(source_subcategory)
         db.session.commit()
 
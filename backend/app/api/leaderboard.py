@@ -47,6 +47,7 @@ def get_rankings():
     metric = request.args.get("metric", "duration").lower()
     page = int(request.args.get("page", 1))
     page_size = int(request.args.get("page_size", 20))
+    cursor = request.args.get("cursor")
 
     try:
         result = get_leaderboard_rankings(
@@ -55,6 +56,7 @@ def get_rankings():
             metric=metric,
             page=page,
             page_size=page_size,
+            cursor=cursor,
         )
     except ValueError as exc:
         return jsonify({"success": False, "message": str(exc)}), 400
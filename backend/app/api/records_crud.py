@@ -8,6 +8,7 @@ from datetime import datetime
 from app import db
 from app.models import LogEntry, Stage, SubCategory
 from app.services import record_service
+from app.services.efficiency_writer import mark_efficiency_dirty
 
 # 创建子蓝图
 crud_bp = Blueprint("records_crud", __name__)
@@ -92,7 +93,9 @@ def create_record():
             if not stage:
                 return jsonify({"success": False, "message": "阶段不存在"}), 404
 
-        stage = record_service.get_stage_for_date(current_user_id, log_date)
+        stage = record_service.get_stage_for_date(
+            current_user_id, log_date, fresh=True
+        )
         if not stage:
             return (
                 jsonify(
@@ -119,11 +122,10 @@ def create_record():
         )
 
         db.session.add(record)
+        # 登记对应日期的效率分，随记录一同提交，由写后队列合并重算
+        mark_efficiency_dirty(current_user_id, stage.id, log_date)
         db.session.commit()
 
-        # 更新对应日期的效率分
-        record_service.update_efficiency_for_date(log_date, stage)
-
         return jsonify(
             {
                 "success": True,
@@ -179,8 +181,9 @@ def update_record(record_id):
         if not record:
             return jsonify({"success": False, "message": "记录不存在"}), 404
 
-        # 记录原阶段对象用于刷新效率数据
+        # 记录原阶段与日期用于刷新效率数据
         original_stage = record.stage
+        original_date = record.log_date
 
         # 更新字段
         updateable_fields = [
@@ -220,7 +223,9 @@ def update_record(record_id):
             if not stage:
                 return jsonify({"success": False, "message": "阶段不存在"}), 404
 
-        stage = record_service.get_stage_for_date(current_user_id, effective_log_date)
+        stage = record_service.get_stage_for_date(
+            current_user_id, effective_log_date, fresh=True
+        )
         if not stage:
             return (
                 jsonify(
@@ -234,13 +239,12 @@ def update_record(record_id):
         record.stage_id = stage.id
 
         record.updated_at = datetime.utcnow()
+        # 登记新旧日期的效率分重算，随记录一同提交
+        mark_efficiency_dirty(current_user_id, record.stage_id, record.log_date)
+        if (original_stage.id, original_date) != (record.stage_id, record.log_date):
+            mark_efficiency_dirty(current_user_id, original_stage.id, original_date)
         db.session.commit()
 
-        # 重新计算相关阶段效率
-        record_service.recalculate_efficiency_for_stage(original_stage)
-        if record.stage_id != original_stage.id:
-            record_service.recalculate_efficiency_for_stage(record.stage)
-
         return jsonify(
             {
                 "success": True,
@@ -271,14 +275,14 @@ def delete_record(record_id):
         if not record:
             return jsonify({"success": False, "message": "记录不存在"}), 404
 
-        stage = record.stage
+        stage_id = record.stage_id
+        log_date = record.log_date
 
         db.session.delete(record)
+        # 登记被删记录所在日期的效率分重算，随删除一同提交
+        mark_efficiency_dirty(current_user_id, stage_id, log_date)
         db.session.commit()
 
-        # 重新计算阶段效率
-        record_service.recalculate_efficiency_for_stage(stage)
-
         return jsonify({"success": True, "message": "记录删除成功"})
 
     except Exception as e:
@@ -2,10 +2,15 @@
 数据导入导出相关的API路由
 """
 
-from flask import Blueprint, request, jsonify, current_app, Response
+import tempfile
+import zipfile
+
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.datastructures import FileStorage
 from app.models import User
 from app.services import data_service
+from app.services.import_jobs import get_import_job, list_import_jobs, submit_import_job
 
 # 创建子蓝图
 import_export_bp = Blueprint("import_export", __name__)
@@ -37,50 +42,130 @@ def import_zip():
     if not user:
         return jsonify({"success": False, "message": "用户不存在"}), 404
 
-    # 3) 调用服务执行导入
-    ok, msg = data_service.import_data_for_user(user, file_storage.stream)
+    # 附带 deltas（按顺序的增量包）时，先与全量备份合并成新的全量备份再导入
+    deltas = [item for item in request.files.getlist("deltas") if item and item.filename]
+    if deltas and _request_flag("async"):
+        with tempfile.TemporaryFile() as merged:
+            try:
+                data_service.merge_backup_chain(
+                    file_storage.stream, [item.stream for item in deltas], merged
+                )
+            except (ValueError, KeyError, zipfile.BadZipFile) as e:
+                return jsonify({"success": False, "message": f"增量合并失败: {e}"}), 400
+            merged.seek(0)
+            return _enqueue_import(
+                user.id, FileStorage(stream=merged, filename=file_storage.filename)
+            )
+
+    # async=true：文件先落盘，由后台任务分块导入，立即返回任务状态
+    if _request_flag("async"):
+        return _enqueue_import(user.id, file_storage)
+
+    # 3) 调用服务执行导入（效率在导入事务内一次性重建）
+    report: dict = {}
+    if deltas:
+        ok, msg = data_service.import_backup_chain(
+            user, file_storage.stream, [item.stream for item in deltas], report=report
+        )
+    else:
+        ok, msg = data_service.import_data_for_user(
+            user, file_storage.stream, report=report
+        )
     if ok:
-        # 与旧项目一致：全量重算效率
-        try:
-            from app.services.record_service import recalculate_efficiency_for_stage
-
-            stages = user.stages
-            for stage in stages:
-                recalculate_efficiency_for_stage(stage.id)
-        except Exception as e:
-            current_app.logger.error(f"重算效率失败: {e}")
-            # 不阻止导入成功的响应，仅记录错误
-
-        return jsonify({"success": True, "message": msg or "导入成功"}), 200
+        return jsonify(
+            {"success": True, "message": msg or "导入成功", "report": report}
+        ), 200
     else:
         return jsonify({"success": False, "message": msg or "导入失败"}), 400
 
 
+def _request_flag(name: str) -> bool:
+    value = request.args.get(name, request.form.get(name, ""))
+    return str(value).lower() in {"1", "true", "yes"}
+
+
+def _enqueue_import(user_id, file_storage):
+    try:
+        job = submit_import_job(user_id, file_storage)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return jsonify({"success": True, "data": job}), 202
+
+
+@import_export_bp.route("/import/jobs", methods=["POST"])
+@jwt_required()
+def create_import_job():
+    """上传备份包并创建后台导入任务（字段名 file）。"""
+    file_storage = request.files.get("file")
+    if (
+        not file_storage
+        or not file_storage.filename
+        or not file_storage.filename.lower().endswith(".zip")
+    ):
+        return jsonify(
+            {"success": False, "message": "请上传 .zip 文件（字段名 file）"}
+        ), 400
+    return _enqueue_import(get_jwt_identity(), file_storage)
+
+
+@import_export_bp.route("/import/jobs", methods=["GET"])
+@jwt_required()
+def list_import_job_status():
+    """最近的导入任务。"""
+    return jsonify({"success": True, "data": list_import_jobs(get_jwt_identity())}), 200
+
+
+@import_export_bp.route("/import/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_import_job_status(job_id):
+    """导入进度：各表已处理行数、已处理字节数与预计剩余时间。"""
+    job = get_import_job(get_jwt_identity(), job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "导入任务不存在"}), 404
+    return jsonify({"success": True, "data": job}), 200
+
+
 @import_export_bp.route("/export", methods=["GET"])
 @jwt_required()
 def export_zip():
     """
     导出当前用户的全部数据为 zip 文件，与旧项目行为一致。
+    ?since=<上次导出 manifest.json 中的 version> 时只导出此后的增量；
+    ?format=parquet|arrow 时导出供分析使用的列式文件（不支持增量）。
     """
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
     if not user:
         return jsonify({"success": False, "message": "用户不存在"}), 404
 
+    since = request.args.get("since")
     try:
-        # 调用服务生成 zip 文件内容（字节流）
-        success, buffer, filename = data_service.export_data_for_user(user)
-        if not success or not buffer:
-            return jsonify({"success": False, "message": "导出失败，无数据"}), 400
+        since = int(since) if since not in (None, "") else None
+    except ValueError:
+        return jsonify({"success": False, "message": "since 必须是整数版本号"}), 400
+
+    export_format = (request.args.get("format") or "json").lower()
+    if export_format != "json" and since is not None:
+        return jsonify({"success": False, "message": "列式导出不支持增量"}), 400
 
-        # 返回文件下载响应
+    try:
+        # 压缩包边生成边发送，不在内存中保留完整文件
+        if export_format == "json":
+            chunks, filename = data_service.stream_export_for_user(user, since=since)
+        else:
+            chunks, filename = data_service.stream_columnar_export_for_user(
+                user, export_format
+            )
         return Response(
-            buffer.getvalue(),
+            stream_with_context(chunks),
             mimetype="application/zip",
             headers={
-                "Content-Disposition": f"attachment; filename={filename or 'learning_data.zip'}"
+                "Content-Disposition": f"attachment; filename={filename or 'learning_data.zip'}",
+                "X-Accel-Buffering": "no",
             },
         )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Export error: {e}")
         return jsonify({"success": False, "message": f"导出异常: {e}"}), 500
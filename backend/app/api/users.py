@@ -6,6 +6,7 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import func
 from app import db
+from app.services.leaderboard_snapshot import refresh_leaderboard_for_users
 from app.models import (
     User,
     Setting,
@@ -176,6 +177,7 @@ def update_profile():
         if existing:
             return jsonify({"success": False, "message": "用户名已被使用"}), 409
         user.username = data["username"]
+        refresh_leaderboard_for_users([user.id])
 
     if "email" in data:
         # 检查邮箱是否已被使用
@@ -10,7 +10,13 @@ from .base import User, Setting
 from .learning import Stage, Category, SubCategory, LogEntry
 
 # 导入数据分析模型
-from .analytics import WeeklyData, DailyData
+from .analytics import (
+    WeeklyData,
+    DailyData,
+    DailyRollup,
+    EfficiencyDirtyKey,
+    LeaderboardSnapshot,
+)
 
 # 导入应用功能模型
 from .features import CountdownEvent, Motto
@@ -21,7 +27,13 @@ from .features import CountdownEvent, Motto
 from .milestones import MilestoneCategory, Milestone, MilestoneAttachment
 
 # 导入 AI 模型
-from .ai import AIChatMessage, AIChatSession, AIInsight
+from .ai import AIChatMessage, AIChatSession, AIInsight, AIJob
+
+# 导入数据导入任务模型
+from .data_import import DataImportJob, DataImportRow
+
+# 导入数据变更日志模型
+from .data_change import DataChange
 
 # 导出所有模型，保持向后兼容性
 __all__ = [
@@ -36,6 +48,9 @@ __all__ = [
     # 数据分析模型
     "WeeklyData",
     "DailyData",
+    "DailyRollup",
+    "EfficiencyDirtyKey",
+    "LeaderboardSnapshot",
     # 应用功能模型
     "CountdownEvent",
     "Motto",
@@ -48,5 +63,11 @@ __all__ = [
     "AIInsight",
     "AIChatSession",
     "AIChatMessage",
+    "AIJob",
+    # 数据导入任务
+    "DataImportJob",
+    "DataImportRow",
+    # 增量导出
+    "DataChange",
 ]
 
@@ -25,6 +25,8 @@ class AIInsight(db.Model):
     next_end_date = db.Column(db.Date, nullable=True)
     input_snapshot = db.Column(db.JSON, nullable=True)
     output_text = db.Column(db.Text, nullable=False)
+    # 模型输入摘要，相同摘要的 LLM 结果可以直接复用（见 ai_planner.response_cache）
+    prompt_hash = db.Column(db.String(64), nullable=True, index=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     user = db.relationship("User", backref=db.backref("ai_insights", lazy="dynamic"))
@@ -149,3 +151,54 @@ class AIChatMessage(db.Model):
             "meta": self.meta_snapshot or {},
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
+
+
+class AIJob(db.Model):
+    """Queued AI generation jobs executed off the request path."""
+
+    __tablename__ = "ai_job"
+    __table_args__ = (
+        db.Index("ix_ai_job_state_available", "state", "available_at"),
+        db.Index("ix_ai_job_user_state", "user_id", "state"),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # briefing / analysis / plan / bundle / chat
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    state = db.Column(db.String(20), nullable=False, default="queued")  # queued / running / succeeded / failed / dead
+    stage = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self, include_result: bool = True):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "stage": self.stage,
+            "params": self.params or {},
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "error": self.error,
+            "available_at": self.available_at.isoformat() if self.available_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
@@ -52,3 +52,107 @@ class DailyData(db.Model):
             "efficiency": self.efficiency,
             "stage_id": self.stage_id,
         }
+
+
+class DailyRollup(db.Model):
+    """按 (用户, 日期, 阶段, 子分类) 预聚合的学习时长，由日志写入时增量维护"""
+
+    __tablename__ = "daily_rollup"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 不设外键：删除阶段/用户时由 ORM 钩子在同一次 flush 之后清理汇总行
+    user_id = db.Column(db.Integer, nullable=False)
+    log_date = db.Column(db.Date, nullable=False)
+    stage_id = db.Column(db.Integer, nullable=False)
+    subcategory_id = db.Column(db.Integer, nullable=True, index=True)
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    # SUM(actual_duration * COALESCE(mood, 3))，用于计算时长加权心情
+    mood_minutes = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_daily_rollup_user_date", "user_id", "log_date"),
+        db.Index("ix_daily_rollup_stage_date", "stage_id", "log_date"),
+        # 每个桶只有一行；子分类可为空，用 COALESCE 让 NULL 也参与唯一性判断
+        db.Index(
+            "uq_daily_rollup_bucket",
+            user_id,
+            stage_id,
+            log_date,
+            db.func.coalesce(subcategory_id, db.literal_column("0")),
+            unique=True,
+        ),
+    )
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "log_date": self.log_date.isoformat(),
+            "stage_id": self.stage_id,
+            "subcategory_id": self.subcategory_id,
+            "minutes": self.minutes,
+            "session_count": self.session_count,
+            "mood_minutes": self.mood_minutes,
+        }
+
+
+class EfficiencyDirtyKey(db.Model):
+    """待重算效率分的 (阶段, 日期)：与日志写入同一事务登记，由写后队列取出重算后删除"""
+
+    __tablename__ = "efficiency_dirty_key"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 与 daily_rollup 相同，不设外键：阶段已删除的键在重算时直接丢弃
+    user_id = db.Column(db.Integer, nullable=False)
+    stage_id = db.Column(db.Integer, nullable=False)
+    log_date = db.Column(db.Date, nullable=False)
+    # 首次登记时间决定最长推迟，最近一次登记时间决定静默期
+    first_marked_at = db.Column(db.DateTime, nullable=False)
+    last_marked_at = db.Column(db.DateTime, nullable=False)
+    # 连续失败次数与退避后的下次可重试时间
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "stage_id", "log_date", name="uq_efficiency_dirty_key"
+        ),
+    )
+
+
+class LeaderboardSnapshot(db.Model):
+    """排行榜快照：按 (周期, 指标) 预先聚合得分，名次在读取时沿排序索引得出"""
+
+    __tablename__ = "leaderboard_snapshot"
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(16), nullable=False)
+    metric = db.Column(db.String(16), nullable=False)
+    # 快照对应的统计区间终点；跨天后整表失效重建
+    range_end = db.Column(db.Date, nullable=False)
+    # 与 daily_rollup 相同，不设外键，由刷新逻辑维护
+    user_id = db.Column(db.Integer, nullable=False)
+    username = db.Column(db.String(64), nullable=False)
+    total_duration = db.Column(db.Integer, nullable=False, default=0)
+    avg_efficiency = db.Column(db.Float, nullable=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    last_activity = db.Column(db.Date, nullable=True)
+    # 排序键：主/次指标（缺省按 0），同分按用户名升序
+    primary_score = db.Column(db.Float, nullable=False, default=0.0)
+    secondary_score = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "period", "metric", "user_id", name="uq_leaderboard_snapshot_user"
+        ),
+        # 不存名次：单个用户变化只改写自己一行，分页用 RANK() OVER、
+        # “我的名次”用 COUNT，都沿这条排序索引读取
+        db.Index(
+            "ix_leaderboard_snapshot_order",
+            "period",
+            "metric",
+            "primary_score",
+            "secondary_score",
+            "username",
+        ),
+    )
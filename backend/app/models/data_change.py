@@ -0,0 +1,26 @@
+"""
+数据变更日志模型
+增量导出使用的行版本与删除墓碑
+"""
+
+from app import db
+from datetime import datetime
+
+
+class DataChange(db.Model):
+    """
+    用户数据的变更记录：id 即全局递增的行版本（增量导出的水位线）。
+
+    op 为 upsert / delete；reset 表示全量导入替换了该用户的全部数据，
+    更早的水位线从此失效。
+    """
+
+    __tablename__ = "data_change"
+    __table_args__ = (db.Index("ix_data_change_user_version", "user_id", "id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_key = db.Column(db.String(100), nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,77 @@
+"""
+数据导入任务模型
+后台分块导入备份包的任务状态、断点与暂存行
+"""
+
+from app import db
+from datetime import datetime
+
+
+class DataImportJob(db.Model):
+    """后台数据导入任务：上传文件落盘后分块解析，最后一次性替换用户数据"""
+
+    __tablename__ = "data_import_job"
+    __table_args__ = (db.Index("ix_data_import_job_state", "state", "locked_at"),)
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    state = db.Column(db.String(20), nullable=False, default="queued")  # queued / running / succeeded / failed
+    phase = db.Column(db.String(20), nullable=False, default="staging")  # staging / attachments / swapping / finalizing / done
+    filename = db.Column(db.String(255), nullable=True)
+    file_path = db.Column(db.String(512), nullable=False)
+    bytes_total = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_processed = db.Column(db.BigInteger, nullable=False, default=0)
+    # {"table": 当前表, "records": 当前表已暂存的记录数, "done": [已完成的表]}
+    checkpoint = db.Column(db.JSON, nullable=False, default=dict)
+    rows = db.Column(db.JSON, nullable=False, default=dict)  # 各表已暂存行数
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def eta_seconds(self, now=None):
+        """按已处理字节的平均速度估算剩余秒数；尚无进度时返回 None"""
+        if self.state != "running" or not self.started_at or not self.bytes_processed:
+            return None
+        elapsed = ((now or datetime.utcnow()) - self.started_at).total_seconds()
+        remaining = max(self.bytes_total - self.bytes_processed, 0)
+        return round(elapsed * remaining / self.bytes_processed, 1)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "phase": self.phase,
+            "filename": self.filename,
+            "rows": self.rows or {},
+            "bytes_total": self.bytes_total,
+            "bytes_processed": self.bytes_processed,
+            "eta_seconds": self.eta_seconds(),
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class DataImportRow(db.Model):
+    """导入任务暂存的原始记录，替换阶段按 seq 顺序写入正式表"""
+
+    __tablename__ = "data_import_row"
+    __table_args__ = (
+        db.Index("ix_data_import_row_job_table_seq", "job_id", "table_name", "seq"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), db.ForeignKey("data_import_job.id"), nullable=False)
+    table_name = db.Column(db.String(50), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
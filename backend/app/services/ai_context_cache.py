@@ -0,0 +1,239 @@
+"""
+AI 上下文聚合备忘
+
+对话、简报、分析在一次请求里会以相同的 (用户, 类别, 窗口) 反复调用
+_aggregate_learning_data、效率基线、倒计时、阶段时间线与设置摘要。
+这里为它们提供两层按用户的备忘：
+- 请求级：挂在 flask.g 上，同一请求/应用上下文内同一个键只计算一次；
+- 短 TTL：挂在 app.extensions 上，AI_CONTEXT_CACHE_TTL_SECONDS 内跨请求复用，
+  设为 0 关闭。
+
+缓存失效：
+- ORM 对 LogEntry / Stage / Setting / CountdownEvent 等的增删改在 after_flush 中
+  递增对应用户的版本号，提交或回滚后再递增一次；
+- 绕过 ORM 的批量写入（效率分 upsert、清空数据）需显式调用 mark_ai_context_stale；
+- 计算前记录版本号，写回时版本已变化则丢弃结果，不会把旧数据写进缓存。
+
+缓存值为普通 dict/list，取出时深拷贝，调用方可以随意修改。
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from typing import Any, Callable, Hashable, Iterable, Sequence
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (
+    Category,
+    CountdownEvent,
+    DailyData,
+    LogEntry,
+    Setting,
+    Stage,
+    SubCategory,
+)
+
+_DEFAULT_AI_CONTEXT_CACHE_TTL_SECONDS = 30.0
+_EXTENSION_KEY = "ai_context_memo"
+_REQUEST_MEMO_KEY = "_ai_context_memo"
+_SESSION_INFO_KEY = "ai_context_stale_users"
+_USER_OWNED_MODELS = (Stage, Setting, CountdownEvent, Category)
+_STAGE_OWNED_MODELS = (LogEntry, DailyData)
+_memo_lock = threading.Lock()
+
+
+class _MemoStore:
+    """单个应用的跨请求备忘：用户版本号 + 带过期时间的条目。"""
+
+    def __init__(self) -> None:
+        self.versions: dict[int, int] = {}
+        self.entries: dict[int, dict[tuple, tuple[float, int, Any]]] = {}
+
+
+def _store() -> _MemoStore:
+    return current_app.extensions.setdefault(_EXTENSION_KEY, _MemoStore())
+
+
+def _request_memo() -> dict[tuple, tuple[int, Any]]:
+    memo = g.get(_REQUEST_MEMO_KEY)
+    if memo is None:
+        memo = {}
+        setattr(g, _REQUEST_MEMO_KEY, memo)
+    return memo
+
+
+def memoize_user_context(
+    user_id: int,
+    kind: str,
+    key: Hashable,
+    loader: Callable[[], Any],
+    *,
+    request_only: bool = False,
+) -> Any:
+    """
+    按 (用户, 类别, 键) 备忘 loader 的结果，返回其深拷贝。
+
+    request_only=True 时只在当前请求内复用，用于会被后台任务异步改变的数据。
+    """
+    return memoize_user_contexts(
+        user_id,
+        kind,
+        [key],
+        lambda _missing: [loader()],
+        request_only=request_only,
+    )[0]
+
+
+def memoize_user_contexts(
+    user_id: int,
+    kind: str,
+    keys: Sequence[Hashable],
+    loader: Callable[[list], list],
+    *,
+    request_only: bool = False,
+) -> list:
+    """
+    批量版本：未命中的键一次性交给 loader(missing_keys)，
+    loader 按相同顺序返回各键的结果，便于共用一次数据加载。
+    """
+    if not has_app_context():
+        return list(loader(list(keys)))
+    # 路由传入的可能是字符串 id，先统一为 int，再按同一个键落库待写的效率分
+    user_id = int(user_id)
+    # 先落库该用户待写的效率分，之后记录的版本号才覆盖这次计算读到的数据
+    from app.services.efficiency_writer import flush_pending_efficiency
+
+    flush_pending_efficiency(user_id)
+
+    store = _store()
+    request_memo = _request_memo()
+    now = time.monotonic()
+    values: dict[Hashable, Any] = {}
+    missing: list[Hashable] = []
+    with _memo_lock:
+        version = store.versions.get(user_id, 0)
+        user_entries = store.entries.get(user_id, {})
+        for key in keys:
+            if key in values or key in missing:
+                continue
+            request_entry = request_memo.get((user_id, kind, key))
+            if request_entry is not None and request_entry[0] == version:
+                values[key] = request_entry[1]
+                continue
+            cached = None if request_only else user_entries.get((kind, key))
+            if cached is not None and cached[0] > now and cached[1] == version:
+                request_memo[(user_id, kind, key)] = (version, cached[2])
+                values[key] = cached[2]
+                continue
+            missing.append(key)
+
+    if missing:
+        loaded = list(loader(list(missing)))
+        ttl_seconds = float(
+            current_app.config.get(
+                "AI_CONTEXT_CACHE_TTL_SECONDS", _DEFAULT_AI_CONTEXT_CACHE_TTL_SECONDS
+            )
+        )
+        with _memo_lock:
+            unchanged = store.versions.get(user_id, 0) == version
+            expires_at = time.monotonic() + ttl_seconds
+            for key, value in zip(missing, loaded):
+                values[key] = value
+                if not unchanged:
+                    continue
+                request_memo[(user_id, kind, key)] = (version, value)
+                if ttl_seconds > 0 and not request_only:
+                    store.entries.setdefault(user_id, {})[(kind, key)] = (
+                        expires_at,
+                        version,
+                        value,
+                    )
+    return [copy.deepcopy(values[key]) for key in keys]
+
+
+def invalidate_ai_context(user_id: int | None = None) -> None:
+    """清除指定用户（None 表示全部）的 AI 上下文备忘。"""
+    if not has_app_context():
+        return
+    store = _store()
+    with _memo_lock:
+        user_ids = list(store.versions) if user_id is None else [int(user_id)]
+        if user_id is None:
+            store.entries.clear()
+        for item in user_ids:
+            store.versions[item] = store.versions.get(item, 0) + 1
+            store.entries.pop(item, None)
+
+
+def mark_ai_context_stale(user_ids: Iterable[int]) -> None:
+    """绕过 ORM 的写入后调用：立即失效，并在当前事务结束时再失效一次。"""
+    user_ids = {int(user_id) for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    db.session.info.setdefault(_SESSION_INFO_KEY, set()).update(user_ids)
+    _invalidate_users(user_ids)
+
+
+def _invalidate_users(user_ids: Iterable[int]) -> None:
+    for user_id in user_ids:
+        invalidate_ai_context(user_id)
+
+
+def _loaded_values(obj, field: str) -> set:
+    """当前值与 flush 前的旧值。"""
+    values = {getattr(obj, field, None)}
+    values.update(inspect(obj).attrs[field].history.deleted or ())
+    values.discard(None)
+    return values
+
+
+def _owner_user_ids(session: Session, table, ids: set[int]) -> set[int]:
+    if not ids:
+        return set()
+    rows = session.connection().execute(
+        select(table.c.user_id).where(table.c.id.in_(sorted(ids)))
+    )
+    return set(rows.scalars())
+
+
+def _after_flush(session: Session, _flush_context) -> None:
+    user_ids: set[int] = set()
+    stage_ids: set[int] = set()
+    category_ids: set[int] = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, _USER_OWNED_MODELS):
+            user_ids.update(_loaded_values(obj, "user_id"))
+        elif isinstance(obj, _STAGE_OWNED_MODELS):
+            stage_ids.update(_loaded_values(obj, "stage_id"))
+        elif isinstance(obj, SubCategory):
+            # 子分类改名会影响分类统计
+            category_ids.update(_loaded_values(obj, "category_id"))
+    user_ids |= _owner_user_ids(session, Stage.__table__, stage_ids)
+    user_ids |= _owner_user_ids(session, Category.__table__, category_ids)
+    if not user_ids:
+        return
+    # 本事务内立即失效，提交或回滚后再失效一次，
+    # 避免其他请求在提交前用旧数据算出的结果残留下来
+    session.info.setdefault(_SESSION_INFO_KEY, set()).update(user_ids)
+    _invalidate_users(user_ids)
+
+
+def _after_transaction_end(session: Session) -> None:
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if user_ids:
+        _invalidate_users(user_ids)
+
+
+def register_ai_context_listeners() -> None:
+    """注册数据变更时清除 AI 上下文备忘的 ORM 钩子（可重复调用）。"""
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+    for event_name in ("after_commit", "after_rollback"):
+        if not event.contains(Session, event_name, _after_transaction_end):
+            event.listen(Session, event_name, _after_transaction_end)
@@ -1,4 +1,4 @@
-from .chat import create_chat_message, list_chat_messages, list_chat_sessions
+from .chat import create_chat_message, list_chat_messages, list_chat_sessions, stream_chat_message
 from .chat_context import ALLOWED_CHAT_MODULES, ALLOWED_TIME_WINDOWS, build_default_chat_context, build_global_chat_context, build_requested_modules, build_window_context, normalize_requested_modules, normalize_requested_windows
 from .aggregation import _aggregate_learning_data
 from .countdown import _build_countdown_context
@@ -12,8 +12,23 @@ from .date_ranges import (
 )
 from .efficiency import _compute_efficiency_baseline
 from .errors import AIPlannerError
-from .llm_client import _call_qwen, _configure_qwen
-from .main import generate_analysis, generate_briefing, generate_plan, list_history
+from .llm_client import _call_qwen, _configure_qwen, _stream_qwen
+from .jobs import (
+    get_ai_job,
+    iter_ai_job_events,
+    list_ai_jobs,
+    retry_ai_job,
+    run_ai_jobs,
+    submit_ai_job,
+    submit_insight_job,
+)
+from .main import (
+    generate_analysis,
+    generate_briefing,
+    generate_insight_bundle,
+    generate_plan,
+    list_history,
+)
 from .persistence import _save_insight
 from .prompts import (
     _build_analysis_prompt,
@@ -47,12 +62,22 @@ __all__ = [
     "_fallback_plan_text",
     "_configure_qwen",
     "_call_qwen",
+    "_stream_qwen",
     "_save_insight",
     "create_chat_message",
+    "stream_chat_message",
     "list_chat_sessions",
     "list_chat_messages",
     "generate_briefing",
     "generate_analysis",
     "generate_plan",
+    "generate_insight_bundle",
+    "submit_ai_job",
+    "submit_insight_job",
+    "get_ai_job",
+    "list_ai_jobs",
+    "retry_ai_job",
+    "run_ai_jobs",
+    "iter_ai_job_events",
     "list_history",
 ]
@@ -1,15 +1,29 @@
 from __future__ import annotations
 
-from collections import Counter, defaultdict
-from datetime import date, timedelta
-from typing import Dict, List, Optional
+import bisect
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 from app.models import DailyData, LogEntry, Stage, SubCategory
+from app.services.ai_context_cache import memoize_user_contexts
 
 from .countdown import _build_countdown_context
 from .efficiency import _compute_efficiency_baseline
 
 
+Window = Tuple[Optional[date], Optional[date], Optional[Stage]]
+WindowKey = Tuple[Optional[date], Optional[date], Optional[int]]
+
+
+def _window_key(window: Window) -> WindowKey:
+    start_date, end_date, stage = window
+    return start_date, end_date, stage.id if stage else None
+
+
 def _aggregate_learning_data(
     user_id: int,
     start_date: Optional[date],
@@ -18,33 +32,218 @@ def _aggregate_learning_data(
 ) -> Dict:
     """
     Aggregate learning data in the given period.
+
+    Results are memoized per (user, window) and invalidated by data writes,
+    so one chat turn scans each window only once.
+    """
+    return _aggregate_learning_windows(user_id, [(start_date, end_date, stage)])[0]
+
+
+def _aggregate_learning_windows(user_id: int, windows: Sequence[Window]) -> List[Dict]:
+    """
+    Aggregate several (possibly nested) windows with a single scan.
+
+    Windows that are not memoized yet are computed together: the union date
+    range is loaded once and every window is sliced out of shared day-indexed
+    prefix sums. Each result is identical to a standalone per-window scan.
+    """
+    stages_by_key = {_window_key(window): window[2] for window in windows}
+    return memoize_user_contexts(
+        user_id,
+        "aggregate",
+        [_window_key(window) for window in windows],
+        lambda missing: _load_learning_windows(
+            user_id,
+            [(start, end, stages_by_key[(start, end, stage_id)]) for start, end, stage_id in missing],
+        ),
+    )
+
+
+def _union_bounds(windows: Sequence[Window]) -> Tuple[Optional[date], Optional[date]]:
+    starts = [window[0] for window in windows]
+    ends = [window[1] for window in windows]
+    lower = None if any(value is None for value in starts) else min(starts)
+    upper = None if any(value is None for value in ends) else max(ends)
+    return lower, upper
+
+
+def _log_hour(log: LogEntry) -> int:
+    # 「活跃时段」统计：使用开始时间 hour，如果缺失则跳过（-1）
+    start_time = getattr(log, "start_time", None)
+    if not start_time:
+        return -1
+    hour = getattr(start_time, "hour", None)
+    if hour is None:
+        hour_text = str(start_time)[:2]  # 支持 "HH:MM:SS" 或 datetime
+        if hour_text.isdigit():
+            hour = int(hour_text)
+    if isinstance(hour, int) and 0 <= hour <= 23:
+        return hour
+    return -1
+
+
+def _log_labels(
+    log: LogEntry, subcategory_map: Dict[int, SubCategory]
+) -> Tuple[str, str]:
+    """Return (category name, full task label) for a log entry."""
+    task_name = (log.task or '').strip() or '未命名任务'
+
+    category_name = '未分类'
+    subcategory_name = None
+    if log.subcategory_id and log.subcategory_id in subcategory_map:
+        subcategory = subcategory_map[log.subcategory_id]
+        if getattr(subcategory, 'category', None) and subcategory.category.name:
+            category_name = subcategory.category.name
+        elif subcategory.name:
+            category_name = subcategory.name
+        if subcategory.name:
+            subcategory_name = subcategory.name
+    elif log.legacy_category:
+        category_name = log.legacy_category
+
+    path_parts = [part for part in [category_name, subcategory_name] if part]
+    path_label = "-".join(path_parts) if path_parts else "未分类"
+    return category_name, f"[{path_label}] {task_name}"
+
+
+@dataclass(frozen=True)
+class _LogColumns:
+    """
+    Column view of a set of logs sorted by (log_date, id).
+
+    Per-row arrays are complemented by dense day-indexed arrays spanning
+    [base_ordinal, base_ordinal + day_count) and their prefix sums, so the
+    totals of any date window are two lookups.
+    """
+
+    base_ordinal: int
+    ordinals: np.ndarray
+    minutes: np.ndarray
+    category_codes: np.ndarray
+    task_codes: np.ndarray
+    hour_prefix: np.ndarray
+    day_minutes: np.ndarray
+    day_sessions: np.ndarray
+    minute_prefix: np.ndarray
+    session_prefix: np.ndarray
+    mood_sum_prefix: np.ndarray
+    mood_count_prefix: np.ndarray
+    weekday_prefix: np.ndarray
+
+    @classmethod
+    def build(
+        cls,
+        base_ordinal: int,
+        day_count: int,
+        ordinals: List[int],
+        minutes: List[int],
+        moods: List[Optional[int]],
+        hours: List[int],
+        category_codes: List[int],
+        task_codes: List[int],
+    ) -> "_LogColumns":
+        ordinal_array = np.asarray(ordinals, dtype=np.int64)
+        minute_array = np.asarray(minutes, dtype=np.int64)
+        day_offsets = ordinal_array - base_ordinal
+
+        hour_array = np.asarray(hours, dtype=np.int64)
+        hour_matrix = np.zeros((len(ordinals), 24), dtype=np.int64)
+        has_hour = hour_array >= 0
+        hour_matrix[np.nonzero(has_hour)[0], hour_array[has_hour]] = minute_array[has_hour]
+        hour_prefix = np.zeros((len(ordinals) + 1, 24), dtype=np.int64)
+        np.cumsum(hour_matrix, axis=0, out=hour_prefix[1:])
+
+        has_mood = np.asarray([mood is not None for mood in moods], dtype=bool)
+        mood_array = np.asarray([mood or 0 for mood in moods], dtype=np.int64)
+
+        day_minutes = np.bincount(day_offsets, weights=minute_array, minlength=day_count)
+        day_minutes = day_minutes.astype(np.int64)
+        day_sessions = np.bincount(day_offsets, minlength=day_count).astype(np.int64)
+        day_mood_sum = np.bincount(
+            day_offsets[has_mood], weights=mood_array[has_mood], minlength=day_count
+        ).astype(np.int64)
+        day_mood_count = np.bincount(day_offsets[has_mood], minlength=day_count)
+
+        # 第 0 天的星期：date.fromordinal(1) 是周一
+        weekdays = (np.arange(day_count, dtype=np.int64) + base_ordinal - 1) % 7
+        weekday_matrix = np.zeros((day_count, 7), dtype=np.int64)
+        weekday_matrix[np.arange(day_count), weekdays] = day_minutes
+        weekday_prefix = np.zeros((day_count + 1, 7), dtype=np.int64)
+        np.cumsum(weekday_matrix, axis=0, out=weekday_prefix[1:])
+
+        def _prefix(values: np.ndarray) -> np.ndarray:
+            prefix = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum(values, out=prefix[1:])
+            return prefix
+
+        return cls(
+            base_ordinal=base_ordinal,
+            ordinals=ordinal_array,
+            minutes=minute_array,
+            category_codes=np.asarray(category_codes, dtype=np.int64),
+            task_codes=np.asarray(task_codes, dtype=np.int64),
+            hour_prefix=hour_prefix,
+            day_minutes=day_minutes,
+            day_sessions=day_sessions,
+            minute_prefix=_prefix(day_minutes),
+            session_prefix=_prefix(day_sessions),
+            mood_sum_prefix=_prefix(day_mood_sum),
+            mood_count_prefix=_prefix(day_mood_count),
+            weekday_prefix=weekday_prefix,
+        )
+
+
+def _ranked_minutes(
+    codes: np.ndarray, minutes: np.ndarray, labels: List[str]
+) -> List[Tuple[str, int]]:
     """
+    Minutes per label ordered by minutes desc, ties kept in first-seen order
+    (matching Counter.most_common / a stable reverse sort over a dict).
+    """
+    if not len(codes):
+        return []
+    present, first_index, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    totals = np.bincount(inverse, weights=minutes, minlength=len(present)).astype(np.int64)
+    seen_order = np.argsort(first_index, kind="stable")
+    ordered = sorted(
+        ((labels[int(present[pos])], int(totals[pos])) for pos in seen_order),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return ordered
+
+
+def _efficiency_rows(
+    user_id: int, lower: Optional[date], upper: Optional[date]
+) -> List[Tuple[date, int, Optional[float]]]:
+    efficiency_query = (
+        DailyData.query.with_entities(
+            DailyData.log_date, DailyData.stage_id, DailyData.efficiency
+        )
+        .join(Stage, DailyData.stage_id == Stage.id)
+        .filter(Stage.user_id == user_id)
+        .order_by(DailyData.log_date.asc(), DailyData.id.asc())
+    )
+    if lower:
+        efficiency_query = efficiency_query.filter(DailyData.log_date >= lower)
+    if upper:
+        efficiency_query = efficiency_query.filter(DailyData.log_date <= upper)
+    return [(row.log_date, row.stage_id, row.efficiency) for row in efficiency_query.all()]
+
+
+def _load_learning_windows(user_id: int, windows: Sequence[Window]) -> List[Dict]:
+    lower, upper = _union_bounds(windows)
+
     logs_query = (
         LogEntry.query.join(Stage, LogEntry.stage_id == Stage.id)
         .filter(Stage.user_id == user_id)
         .order_by(LogEntry.log_date.asc(), LogEntry.id.asc())
     )
-    if stage:
-        logs_query = logs_query.filter(LogEntry.stage_id == stage.id)
-    if start_date:
-        logs_query = logs_query.filter(LogEntry.log_date >= start_date)
-    if end_date:
-        logs_query = logs_query.filter(LogEntry.log_date <= end_date)
-
+    if lower:
+        logs_query = logs_query.filter(LogEntry.log_date >= lower)
+    if upper:
+        logs_query = logs_query.filter(LogEntry.log_date <= upper)
     logs = logs_query.all()
-    countdown_context = _build_countdown_context(user_id, start_date, end_date)
-    efficiency_baseline = _compute_efficiency_baseline(user_id, end_date or date.today())
-
-    total_minutes = sum(int(log.actual_duration or 0) for log in logs)
-    total_sessions = len(logs)
-
-    daily_minutes: Dict[date, int] = defaultdict(int)
-    weekday_minutes: Dict[int, int] = defaultdict(int)  # 0=Mon ... 6=Sun
-    hour_minutes: Dict[int, int] = defaultdict(int)  # 0-23
-    mood_sum = 0
-    mood_count = 0
-    task_counter: Counter[str] = Counter()
-    category_minutes: Dict[str, int] = defaultdict(int)
 
     subcategory_ids = {
         log.subcategory_id for log in logs if log.subcategory_id is not None
@@ -56,66 +255,128 @@ def _aggregate_learning_data(
             for sub in SubCategory.query.filter(SubCategory.id.in_(subcategory_ids)).all()
         }
 
-    for log in logs:
-        minutes = int(log.actual_duration or 0)
-        log_day = log.log_date
-        daily_minutes[log_day] += minutes
-        # 「活跃时段」统计：使用开始时间 hour，如果缺失则跳过
-        start_time = getattr(log, "start_time", None)
-        if start_time:
-            hour = getattr(start_time, "hour", None)
-            if hour is None:
-                hour_text = str(start_time)[:2]  # 支持 "HH:MM:SS" 或 datetime
-                if hour_text.isdigit():
-                    hour = int(hour_text)
-            if isinstance(hour, int) and 0 <= hour <= 23:
-                hour_minutes[hour] += minutes
-        if log_day:
-            weekday_minutes[log_day.weekday()] += minutes
-
-        task_name = (log.task or '').strip() or '未命名任务'
-
-        category_name = '未分类'
-        subcategory_name = None
-        if log.subcategory_id and log.subcategory_id in subcategory_map:
-            subcategory = subcategory_map[log.subcategory_id]
-            if getattr(subcategory, 'category', None) and subcategory.category.name:
-                category_name = subcategory.category.name
-            elif subcategory.name:
-                category_name = subcategory.name
-            if subcategory.name:
-                subcategory_name = subcategory.name
-        elif log.legacy_category:
-            category_name = log.legacy_category
-
-        path_parts = [part for part in [category_name, subcategory_name] if part]
-        path_label = "-".join(path_parts) if path_parts else "未分类"
-        full_task_label = f"[{path_label}] {task_name}"
-        task_counter[full_task_label] += minutes
-
-        if log.mood is not None:
-            mood_sum += log.mood
-            mood_count += 1
-
-        category_minutes[category_name] += minutes
+    # 日索引覆盖所有窗口与全部已加载日志
+    bounded = [day for window in windows for day in window[:2] if day]
+    bounded.extend(log.log_date for log in logs[:1] + logs[-1:])
+    base_ordinal = min(bounded).toordinal() if bounded else date.today().toordinal()
+    day_count = (max(bounded).toordinal() - base_ordinal + 1) if bounded else 0
+
+    category_labels: List[str] = []
+    task_labels: List[str] = []
+    category_index: Dict[str, int] = {}
+    task_index: Dict[str, int] = {}
+    rows_by_stage: Dict[int, List[int]] = defaultdict(list)
+    ordinals: List[int] = []
+    minutes: List[int] = []
+    moods: List[Optional[int]] = []
+    hours: List[int] = []
+    category_codes: List[int] = []
+    task_codes: List[int] = []
+    for position, log in enumerate(logs):
+        category_name, task_label = _log_labels(log, subcategory_map)
+        if category_name not in category_index:
+            category_index[category_name] = len(category_labels)
+            category_labels.append(category_name)
+        if task_label not in task_index:
+            task_index[task_label] = len(task_labels)
+            task_labels.append(task_label)
+        ordinals.append(log.log_date.toordinal())
+        minutes.append(int(log.actual_duration or 0))
+        moods.append(log.mood)
+        hours.append(_log_hour(log))
+        category_codes.append(category_index[category_name])
+        task_codes.append(task_index[task_label])
+        rows_by_stage[log.stage_id].append(position)
+
+    def _columns(positions: Optional[List[int]]) -> _LogColumns:
+        if positions is None:
+            positions = list(range(len(logs)))
+        return _LogColumns.build(
+            base_ordinal,
+            day_count,
+            [ordinals[pos] for pos in positions],
+            [minutes[pos] for pos in positions],
+            [moods[pos] for pos in positions],
+            [hours[pos] for pos in positions],
+            [category_codes[pos] for pos in positions],
+            [task_codes[pos] for pos in positions],
+        )
+
+    column_views: Dict[Optional[int], _LogColumns] = {}
+    efficiency_rows = _efficiency_rows(user_id, lower, upper)
+    efficiency_ordinals = [row[0].toordinal() for row in efficiency_rows]
+
+    results = []
+    for start_date, end_date, stage in windows:
+        stage_id = stage.id if stage else None
+        if stage_id not in column_views:
+            column_views[stage_id] = _columns(
+                rows_by_stage.get(stage_id, []) if stage_id is not None else None
+            )
+        window_efficiency = [
+            (log_date, efficiency)
+            for log_date, row_stage_id, efficiency in efficiency_rows[
+                bisect.bisect_left(efficiency_ordinals, start_date.toordinal())
+                if start_date
+                else 0 : bisect.bisect_right(efficiency_ordinals, end_date.toordinal())
+                if end_date
+                else len(efficiency_rows)
+            ]
+            if stage_id is None or row_stage_id == stage_id
+        ]
+        results.append(
+            _summarize_window(
+                user_id,
+                start_date,
+                end_date,
+                column_views[stage_id],
+                window_efficiency,
+                category_labels,
+                task_labels,
+            )
+        )
+    return results
+
+
+def _summarize_window(
+    user_id: int,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    columns: _LogColumns,
+    efficiency_rows: List[Tuple[date, Optional[float]]],
+    category_labels: List[str],
+    task_labels: List[str],
+) -> Dict:
+    countdown_context = _build_countdown_context(user_id, start_date, end_date)
+    efficiency_baseline = _compute_efficiency_baseline(user_id, end_date or date.today())
+
+    base = columns.base_ordinal
+    day_lo = start_date.toordinal() - base if start_date else 0
+    day_hi = end_date.toordinal() - base + 1 if end_date else len(columns.day_minutes)
+    day_lo = max(day_lo, 0)
+    day_hi = max(day_hi, day_lo)
+    row_lo = int(np.searchsorted(columns.ordinals, base + day_lo, side="left"))
+    row_hi = int(np.searchsorted(columns.ordinals, base + day_hi, side="left"))
+
+    total_minutes = int(columns.minute_prefix[day_hi] - columns.minute_prefix[day_lo])
+    total_sessions = int(columns.session_prefix[day_hi] - columns.session_prefix[day_lo])
+    mood_sum = int(columns.mood_sum_prefix[day_hi] - columns.mood_sum_prefix[day_lo])
+    mood_count = int(columns.mood_count_prefix[day_hi] - columns.mood_count_prefix[day_lo])
+    weekday_minutes = columns.weekday_prefix[day_hi] - columns.weekday_prefix[day_lo]
+    hour_minutes = columns.hour_prefix[row_hi] - columns.hour_prefix[row_lo]
+
+    window_day_minutes = columns.day_minutes[day_lo:day_hi]
+    window_active = columns.day_sessions[day_lo:day_hi] > 0
+    active_offsets = np.nonzero(window_active)[0]
+    daily_minutes: Dict[date, int] = {
+        date.fromordinal(base + day_lo + int(offset)): int(window_day_minutes[offset])
+        for offset in active_offsets
+    }
 
     average_mood = round(mood_sum / mood_count, 2) if mood_count else None
 
-    efficiency_query = (
-        DailyData.query.join(Stage, DailyData.stage_id == Stage.id)
-        .filter(Stage.user_id == user_id)
-        .order_by(DailyData.log_date.asc(), DailyData.id.asc())
-    )
-    if stage:
-        efficiency_query = efficiency_query.filter(DailyData.stage_id == stage.id)
-    if start_date:
-        efficiency_query = efficiency_query.filter(DailyData.log_date >= start_date)
-    if end_date:
-        efficiency_query = efficiency_query.filter(DailyData.log_date <= end_date)
-
-    efficiency_rows = efficiency_query.all()
     efficiency_values = [
-        row.efficiency for row in efficiency_rows if row.efficiency is not None
+        efficiency for _log_date, efficiency in efficiency_rows if efficiency is not None
     ]
     average_efficiency = (
         round(sum(efficiency_values) / len(efficiency_values), 2)
@@ -124,9 +385,9 @@ def _aggregate_learning_data(
     )
 
     daily_efficiency = {
-        row.log_date: row.efficiency
-        for row in efficiency_rows
-        if row.efficiency is not None
+        log_date: efficiency
+        for log_date, efficiency in efficiency_rows
+        if efficiency is not None
     }
 
     all_days = sorted(set(daily_minutes.keys()) | set(daily_efficiency.keys()))
@@ -139,6 +400,7 @@ def _aggregate_learning_data(
         for day in all_days
     ]
 
+    row_minutes = columns.minutes[row_lo:row_hi]
     category_stats = [
         {
             'name': name,
@@ -146,8 +408,8 @@ def _aggregate_learning_data(
             'hours': round(minutes / 60, 2),
             'percentage': round(minutes / max(total_minutes, 1) * 100, 1),
         }
-        for name, minutes in sorted(
-            category_minutes.items(), key=lambda item: item[1], reverse=True
+        for name, minutes in _ranked_minutes(
+            columns.category_codes[row_lo:row_hi], row_minutes, category_labels
         )
     ]
 
@@ -158,62 +420,49 @@ def _aggregate_learning_data(
             'hours': round(minutes / 60, 2),
             'percentage': round(minutes / max(total_minutes, 1) * 100, 1),
         }
-        for task, minutes in task_counter.most_common(5)
+        for task, minutes in _ranked_minutes(
+            columns.task_codes[row_lo:row_hi], row_minutes, task_labels
+        )[:5]
     ]
 
     active_days = len(daily_minutes)
     idle_days: List[str] = []
-    if start_date and end_date:
-        current = start_date
-        while current <= end_date:
-            if current not in daily_minutes:
-                idle_days.append(current.isoformat())
-            current += timedelta(days=1)
-
-    # 活跃占比与学习打卡连击（当前/最长连续）
     total_days = None
     active_ratio = None
     current_streak = 0
     longest_streak = 0
     if start_date and end_date:
+        idle_days = [
+            date.fromordinal(base + day_lo + int(offset)).isoformat()
+            for offset in np.nonzero(~window_active)[0]
+        ]
+        # 活跃占比与学习打卡连击（当前/最长连续）
         total_days = (end_date - start_date).days + 1
         if total_days > 0:
             active_ratio = round(active_days / total_days, 3)
-        # 计算 streak
-        run = 0
-        current = start_date
-        while current <= end_date:
-            if current in daily_minutes and daily_minutes[current] > 0:
-                run += 1
-                longest_streak = max(longest_streak, run)
-            else:
-                run = 0
-            current += timedelta(days=1)
-        # 计算当前连击：从区间末尾往前
-        run = 0
-        current = end_date
-        while current >= start_date:
-            if current in daily_minutes and daily_minutes[current] > 0:
-                run += 1
-                current -= timedelta(days=1)
-            else:
-                break
-        current_streak = run
+        studied = np.concatenate(([False], window_day_minutes > 0, [False]))
+        edges = np.diff(studied.astype(np.int8))
+        run_starts = np.nonzero(edges == 1)[0]
+        run_ends = np.nonzero(edges == -1)[0]
+        if len(run_starts):
+            longest_streak = int((run_ends - run_starts).max())
+            if run_ends[-1] == len(window_day_minutes):
+                current_streak = int(run_ends[-1] - run_starts[-1])
 
     # 将 weekday/hour 统计转为列表并补齐缺失键
     weekday_stats = [
         {
             "weekday": i,  # 0=Mon
-            "minutes": int(weekday_minutes.get(i, 0)),
-            "hours": round(weekday_minutes.get(i, 0) / 60, 2),
+            "minutes": int(weekday_minutes[i]),
+            "hours": round(int(weekday_minutes[i]) / 60, 2),
         }
         for i in range(7)
     ]
     hour_stats = [
         {
             "hour": h,
-            "minutes": int(hour_minutes.get(h, 0)),
-            "hours": round(hour_minutes.get(h, 0) / 60, 2),
+            "minutes": int(hour_minutes[h]),
+            "hours": round(int(hour_minutes[h]) / 60, 2),
         }
         for h in range(24)
     ]
@@ -243,4 +492,4 @@ def _aggregate_learning_data(
     }
 
 
-__all__ = ["_aggregate_learning_data"]
+__all__ = ["_aggregate_learning_data", "_aggregate_learning_windows"]
@@ -917,8 +917,10 @@ def build_briefing_result(
     meta: Dict[str, Any],
     stats: Dict[str, Any],
     prev_stats: Optional[Dict[str, Any]],
+    fallback_briefing: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
-    fallback_briefing = _briefing_fallback(meta, stats, prev_stats)
+    if fallback_briefing is None:
+        fallback_briefing = _briefing_fallback(meta, stats, prev_stats)
     prompt = _build_structured_briefing_prompt(fallback_briefing)
     try:
         model_text = llm_client._call_qwen(prompt)
@@ -2,8 +2,9 @@ from __future__ import annotations
 
 import json
 import re
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterator
 
 from flask import current_app
 
@@ -12,7 +13,7 @@ from app.models import AIChatMessage, AIChatSession
 
 from .chat_context import build_default_chat_context, build_global_chat_context, build_requested_modules, normalize_requested_modules, normalize_requested_windows
 from .errors import AIPlannerError
-from .llm_client import _call_qwen
+from .llm_client import _call_qwen, _stream_qwen, _token_budget
 
 _VISIBLE_HISTORY_LIMIT = 12
 
@@ -162,7 +163,25 @@ def list_chat_messages(user_id: int, session_id: int) -> dict[str, Any]:
     return {"session": session.to_dict(), "messages": messages}
 
 
-def create_chat_message(
+@dataclass
+class _ChatTurn:
+    """一轮对话在调用回答模型之前已确定的全部状态。"""
+
+    user_id: int
+    session: AIChatSession
+    scope: str
+    date_str: str | None
+    stage_id: int | None
+    question: str
+    context_bundle: dict[str, Any]
+    planner_result: dict[str, Any]
+    requested_module_names: list[str]
+    requested_window_names: list[str]
+    answer_prompt: str
+    model_name: str
+
+
+def _prepare_chat_turn(
     user_id: int,
     *,
     session_id: int | None,
@@ -170,7 +189,7 @@ def create_chat_message(
     date_str: str | None,
     stage_id: int | None,
     content: str,
-) -> dict[str, Any]:
+) -> _ChatTurn:
     question = str(content or "").strip()
     if not question:
         raise AIPlannerError("content 不能为空")
@@ -223,12 +242,12 @@ def create_chat_message(
         "focus": question[:80],
         "answer_strategy": "直接回答，并引用最关键的事实证据。",
     }
-    planner_failed = False
     try:
-        planner_raw = _call_qwen(planner_prompt)
+        # 规划结果只是一小段 JSON，限制输出长度以缩短首个回答字出现前的等待
+        with _token_budget(current_app.config.get("AI_PLANNER_MAX_TOKENS", 256)):
+            planner_raw = _call_qwen(planner_prompt)
         planner_result.update(_extract_json_block(planner_raw))
     except Exception:
-        planner_failed = True
         current_app.logger.warning("AI chat planner pass fell back for user %s", user_id)
 
     requested_module_names = normalize_requested_modules(
@@ -245,7 +264,6 @@ def create_chat_message(
         session_id=session.id,
     )
 
-    model_name = current_app.config.get("QWEN_MODEL", "qwen-plus-2025-07-28")
     answer_prompt = _answer_pass_prompt(
         user_question=question,
         visible_history=visible_history,
@@ -253,31 +271,52 @@ def create_chat_message(
         requested_modules=requested_modules,
         answer_strategy=str(planner_result.get("answer_strategy") or ""),
     )
+    return _ChatTurn(
+        user_id=user_id,
+        session=session,
+        scope=scope,
+        date_str=date_str,
+        stage_id=stage_id,
+        question=question,
+        context_bundle=context_bundle,
+        planner_result=planner_result,
+        requested_module_names=requested_module_names,
+        requested_window_names=requested_window_names,
+        answer_prompt=answer_prompt,
+        model_name=current_app.config.get("QWEN_MODEL", "qwen-plus-2025-07-28"),
+    )
 
-    used_fallback = False
-    try:
-        assistant_content = _call_qwen(answer_prompt)
-    except Exception:
-        assistant_content = _fallback_chat_reply(
-            user_question=question,
-            context_bundle=context_bundle,
-        )
-        used_fallback = True
 
-    if planner_failed:
-        used_fallback = used_fallback or False
+def _fallback_for_turn(turn: _ChatTurn) -> str:
+    return _fallback_chat_reply(
+        user_question=turn.question,
+        context_bundle=turn.context_bundle,
+    )
+
+
+def _finalize_chat_turn(
+    turn: _ChatTurn,
+    assistant_content: str,
+    used_fallback: bool,
+) -> dict[str, Any]:
+    session = turn.session
+    scope = turn.scope
+    stage_id = turn.stage_id
+    date_reference = None if scope == "stage" else context_date(turn.date_str)
+    context_bundle = turn.context_bundle
+    model_name = turn.model_name
 
     generation_mode, generation_label = _resolve_generation_mode(model_name, used_fallback)
     now = datetime.utcnow()
 
     user_message = AIChatMessage(
         session_id=session.id,
-        user_id=user_id,
+        user_id=turn.user_id,
         role="user",
-        content=question,
+        content=turn.question,
         scope=scope,
         scope_reference=stage_id if scope == "stage" else None,
-        date_reference=None if scope == "stage" else context_date(date_str),
+        date_reference=date_reference,
         generation_mode=None,
         model_name=None,
         meta_snapshot={
@@ -287,21 +326,21 @@ def create_chat_message(
     )
     assistant_message = AIChatMessage(
         session_id=session.id,
-        user_id=user_id,
+        user_id=turn.user_id,
         role="assistant",
         content=assistant_content,
         scope=scope,
         scope_reference=stage_id if scope == "stage" else None,
-        date_reference=None if scope == "stage" else context_date(date_str),
+        date_reference=date_reference,
         generation_mode=generation_mode,
         model_name=None if used_fallback else model_name,
         meta_snapshot={
             "generation_label": generation_label,
             "period_label": context_bundle["meta"]["period_label"],
             "next_period_label": context_bundle["meta"]["next_period_label"],
-            "used_modules": requested_module_names,
-            "used_windows": requested_window_names,
-            "focus": planner_result.get("focus"),
+            "used_modules": turn.requested_module_names,
+            "used_windows": turn.requested_window_names,
+            "focus": turn.planner_result.get("focus"),
         },
         created_at=now,
     )
@@ -310,7 +349,7 @@ def create_chat_message(
     session.last_message_at = now
     session.updated_at = now
     if session.title == "新对话":
-        session.title = _session_title_from_message(question)
+        session.title = _session_title_from_message(turn.question)
     db.session.commit()
 
     return {
@@ -321,14 +360,103 @@ def create_chat_message(
             "generation_mode": generation_mode,
             "generation_label": generation_label,
             "model_name": None if used_fallback else model_name,
-            "used_modules": requested_module_names,
-            "used_windows": requested_window_names,
+            "used_modules": turn.requested_module_names,
+            "used_windows": turn.requested_window_names,
             "scope": scope,
             "period_label": context_bundle["meta"]["period_label"],
         },
     }
 
 
+def create_chat_message(
+    user_id: int,
+    *,
+    session_id: int | None,
+    scope: str,
+    date_str: str | None,
+    stage_id: int | None,
+    content: str,
+) -> dict[str, Any]:
+    turn = _prepare_chat_turn(
+        user_id,
+        session_id=session_id,
+        scope=scope,
+        date_str=date_str,
+        stage_id=stage_id,
+        content=content,
+    )
+
+    used_fallback = False
+    try:
+        assistant_content = _call_qwen(turn.answer_prompt)
+    except Exception:
+        assistant_content = _fallback_for_turn(turn)
+        used_fallback = True
+
+    return _finalize_chat_turn(turn, assistant_content, used_fallback)
+
+
+def stream_chat_message(
+    user_id: int,
+    *,
+    session_id: int | None,
+    scope: str,
+    date_str: str | None,
+    stage_id: int | None,
+    content: str,
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """
+    流式版本的 create_chat_message。
+
+    上下文与规划在返回前同步完成（参数或会话错误直接抛出 AIPlannerError），
+    返回的迭代器依次产出 (事件名, 数据)：
+    - ("start", 会话信息)
+    - ("delta", {"content": 增量文本})，回答模型每到一段就产出一次
+    - ("done", 与 create_chat_message 相同的结果)
+    - ("error", {"message": ...})：回答已输出一部分后中断，本轮不落库
+    模型在输出任何内容之前失败时，与非流式接口一样改用规则兜底回复。
+    """
+    turn = _prepare_chat_turn(
+        user_id,
+        session_id=session_id,
+        scope=scope,
+        date_str=date_str,
+        stage_id=stage_id,
+        content=content,
+    )
+
+    def _events() -> Iterator[tuple[str, dict[str, Any]]]:
+        yield "start", {
+            "session_id": turn.session.id,
+            "used_modules": turn.requested_module_names,
+            "used_windows": turn.requested_window_names,
+            "period_label": turn.context_bundle["meta"]["period_label"],
+        }
+        parts: list[str] = []
+        used_fallback = False
+        try:
+            for piece in _stream_qwen(turn.answer_prompt):
+                parts.append(piece)
+                yield "delta", {"content": piece}
+        except Exception as exc:
+            if parts:
+                db.session.rollback()
+                current_app.logger.warning(
+                    "AI chat stream interrupted for user %s: %s", user_id, exc
+                )
+                yield "error", {"message": "回答生成中断，请重试"}
+                return
+            used_fallback = True
+            fallback = _fallback_for_turn(turn)
+            parts = [fallback]
+            yield "delta", {"content": fallback}
+
+        assistant_content = "".join(parts).strip()
+        yield "done", _finalize_chat_turn(turn, assistant_content, used_fallback)
+
+    return _events()
+
+
 def context_date(date_str: str | None):
     if not date_str:
         return None
@@ -5,9 +5,10 @@ from datetime import date, timedelta
 from typing import Any
 
 from app.models import AIChatMessage, AIInsight, Setting, Stage
+from app.services.ai_context_cache import memoize_user_context
 from app.services.chart_service import get_chart_forecast_status_for_user
 
-from .aggregation import _aggregate_learning_data
+from .aggregation import _aggregate_learning_data, _aggregate_learning_windows
 from .date_ranges import _format_period_label, _get_date_range_for_scope, _get_next_range, _get_prev_range
 
 ALLOWED_CHAT_MODULES = {
@@ -139,7 +140,24 @@ def _build_weekly_detail(stats: dict[str, Any]) -> list[dict[str, Any]]:
     return weekly_rows[-12:]
 
 
+def _forecast_status(user_id: int) -> dict[str, Any]:
+    # 预测状态由后台训练异步更新，只在单个请求内复用
+    return memoize_user_context(
+        user_id,
+        "forecast_status",
+        None,
+        lambda: get_chart_forecast_status_for_user(user_id),
+        request_only=True,
+    )
+
+
 def _build_stage_timeline(user_id: int) -> list[dict[str, Any]]:
+    return memoize_user_context(
+        user_id, "stage_timeline", None, lambda: _load_stage_timeline(user_id)
+    )
+
+
+def _load_stage_timeline(user_id: int) -> list[dict[str, Any]]:
     stages = Stage.query.filter_by(user_id=user_id).order_by(Stage.start_date.asc()).all()
     timeline: list[dict[str, Any]] = []
     for index, stage in enumerate(stages):
@@ -195,6 +213,12 @@ def _build_recent_history(user_id: int, session_id: int | None = None) -> list[d
 
 
 def _build_settings_digest(user_id: int) -> dict[str, Any]:
+    return memoize_user_context(
+        user_id, "settings_digest", None, lambda: _load_settings_digest(user_id)
+    )
+
+
+def _load_settings_digest(user_id: int) -> dict[str, Any]:
     settings = Setting.query.filter(Setting.user_id == user_id).all()
     allowed_prefixes = ("study_", "learning_", "focus_", "countdown_", "theme")
     result: dict[str, Any] = {}
@@ -268,6 +292,22 @@ def _build_context_bundle_for_dates(
     }
 
 
+def _prefetch_scope_aggregates(
+    user_id: int,
+    scopes: list[tuple[str, str | None, int | None]],
+) -> None:
+    """一次扫描算出多个范围及其上一周期的聚合，随后逐个构建时直接命中备忘。"""
+    windows = []
+    for scope, date_str, stage_id in scopes:
+        start, end, stage = _get_date_range_for_scope(scope, date_str, stage_id, user_id)
+        windows.append((start, end, stage))
+        if scope != "stage":
+            prev_start, prev_end = _get_prev_range(scope, start, end)
+            if prev_start and prev_end:
+                windows.append((prev_start, prev_end, None))
+    _aggregate_learning_windows(user_id, windows)
+
+
 def build_global_chat_context(
     user_id: int,
     *,
@@ -275,6 +315,10 @@ def build_global_chat_context(
 ) -> dict[str, Any]:
     today = date.today()
     current_stage, _ = _find_stage_windows(user_id)
+    scopes = [(scope, today.isoformat(), None) for scope in ("day", "week", "month")]
+    if current_stage:
+        scopes.append(("stage", None, current_stage.id))
+    _prefetch_scope_aggregates(user_id, scopes)
     day_bundle = build_default_chat_context(user_id, "day", today.isoformat(), None, session_id=session_id)
     week_bundle = build_default_chat_context(user_id, "week", today.isoformat(), None, session_id=session_id)
     month_bundle = build_default_chat_context(user_id, "month", today.isoformat(), None, session_id=session_id)
@@ -289,7 +333,7 @@ def build_global_chat_context(
         if current_stage
         else None
     )
-    forecast_status = get_chart_forecast_status_for_user(user_id)
+    forecast_status = _forecast_status(user_id)
     return {
         "meta": {
             "scope": "global",
@@ -339,7 +383,7 @@ def build_default_chat_context(
     if scope == "stage" and next_stage_name:
         next_period_label = f"阶段：{next_stage_name}"
 
-    forecast_status = get_chart_forecast_status_for_user(user_id)
+    forecast_status = _forecast_status(user_id)
     forecast_summary = {}
     for dataset_key, forecast in (forecast_status.get("forecasts") or {}).items():
         forecast_summary[dataset_key] = {
@@ -515,7 +559,7 @@ def build_requested_modules(
                 elif key == "trend_weekly_detail":
                     window_modules[key] = _build_weekly_detail(stats)
                 elif key == "forecast_detail":
-                    window_modules[key] = get_chart_forecast_status_for_user(user_id)
+                    window_modules[key] = _forecast_status(user_id)
                 elif key == "category_duration_detail":
                     window_modules[key] = list(stats.get("category_stats") or [])
                 elif key == "category_efficiency_detail":
@@ -543,7 +587,7 @@ def build_requested_modules(
         elif key == "trend_weekly_detail":
             modules[key] = _build_weekly_detail(stats)
         elif key == "forecast_detail":
-            modules[key] = get_chart_forecast_status_for_user(user_id)
+            modules[key] = _forecast_status(user_id)
         elif key == "category_duration_detail":
             modules[key] = list(stats.get("category_stats") or [])
         elif key == "category_efficiency_detail":
@@ -2,6 +2,24 @@ from datetime import date
 from typing import Any, Dict, Optional
 
 from app.models import CountdownEvent
+from app.services.ai_context_cache import memoize_user_context
+
+
+def _load_countdown_events(user_id: int) -> list[dict[str, Any]]:
+    events = (
+        CountdownEvent.query.filter(CountdownEvent.user_id == user_id)
+        .order_by(CountdownEvent.target_datetime_utc.asc())
+        .all()
+    )
+    return [
+        {
+            "id": event.id,
+            "title": event.title,
+            "event_date": event.target_datetime_utc.date(),
+        }
+        for event in events
+        if event.target_datetime_utc
+    ]
 
 
 def _build_countdown_context(
@@ -11,10 +29,8 @@ def _build_countdown_context(
     Fetch all countdown events (historical + upcoming) and compute their
     relative distance to the current analysis window.
     """
-    events = (
-        CountdownEvent.query.filter(CountdownEvent.user_id == user_id)
-        .order_by(CountdownEvent.target_datetime_utc.asc())
-        .all()
+    events = memoize_user_context(
+        user_id, "countdown_events", None, lambda: _load_countdown_events(user_id)
     )
     reference_date = end_date or date.today()
     timeline: list[dict[str, Any]] = []
@@ -22,16 +38,14 @@ def _build_countdown_context(
     recovery_events: list[dict[str, Any]] = []
 
     for event in events:
-        if not event.target_datetime_utc:
-            continue
-        event_date = event.target_datetime_utc.date()
+        event_date = event["event_date"]
         days_to_start = (event_date - start_date).days if start_date else None
         days_to_end = (event_date - end_date).days if end_date else None
         days_from_reference = (event_date - reference_date).days
 
         entry = {
-            "id": event.id,
-            "title": event.title,
+            "id": event["id"],
+            "title": event["title"],
             "event_date": event_date.isoformat(),
             "days_to_period_start": days_to_start,
             "days_to_period_end": days_to_end,
@@ -3,7 +3,9 @@ from __future__ import annotations
 from datetime import date, datetime, timedelta
 from typing import Optional, Tuple
 
+from app import db
 from app.models import LogEntry, Stage
+from app.services.stage_index import get_stage_index
 
 from .errors import AIPlannerError
 
@@ -117,13 +119,8 @@ def _get_next_range(
     if scope == "stage":
         if not stage:
             return None, None, None
-        next_stage = (
-            Stage.query.filter(
-                Stage.user_id == user_id, Stage.start_date > stage.start_date
-            )
-            .order_by(Stage.start_date.asc())
-            .first()
-        )
+        next_stage_id = get_stage_index(user_id).next_stage_id(stage.id)
+        next_stage = db.session.get(Stage, next_stage_id) if next_stage_id else None
         if next_stage:
             next_last_log = (
                 LogEntry.query.filter_by(stage_id=next_stage.id)
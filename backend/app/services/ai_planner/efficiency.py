@@ -1,7 +1,18 @@
 from datetime import date, timedelta
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
 from app.models import DailyData, Stage
+from app.services.ai_context_cache import memoize_user_context
+
+
+def _load_efficiency_series(user_id: int) -> List[Tuple[date, float]]:
+    rows = (
+        DailyData.query.with_entities(DailyData.log_date, DailyData.efficiency)
+        .join(Stage, DailyData.stage_id == Stage.id)
+        .filter(Stage.user_id == user_id, DailyData.efficiency.isnot(None))
+        .all()
+    )
+    return [(row.log_date, row.efficiency) for row in rows]
 
 
 def _compute_efficiency_baseline(
@@ -12,21 +23,20 @@ def _compute_efficiency_baseline(
     - all-time average
     - last 30 days average
     - last 30 days peak
+
+    The user's efficiency series is loaded once and shared by every
+    reference date requested while it stays valid.
     """
     ref = reference_date or date.today()
-    base_query = (
-        DailyData.query.join(Stage, DailyData.stage_id == Stage.id)
-        .filter(Stage.user_id == user_id)
+    series = memoize_user_context(
+        user_id, "efficiency_series", None, lambda: _load_efficiency_series(user_id)
     )
 
-    all_rows = base_query.all()
-    all_values = [r.efficiency for r in all_rows if r.efficiency is not None]
-
+    all_values = [value for _log_date, value in series]
     last_30_start = ref - timedelta(days=29)
-    recent_rows = base_query.filter(
-        DailyData.log_date >= last_30_start, DailyData.log_date <= ref
-    ).all()
-    recent_values = [r.efficiency for r in recent_rows if r.efficiency is not None]
+    recent_values = [
+        value for log_date, value in series if last_30_start <= log_date <= ref
+    ]
 
     def _avg(values: list[float]) -> Optional[float]:
         return round(sum(values) / len(values), 2) if values else None
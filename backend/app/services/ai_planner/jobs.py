@@ -0,0 +1,528 @@
+"""
+AI 生成任务队列
+
+简报、分析、规划、组合简报与对话都可以作为任务入队，在请求线程之外执行，
+任务持久化在 ai_job 表中：
+- submit_ai_job 写入一条 queued 任务并立即返回，由工作线程池领取执行；
+- 领取通过条件 UPDATE（state='queued' 才能改为 running）完成，多个进程的
+  工作线程可以共用同一张表；同一用户同时运行的任务数不超过 AI_JOB_PER_USER_LIMIT；
+  领取、租约与工作线程池的实现与后台数据导入共用（见 db_jobs）；
+- AIPlannerError 视为业务错误，直接置为 failed；其他异常按
+  AI_JOB_RETRY_BACKOFF_SECONDS 指数退避重试，超过 AI_JOB_MAX_ATTEMPTS 次后进入
+  dead（死信），保留待人工查看或通过 retry_ai_job 重新入队；
+- 执行期间工作线程持续续约（进入新阶段时、以及后台心跳），超过 AI_JOB_LEASE_SECONDS
+  未续约的运行中任务视为工作线程已退出，重新入队；执行结果与状态只在仍持有租约时
+  写入，租约丢失的一方放弃本次结果；
+- get_ai_job 轮询状态，iter_ai_job_events 轮询数据库推送阶段变化。
+
+组合任务（bundle）只生成一次简报，同时落库简报/分析/规划三条记录，
+阶段依次为 aggregating → generating → persisting，命中简报缓存时跳过 generating。
+
+工作线程池在应用收到第一个请求时启动，并在提交或轮询未结束的任务时被唤醒；
+AI_JOB_WORKERS=0 时本进程不启动工作线程，交由 flask run-ai-jobs 等独立进程执行；
+测试环境默认在提交时于当前线程同步执行该任务。
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func, update
+
+from app import db
+from app.models import AIJob
+from app.services.db_jobs import (
+    DBJobWorkerPool,
+    JobLeaseLost,
+    claim_first,
+    config_value,
+    default_worker_id,
+    ensure_worker_pool,
+    finished_values,
+    retry_values,
+    sync_mode,
+    write_leased,
+)
+
+from . import chat, main
+from .errors import AIPlannerError
+
+JOB_KINDS = ("bundle", "briefing", "analysis", "plan", "chat")
+TERMINAL_STATES = ("succeeded", "failed", "dead")
+
+_DEFAULT_AI_JOB_WORKERS = 2
+_DEFAULT_AI_JOB_PER_USER_LIMIT = 2
+_DEFAULT_AI_JOB_MAX_ATTEMPTS = 3
+_DEFAULT_AI_JOB_RETRY_BACKOFF_SECONDS = 2.0
+_DEFAULT_AI_JOB_LEASE_SECONDS = 300.0
+_DEFAULT_AI_JOB_RETENTION_SECONDS = 86400.0
+_DEFAULT_AI_JOB_POLL_SECONDS = 1.0
+_EXTENSION_KEY = "ai_job_workers"
+_CLAIM_BATCH = 20
+
+# 同一进程内串行化「统计运行数 + 领取」，避免本进程的线程同时突破单用户并发上限
+_claim_lock = threading.Lock()
+
+_Handler = Callable[[int, Dict[str, Any], Callable[[str], None]], Dict[str, Any]]
+_HANDLERS: Dict[str, _Handler] = {
+    "bundle": lambda user_id, params, on_stage: main.generate_insight_bundle(
+        user_id, on_stage=on_stage, **params
+    ),
+    "briefing": lambda user_id, params, _on_stage: main.generate_briefing(user_id, **params),
+    "analysis": lambda user_id, params, _on_stage: main.generate_analysis(user_id, **params),
+    "plan": lambda user_id, params, _on_stage: main.generate_plan(user_id, **params),
+    "chat": lambda user_id, params, _on_stage: chat.create_chat_message(user_id, **params),
+}
+
+
+def _sync_mode() -> bool:
+    return sync_mode("AI_JOB_SYNC_MODE")
+
+
+def _jsonable(result: Dict[str, Any]) -> Dict[str, Any]:
+    # 与接口直接返回时的序列化保持一致（日期等由应用的 JSON provider 处理）
+    return json.loads(current_app.json.dumps(result))
+
+
+def submit_ai_job(user_id: int, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """写入一条待执行任务并返回其状态（同步模式下已执行完毕）。"""
+    if kind not in JOB_KINDS:
+        raise AIPlannerError(f"不支持的任务类型：{kind}")
+    now = datetime.utcnow()
+    job = AIJob(
+        id=uuid.uuid4().hex,
+        user_id=int(user_id),
+        kind=kind,
+        params=dict(params),
+        state="queued",
+        stage="queued",
+        attempts=0,
+        max_attempts=max(
+            int(config_value("AI_JOB_MAX_ATTEMPTS", _DEFAULT_AI_JOB_MAX_ATTEMPTS)), 1
+        ),
+        available_at=now,
+        created_at=now,
+        updated_at=now,
+    )
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+    if _sync_mode():
+        run_ai_jobs(job_id=job_id, ignore_user_limit=True)
+    else:
+        _wake_workers()
+    return _load_job(job_id).to_dict()
+
+
+def submit_insight_job(
+    user_id: int,
+    scope: str,
+    date_str: Optional[str] = None,
+    stage_id: Optional[int] = None,
+    refresh: bool = False,
+) -> Dict[str, Any]:
+    """提交一次组合生成（简报 + 分析 + 规划）任务。"""
+    return submit_ai_job(
+        user_id,
+        "bundle",
+        {
+            "scope": scope,
+            "date_str": date_str,
+            "stage_id": stage_id,
+            "refresh": bool(refresh),
+        },
+    )
+
+
+def _load_job(job_id: str) -> Optional[AIJob]:
+    return db.session.get(AIJob, job_id, populate_existing=True)
+
+
+def _find_job(user_id: int, job_id: str) -> AIJob:
+    job = _load_job(job_id)
+    if job is None or job.user_id != int(user_id):
+        raise AIPlannerError("任务不存在或已过期")
+    return job
+
+
+def get_ai_job(user_id: int, job_id: str) -> Dict[str, Any]:
+    job = _find_job(user_id, job_id)
+    if job.state not in TERMINAL_STATES:
+        # 轮询未结束的任务时唤醒工作线程，回收重启前遗留或租约过期的任务
+        _wake_workers()
+    return job.to_dict()
+
+
+def list_ai_jobs(
+    user_id: int,
+    state: Optional[str] = None,
+    limit: int = 20,
+) -> List[Dict[str, Any]]:
+    query = AIJob.query.filter(AIJob.user_id == int(user_id))
+    if state:
+        query = query.filter(AIJob.state == state)
+    jobs = query.order_by(AIJob.created_at.desc()).limit(max(1, limit)).all()
+    return [job.to_dict(include_result=False) for job in jobs]
+
+
+def retry_ai_job(user_id: int, job_id: str) -> Dict[str, Any]:
+    """把失败或死信任务重新入队，尝试次数清零。"""
+    job = _find_job(user_id, job_id)
+    if job.state not in {"failed", "dead"}:
+        raise AIPlannerError("只有失败的任务可以重试")
+    job.state = "queued"
+    job.stage = "queued"
+    job.attempts = 0
+    job.error = None
+    job.result = None
+    job.available_at = datetime.utcnow()
+    job.locked_by = None
+    job.locked_at = None
+    job.finished_at = None
+    db.session.commit()
+    if _sync_mode():
+        run_ai_jobs(job_id=job_id, ignore_user_limit=True)
+    else:
+        _wake_workers()
+    return _load_job(job_id).to_dict()
+
+
+def _lease_cutoff(now: datetime) -> datetime:
+    return now - timedelta(
+        seconds=config_value("AI_JOB_LEASE_SECONDS", _DEFAULT_AI_JOB_LEASE_SECONDS)
+    )
+
+
+def _recover_expired(now: datetime) -> None:
+    """回收租约过期的运行中任务，并清理超过保留期的已完成任务。"""
+    lease_cutoff = _lease_cutoff(now)
+    expired = AIJob.query.filter(
+        AIJob.state == "running", AIJob.locked_at < lease_cutoff
+    ).all()
+    for job in expired:
+        # 条件里带上租约时间：查询之后刚被续约的任务不回收
+        db.session.execute(
+            update(AIJob)
+            .where(
+                AIJob.id == job.id,
+                AIJob.state == "running",
+                AIJob.locked_at < lease_cutoff,
+            )
+            .values(
+                updated_at=now,
+                **_retry_values(job, "任务执行超时，工作进程可能已退出", now),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    retention_cutoff = now - timedelta(
+        seconds=config_value(
+            "AI_JOB_RETENTION_SECONDS", _DEFAULT_AI_JOB_RETENTION_SECONDS
+        )
+    )
+    AIJob.query.filter(
+        AIJob.state.in_(("succeeded", "failed")),
+        AIJob.finished_at < retention_cutoff,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _claim_next_job(
+    worker_id: str,
+    now: datetime,
+    job_id: Optional[str] = None,
+    ignore_user_limit: bool = False,
+) -> Optional[str]:
+    with _claim_lock:
+        _recover_expired(now)
+        query = db.session.query(AIJob.id).filter(
+            AIJob.state == "queued", AIJob.available_at <= now
+        )
+        if job_id is not None:
+            query = query.filter(AIJob.id == job_id)
+        if not ignore_user_limit:
+            limit = max(
+                int(config_value("AI_JOB_PER_USER_LIMIT", _DEFAULT_AI_JOB_PER_USER_LIMIT)),
+                1,
+            )
+            busy_users = (
+                db.session.query(AIJob.user_id)
+                .filter(AIJob.state == "running")
+                .group_by(AIJob.user_id)
+                .having(func.count(AIJob.id) >= limit)
+            )
+            query = query.filter(AIJob.user_id.not_in(busy_users))
+        candidates = [
+            row.id
+            for row in query.order_by(AIJob.available_at.asc(), AIJob.created_at.asc())
+            .limit(_CLAIM_BATCH)
+            .all()
+        ]
+        return claim_first(
+            AIJob,
+            candidates,
+            AIJob.state == "queued",
+            worker_id,
+            now,
+            stage="running",
+        )
+
+
+def _retry_values(job: AIJob, error: str, now: datetime) -> Dict[str, Any]:
+    """一次可重试失败之后的字段：退避后重新入队，次数用尽时进入死信。"""
+    values = retry_values(
+        job.attempts,
+        job.max_attempts,
+        error,
+        now,
+        exhausted_state="dead",
+        backoff_seconds=config_value(
+            "AI_JOB_RETRY_BACKOFF_SECONDS", _DEFAULT_AI_JOB_RETRY_BACKOFF_SECONDS
+        ),
+    )
+    values["stage"] = "retrying" if values["state"] == "queued" else values["state"]
+    return values
+
+
+def _set_stage(job_id: str, worker_id: str, stage: str) -> None:
+    # 进入每个阶段时顺带续约
+    write_leased(AIJob, job_id, worker_id, stage=stage)
+
+
+def _finish(
+    job_id: str,
+    worker_id: str,
+    state: str,
+    *,
+    result=None,
+    error: Optional[str] = None,
+) -> None:
+    write_leased(
+        AIJob,
+        job_id,
+        worker_id,
+        **finished_values(
+            state, datetime.utcnow(), stage=state, result=result, error=error
+        ),
+    )
+
+
+class _LeaseHeartbeat:
+    """
+    任务执行期间在后台线程里按租约的三分之一定期续约，
+    避免一次较长的模型调用让租约过期、任务被其他工作线程重复执行。
+    """
+
+    def __init__(self, app, job_id: str, worker_id: str, lease_seconds: float) -> None:
+        self.app = app
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = max(lease_seconds / 3.0, 0.05)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "_LeaseHeartbeat":
+        self._thread = threading.Thread(
+            target=self._run, name=f"ai-job-heartbeat-{self.job_id}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    try:
+                        write_leased(AIJob, self.job_id, self.worker_id)
+                    finally:
+                        db.session.remove()
+            except JobLeaseLost:
+                # 租约已丢失：执行线程在下一次写入状态时会发现并放弃结果
+                return
+            except Exception as exc:  # noqa: BLE001 - 续约失败不影响任务本身
+                self.app.logger.warning(
+                    "AI job %s lease heartbeat failed: %s", self.job_id, exc
+                )
+
+
+def _execute_job(job_id: str, worker_id: str) -> None:
+    job = _load_job(job_id)
+    user_id, kind, params = job.user_id, job.kind, dict(job.params or {})
+    heartbeat = _LeaseHeartbeat(
+        current_app._get_current_object(),
+        job_id,
+        worker_id,
+        config_value("AI_JOB_LEASE_SECONDS", _DEFAULT_AI_JOB_LEASE_SECONDS),
+    )
+    try:
+        try:
+            with heartbeat:
+                result = _HANDLERS[kind](
+                    user_id, params, lambda stage: _set_stage(job_id, worker_id, stage)
+                )
+            payload = _jsonable(result)
+        except JobLeaseLost:
+            raise
+        except AIPlannerError as exc:
+            db.session.rollback()
+            _finish(job_id, worker_id, "failed", error=str(exc))
+        except Exception as exc:  # noqa: BLE001 - 记录后按重试策略处理
+            db.session.rollback()
+            job = _load_job(job_id)
+            current_app.logger.error(
+                "AI job %s (%s) failed on attempt %s: %s",
+                job_id,
+                kind,
+                job.attempts,
+                exc,
+                exc_info=exc,
+            )
+            write_leased(
+                AIJob,
+                job_id,
+                worker_id,
+                **_retry_values(job, f"{type(exc).__name__}: {exc}", datetime.utcnow()),
+            )
+        else:
+            _finish(job_id, worker_id, "succeeded", result=payload)
+    except JobLeaseLost:
+        current_app.logger.warning(
+            "AI job %s lease was lost; discarding this attempt", job_id
+        )
+
+
+def run_ai_jobs(
+    max_jobs: Optional[int] = None,
+    *,
+    worker_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+    ignore_user_limit: bool = False,
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    在当前线程中领取并执行到期任务，返回执行的任务数。
+
+    工作线程每次执行一个；测试与命令行可以直接调用来清空队列，
+    now 用于跳过退避等待。
+    """
+    worker_id = worker_id or default_worker_id()
+    executed = 0
+    while max_jobs is None or executed < max_jobs:
+        claimed = _claim_next_job(
+            worker_id,
+            now or datetime.utcnow(),
+            job_id=job_id,
+            ignore_user_limit=ignore_user_limit,
+        )
+        if claimed is None:
+            break
+        _execute_job(claimed, worker_id)
+        executed += 1
+    return executed
+
+
+def _ensure_workers(app) -> Optional[DBJobWorkerPool]:
+    """按当前配置取得（必要时创建并启动）本进程的工作线程池；不启用时返回 None。"""
+    if _sync_mode():
+        return None
+    workers = int(config_value("AI_JOB_WORKERS", _DEFAULT_AI_JOB_WORKERS))
+    return ensure_worker_pool(
+        app,
+        _EXTENSION_KEY,
+        workers,
+        lambda: DBJobWorkerPool(
+            app,
+            workers,
+            config_value("AI_JOB_POLL_SECONDS", _DEFAULT_AI_JOB_POLL_SECONDS),
+            lambda worker_id: run_ai_jobs(1, worker_id=worker_id),
+            name="ai-job-worker",
+        ),
+    )
+
+
+def start_ai_job_workers() -> None:
+    """
+    启动本进程的工作线程池（已启动时不做任何事）。
+
+    应用收到请求时调用，进程重启后排队中、等待重试与租约过期的任务无需等新任务提交
+    也会被领取执行。
+    """
+    _ensure_workers(current_app._get_current_object())
+
+
+def _wake_workers() -> None:
+    pool = _ensure_workers(current_app._get_current_object())
+    if pool is not None:
+        pool.wake()
+
+
+def iter_ai_job_events(
+    user_id: int,
+    job_id: str,
+    *,
+    poll_seconds: Optional[float] = None,
+    heartbeat_seconds: float = 15.0,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    产出 (事件名, 数据)：状态或阶段每变化一次一条 progress，结束时 done 或 error；
+    长时间没有变化时产出 ping 保持连接。任务不存在时立即抛出 AIPlannerError。
+    """
+    if _find_job(user_id, job_id).state not in TERMINAL_STATES:
+        _wake_workers()
+    if poll_seconds is None:
+        poll_seconds = config_value("AI_JOB_POLL_SECONDS", _DEFAULT_AI_JOB_POLL_SECONDS)
+    return _job_events(job_id, max(poll_seconds, 0.05), heartbeat_seconds)
+
+
+def _job_events(
+    job_id: str,
+    poll_seconds: float,
+    heartbeat_seconds: float,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    last_seen = None
+    idle_since = time.monotonic()
+    while True:
+        # 结束上一次读事务，才能看到工作线程新提交的状态
+        db.session.rollback()
+        job = _load_job(job_id)
+        if job is None:
+            yield "error", {"job_id": job_id, "message": "任务不存在或已过期"}
+            return
+        marker = (job.state, job.stage, job.attempts)
+        if marker != last_seen:
+            last_seen = marker
+            idle_since = time.monotonic()
+            yield "progress", job.to_dict(include_result=False)
+            if job.state in TERMINAL_STATES:
+                if job.state == "succeeded":
+                    yield "done", {"job_id": job.id, "result": job.result}
+                else:
+                    yield "error", {"job_id": job.id, "message": job.error}
+                return
+        elif time.monotonic() - idle_since >= heartbeat_seconds:
+            idle_since = time.monotonic()
+            yield "ping", {"job_id": job_id}
+        time.sleep(poll_seconds)
+
+
+__all__ = [
+    "JOB_KINDS",
+    "submit_ai_job",
+    "submit_insight_job",
+    "get_ai_job",
+    "list_ai_jobs",
+    "retry_ai_job",
+    "run_ai_jobs",
+    "start_ai_job_workers",
+    "iter_ai_job_events",
+]
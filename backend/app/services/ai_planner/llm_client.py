@@ -1,38 +1,98 @@
+"""
+通义千问调用
+
+- _call_qwen：默认经由专用事件循环线程上的 AsyncOpenAI 发起请求，
+  用信号量限制同时在途的上游请求数，连接池保持长连接，重试退避用 asyncio.sleep，
+  不再占用请求线程睡眠；同一时刻完全相同的调用（模型、提示词、输出上限一致）
+  合并为一次上游请求，双击等重复提交共享同一个结果；
+- _stream_qwen：流式输出需要在请求线程中逐段产出，仍使用同步客户端。
+
+两种客户端都按 (API 密钥, base_url) 缓存，切换密钥不会丢弃其他客户端。
+AI_ASYNC_CLIENT=0 时 _call_qwen 退回同步客户端。
+"""
+
 from __future__ import annotations
 
-from typing import Any, Dict, TYPE_CHECKING
+import asyncio
+import collections
+import os
+import threading
 import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, TYPE_CHECKING
 
 from flask import current_app
 
 if TYPE_CHECKING:
-    from openai import APIConnectionError, APIStatusError, OpenAI, RateLimitError
+    from openai import (
+        APIConnectionError,
+        APIStatusError,
+        AsyncOpenAI,
+        OpenAI,
+        RateLimitError,
+    )
 else:
     OpenAI: Any = None
+    AsyncOpenAI: Any = None
     APIConnectionError: Any = Exception
     APIStatusError: Any = Exception
     RateLimitError: Any = Exception
     try:  # pragma: no cover - handled at runtime
         from openai import APIConnectionError as _APIConnectionError
         from openai import APIStatusError as _APIStatusError
+        from openai import AsyncOpenAI as _AsyncOpenAI
         from openai import OpenAI as _OpenAI
         from openai import RateLimitError as _RateLimitError
     except ImportError:
         pass
     else:
         OpenAI = _OpenAI
+        AsyncOpenAI = _AsyncOpenAI
         APIConnectionError = _APIConnectionError
         APIStatusError = _APIStatusError
         RateLimitError = _RateLimitError
 
+try:  # pragma: no cover - handled at runtime
+    import httpx
+    from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+except ImportError:
+    httpx = None
+    DefaultAsyncHttpxClient = None
+    DefaultHttpxClient = None
+
 from .errors import AIPlannerError
 
-# Cache a single client per API key/base_url to avoid re-instantiating the SDK on every call.
-_qwen_client_cache: Dict[str, Any] = {}
+_MAX_CACHED_CLIENTS = 4
+_DEFAULT_MAX_CONCURRENCY = 8
+_DEFAULT_KEEPALIVE_CONNECTIONS = 8
+_DEFAULT_REQUEST_TIMEOUT = 90.0
 
+# Cache one sync client per API key/base_url (LRU) to avoid re-instantiating the SDK on every call.
+_qwen_client_cache: "collections.OrderedDict[str, Any]" = collections.OrderedDict()
+_qwen_client_lock = threading.Lock()
+_token_budget_var: ContextVar[int | None] = ContextVar("qwen_token_budget", default=None)
 
-def _configure_qwen():
-    if OpenAI is None:
+
+@dataclass(frozen=True)
+class _QwenTarget:
+    """一次调用所需的连接参数，在请求线程中从应用配置读出。"""
+
+    api_key: str
+    base_url: str
+    model_name: str
+    max_connections: int
+    keepalive_connections: int
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.api_key}@{self.base_url}"
+
+
+def _qwen_target(sdk_class: Any) -> _QwenTarget:
+    if sdk_class is None:
         raise AIPlannerError(
             "未安装 openai SDK，请先 pip install openai 或运行 pip install -r requirements.txt 安装依赖"
         )
@@ -42,87 +102,336 @@ def _configure_qwen():
     base_url = current_app.config.get(
         "QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
     )
-    cache_key = f"{api_key}@{base_url}"
-    client = _qwen_client_cache.get(cache_key)
-    if client is None:
-        client = OpenAI(api_key=api_key, base_url=base_url)
-        _qwen_client_cache.clear()
-        _qwen_client_cache[cache_key] = client
-    model_name = current_app.config.get("QWEN_MODEL", "qwen-plus-2025-07-28")
-    return client, model_name
+    max_connections = max(
+        int(current_app.config.get("AI_MAX_CONCURRENCY", _DEFAULT_MAX_CONCURRENCY) or 1), 1
+    )
+    keepalive = int(
+        current_app.config.get("AI_HTTP_KEEPALIVE_CONNECTIONS", _DEFAULT_KEEPALIVE_CONNECTIONS)
+        or 0
+    )
+    return _QwenTarget(
+        api_key=api_key,
+        base_url=base_url,
+        model_name=current_app.config.get("QWEN_MODEL", "qwen-plus-2025-07-28"),
+        max_connections=max_connections,
+        keepalive_connections=min(max(keepalive, 0), max_connections),
+    )
 
 
-def _call_qwen(prompt: str) -> str:
-    client, model_name = _configure_qwen()
+def _http_limits(target: _QwenTarget):
+    return httpx.Limits(
+        max_connections=target.max_connections,
+        max_keepalive_connections=target.keepalive_connections,
+    )
+
+
+def _build_qwen_client(target: _QwenTarget):
+    kwargs: Dict[str, Any] = {"api_key": target.api_key, "base_url": target.base_url}
+    if DefaultHttpxClient is not None:
+        kwargs["http_client"] = DefaultHttpxClient(limits=_http_limits(target))
+    return OpenAI(**kwargs)
+
+
+def _build_async_qwen_client(target: _QwenTarget):
+    kwargs: Dict[str, Any] = {"api_key": target.api_key, "base_url": target.base_url}
+    if DefaultAsyncHttpxClient is not None:
+        kwargs["http_client"] = DefaultAsyncHttpxClient(limits=_http_limits(target))
+    return AsyncOpenAI(**kwargs)
+
+
+def _configure_qwen():
+    target = _qwen_target(OpenAI)
+    with _qwen_client_lock:
+        client = _qwen_client_cache.get(target.cache_key)
+        if client is None:
+            client = _build_qwen_client(target)
+            _qwen_client_cache[target.cache_key] = client
+            while len(_qwen_client_cache) > _MAX_CACHED_CLIENTS:
+                _qwen_client_cache.popitem(last=False)
+        _qwen_client_cache.move_to_end(target.cache_key)
+    return client, target.model_name
+
+
+def _retry_settings() -> tuple[int, float]:
     max_retries = int(current_app.config.get("AI_MAX_RETRIES", 2) or 0)
     backoff = float(current_app.config.get("AI_RETRY_BACKOFF", 1.25) or 1.25)
+    return max_retries, backoff
+
+
+def _retry_delay_or_raise(
+    exc: Exception,
+    attempt: int,
+    max_retries: int,
+    backoff: float,
+    model_name: str,
+) -> float:
+    """可重试的失败返回等待秒数，否则抛出对应的 AIPlannerError。"""
+    delay = max(0.2, 0.6 * (backoff ** attempt))
+    if isinstance(exc, (APIStatusError, RateLimitError)):
+        detail = getattr(exc, "message", None) or getattr(exc, "response", None) or str(exc)
+        # 对临时性错误做重试
+        transient = any(
+            key in str(detail).lower()
+            for key in [
+                "timeout",
+                "temporarily",
+                "unavailable",
+                "deadline",
+                "internal",
+                "quota",
+                "network",
+                "503",
+            ]
+        )
+        if attempt < max_retries and transient:
+            return delay
+        raise AIPlannerError(
+            f"调用通义千问接口失败：{detail}（模型：{model_name}）"
+        ) from exc
+    if isinstance(exc, APIConnectionError):
+        if attempt < max_retries:
+            return delay
+        raise AIPlannerError("连接通义千问失败，请检查网络后重试") from exc
+    # 常见 SSL/连接错误
+    msg = str(exc)
+    if attempt < max_retries and any(
+        s in msg for s in [
+            "SSL:",
+            "EOF occurred",
+            "Connection reset",
+            "Connection aborted",
+            "RemoteDisconnected",
+        ]
+    ):
+        return delay
+    raise AIPlannerError(f"生成内容失败，请稍后重试：{exc}") from exc
+
+
+@contextmanager
+def _token_budget(max_tokens: int | None) -> Iterator[None]:
+    """在作用域内为未显式指定 max_tokens 的模型调用设置输出长度上限。"""
+    token = _token_budget_var.set(max_tokens)
+    try:
+        yield
+    finally:
+        _token_budget_var.reset(token)
+
+
+def _completion_kwargs(model_name: str, prompt: str, max_tokens: int | None) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {
+        "model": model_name,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if max_tokens is None:
+        max_tokens = _token_budget_var.get()
+    if max_tokens:
+        kwargs["max_tokens"] = int(max_tokens)
+    return kwargs
+
+
+def _message_text(response: Any) -> str:
+    if not response or not getattr(response, "choices", None):
+        raise AIPlannerError("未能生成有效的模型输出")
+    message = response.choices[0].message.content if response.choices else None
+    if not message:
+        raise AIPlannerError("模型未返回内容，请稍后重试")
+    return str(message).strip()
+
+
+class _AsyncQwenRunner:
+    """
+    在一个守护线程的事件循环上执行 AsyncOpenAI 调用。
+
+    客户端、信号量只在事件循环线程内访问；在途表由请求线程读写，受锁保护。
+    进程 fork 后（例如 gunicorn 预加载）事件循环线程不会被继承，按 pid 重新启动。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pid: int | None = None
+        self._clients: "collections.OrderedDict[str, Any]" = collections.OrderedDict()
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+        self._inflight: Dict[tuple, Future] = {}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._run_loop,
+            args=(loop,),
+            name="qwen-async-client",
+            daemon=True,
+        ).start()
+        self._loop = loop
+        self._pid = os.getpid()
+        self._clients = collections.OrderedDict()
+        self._semaphores = {}
+        self._inflight = {}
+        return loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(
+        self,
+        target: _QwenTarget,
+        kwargs: Dict[str, Any],
+        max_retries: int,
+        backoff: float,
+    ) -> Future:
+        """提交一次调用；完全相同的调用仍在进行时直接复用其 Future。"""
+        key = (
+            target.cache_key,
+            kwargs["model"],
+            kwargs["messages"][-1]["content"],
+            kwargs.get("max_tokens"),
+        )
+        with self._lock:
+            loop = self._ensure_loop()
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = asyncio.run_coroutine_threadsafe(
+                self._complete(target, kwargs, max_retries, backoff), loop
+            )
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: tuple, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _client_for(self, target: _QwenTarget):
+        client = self._clients.get(target.cache_key)
+        if client is None:
+            client = _build_async_qwen_client(target)
+            self._clients[target.cache_key] = client
+            while len(self._clients) > _MAX_CACHED_CLIENTS:
+                _key, evicted = self._clients.popitem(last=False)
+                close = getattr(evicted, "close", None)
+                if callable(close):
+                    asyncio.ensure_future(close())
+        self._clients.move_to_end(target.cache_key)
+        return client
+
+    def _semaphore_for(self, limit: int) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(limit)
+        if semaphore is None:
+            semaphore = self._semaphores[limit] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def _complete(
+        self,
+        target: _QwenTarget,
+        kwargs: Dict[str, Any],
+        max_retries: int,
+        backoff: float,
+    ) -> str:
+        client = self._client_for(target)
+        semaphore = self._semaphore_for(target.max_connections)
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    response = await client.chat.completions.create(**kwargs)
+                return _message_text(response)
+            except Exception as exc:
+                # 退避期间不占用并发名额，也不阻塞任何线程
+                await asyncio.sleep(
+                    _retry_delay_or_raise(exc, attempt, max_retries, backoff, target.model_name)
+                )
+                attempt += 1
+
+
+_async_runner = _AsyncQwenRunner()
+
+
+def _call_qwen_sync(prompt: str, max_tokens: int | None) -> str:
+    client, model_name = _configure_qwen()
+    max_retries, backoff = _retry_settings()
     attempt = 0
-    last_error: Exception | None = None
-    while attempt <= max_retries:
+    while True:
         try:
             response = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": prompt}],
+                **_completion_kwargs(model_name, prompt, max_tokens)
             )
-            if not response or not getattr(response, "choices", None):
-                raise AIPlannerError("未能生成有效的模型输出")
-            message = response.choices[0].message.content if response.choices else None
-            if not message:
-                raise AIPlannerError("模型未返回内容，请稍后重试")
-            return str(message).strip()
-        except (APIStatusError, RateLimitError) as exc:
-            last_error = exc
-            detail = getattr(exc, "message", None) or getattr(exc, "response", None) or str(exc)
-            # 对临时性错误做重试
-            transient = any(
-                key in str(detail).lower()
-                for key in [
-                    "timeout",
-                    "temporarily",
-                    "unavailable",
-                    "deadline",
-                    "internal",
-                    "quota",
-                    "network",
-                    "503",
-                ]
+            return _message_text(response)
+        except Exception as exc:
+            time.sleep(_retry_delay_or_raise(exc, attempt, max_retries, backoff, model_name))
+            attempt += 1
+
+
+def _call_qwen(prompt: str, *, max_tokens: int | None = None) -> str:
+    if AsyncOpenAI is None or not current_app.config.get("AI_ASYNC_CLIENT", True):
+        return _call_qwen_sync(prompt, max_tokens)
+    target = _qwen_target(AsyncOpenAI)
+    max_retries, backoff = _retry_settings()
+    timeout = float(current_app.config.get("AI_REQUEST_TIMEOUT", _DEFAULT_REQUEST_TIMEOUT))
+    future = _async_runner.submit(
+        target,
+        _completion_kwargs(target.model_name, prompt, max_tokens),
+        max_retries,
+        backoff,
+    )
+    try:
+        return future.result(timeout=timeout if timeout > 0 else None)
+    except FutureTimeoutError as exc:
+        raise AIPlannerError("调用通义千问超时，请稍后重试") from exc
+
+
+def _stream_qwen(prompt: str, *, max_tokens: int | None = None) -> Iterator[str]:
+    """
+    以流式方式调用模型，逐段产出增量文本。
+
+    建立连接阶段的失败按 _call_qwen 的规则重试；一旦开始产出内容，
+    中途失败直接抛出 AIPlannerError，由调用方决定如何收尾。
+    """
+    client, model_name = _configure_qwen()
+    max_retries, backoff = _retry_settings()
+    attempt = 0
+    while True:
+        try:
+            stream = client.chat.completions.create(
+                stream=True, **_completion_kwargs(model_name, prompt, max_tokens)
             )
-            if attempt < max_retries and transient:
-                time.sleep(max(0.2, 0.6 * (backoff ** attempt)))
-                attempt += 1
-                continue
-            raise AIPlannerError(
-                f"调用通义千问接口失败：{detail}（模型：{model_name}）"
-            ) from exc
-        except APIConnectionError as exc:
-            last_error = exc
-            if attempt < max_retries:
-                time.sleep(max(0.2, 0.6 * (backoff ** attempt)))
-                attempt += 1
-                continue
-            raise AIPlannerError("连接通义千问失败，请检查网络后重试") from exc
+            break
         except Exception as exc:
-            last_error = exc
-            # 常见 SSL/连接错误
-            msg = str(exc)
-            if attempt < max_retries and any(
-                s in msg for s in [
-                    "SSL:",
-                    "EOF occurred",
-                    "Connection reset",
-                    "Connection aborted",
-                    "RemoteDisconnected",
-                ]
-            ):
-                time.sleep(max(0.2, 0.6 * (backoff ** attempt)))
-                attempt += 1
-                continue
-            raise AIPlannerError(f"生成内容失败，请稍后重试：{exc}") from exc
+            time.sleep(_retry_delay_or_raise(exc, attempt, max_retries, backoff, model_name))
+            attempt += 1
 
-    # 理论上到不了这里
-    if last_error:
-        raise AIPlannerError(f"生成内容失败，请稍后重试：{last_error}")
-    raise AIPlannerError("生成内容失败：未知原因")
+    emitted = False
+    try:
+        for chunk in stream:
+            choices = getattr(chunk, "choices", None)
+            if not choices:
+                continue
+            delta = getattr(choices[0], "delta", None)
+            text = getattr(delta, "content", None) if delta is not None else None
+            if text:
+                emitted = True
+                yield str(text)
+    except AIPlannerError:
+        raise
+    except Exception as exc:
+        raise AIPlannerError(f"生成内容失败，请稍后重试：{exc}") from exc
+    finally:
+        close = getattr(stream, "close", None)
+        if callable(close):
+            close()
+    if not emitted:
+        raise AIPlannerError("模型未返回内容，请稍后重试")
 
 
-__all__ = ["_configure_qwen", "_call_qwen", "_qwen_client_cache"]
+__all__ = [
+    "_configure_qwen",
+    "_call_qwen",
+    "_stream_qwen",
+    "_token_budget",
+    "_qwen_client_cache",
+]
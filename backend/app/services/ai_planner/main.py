@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 from flask import current_app
 
+from app import db
 from app.models import AIInsight
 
 from .aggregation import _aggregate_learning_data
@@ -16,6 +17,11 @@ from .date_ranges import (
 )
 from .errors import AIPlannerError
 from .persistence import _save_insight
+from .response_cache import (
+    briefing_from_insight,
+    briefing_prompt_hash,
+    find_cached_insight,
+)
 
 
 def _resolve_briefing_context(
@@ -60,7 +66,18 @@ def _generate_briefing_payload(
     scope: str,
     date_str: Optional[str] = None,
     stage_id: Optional[int] = None,
+    *,
+    refresh: bool = False,
+    on_stage: Optional[Callable[[str], None]] = None,
 ) -> Dict[str, Any]:
+    """
+    生成结构化简报。
+
+    输入摘要命中 TTL 内的已存记录时直接返回其简报（cached_insight 指向该记录），
+    refresh=True 跳过缓存重新调用模型；on_stage 在进入各阶段时收到阶段名。
+    """
+    if on_stage is not None:
+        on_stage("aggregating")
     context = _resolve_briefing_context(user_id, scope, date_str, stage_id)
     meta = {
         "scope": scope,
@@ -71,16 +88,40 @@ def _generate_briefing_payload(
         "next_stage_name": context["next_stage_name"],
         "next_days": context["next_days"],
     }
+    fallback_briefing = _briefing_fallback(meta, context["stats"], context["prev_stats"])
+    prompt_hash = briefing_prompt_hash(fallback_briefing)
+    if not refresh:
+        cached_insight = find_cached_insight(user_id, prompt_hash)
+        cached_briefing = (
+            briefing_from_insight(cached_insight) if cached_insight is not None else None
+        )
+        if cached_briefing is not None:
+            return {
+                "briefing": cached_briefing,
+                "context": context,
+                "prompt_hash": prompt_hash,
+                "cached_insight": cached_insight,
+            }
+    if on_stage is not None:
+        on_stage("generating")
     try:
-        result = build_briefing_result(meta, context["stats"], context["prev_stats"])
+        result = build_briefing_result(
+            meta,
+            context["stats"],
+            context["prev_stats"],
+            fallback_briefing=fallback_briefing,
+        )
     except AIPlannerError:
         if current_app.config.get("AI_ENABLE_FALLBACK", True):
             result = _briefing_fallback(meta, context["stats"], context["prev_stats"])
         else:
             raise
+    llm_generated = result["meta"].get("generation_mode") == "llm_enhanced"
     return {
         "briefing": result,
         "context": context,
+        "prompt_hash": prompt_hash if llm_generated else None,
+        "cached_insight": None,
     }
 
 
@@ -93,6 +134,8 @@ def _persist_briefing_insight(
     briefing: Dict[str, Any],
     context: Dict[str, Any],
     output_text: str,
+    prompt_hash: Optional[str] = None,
+    commit: bool = True,
 ):
     snapshot = {
         "workflow_type": "briefing",
@@ -124,6 +167,35 @@ def _persist_briefing_insight(
         next_end=context["next_end"],
         snapshot=snapshot,
         output_text=output_text,
+        prompt_hash=prompt_hash,
+        commit=commit,
+    )
+
+
+def _insight_for_payload(
+    payload: Dict[str, Any],
+    *,
+    user_id: int,
+    insight_type: str,
+    scope: str,
+    stage_id: Optional[int],
+    output_text: str,
+    commit: bool = True,
+):
+    """缓存命中且类型相同时复用原记录，否则落一条新记录。"""
+    cached_insight = payload["cached_insight"]
+    if cached_insight is not None and cached_insight.insight_type == insight_type:
+        return cached_insight
+    return _persist_briefing_insight(
+        user_id=user_id,
+        insight_type=insight_type,
+        scope=scope,
+        stage_id=stage_id,
+        briefing=payload["briefing"],
+        context=payload["context"],
+        output_text=output_text,
+        prompt_hash=payload["prompt_hash"],
+        commit=commit,
     )
 
 
@@ -132,19 +204,22 @@ def generate_briefing(
     scope: str,
     date_str: Optional[str] = None,
     stage_id: Optional[int] = None,
+    refresh: bool = False,
 ) -> Dict[str, Any]:
-    payload = _generate_briefing_payload(user_id, scope, date_str, stage_id)
+    payload = _generate_briefing_payload(
+        user_id, scope, date_str, stage_id, refresh=refresh
+    )
     briefing = payload["briefing"]
-    insight = _persist_briefing_insight(
+    insight = _insight_for_payload(
+        payload,
         user_id=user_id,
         insight_type="briefing",
         scope=scope,
         stage_id=stage_id,
-        briefing=briefing,
-        context=payload["context"],
         output_text=briefing["narrative"]["full_markdown"],
     )
     briefing["meta"]["generated_at"] = insight.created_at.isoformat()
+    briefing["meta"]["cache_hit"] = payload["cached_insight"] is not None
     briefing["insight_id"] = insight.id
     return briefing
 
@@ -154,19 +229,22 @@ def generate_analysis(
     scope: str,
     date_str: Optional[str] = None,
     stage_id: Optional[int] = None,
+    refresh: bool = False,
 ) -> Dict:
-    payload = _generate_briefing_payload(user_id, scope, date_str, stage_id)
+    payload = _generate_briefing_payload(
+        user_id, scope, date_str, stage_id, refresh=refresh
+    )
     briefing = payload["briefing"]
     output_text = briefing["narrative"]["analysis_markdown"]
-    insight = _persist_briefing_insight(
+    insight = _insight_for_payload(
+        payload,
         user_id=user_id,
         insight_type="analysis",
         scope=scope,
         stage_id=stage_id,
-        briefing=briefing,
-        context=payload["context"],
         output_text=output_text,
     )
+    briefing["meta"]["cache_hit"] = payload["cached_insight"] is not None
     return {
         "insight_id": insight.id,
         "text": output_text,
@@ -181,19 +259,22 @@ def generate_plan(
     scope: str,
     date_str: Optional[str] = None,
     stage_id: Optional[int] = None,
+    refresh: bool = False,
 ) -> Dict:
-    payload = _generate_briefing_payload(user_id, scope, date_str, stage_id)
+    payload = _generate_briefing_payload(
+        user_id, scope, date_str, stage_id, refresh=refresh
+    )
     briefing = payload["briefing"]
     output_text = briefing["narrative"]["plan_markdown"]
-    insight = _persist_briefing_insight(
+    insight = _insight_for_payload(
+        payload,
         user_id=user_id,
         insight_type="plan",
         scope=scope,
         stage_id=stage_id,
-        briefing=briefing,
-        context=payload["context"],
         output_text=output_text,
     )
+    briefing["meta"]["cache_hit"] = payload["cached_insight"] is not None
     return {
         "insight_id": insight.id,
         "text": output_text,
@@ -204,6 +285,71 @@ def generate_plan(
     }
 
 
+_BUNDLE_OUTPUTS = (
+    ("briefing", "full_markdown"),
+    ("analysis", "analysis_markdown"),
+    ("plan", "plan_markdown"),
+)
+
+
+def generate_insight_bundle(
+    user_id: int,
+    scope: str,
+    date_str: Optional[str] = None,
+    stage_id: Optional[int] = None,
+    refresh: bool = False,
+    on_stage: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    只生成一次简报，同时得到简报、分析、规划三份结果。
+
+    三条 AIInsight 在同一事务中提交，返回结构与 generate_briefing /
+    generate_analysis / generate_plan 分别返回的一致。
+    """
+    payload = _generate_briefing_payload(
+        user_id, scope, date_str, stage_id, refresh=refresh, on_stage=on_stage
+    )
+    briefing = payload["briefing"]
+    if on_stage is not None:
+        on_stage("persisting")
+    insights = {}
+    try:
+        for insight_type, narrative_key in _BUNDLE_OUTPUTS:
+            insights[insight_type] = _insight_for_payload(
+                payload,
+                user_id=user_id,
+                insight_type=insight_type,
+                scope=scope,
+                stage_id=stage_id,
+                output_text=briefing["narrative"][narrative_key],
+                commit=False,
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    briefing["meta"]["generated_at"] = insights["briefing"].created_at.isoformat()
+    briefing["meta"]["cache_hit"] = payload["cached_insight"] is not None
+    briefing["insight_id"] = insights["briefing"].id
+    return {
+        "briefing": briefing,
+        "analysis": {
+            "insight_id": insights["analysis"].id,
+            "text": briefing["narrative"]["analysis_markdown"],
+            "generated_at": insights["analysis"].created_at.isoformat(),
+            "period_label": briefing["meta"]["period_label"],
+        },
+        "plan": {
+            "insight_id": insights["plan"].id,
+            "text": briefing["narrative"]["plan_markdown"],
+            "generated_at": insights["plan"].created_at.isoformat(),
+            "period_label": briefing["meta"]["period_label"],
+            "next_period_label": briefing["meta"]["next_period_label"],
+        },
+    }
+
+
 def list_history(
     user_id: int,
     limit: int = 20,
@@ -227,4 +373,10 @@ def list_history(
     return [item.to_dict() for item in items]
 
 
-__all__ = ["generate_briefing", "generate_analysis", "generate_plan", "list_history"]
+__all__ = [
+    "generate_briefing",
+    "generate_analysis",
+    "generate_plan",
+    "generate_insight_bundle",
+    "list_history",
+]
@@ -16,6 +16,8 @@ def _save_insight(
     next_end: Optional[date],
     snapshot: Dict,
     output_text: str,
+    prompt_hash: Optional[str] = None,
+    commit: bool = True,
 ) -> AIInsight:
     insight = AIInsight(
         user_id=user_id,
@@ -28,9 +30,14 @@ def _save_insight(
         next_end_date=next_end,
         input_snapshot=snapshot,
         output_text=output_text,
+        prompt_hash=prompt_hash,
     )
     db.session.add(insight)
-    db.session.commit()
+    if commit:
+        db.session.commit()
+    else:
+        # 由调用方与同一批记录一起提交
+        db.session.flush()
     return insight
 
 
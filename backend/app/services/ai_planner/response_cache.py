@@ -0,0 +1,74 @@
+"""
+简报响应缓存
+
+简报、分析、规划共用同一份结构化简报。模型输入完全由 _build_prompt_payload
+的结果决定，因此以「提示词载荷 + 模型名 + 缓存版本」的哈希作为内容地址，
+写在 AIInsight.prompt_hash 上：
+- 周期内数据没有变化时哈希不变，直接复用最近一条 LLM 生成的记录，不再调用模型；
+- 数据一旦变化哈希随之改变，无需显式失效；
+- 只缓存 llm_enhanced 的结果，规则兜底不会占住缓存；
+- AI_RESPONSE_CACHE_TTL_SECONDS 限制复用的时长，0 表示关闭；调用方可传 refresh 跳过。
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from app.models import AIInsight
+
+from .briefing import _build_prompt_payload
+
+# 提示词模板或归一化逻辑变化时递增，使旧缓存整体失效
+PROMPT_CACHE_VERSION = 1
+_DEFAULT_RESPONSE_CACHE_TTL_SECONDS = 6 * 3600
+_BRIEFING_KEYS = ("meta", "diagnosis", "battle_plan", "evidence", "narrative")
+
+
+def briefing_prompt_hash(fallback_briefing: Dict[str, Any]) -> str:
+    """规则简报对应的模型输入摘要（sha256 十六进制）。"""
+    payload = {
+        "version": PROMPT_CACHE_VERSION,
+        "model": current_app.config.get("QWEN_MODEL"),
+        "prompt": _build_prompt_payload(fallback_briefing),
+    }
+    encoded = json.dumps(
+        payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def find_cached_insight(user_id: int, prompt_hash: str) -> Optional[AIInsight]:
+    """TTL 内该用户同一输入摘要下最近的一条记录。"""
+    ttl_seconds = float(
+        current_app.config.get(
+            "AI_RESPONSE_CACHE_TTL_SECONDS", _DEFAULT_RESPONSE_CACHE_TTL_SECONDS
+        )
+    )
+    if ttl_seconds <= 0:
+        return None
+    return (
+        AIInsight.query.filter(
+            AIInsight.user_id == user_id,
+            AIInsight.prompt_hash == prompt_hash,
+            AIInsight.created_at >= datetime.utcnow() - timedelta(seconds=ttl_seconds),
+        )
+        .order_by(AIInsight.created_at.desc(), AIInsight.id.desc())
+        .first()
+    )
+
+
+def briefing_from_insight(insight: AIInsight) -> Optional[Dict[str, Any]]:
+    """从记录的输入快照还原结构化简报；快照不完整时返回 None。"""
+    snapshot = insight.input_snapshot or {}
+    if any(not snapshot.get(key) for key in _BRIEFING_KEYS):
+        return None
+    return {key: copy.deepcopy(snapshot[key]) for key in _BRIEFING_KEYS}
+
+
+__all__ = ["PROMPT_CACHE_VERSION", "briefing_prompt_hash", "find_cached_insight", "briefing_from_insight"]
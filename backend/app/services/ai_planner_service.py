@@ -34,10 +34,19 @@ from app.services.ai_planner import (  # type: ignore[F401]
     create_chat_message,
     generate_analysis,
     generate_briefing,
+    generate_insight_bundle,
     generate_plan,
+    get_ai_job,
+    iter_ai_job_events,
     list_chat_messages,
     list_chat_sessions,
+    list_ai_jobs,
     list_history,
+    retry_ai_job,
+    run_ai_jobs,
+    stream_chat_message,
+    submit_ai_job,
+    submit_insight_job,
     normalize_requested_modules,
     normalize_requested_windows,
 )
@@ -69,10 +78,19 @@ __all__ = [
     "normalize_requested_modules",
     "normalize_requested_windows",
     "create_chat_message",
+    "stream_chat_message",
     "list_chat_sessions",
     "list_chat_messages",
     "generate_briefing",
     "generate_analysis",
     "generate_plan",
+    "generate_insight_bundle",
+    "submit_ai_job",
+    "submit_insight_job",
+    "get_ai_job",
+    "list_ai_jobs",
+    "retry_ai_job",
+    "run_ai_jobs",
+    "iter_ai_job_events",
     "list_history",
 ]
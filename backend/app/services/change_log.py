@@ -0,0 +1,243 @@
+"""
+数据变更日志（增量导出的行版本与墓碑）
+
+大多数业务表没有 updated_at，增量导出改用 data_change 表记录行版本：
+- ORM 对导出表的增删改在 after_flush 中按 (用户, 表, 主键) 写入 upsert / delete，
+  与业务数据在同一事务内提交或回滚，data_change.id 即递增的版本号；
+- 写入变更前先锁住用户行（SELECT ... FOR UPDATE，直到事务结束），同一用户的变更写入
+  因此串行：id 的分配顺序与提交顺序一致，不会出现较小的 id 晚于水位线才提交、
+  被增量导出跳过的情况（SQLite 本身串行化写事务，不需要行锁）；
+- 绕过 ORM 的批量更新需显式调用 record_changes；
+- 清空或整体导入用户数据后调用 reset_change_log：写入 reset 标记并删除更早的记录，
+  早于该标记的水位线不再能生成增量，客户端需要重新全量导出。
+
+派生表（daily_data / weekly_data）在导入时统一重建，不参与增量，也不记录变更。
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (
+    Category,
+    CountdownEvent,
+    DataChange,
+    LogEntry,
+    Milestone,
+    MilestoneAttachment,
+    MilestoneCategory,
+    Motto,
+    Setting,
+    Stage,
+    SubCategory,
+    User,
+)
+
+# 直接带 user_id 的表
+_USER_OWNED_MODELS = (
+    Setting,
+    Stage,
+    Category,
+    Motto,
+    MilestoneCategory,
+    Milestone,
+    CountdownEvent,
+)
+# 通过父表归属用户的表：模型 -> (外键字段, 父模型)
+_CHILD_MODELS = {
+    LogEntry: ("stage_id", Stage),
+    SubCategory: ("category_id", Category),
+    MilestoneAttachment: ("milestone_id", Milestone),
+}
+_PARENT_MODELS = {parent for _field, parent in _CHILD_MODELS.values()}
+TRACKED_TABLES = {
+    model.__tablename__: model
+    for model in _USER_OWNED_MODELS + tuple(_CHILD_MODELS)
+}
+
+
+def row_key(table_name: str, values: dict) -> str:
+    """一行在用户范围内的主键；设置表以 key 区分，其余表用 id。"""
+    if table_name == Setting.__tablename__:
+        return str(values.get("key"))
+    return str(values.get("id"))
+
+
+def _object_key(obj) -> str:
+    if isinstance(obj, Setting):
+        return str(obj.key)
+    return str(obj.id)
+
+
+def current_version(user_id: int) -> int:
+    """用户当前的数据版本（尚无变更记录时为 0）。"""
+    version = (
+        db.session.query(func.max(DataChange.id))
+        .filter(DataChange.user_id == int(user_id))
+        .scalar()
+    )
+    return int(version or 0)
+
+
+def changes_since(
+    user_id: int, since: int
+) -> Tuple[int, Dict[str, Dict[str, str]]]:
+    """
+    返回 (当前版本, {表名: {行主键: 最后一次操作}})，只包含 since 之后的变更。
+
+    水位线早于最近一次重置或晚于当前版本时抛出 ValueError。
+    """
+    user_id = int(user_id)
+    since = int(since)
+    version = current_version(user_id)
+    if since < 0 or since > version:
+        raise ValueError(f"无效的水位线 {since}（当前版本 {version}）")
+    reset_version = (
+        db.session.query(func.max(DataChange.id))
+        .filter(DataChange.user_id == user_id, DataChange.op == "reset")
+        .scalar()
+    )
+    if reset_version and since < reset_version:
+        raise ValueError("水位线早于最近一次清空或全量导入，请重新全量导出")
+
+    changes: Dict[str, Dict[str, str]] = {}
+    rows = (
+        db.session.query(DataChange.table_name, DataChange.row_key, DataChange.op)
+        .filter(
+            DataChange.user_id == user_id,
+            DataChange.id > since,
+            DataChange.id <= version,
+            DataChange.op != "reset",
+        )
+        .order_by(DataChange.id.asc())
+        .yield_per(1000)
+    )
+    for table_name, key, op in rows:
+        changes.setdefault(table_name, {})[key] = op
+    return version, changes
+
+
+def _lock_users(connection, user_ids) -> None:
+    """锁住这些用户行直到当前事务结束；按 id 排序加锁，避免多个用户时互相等待。"""
+    table = User.__table__
+    connection.execute(
+        select(table.c.id)
+        .where(table.c.id.in_(sorted(user_ids)))
+        .order_by(table.c.id)
+        .with_for_update()
+    )
+
+
+def record_changes(
+    user_id: int, table_name: str, row_keys: Iterable, op: str = "upsert"
+) -> None:
+    """绕过 ORM 写入导出表后调用，随当前事务提交（不单独提交）。"""
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": int(user_id),
+            "table_name": table_name,
+            "row_key": str(key),
+            "op": op,
+            "changed_at": now,
+        }
+        for key in row_keys
+    ]
+    if rows:
+        _lock_users(db.session.connection(), {int(user_id)})
+        db.session.execute(DataChange.__table__.insert(), rows)
+
+
+def reset_change_log(user_id: int) -> None:
+    """用户数据被整体替换：写入 reset 标记并丢弃更早的变更（不单独提交）。"""
+    user_id = int(user_id)
+    record_changes(user_id, "*", ["*"], op="reset")
+    reset_version = current_version(user_id)
+    DataChange.query.filter(
+        DataChange.user_id == user_id, DataChange.id < reset_version
+    ).delete(synchronize_session=False)
+
+
+def _loaded_value(obj, field: str) -> Optional[int]:
+    """当前值；已删除对象取 flush 前加载的值。"""
+    value = getattr(obj, field, None)
+    if value is None:
+        deleted = db.inspect(obj).attrs[field].history.deleted
+        value = deleted[0] if deleted else None
+    return value
+
+
+def _after_flush(session: Session, _flush_context) -> None:
+    pending = []
+    owners: Dict[Tuple[type, int], int] = {}
+    for op, objects, check_modified in (
+        ("upsert", session.new, False),
+        ("upsert", session.dirty, True),
+        ("delete", session.deleted, False),
+    ):
+        for obj in list(objects):
+            model = type(obj)
+            if model not in _USER_OWNED_MODELS and model not in _CHILD_MODELS:
+                continue
+            if check_modified and not session.is_modified(obj, include_collections=False):
+                continue
+            if model in _PARENT_MODELS:
+                # 同一次 flush 中被级联删除的父行已不在库中，先从会话对象里记下归属
+                owners[(model, obj.id)] = _loaded_value(obj, "user_id")
+            pending.append((op, obj))
+    if not pending:
+        return
+
+    # 子表按父表主键批量查归属用户
+    missing: Dict[type, set] = {}
+    for _op, obj in pending:
+        parent = _CHILD_MODELS.get(type(obj))
+        if parent is None:
+            continue
+        field, parent_model = parent
+        parent_id = _loaded_value(obj, field)
+        if parent_id is not None and (parent_model, parent_id) not in owners:
+            missing.setdefault(parent_model, set()).add(parent_id)
+    for parent_model, ids in missing.items():
+        table = parent_model.__table__
+        rows = session.connection().execute(
+            select(table.c.id, table.c.user_id).where(table.c.id.in_(sorted(ids)))
+        )
+        for parent_id, user_id in rows:
+            owners[(parent_model, parent_id)] = user_id
+
+    now = datetime.utcnow()
+    rows = []
+    for op, obj in pending:
+        model = type(obj)
+        if model in _USER_OWNED_MODELS:
+            user_id = _loaded_value(obj, "user_id")
+        else:
+            field, parent_model = _CHILD_MODELS[model]
+            user_id = owners.get((parent_model, _loaded_value(obj, field)))
+        if user_id is None:
+            continue
+        rows.append(
+            {
+                "user_id": user_id,
+                "table_name": model.__tablename__,
+                "row_key": _object_key(obj),
+                "op": op,
+                "changed_at": now,
+            }
+        )
+    if rows:
+        connection = session.connection()
+        _lock_users(connection, {row["user_id"] for row in rows})
+        connection.execute(DataChange.__table__.insert(), rows)
+
+
+def register_change_log_listeners() -> None:
+    """注册导出表变更时写入 data_change 的 ORM 钩子（可重复调用）。"""
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
@@ -4,22 +4,53 @@
 """
 
 import io
-from typing import cast, Sequence
-import matplotlib
+import threading
+from typing import Any, cast, Sequence
 
-matplotlib.use("Agg")  # 使用非GUI后端
-import matplotlib.pyplot as plt
 import numpy as np
 
-# 配置matplotlib中文显示
-plt.style.use("seaborn-v0_8-whitegrid")
-try:
-    plt.rcParams["font.sans-serif"] = ["SimHei", "DejaVu Sans"]
-    plt.rcParams["axes.unicode_minus"] = False
-except Exception:
-    print(
-        "Warning: Chinese font 'SimHei' not found. Chart labels may not render correctly."
-    )
+# matplotlib 导入耗时且占内存，首次绘图时才加载；
+# gunicorn 预加载时可调用 load_pyplot 在 fork 前完成
+_DEFAULT_BACKEND = "Agg"  # 使用非GUI后端
+_pyplot: Any = None
+_pyplot_lock = threading.Lock()
+
+
+def load_pyplot(backend: str | None = None):
+    """导入并初始化 matplotlib.pyplot，重复调用直接返回已加载的模块。"""
+    global _pyplot
+    if _pyplot is not None:
+        return _pyplot
+    with _pyplot_lock:
+        if _pyplot is not None:
+            return _pyplot
+        if backend is None:
+            backend = _configured_backend()
+        import matplotlib
+
+        matplotlib.use(backend)
+        import matplotlib.pyplot as plt
+
+        # 配置matplotlib中文显示
+        plt.style.use("seaborn-v0_8-whitegrid")
+        try:
+            plt.rcParams["font.sans-serif"] = ["SimHei", "DejaVu Sans"]
+            plt.rcParams["axes.unicode_minus"] = False
+        except Exception:
+            print(
+                "Warning: Chinese font 'SimHei' not found. Chart labels may not render correctly."
+            )
+        _pyplot = plt
+        return plt
+
+
+def _configured_backend() -> str:
+    from flask import current_app, has_app_context
+
+    if has_app_context():
+        return current_app.config.get("MATPLOTLIB_BACKEND", _DEFAULT_BACKEND)
+    return _DEFAULT_BACKEND
+
 
 # 图表颜色配置
 COLORS = {
@@ -170,6 +201,7 @@ def export_trends_image(username, trend_data):
     if not trend_data.get("has_data"):
         return None
 
+    plt = load_pyplot()
     try:
         fig, axes = plt.subplots(2, 2, figsize=(20, 14), dpi=120)
         fig.suptitle(f"{username} 的学习趋势总览", fontsize=24, weight="bold", y=0.98)
@@ -203,6 +235,7 @@ def export_category_image(username, category_data):
     Returns:
         BytesIO: 包含 PNG 图片的缓冲区
     """
+    plt = load_pyplot()
     try:
         if not category_data or not category_data["main"]["labels"]:
             # 没有数据时显示提示
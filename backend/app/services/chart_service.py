@@ -2,7 +2,9 @@
 图表统计服务
 """
 
+import bisect
 import collections
+import contextlib
 import copy
 import hashlib
 import json
@@ -10,26 +12,48 @@ import math
 import os
 import threading
 import time
+from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 from typing import Any, Sequence, TypedDict
-from sqlalchemy import func, desc
+from sqlalchemy import Float, cast, func, literal, select, union_all
 import numpy as np
 from flask import current_app, has_app_context
 
 from app import db
-from app.models import Stage, LogEntry, DailyData, Category, SubCategory
-from .forecast_service import DAILY_CONFIG, WEEKLY_CONFIG, build_trend_forecasts
+from app.models import Stage, LogEntry, DailyData, DailyRollup, Category, SubCategory
+from .forecast_service import (
+    DAILY_CONFIG,
+    WEEKLY_CONFIG,
+    build_trend_forecasts,
+)
+from .forecast_cache_backend import (
+    CACHE_BACKEND_NONE,
+    ForecastCacheBackend,
+    create_forecast_cache_backend,
+    default_lease_owner,
+)
+from .efficiency_writer import flush_pending_efficiency
+from .forecast_worker_pool import EXECUTOR_PROCESS, ForecastWorkerPool
 from .helpers import get_custom_week_info
 
 _OVERVIEW_CACHE_TTL_SECONDS = 20.0
 _PENDING_OVERVIEW_CACHE_TTL_SECONDS = 3.0
 _FORECAST_CACHE_TTL_SECONDS = 15 * 60.0
+# 共享缓存中的结果按 trained_for_date 失效，TTL 只用来回收长期不活跃的用户
+_FORECAST_SHARED_TTL_SECONDS = 24 * 3600.0
+# 其他进程持有训练租约时，本进程隔多久再去共享缓存查看结果
+_FORECAST_REMOTE_POLL_SECONDS = 5.0
 _overview_cache_lock = threading.Lock()
 _overview_cache: dict[int, tuple[float, dict]] = {}
 _overview_inflight: dict[int, threading.Event] = {}
 _forecast_cache_lock = threading.Lock()
 _forecast_cache: dict[int, dict[str, Any]] = {}
 _forecast_inflight: dict[int, threading.Event] = {}
+_forecast_pool_lock = threading.Lock()
+_forecast_pool: ForecastWorkerPool | None = None
+_forecast_backend_lock = threading.Lock()
+_forecast_cache_backend: ForecastCacheBackend | None = None
+_forecast_cache_backend_key: tuple[str, str, int] | None = None
 _FORECAST_DATASET_KEYS = (
     "daily_duration_data",
     "daily_efficiency_data",
@@ -67,66 +91,105 @@ def _calculate_sma(
     return sma_values
 
 
-def _calculate_kpis(user_id, stage_ids):
-    """为用户计算关键性能指标(KPIs)"""
-    kpis = {}
+@dataclass(frozen=True)
+class _OverviewColumns:
+    """统计总览所需的列式数据，日期统一存为 date.toordinal() 整数"""
+
+    log_days: np.ndarray
+    log_minutes: np.ndarray
+    efficiency_days: np.ndarray
+    efficiency_values: np.ndarray
 
-    total_duration_minutes = (
-        db.session.query(func.sum(LogEntry.actual_duration))
-        .filter(LogEntry.stage_id.in_(stage_ids))
-        .scalar()
-        or 0
+    @property
+    def has_logs(self) -> bool:
+        return self.log_days.size > 0
+
+
+def _load_overview_columns(user_id: int) -> _OverviewColumns:
+    """
+    一次查询取回总览需要的全部原始列，不经过 ORM 实例化。
+
+    汇总表中的每日时长与 DailyData 中的每日效率通过 UNION ALL 合并，
+    kind=0 为时长行、kind=1 为效率行；效率行按 id 排序，
+    同一天存在多个阶段的效率时以后写入的一条为准（与旧的 dict 构建顺序一致）。
+    读取前先落库该用户在写后队列中尚未处理的效率更新。
+    """
+    flush_pending_efficiency(user_id)
+    duration_rows = select(
+        literal(0).label("kind"),
+        DailyRollup.log_date.label("log_date"),
+        cast(DailyRollup.minutes, Float).label("value"),
+        DailyRollup.id.label("row_id"),
+    ).where(DailyRollup.user_id == user_id)
+    efficiency_rows = (
+        select(
+            literal(1).label("kind"),
+            DailyData.log_date.label("log_date"),
+            cast(DailyData.efficiency, Float).label("value"),
+            DailyData.id.label("row_id"),
+        )
+        .join(Stage, DailyData.stage_id == Stage.id)
+        .where(Stage.user_id == user_id)
+    )
+    statement = union_all(duration_rows, efficiency_rows).order_by("kind", "row_id")
+    rows = db.session.execute(statement).all()
+
+    row_count = len(rows)
+    kinds = np.fromiter((row[0] for row in rows), dtype=np.int8, count=row_count)
+    days = np.fromiter(
+        (row[1].toordinal() for row in rows), dtype=np.int64, count=row_count
     )
-    total_days_with_logs = (
-        db.session.query(func.count(func.distinct(LogEntry.log_date)))
-        .filter(LogEntry.stage_id.in_(stage_ids))
-        .scalar()
-        or 0
+    values = np.fromiter(
+        (np.nan if row[2] is None else row[2] for row in rows),
+        dtype=np.float64,
+        count=row_count,
     )
+    is_duration = kinds == 0
+    return _OverviewColumns(
+        log_days=days[is_duration],
+        log_minutes=np.nan_to_num(values[is_duration], nan=0.0),
+        efficiency_days=days[~is_duration],
+        efficiency_values=values[~is_duration],
+    )
+
+
+def _calculate_kpis(columns: _OverviewColumns):
+    """为用户计算关键性能指标(KPIs)"""
+    kpis = {}
+
+    total_duration_minutes = float(columns.log_minutes.sum())
+    total_days_with_logs = int(np.unique(columns.log_days).size)
     kpis["avg_daily_minutes"] = (
         round(total_duration_minutes / total_days_with_logs, 1)
         if total_days_with_logs > 0
         else 0
     )
 
-    top_efficiency_day = (
-        DailyData.query.join(Stage)
-        .filter(Stage.user_id == user_id)
-        .order_by(desc(DailyData.efficiency))
-        .first()
-    )
-    if top_efficiency_day and top_efficiency_day.efficiency is not None:
+    valid_efficiency = ~np.isnan(columns.efficiency_values)
+    if valid_efficiency.any():
+        candidates = np.flatnonzero(valid_efficiency)
+        top_index = candidates[np.argmax(columns.efficiency_values[candidates])]
+        top_date = date.fromordinal(int(columns.efficiency_days[top_index]))
+        top_efficiency = float(columns.efficiency_values[top_index])
         kpis["efficiency_star"] = (
-            f"{top_efficiency_day.log_date.strftime('%Y-%m-%d')} (效率: {top_efficiency_day.efficiency:.1f})"
+            f"{top_date.strftime('%Y-%m-%d')} (效率: {top_efficiency:.1f})"
         )
     else:
         kpis["efficiency_star"] = "无足够数据"
 
     today = date.today()
-    start_of_this_week = today - timedelta(days=today.weekday())
-    end_of_this_week = start_of_this_week + timedelta(days=6)
-    logs_this_week = (
-        db.session.query(func.sum(LogEntry.actual_duration))
-        .join(Stage)
-        .filter(
-            Stage.user_id == user_id,
-            LogEntry.log_date.between(start_of_this_week, end_of_this_week),
-        )
-        .scalar()
-        or 0
+    start_of_this_week = (today - timedelta(days=today.weekday())).toordinal()
+    start_of_last_week = start_of_this_week - 7
+    log_days = columns.log_days
+    logs_this_week = float(
+        columns.log_minutes[
+            (log_days >= start_of_this_week) & (log_days <= start_of_this_week + 6)
+        ].sum()
     )
-
-    start_of_last_week = start_of_this_week - timedelta(days=7)
-    end_of_last_week = start_of_this_week - timedelta(days=1)
-    logs_last_week = (
-        db.session.query(func.sum(LogEntry.actual_duration))
-        .join(Stage)
-        .filter(
-            Stage.user_id == user_id,
-            LogEntry.log_date.between(start_of_last_week, end_of_last_week),
-        )
-        .scalar()
-        or 0
+    logs_last_week = float(
+        columns.log_minutes[
+            (log_days >= start_of_last_week) & (log_days < start_of_this_week)
+        ].sum()
     )
 
     if logs_last_week > 0:
@@ -142,12 +205,6 @@ def _calculate_kpis(user_id, stage_ids):
     return kpis
 
 
-class _WeekBucket(TypedDict):
-    duration: float
-    efficiency: float | None
-    days: int
-
-
 class _CategorySub(TypedDict):
     name: str
     duration: float
@@ -167,6 +224,21 @@ def _force_sync_forecast_mode() -> bool:
     return bool(current_app.config.get("TESTING"))
 
 
+def _candidate_parallelism_options() -> dict[str, Any]:
+    if not has_app_context():
+        return {}
+    workers = int(current_app.config.get("CHART_FORECAST_CANDIDATE_WORKERS") or 0)
+    if workers <= 1:
+        return {}
+    return {
+        "candidate_workers": workers,
+        "candidate_executor_kind": current_app.config.get(
+            "CHART_FORECAST_CANDIDATE_EXECUTOR",
+            "process",
+        ),
+    }
+
+
 def _utc_now_iso() -> str:
     return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
@@ -288,26 +360,42 @@ def _build_pending_forecast_bundle() -> dict[str, dict[str, Any]]:
     }
 
 
-def _forecast_cache_dir() -> str:
-    instance_path = current_app.instance_path if has_app_context() else os.getcwd()
+def _forecast_cache_dir(instance_path: str | None = None) -> str:
+    if instance_path is None:
+        instance_path = current_app.instance_path if has_app_context() else os.getcwd()
     cache_dir = os.path.join(instance_path, _FORECAST_CACHE_DIRNAME)
     os.makedirs(cache_dir, exist_ok=True)
     return cache_dir
 
 
-def _forecast_cache_file(user_id: int) -> str:
-    return os.path.join(_forecast_cache_dir(), f"user_{user_id}.json")
+def _get_forecast_cache_backend(app=None) -> ForecastCacheBackend | None:
+    """按应用配置获取跨进程共享的预测缓存后端，none 表示只用进程内缓存。"""
+    global _forecast_cache_backend, _forecast_cache_backend_key
+    if app is None:
+        if not has_app_context():
+            return None
+        app = current_app._get_current_object()
+    kind = app.config.get("CHART_FORECAST_CACHE_BACKEND") or CACHE_BACKEND_NONE
+    directory = app.config.get("CHART_FORECAST_CACHE_DIR") or _forecast_cache_dir(
+        app.instance_path
+    )
+    # 进程号也作为键的一部分：fork 出的 worker 不能复用父进程的连接与映射
+    key = (str(kind).lower(), directory, os.getpid())
+    with _forecast_backend_lock:
+        if _forecast_cache_backend_key != key:
+            previous_key = _forecast_cache_backend_key
+            if _forecast_cache_backend is not None and previous_key[2] == os.getpid():
+                _forecast_cache_backend.close()
+            _forecast_cache_backend = create_forecast_cache_backend(kind, directory)
+            _forecast_cache_backend_key = key
+        return _forecast_cache_backend
 
 
 def _load_persisted_forecast_entry(user_id: int) -> dict[str, Any] | None:
-    cache_file = _forecast_cache_file(user_id)
-    if not os.path.exists(cache_file):
-        return None
-    try:
-        with open(cache_file, "r", encoding="utf-8") as fp:
-            payload = json.load(fp)
-    except (OSError, json.JSONDecodeError):
+    backend = _get_forecast_cache_backend()
+    if backend is None:
         return None
+    payload = backend.get(user_id)
     if not isinstance(payload, dict):
         return None
     payload["expires_at"] = time.monotonic() + _FORECAST_CACHE_TTL_SECONDS
@@ -318,35 +406,37 @@ def _persist_forecast_entry(
     user_id: int,
     entry: dict[str, Any],
     *,
-    instance_path: str | None = None,
+    backend: ForecastCacheBackend | None,
+    expected_signature: str | None,
     logger: Any | None = None,
-    testing: bool = False,
-) -> None:
-    if testing:
-        return
-    base_dir = instance_path or (current_app.instance_path if has_app_context() else os.getcwd())
-    cache_dir = os.path.join(base_dir, _FORECAST_CACHE_DIRNAME)
-    os.makedirs(cache_dir, exist_ok=True)
-    cache_file = os.path.join(cache_dir, f"user_{user_id}.json")
-    serializable = copy.deepcopy(entry)
-    serializable.pop("expires_at", None)
+) -> bool:
+    """以签名 CAS 写入共享缓存：期间其他进程写入了别的结果时放弃本次写入。"""
+    if backend is None:
+        return True
     try:
-        with open(cache_file, "w", encoding="utf-8") as fp:
-            json.dump(serializable, fp, ensure_ascii=False)
-    except OSError:
+        return backend.compare_and_set(
+            user_id,
+            entry,
+            expected_signature=expected_signature,
+            ttl_seconds=_FORECAST_SHARED_TTL_SECONDS,
+        )
+    except Exception:  # noqa: BLE001 - 共享缓存失败不影响进程内结果
         if logger is not None:
             logger.warning(
                 "Failed to persist chart forecast cache for user %s",
                 user_id,
+                exc_info=True,
             )
+        return False
 
 
 def _clear_persisted_forecast_entry(user_id: int) -> None:
-    cache_file = _forecast_cache_file(user_id)
+    backend = _get_forecast_cache_backend()
+    if backend is None:
+        return
     try:
-        if os.path.exists(cache_file):
-            os.remove(cache_file)
-    except OSError:
+        backend.delete(user_id)
+    except Exception:  # noqa: BLE001
         if has_app_context():
             current_app.logger.warning(
                 "Failed to remove chart forecast cache for user %s",
@@ -354,6 +444,38 @@ def _clear_persisted_forecast_entry(user_id: int) -> None:
             )
 
 
+def _claim_forecast_lease(
+    backend: ForecastCacheBackend | None,
+    user_id: int,
+    signature: str,
+    lease_seconds: float,
+) -> bool:
+    if backend is None:
+        return True
+    try:
+        return backend.claim(
+            user_id,
+            signature=signature,
+            owner=default_lease_owner(),
+            lease_seconds=lease_seconds,
+        )
+    except Exception:  # noqa: BLE001 - 后端不可用时退化为进程内去重
+        if has_app_context():
+            current_app.logger.warning(
+                "Failed to claim chart forecast lease for user %s",
+                user_id,
+                exc_info=True,
+            )
+        return True
+
+
+def _release_forecast_lease(backend: ForecastCacheBackend | None, user_id: int) -> None:
+    if backend is None:
+        return
+    with contextlib.suppress(Exception):
+        backend.release(user_id, owner=default_lease_owner())
+
+
 def _week_start(d: date) -> date:
     return d - timedelta(days=d.weekday())
 
@@ -371,121 +493,137 @@ def _is_incomplete_weekly_bucket(
     return bucket_start <= today <= bucket_end and today < bucket_end
 
 
-def _build_stage_snapshot_resolver(all_stages):
+def _build_stage_snapshot_columns(all_stages):
+    """
+    返回一个按日期数组批量计算阶段特征的函数。
+
+    每个日期落在「开始日期不晚于它的最后一个阶段」里（早于所有阶段时取第一个阶段），
+    结果为 (阶段已持续天数, 归一化阶段序号, 是否阶段首日) 三列。
+    """
     sorted_stages = sorted(all_stages, key=lambda stage: stage.start_date)
     total_stages = len(sorted_stages)
+    stage_start_days = np.array(
+        [stage.start_date.toordinal() for stage in sorted_stages], dtype=np.int64
+    )
+    stage_index_norms = np.array(
+        [
+            round(idx / max(total_stages - 1, 1), 4) if total_stages > 1 else 0.0
+            for idx in range(total_stages)
+        ],
+        dtype=np.float64,
+    )
 
-    def _resolve(target_date: date) -> list[float]:
-        current_index = 0
-        for idx, stage in enumerate(sorted_stages):
-            if stage.start_date <= target_date:
-                current_index = idx
-            else:
-                break
-        current_stage = sorted_stages[current_index]
-        stage_age_days = max((target_date - current_stage.start_date).days, 0)
-        stage_index_norm = (
-            current_index / max(total_stages - 1, 1) if total_stages > 1 else 0.0
-        )
-        stage_start_flag = 1.0 if target_date == current_stage.start_date else 0.0
-        return [
-            round(float(stage_age_days), 2),
-            round(float(stage_index_norm), 4),
-            stage_start_flag,
-        ]
+    def _resolve(target_days: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        stage_index = np.searchsorted(stage_start_days, target_days, side="right") - 1
+        stage_index = np.maximum(stage_index, 0)
+        current_starts = stage_start_days[stage_index]
+        stage_age_days = np.maximum(target_days - current_starts, 0).astype(np.float64)
+        stage_start_flag = (target_days == current_starts).astype(np.float64)
+        return stage_age_days, stage_index_norms[stage_index], stage_start_flag
 
     return _resolve
 
 
-def _prepare_trend_data(user_id, all_stages, all_logs):
-    """准备每日和每周趋势的数据结构"""
-    first_log_date = min(log.log_date for log in all_logs)
-    last_log_date = max(log.log_date for log in all_logs)
+def _stage_feature_rows(
+    stage_columns: tuple[np.ndarray, np.ndarray, np.ndarray],
+    *,
+    age_divisor: float = 1.0,
+) -> list[list[float]]:
+    ages, index_norms, start_flags = stage_columns
+    return [
+        [round(age / age_divisor, 2), index_norm, start_flag]
+        for age, index_norm, start_flag in zip(
+            ages.tolist(), index_norms.tolist(), start_flags.tolist()
+        )
+    ]
+
+
+def _prepare_trend_data(all_stages, columns: _OverviewColumns):
+    """准备每日和每周趋势的数据结构，所有分组统计都在列式数组上完成"""
+    first_day = int(columns.log_days.min())
+    last_day = int(columns.log_days.max())
+    last_log_date = date.fromordinal(last_day)
     today = date.today()
     global_start_date = all_stages[0].start_date
-    stage_ids = [s.id for s in all_stages]
+    day_count = last_day - first_day + 1
 
-    date_range = [
-        first_log_date + timedelta(days=x)
-        for x in range((last_log_date - first_log_date).days + 1)
-    ]
-    resolve_stage_snapshot = _build_stage_snapshot_resolver(all_stages)
+    day_ordinals = np.arange(first_day, last_day + 1, dtype=np.int64)
+    date_range = [date.fromordinal(day) for day in day_ordinals.tolist()]
+    resolve_stage_columns = _build_stage_snapshot_columns(all_stages)
     daily_labels = [d.isoformat() for d in date_range]
-    daily_duration_map = {
-        d[0]: d[1]
-        for d in db.session.query(LogEntry.log_date, func.sum(LogEntry.actual_duration))
-        .filter(LogEntry.stage_id.in_(stage_ids))
-        .group_by(LogEntry.log_date)
-        .all()
-    }
-    daily_durations = [
-        round((daily_duration_map.get(d, 0) or 0) / 60, 2) for d in date_range
+
+    day_minutes = np.bincount(
+        columns.log_days - first_day, weights=columns.log_minutes, minlength=day_count
+    )
+    daily_durations = [round(minutes / 60, 2) for minutes in day_minutes.tolist()]
+
+    # 范围外的效率行（例如日志已删除的日期）不参与展示；重复下标赋值时保留最后一条
+    day_efficiency = np.full(day_count, np.nan)
+    in_range = (columns.efficiency_days >= first_day) & (
+        columns.efficiency_days <= last_day
+    )
+    day_efficiency[columns.efficiency_days[in_range] - first_day] = (
+        columns.efficiency_values[in_range]
+    )
+    daily_efficiencies = [
+        None if math.isnan(value) else value for value in day_efficiency.tolist()
     ]
-    daily_efficiency_map = {
-        d.log_date: d.efficiency
-        for d in DailyData.query.join(Stage).filter(Stage.user_id == user_id).all()
-    }
-    daily_stage_feature_map = {
-        current_date: resolve_stage_snapshot(current_date) for current_date in date_range
-    }
-    daily_efficiencies = [daily_efficiency_map.get(d) for d in date_range]
+
+    day_stage_columns = resolve_stage_columns(day_ordinals)
+    daily_stage_features = _stage_feature_rows(day_stage_columns)
     daily_incomplete = bool(date_range) and _is_incomplete_daily_bucket(
         date_range[-1], today
     )
     daily_training_labels = (
         daily_labels[:-1] if daily_incomplete else list(daily_labels)
     )
-    daily_training_dates = date_range[:-1] if daily_incomplete else list(date_range)
     daily_training_durations = (
         daily_durations[:-1] if daily_incomplete else list(daily_durations)
     )
     daily_training_efficiencies = (
         daily_efficiencies[:-1] if daily_incomplete else list(daily_efficiencies)
     )
-    daily_training_stage_features = [
-        daily_stage_feature_map[current_date] for current_date in daily_training_dates
-    ]
+    daily_training_stage_features = (
+        daily_stage_features[:-1] if daily_incomplete else list(daily_stage_features)
+    )
     daily_live_duration = daily_durations[-1] if daily_incomplete else None
     daily_live_efficiency = daily_efficiencies[-1] if daily_incomplete else None
 
-    weekly_data: dict[tuple[int, int], _WeekBucket] = collections.defaultdict(
-        lambda: {"duration": 0.0, "efficiency": None, "days": 0}
+    # 自定义周窗口等价于「周一所在周相对起始周的序号」，早于起始日期的日子归入第 1 周
+    global_start_monday = _week_start(global_start_date).toordinal()
+    day_mondays = day_ordinals - (day_ordinals - 1) % 7
+    week_offsets = np.maximum((day_mondays - global_start_monday) // 7, 0)
+    _, week_first_index, week_inverse, week_day_counts = np.unique(
+        week_offsets, return_index=True, return_inverse=True, return_counts=True
     )
-    weekly_stage_feature_accumulator: dict[tuple[int, int], list[list[float]]] = (
-        collections.defaultdict(list)
+    week_count = week_day_counts.size
+    week_duration_sums = np.bincount(
+        week_inverse, weights=day_minutes, minlength=week_count
     )
-    for d in date_range:
-        year, week_num = get_custom_week_info(d, global_start_date)
-        weekly_data[(year, week_num)]["duration"] += float(
-            daily_duration_map.get(d) or 0
-        )
-        weekly_data[(year, week_num)]["days"] += 1
-        day_efficiency = daily_efficiency_map.get(d)
-        if day_efficiency is None:
-            day_efficiency = 0.0
-        current_efficiency = weekly_data[(year, week_num)]["efficiency"] or 0.0
-        weekly_data[(year, week_num)]["efficiency"] = current_efficiency + float(
-            day_efficiency
-        )
-        weekly_stage_feature_accumulator[(year, week_num)].append(
-            daily_stage_feature_map[d]
-        )
+    week_efficiency_sums = np.bincount(
+        week_inverse, weights=np.nan_to_num(day_efficiency, nan=0.0), minlength=week_count
+    )
+    week_stage_age_sums = np.bincount(
+        week_inverse, weights=day_stage_columns[0], minlength=week_count
+    )
+    week_stage_index_sums = np.bincount(
+        week_inverse, weights=day_stage_columns[1], minlength=week_count
+    )
+    week_stage_reset_flags = np.zeros(week_count)
+    np.maximum.at(week_stage_reset_flags, week_inverse, day_stage_columns[2])
 
-    sorted_week_keys = sorted(weekly_data.keys())
-    weekly_labels = [f"{k[0]}-W{k[1]:02}" for k in sorted_week_keys]
+    weekly_labels = []
     weekly_durations = []
     weekly_efficiencies = []
     weekly_duration_totals = []
     weekly_elapsed_days = []
     weekly_stage_features = []
-    for year, week_num in sorted_week_keys:
-        duration = weekly_data[(year, week_num)]["duration"]
-        days = weekly_data[(year, week_num)]["days"] or 0
-        week_anchor = next(
-            d
-            for d in date_range
-            if get_custom_week_info(d, global_start_date) == (year, week_num)
-        )
+    for week_idx in range(week_count):
+        week_anchor = date_range[int(week_first_index[week_idx])]
+        year, week_num = get_custom_week_info(week_anchor, global_start_date)
+        weekly_labels.append(f"{year}-W{week_num:02}")
+        duration = float(week_duration_sums[week_idx])
+        days = int(week_day_counts[week_idx])
         bucket_start = _week_start(week_anchor)
         bucket_end = bucket_start + timedelta(days=6)
         elapsed_days = (
@@ -497,21 +635,15 @@ def _prepare_trend_data(user_id, all_stages, all_logs):
         weekly_elapsed_days.append(elapsed_days)
         weekly_duration_totals.append(round(duration / 60, 2))
         weekly_durations.append(round(duration / 60 / elapsed_days, 2))
-        efficiency_total = weekly_data[(year, week_num)]["efficiency"] or 0.0
+        efficiency_total = float(week_efficiency_sums[week_idx])
         weekly_efficiencies.append(round(efficiency_total / elapsed_days, 2))
-        stage_rows = weekly_stage_feature_accumulator[(year, week_num)]
-        avg_stage_age_days = (
-            sum(row[0] for row in stage_rows) / len(stage_rows) if stage_rows else 0.0
-        )
-        avg_stage_index = (
-            sum(row[1] for row in stage_rows) / len(stage_rows) if stage_rows else 0.0
-        )
-        stage_reset_flag = max((row[2] for row in stage_rows), default=0.0)
+        avg_stage_age_days = float(week_stage_age_sums[week_idx]) / days
+        avg_stage_index = float(week_stage_index_sums[week_idx]) / days
         weekly_stage_features.append(
             [
                 round(avg_stage_age_days / 7.0, 2),
                 round(avg_stage_index, 4),
-                stage_reset_flag,
+                float(week_stage_reset_flags[week_idx]),
             ]
         )
 
@@ -521,14 +653,9 @@ def _prepare_trend_data(user_id, all_stages, all_logs):
     weekly_training_labels = list(weekly_labels)
     weekly_training_duration_totals = list(weekly_duration_totals)
     weekly_training_efficiencies = list(weekly_efficiencies)
-    if sorted_week_keys:
-        last_year, last_week = sorted_week_keys[-1]
-        last_anchor = next(
-            d
-            for d in reversed(date_range)
-            if get_custom_week_info(d, global_start_date) == (last_year, last_week)
-        )
-        last_bucket_start = _week_start(last_anchor)
+    if week_count:
+        # 日期序列按天递增，最后一周的最后一天就是整个序列的最后一天
+        last_bucket_start = _week_start(date_range[-1])
         last_bucket_end = last_bucket_start + timedelta(days=6)
         weekly_incomplete = _is_incomplete_weekly_bucket(
             last_bucket_start,
@@ -546,26 +673,27 @@ def _prepare_trend_data(user_id, all_stages, all_logs):
         weekly_stage_features[:-1] if weekly_incomplete else list(weekly_stage_features)
     )
 
-    daily_future_start = date_range[-1] if daily_incomplete else (date_range[-1] + timedelta(days=1))
-    daily_future_stage_features = [
-        resolve_stage_snapshot(daily_future_start + timedelta(days=offset))
-        for offset in range(DAILY_CONFIG.horizon)
-    ]
+    daily_future_start = last_day if daily_incomplete else last_day + 1
+    daily_future_stage_features = _stage_feature_rows(
+        resolve_stage_columns(
+            np.arange(
+                daily_future_start,
+                daily_future_start + DAILY_CONFIG.horizon,
+                dtype=np.int64,
+            )
+        )
+    )
 
     # Keep weekly future features stable for the current day even if the user
     # starts logging into the current week for the first time.
-    weekly_reference_date = today
-    weekly_future_stage_features = []
-    for offset in range(WEEKLY_CONFIG.horizon):
-        target_date = weekly_reference_date + timedelta(days=offset * 7)
-        stage_snapshot = resolve_stage_snapshot(target_date)
-        weekly_future_stage_features.append(
-            [
-                round(stage_snapshot[0] / 7.0, 2),
-                stage_snapshot[1],
-                stage_snapshot[2],
-            ]
-        )
+    weekly_reference_day = today.toordinal()
+    weekly_future_stage_features = _stage_feature_rows(
+        resolve_stage_columns(
+            weekly_reference_day
+            + 7 * np.arange(WEEKLY_CONFIG.horizon, dtype=np.int64)
+        ),
+        age_divisor=7.0,
+    )
 
     return {
         "weekly_duration_data": {
@@ -631,25 +759,19 @@ def _prepare_trend_data(user_id, all_stages, all_logs):
     }
 
 
-def _prepare_stage_annotations(user_id, all_stages, global_start_date, last_log_date):
+def _prepare_stage_annotations(all_stages, global_start_date, last_log_date):
     """为图表覆盖层准备阶段注释数据"""
+    stage_start_dates = sorted(stage.start_date for stage in all_stages)
     annotations = []
     for stage in all_stages:
         start_g_year, start_g_week = get_custom_week_info(
             stage.start_date, global_start_date
         )
 
-        next_stage_check = (
-            Stage.query.filter(
-                Stage.user_id == user_id, Stage.start_date > stage.start_date
-            )
-            .order_by(Stage.start_date.asc())
-            .first()
-        )
-
+        next_stage_index = bisect.bisect_right(stage_start_dates, stage.start_date)
         end_date = (
-            (next_stage_check.start_date - timedelta(days=1))
-            if next_stage_check
+            (stage_start_dates[next_stage_index] - timedelta(days=1))
+            if next_stage_index < len(stage_start_dates)
             else last_log_date
         )
         end_g_year, end_g_week = get_custom_week_info(end_date, global_start_date)
@@ -692,9 +814,8 @@ def _build_chart_base_payload(user_id: int) -> tuple[dict[str, Any], dict[str, A
             None,
         )
 
-    stage_ids = [s.id for s in all_stages]
-    all_logs = LogEntry.query.filter(LogEntry.stage_id.in_(stage_ids)).all()
-    if not all_logs:
+    columns = _load_overview_columns(user_id)
+    if not columns.has_logs:
         return (
             {
                 "kpis": {
@@ -715,12 +836,12 @@ def _build_chart_base_payload(user_id: int) -> tuple[dict[str, Any], dict[str, A
             None,
         )
 
-    kpis = _calculate_kpis(user_id, stage_ids)
-    trend_data = _prepare_trend_data(user_id, all_stages, all_logs)
+    kpis = _calculate_kpis(columns)
+    trend_data = _prepare_trend_data(all_stages, columns)
     global_start_date = all_stages[0].start_date
-    last_log_date = max(log.log_date for log in all_logs)
+    last_log_date = date.fromordinal(int(columns.log_days.max()))
     stage_annotations = _prepare_stage_annotations(
-        user_id, all_stages, global_start_date, last_log_date
+        all_stages, global_start_date, last_log_date
     )
     signature = _build_forecast_signature(
         trend_data,
@@ -760,6 +881,8 @@ def _build_chart_base_payload(user_id: int) -> tuple[dict[str, Any], dict[str, A
             "daily_current_label": trend_data["daily_duration_data"]["ongoing_label"],
             "weekly_current_label": trend_data["weekly_duration_data"]["ongoing_label"],
             "weekly_duration_display_divisor": 7.0,
+            "warm_start_key": user_id,
+            **_candidate_parallelism_options(),
         },
     }
     return base_payload, forecast_context
@@ -782,9 +905,9 @@ def _store_forecast_entry(
     user_id: int,
     entry: dict[str, Any],
     *,
-    instance_path: str | None = None,
+    backend: ForecastCacheBackend | None = None,
+    expected_signature: str | None = None,
     logger: Any | None = None,
-    testing: bool = False,
 ) -> None:
     with _forecast_cache_lock:
         _forecast_cache[user_id] = entry
@@ -792,9 +915,9 @@ def _store_forecast_entry(
         _persist_forecast_entry(
             user_id,
             entry,
-            instance_path=instance_path,
+            backend=backend,
+            expected_signature=expected_signature,
             logger=logger,
-            testing=testing,
         )
 
 
@@ -804,6 +927,7 @@ def _start_forecast_generation(
     signature: str,
     forecast_inputs: dict[str, Any],
     trained_for_date: str,
+    shared_signature: str | None = None,
     force: bool = False,
 ) -> None:
     with _forecast_cache_lock:
@@ -828,34 +952,40 @@ def _start_forecast_generation(
         ):
             return
 
-        wait_event = _forecast_inflight.get(user_id)
-        if wait_event is not None and not force:
-            return
-        if wait_event is not None and force:
-            return
+    app = current_app._get_current_object()
+    logger = app.logger
+    backend = _get_forecast_cache_backend(app)
+    lease_seconds = float(app.config.get("CHART_FORECAST_LEASE_SECONDS") or 300.0)
+    claimed = _claim_forecast_lease(backend, user_id, signature, lease_seconds)
 
-        wait_event = threading.Event()
-        _forecast_inflight[user_id] = wait_event
+    with _forecast_cache_lock:
+        now = time.monotonic()
+        if claimed:
+            _forecast_inflight.setdefault(user_id, threading.Event())
         _forecast_cache[user_id] = {
             "signature": signature,
             "state": "pending",
             "message": _PENDING_FORECAST_REASON,
             "updated_at": _utc_now_iso(),
             "trained_for_date": trained_for_date,
-            "expires_at": now + _FORECAST_CACHE_TTL_SECONDS,
+            "expires_at": now + (
+                _FORECAST_CACHE_TTL_SECONDS if claimed else _FORECAST_REMOTE_POLL_SECONDS
+            ),
             "forecast_bundle": _build_pending_forecast_bundle(),
         }
+    if not claimed:
+        # 其他进程正在训练该用户，稍后从共享缓存读取其结果
+        return
 
-    app = current_app._get_current_object()
-    instance_path = app.instance_path
-    testing = bool(app.config.get("TESTING"))
-    logger = app.logger
+    def _finish():
+        _release_forecast_lease(backend, user_id)
+        with _forecast_cache_lock:
+            event = _forecast_inflight.pop(user_id, None)
+            if event is not None:
+                event.set()
 
-    def _runner():
+    def _on_success(raw_bundle: dict[str, dict]) -> None:
         try:
-            forecast_bundle = _mark_forecast_bundle_ready(
-                build_trend_forecasts(**forecast_inputs)
-            )
             entry = {
                 "signature": signature,
                 "state": "ready",
@@ -863,55 +993,99 @@ def _start_forecast_generation(
                 "updated_at": _utc_now_iso(),
                 "trained_for_date": trained_for_date,
                 "expires_at": time.monotonic() + _FORECAST_CACHE_TTL_SECONDS,
-                "forecast_bundle": forecast_bundle,
+                "forecast_bundle": _mark_forecast_bundle_ready(raw_bundle),
             }
             _store_forecast_entry(
                 user_id,
                 entry,
-                instance_path=instance_path,
+                backend=backend,
+                expected_signature=shared_signature,
                 logger=logger,
-                testing=testing,
             )
         except Exception as exc:  # pragma: no cover - defensive logging path
-            with app.app_context():
-                app.logger.error(
-                    "Error generating chart forecasts for user %s: %s",
-                    user_id,
-                    exc,
-                    exc_info=True,
-                )
-            _store_forecast_entry(
+            _on_error(exc)
+            return
+        _finish()
+
+    def _on_error(exc: BaseException) -> None:
+        with app.app_context():
+            app.logger.error(
+                "Error generating chart forecasts for user %s: %s",
                 user_id,
-                {
-                    "signature": signature,
-                    "state": "error",
-                    "message": _FORECAST_ERROR_REASON,
-                    "updated_at": _utc_now_iso(),
-                    "trained_for_date": trained_for_date,
-                    "expires_at": time.monotonic() + 30.0,
-                    "forecast_bundle": {
-                        dataset_key: _build_default_forecast(
-                            status="error",
-                            reason=_FORECAST_ERROR_REASON,
-                        )
-                        for dataset_key in _FORECAST_DATASET_KEYS
-                    },
-                },
-                instance_path=instance_path,
-                logger=logger,
-                testing=testing,
+                exc,
+                exc_info=exc,
             )
-        finally:
-            with _forecast_cache_lock:
-                event = _forecast_inflight.pop(user_id, None)
-                if event is not None:
-                    event.set()
+        _store_forecast_entry(
+            user_id,
+            {
+                "signature": signature,
+                "state": "error",
+                "message": _FORECAST_ERROR_REASON,
+                "updated_at": _utc_now_iso(),
+                "trained_for_date": trained_for_date,
+                "expires_at": time.monotonic() + 30.0,
+                "forecast_bundle": {
+                    dataset_key: _build_default_forecast(
+                        status="error",
+                        reason=_FORECAST_ERROR_REASON,
+                    )
+                    for dataset_key in _FORECAST_DATASET_KEYS
+                },
+            },
+            logger=logger,
+        )
+        _finish()
+
+    _get_forecast_pool(app).submit(
+        user_id,
+        signature,
+        build_trend_forecasts,
+        forecast_inputs,
+        on_success=_on_success,
+        on_error=_on_error,
+    )
 
-    threading.Thread(
-        target=_runner,
-        name=f"chart-forecast-{user_id}",
-        daemon=True,
-    ).start()
+
+def _get_forecast_pool(app) -> ForecastWorkerPool:
+    """按应用配置获取（必要时重建）预测任务池。"""
+    global _forecast_pool
+    workers = max(int(app.config.get("CHART_FORECAST_WORKERS") or 1), 1)
+    executor_kind = app.config.get("CHART_FORECAST_EXECUTOR") or EXECUTOR_PROCESS
+    with _forecast_pool_lock:
+        pool = _forecast_pool
+        if (
+            pool is None
+            or pool.max_workers != workers
+            or pool.executor_kind != executor_kind
+        ):
+            if pool is not None:
+                pool.shutdown()
+            pool = ForecastWorkerPool(workers, executor_kind=executor_kind)
+            _forecast_pool = pool
+        return pool
+
+
+def _get_forecast_queue_status(user_id: int) -> dict[str, Any]:
+    with _forecast_pool_lock:
+        pool = _forecast_pool
+    if pool is None:
+        status = {
+            "state": "idle",
+            "position": None,
+            "wait_seconds": None,
+            "queue_depth": 0,
+            "workers": 0,
+            "executor": None,
+        }
+    else:
+        status = pool.get_status(user_id)
+    lease = None
+    backend = _get_forecast_cache_backend()
+    if backend is not None:
+        with contextlib.suppress(Exception):
+            lease = backend.get_lease(user_id)
+    status["claimed_by"] = lease.owner if lease is not None else None
+    return status
 
 
 def _resolve_forecast_entry(
@@ -945,17 +1119,20 @@ def _resolve_forecast_entry(
             and cached.get("signature") == signature
             and cached.get("expires_at", 0) > now
             and not force_retrain
+            # 等待其他进程训练的 pending 条目需要继续查看共享缓存
+            and (cached.get("state") != "pending" or user_id in _forecast_inflight)
         ):
             return copy.deepcopy(cached)
 
+    shared_signature = None
     if not force_retrain:
         persisted = _load_persisted_forecast_entry(user_id)
+        shared_signature = persisted.get("signature") if persisted else None
         if (
             persisted
             and persisted.get("trained_for_date") == trained_for_date
             and persisted.get("signature") == signature
         ):
-            persisted["expires_at"] = time.monotonic() + _FORECAST_CACHE_TTL_SECONDS
             _store_forecast_entry(user_id, persisted)
             return copy.deepcopy(persisted)
 
@@ -964,6 +1141,7 @@ def _resolve_forecast_entry(
         signature=signature,
         forecast_inputs=forecast_inputs,
         trained_for_date=trained_for_date,
+        shared_signature=shared_signature,
         force=force_retrain,
     )
     with _forecast_cache_lock:
@@ -1033,6 +1211,7 @@ def get_chart_forecast_status_for_user(user_id: int) -> dict[str, Any]:
         "message": forecast_entry.get("message", ""),
         "updated_at": forecast_entry.get("updated_at"),
         "trained_for_date": forecast_entry.get("trained_for_date"),
+        "queue": _get_forecast_queue_status(user_id),
         "forecasts": copy.deepcopy(
             forecast_entry.get("forecast_bundle") or _build_pending_forecast_bundle()
         ),
@@ -1058,7 +1237,8 @@ def retrain_chart_forecasts_for_user(user_id: int) -> dict[str, Any]:
     forecast_entry = _resolve_forecast_entry(
         user_id,
         signature=signature,
-        forecast_inputs=forecast_context["forecast_inputs"],
+        # 热启动状态在负责该用户的分片子进程里，由任务自己清除
+        forecast_inputs={**forecast_context["forecast_inputs"], "reset_warm_state": True},
         force_retrain=True,
     )
     return {
@@ -1143,22 +1323,22 @@ def get_category_chart_data(user_id, stage_id=None, start_date=None, end_date=No
     # 首先尝试使用新的分类系统（Category + SubCategory）
     query = (
         db.session.query(
-            Category.name, SubCategory.name, func.sum(LogEntry.actual_duration)
+            Category.name, SubCategory.name, func.sum(DailyRollup.minutes)
         )
-        .join(SubCategory, LogEntry.subcategory_id == SubCategory.id)
+        .join(SubCategory, DailyRollup.subcategory_id == SubCategory.id)
         .join(Category, SubCategory.category_id == Category.id)
         .filter(Category.user_id == user_id)
         .group_by(Category.name, SubCategory.name)
     )
 
     if stage_id:
-        query = query.filter(LogEntry.stage_id == stage_id)
+        query = query.filter(DailyRollup.stage_id == stage_id)
 
     if start_date:
-        query = query.filter(LogEntry.log_date >= start_date)
+        query = query.filter(DailyRollup.log_date >= start_date)
 
     if end_date:
-        query = query.filter(LogEntry.log_date <= end_date)
+        query = query.filter(DailyRollup.log_date <= end_date)
 
     results = query.all()
 
@@ -1275,20 +1455,18 @@ def get_category_trend_series(
 
     range_mode = (range_mode or "all").lower()
 
-    base = (
-        db.session.query(LogEntry.log_date, func.sum(LogEntry.actual_duration))
-        .join(Stage, LogEntry.stage_id == Stage.id)
-        .filter(Stage.user_id == user_id)
-    )
+    base = db.session.query(
+        DailyRollup.log_date, func.sum(DailyRollup.minutes)
+    ).filter(DailyRollup.user_id == user_id)
 
     if subcategory_id:
-        base = base.filter(LogEntry.subcategory_id == subcategory_id)
+        base = base.filter(DailyRollup.subcategory_id == subcategory_id)
     elif category_id:
-        base = base.join(SubCategory, LogEntry.subcategory_id == SubCategory.id)
+        base = base.join(SubCategory, DailyRollup.subcategory_id == SubCategory.id)
         base = base.filter(SubCategory.category_id == category_id)
 
     if stage_id:
-        base = base.filter(LogEntry.stage_id == stage_id)
+        base = base.filter(DailyRollup.stage_id == stage_id)
 
     # 处理默认时间范围
     today = date.today()
@@ -1299,14 +1477,14 @@ def get_category_trend_series(
             if stage:
                 start_date = start_date or stage.start_date
                 last_log = (
-                    db.session.query(func.max(LogEntry.log_date))
-                    .filter(LogEntry.stage_id == stage.id)
+                    db.session.query(func.max(DailyRollup.log_date))
+                    .filter(DailyRollup.stage_id == stage.id)
                     .scalar()
                 )
                 end_date = end_date or last_log or today
         elif range_mode == "all":
-            min_date = base.with_entities(func.min(LogEntry.log_date)).scalar()
-            max_date = base.with_entities(func.max(LogEntry.log_date)).scalar()
+            min_date = base.with_entities(func.min(DailyRollup.log_date)).scalar()
+            max_date = base.with_entities(func.max(DailyRollup.log_date)).scalar()
             start_date = start_date or min_date or today
             end_date = end_date or max_date or today
 
@@ -1320,11 +1498,13 @@ def get_category_trend_series(
         start_date, end_date = end_date, start_date
 
     query = base.filter(
-        LogEntry.log_date >= start_date,
-        LogEntry.log_date <= end_date,
+        DailyRollup.log_date >= start_date,
+        DailyRollup.log_date <= end_date,
     )
 
-    rows = query.group_by(LogEntry.log_date).order_by(LogEntry.log_date.asc()).all()
+    rows = (
+        query.group_by(DailyRollup.log_date).order_by(DailyRollup.log_date.asc()).all()
+    )
 
     used_legacy_name: str | None = None
 
@@ -1440,24 +1620,22 @@ def get_category_efficiency_chart_data(
         db.session.query(
             Category.name,
             SubCategory.name,
-            LogEntry.log_date,
-            func.sum(LogEntry.actual_duration).label("total_duration"),
-            func.sum(LogEntry.actual_duration * func.coalesce(LogEntry.mood, 3)).label(
-                "weighted_mood"
-            ),
+            DailyRollup.log_date,
+            func.sum(DailyRollup.minutes).label("total_duration"),
+            func.sum(DailyRollup.mood_minutes).label("weighted_mood"),
         )
-        .join(SubCategory, LogEntry.subcategory_id == SubCategory.id)
+        .join(SubCategory, DailyRollup.subcategory_id == SubCategory.id)
         .join(Category, SubCategory.category_id == Category.id)
         .filter(Category.user_id == user_id)
-        .group_by(Category.name, SubCategory.name, LogEntry.log_date)
+        .group_by(Category.name, SubCategory.name, DailyRollup.log_date)
     )
 
     if stage_id:
-        query = query.filter(LogEntry.stage_id == stage_id)
+        query = query.filter(DailyRollup.stage_id == stage_id)
     if start_date:
-        query = query.filter(LogEntry.log_date >= start_date)
+        query = query.filter(DailyRollup.log_date >= start_date)
     if end_date:
-        query = query.filter(LogEntry.log_date <= end_date)
+        query = query.filter(DailyRollup.log_date <= end_date)
 
     results = query.all()
 
@@ -1584,26 +1762,20 @@ def get_category_efficiency_trend_series(
     range_mode = (range_mode or "all").lower()
 
     # 查询基础数据：日期、时长、加权心情
-    base = (
-        db.session.query(
-            LogEntry.log_date,
-            func.sum(LogEntry.actual_duration).label("total_duration"),
-            func.sum(LogEntry.actual_duration * func.coalesce(LogEntry.mood, 3)).label(
-                "weighted_mood"
-            ),
-        )
-        .join(Stage, LogEntry.stage_id == Stage.id)
-        .filter(Stage.user_id == user_id)
-    )
+    base = db.session.query(
+        DailyRollup.log_date,
+        func.sum(DailyRollup.minutes).label("total_duration"),
+        func.sum(DailyRollup.mood_minutes).label("weighted_mood"),
+    ).filter(DailyRollup.user_id == user_id)
 
     if subcategory_id:
-        base = base.filter(LogEntry.subcategory_id == subcategory_id)
+        base = base.filter(DailyRollup.subcategory_id == subcategory_id)
     elif category_id:
-        base = base.join(SubCategory, LogEntry.subcategory_id == SubCategory.id)
+        base = base.join(SubCategory, DailyRollup.subcategory_id == SubCategory.id)
         base = base.filter(SubCategory.category_id == category_id)
 
     if stage_id:
-        base = base.filter(LogEntry.stage_id == stage_id)
+        base = base.filter(DailyRollup.stage_id == stage_id)
 
     # 处理默认时间范围
     today = date.today()
@@ -1614,14 +1786,14 @@ def get_category_efficiency_trend_series(
             if stage:
                 start_date = start_date or stage.start_date
                 last_log = (
-                    db.session.query(func.max(LogEntry.log_date))
-                    .filter(LogEntry.stage_id == stage.id)
+                    db.session.query(func.max(DailyRollup.log_date))
+                    .filter(DailyRollup.stage_id == stage.id)
                     .scalar()
                 )
                 end_date = end_date or last_log or today
         elif range_mode == "all":
-            min_date = base.with_entities(func.min(LogEntry.log_date)).scalar()
-            max_date = base.with_entities(func.max(LogEntry.log_date)).scalar()
+            min_date = base.with_entities(func.min(DailyRollup.log_date)).scalar()
+            max_date = base.with_entities(func.max(DailyRollup.log_date)).scalar()
             start_date = start_date or min_date or today
             end_date = end_date or max_date or today
 
@@ -1634,9 +1806,9 @@ def get_category_efficiency_trend_series(
         start_date, end_date = end_date, start_date
 
     query = base.filter(
-        LogEntry.log_date >= start_date,
-        LogEntry.log_date <= end_date,
-    ).group_by(LogEntry.log_date)
+        DailyRollup.log_date >= start_date,
+        DailyRollup.log_date <= end_date,
+    ).group_by(DailyRollup.log_date)
 
     rows = query.all()
 
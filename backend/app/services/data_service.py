@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 """数据导入导出服务"""
 
+import contextlib
 import io
 import json
 import os
+import shutil
+import tempfile
+import time
 import zipfile
 from datetime import date, datetime
+from itertools import islice
 
 from flask import current_app
 
@@ -16,6 +21,7 @@ from app.models import (
     Category,
     CountdownEvent,
     DailyData,
+    DailyRollup,
     LogEntry,
     Milestone,
     MilestoneAttachment,
@@ -26,6 +32,19 @@ from app.models import (
     SubCategory,
     WeeklyData,
 )
+from app.services.ai_context_cache import mark_ai_context_stale
+from app.services.change_log import (
+    TRACKED_TABLES,
+    changes_since,
+    current_version,
+    reset_change_log,
+    row_key,
+)
+from app.services.efficiency_writer import flush_pending_efficiency
+from app.services.leaderboard_snapshot import refresh_leaderboard_for_users
+from app.services.record_service import rebuild_efficiency_for_user
+from app.services.rollup_service import rebuild_daily_rollup
+from app.services.stage_index import invalidate_stage_index, mark_stage_index_stale
 
 MODELS_TO_HANDLE: list[type[Any]] = [
     Setting,
@@ -64,35 +83,42 @@ def _prune_unknown_fields(table_name: str, payload: dict) -> dict:
     return {key: value for key, value in payload.items() if key in allowed}
 
 
-def _query_user_records(model, user_id):
-    """Return all rows for the given model that belong to user_id."""
+def _user_records_query(model, user_id):
+    """Return a query for rows of the given model that belong to user_id (None if unowned)."""
     if "user_id" in model.__table__.columns:
-        return model.query.filter(model.user_id == user_id).all()
+        return model.query.filter(model.user_id == user_id)
 
     if hasattr(model, "stage") and "stage_id" in model.__table__.columns:
-        return model.query.join(Stage).filter(Stage.user_id == user_id).all()
+        return model.query.join(Stage).filter(Stage.user_id == user_id)
 
     if hasattr(model, "milestone") and "milestone_id" in model.__table__.columns:
-        return model.query.join(Milestone).filter(Milestone.user_id == user_id).all()
+        return model.query.join(Milestone).filter(Milestone.user_id == user_id)
 
     if hasattr(model, "category") and "category_id" in model.__table__.columns:
-        return model.query.join(Category).filter(Category.user_id == user_id).all()
+        return model.query.join(Category).filter(Category.user_id == user_id)
 
-    return []
+    return None
 
 
-def _clear_user_data(user):
-    """
-    在导入前,安全地清空用户的所有关联数据。
-    这是一个关键步骤,以避免主键或外键冲突。
-    """
-    current_app.logger.info(
-        f"Starting to clear all data for user: {user.username} (ID: {user.id})"
-    )
+def _query_user_records(model, user_id):
+    """Return all rows for the given model that belong to user_id."""
+    query = _user_records_query(model, user_id)
+    return query.all() if query is not None else []
 
+
+def _iter_user_records(model, user_id, batch_size: int):
+    """按主键顺序分批读取用户数据，不一次性把整张表载入内存。"""
+    query = _user_records_query(model, user_id)
+    if query is None:
+        return
+    primary_key = list(model.__table__.primary_key.columns)
+    yield from query.order_by(*primary_key).yield_per(batch_size)
+
+
+def _remove_user_attachments(user_id: int) -> None:
     upload_folder = current_app.config.get("UPLOAD_FOLDER")
     if upload_folder:
-        user_upload_folder = os.path.join(upload_folder, str(user.id))
+        user_upload_folder = os.path.join(upload_folder, str(user_id))
         if os.path.exists(user_upload_folder):
             for filename in os.listdir(user_upload_folder):
                 try:
@@ -107,6 +133,22 @@ def _clear_user_data(user):
             "UPLOAD_FOLDER not configured, skipping attachments cleanup."
         )
 
+
+def _clear_user_data(user, commit: bool = True, remove_files: bool = True):
+    """
+    在导入前,安全地清空用户的所有关联数据。
+    这是一个关键步骤,以避免主键或外键冲突。
+
+    commit=False 时与后续写入在同一事务内提交（后台导入的原子替换）；
+    remove_files=False 时保留附件文件，由调用方在提交后替换。
+    """
+    current_app.logger.info(
+        f"Starting to clear all data for user: {user.username} (ID: {user.id})"
+    )
+
+    if remove_files:
+        _remove_user_attachments(user.id)
+
     MilestoneAttachment.query.filter(
         MilestoneAttachment.milestone.has(user_id=user.id)
     ).delete(synchronize_session=False)
@@ -120,6 +162,7 @@ def _clear_user_data(user):
     DailyData.query.filter(DailyData.stage.has(user_id=user.id)).delete(
         synchronize_session=False
     )
+    DailyRollup.query.filter_by(user_id=user.id).delete(synchronize_session=False)
     WeeklyData.query.filter(WeeklyData.stage.has(user_id=user.id)).delete(
         synchronize_session=False
     )
@@ -134,433 +177,1054 @@ def _clear_user_data(user):
     MilestoneCategory.query.filter_by(user_id=user.id).delete(synchronize_session=False)
     Stage.query.filter_by(user_id=user.id).delete(synchronize_session=False)
 
+    refresh_leaderboard_for_users([user.id])
+    mark_ai_context_stale([user.id])
+    # 批量删除没有墓碑，此前的增量水位线一律失效
+    reset_change_log(user.id)
+    if not commit:
+        mark_stage_index_stale([user.id])
+        return
     db.session.commit()
+    invalidate_stage_index(user.id)
     current_app.logger.info(
         f"Successfully cleared all database entries for user: {user.username}"
     )
 
 
-def export_data_for_user(user):
+class _ZipChunkSink:
     """
-    将指定用户的所有数据导出到一个ZIP压缩包的内存缓冲区中。
-    返回: (success_bool, buffer, filename)
+    ZipFile 的输出端：只追加写入，由生成器定期取走已写入的字节。
+
+    不提供 seek/tell，ZipFile 会按不可回写的流处理（条目后附数据描述符），
+    因此压缩包可以边生成边发送。
+    """
+
+    # pyarrow 包装 Python 文件对象时会检查该属性
+    closed = False
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def drain(self) -> bytes:
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        return chunk
+
+
+def _export_attachment_paths(user_id: int) -> list[tuple[str, str]]:
+    """用户附件目录下待导出的 (文件路径, 压缩包内路径)。"""
+    upload_folder = current_app.config.get("UPLOAD_FOLDER")
+    current_app.logger.info(f"[导出附件] UPLOAD_FOLDER配置: {upload_folder}")
+    if not upload_folder:
+        current_app.logger.warning(
+            "UPLOAD_FOLDER not configured, skipping attachments export."
+        )
+        return []
+
+    user_upload_folder = os.path.join(upload_folder, str(user_id))
+    current_app.logger.info(f"[导出附件] 用户附件目录: {user_upload_folder}")
+    if not os.path.exists(user_upload_folder):
+        current_app.logger.warning(
+            f"[导出附件] 用户附件目录不存在: {user_upload_folder}"
+        )
+        return []
+
+    files = sorted(os.listdir(user_upload_folder))
+    current_app.logger.info(f"[导出附件] 找到 {len(files)} 个文件")
+    return [
+        (os.path.join(user_upload_folder, filename), f"attachments/{filename}")
+        for filename in files
+    ]
+
+
+def _json_array_fragments(items):
+    """
+    逐项序列化为 JSON 数组片段。
+
+    拼接结果与 json.dumps(list, indent=4, ensure_ascii=False) 逐字节一致。
+    """
+    first = True
+    for value in items:
+        item = json.dumps(value, indent=4, ensure_ascii=False)
+        item = item.replace("\n", "\n    ")
+        yield ("[\n    " if first else ",\n    ") + item
+        first = False
+    yield "[]" if first else "\n]"
+
+
+def _zip_stream(members, chunk_size: int):
+    """
+    把 (压缩包内路径, 内容) 依次写成 ZIP，每积累 chunk_size 字节交出一块。
+
+    内容为字符串 / 字节片段的可迭代对象或磁盘文件路径（按块复制）；
+    路径也可以是 ZipInfo，用于指定条目的压缩方式。
+    """
+    sink = _ZipChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for arcname, source in members:
+            if isinstance(source, str):
+                zinfo = zipfile.ZipInfo.from_file(source, arcname=arcname)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(source, "rb") as handle, zf.open(zinfo, "w") as entry:
+                    while True:
+                        block = handle.read(chunk_size)
+                        if not block:
+                            break
+                        entry.write(block)
+                        if len(sink) >= chunk_size:
+                            yield sink.drain()
+                continue
+            with zf.open(arcname, "w", force_zip64=True) as entry:
+                for fragment in source:
+                    if isinstance(fragment, str):
+                        fragment = fragment.encode("utf-8")
+                    entry.write(fragment)
+                    if len(sink) >= chunk_size:
+                        yield sink.drain()
+    yield sink.drain()
+
+
+def _manifest_json(manifest: dict) -> list[str]:
+    return [json.dumps(manifest, indent=4, ensure_ascii=False)]
+
+
+def _attachment_arcname(file_path: str) -> str:
+    """附件记录的 file_path（"<user_id>/<文件名>"）在压缩包中的路径。"""
+    return f"attachments/{os.path.basename(file_path or '')}"
+
+
+def _full_export_members(user_id: int, manifest: dict, batch_size: int):
+    yield "manifest.json", _manifest_json(manifest)
+    for model in MODELS_TO_HANDLE:
+        records = _iter_user_records(model, user_id, batch_size)
+        yield f"data/{model.__tablename__}.json", _json_array_fragments(
+            record.to_dict() for record in records
+        )
+    current_app.logger.info("Exported all database tables to JSON.")
+
+    for file_path, arcname in _export_attachment_paths(user_id):
+        current_app.logger.info(f"[导出附件] 正在添加文件: {arcname}")
+        yield arcname, file_path
+
+
+def _sorted_row_keys(table_name: str, keys) -> list:
+    if table_name == Setting.__tablename__:
+        return sorted(keys)
+    return sorted(keys, key=int)
+
+
+def _iter_records_by_keys(model, user_id: int, keys: list, batch_size: int):
+    """按主键分批读取用户的指定行；已不存在的行被跳过。"""
+    query = _user_records_query(model, user_id)
+    if query is None:
+        return
+    column = model.key if model is Setting else model.id
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start : start + batch_size]
+        values = batch if model is Setting else [int(key) for key in batch]
+        yield from query.filter(column.in_(values)).order_by(column).all()
+
+
+def _tombstone(table_name: str, key: str) -> dict:
+    if table_name == Setting.__tablename__:
+        return {"key": key}
+    return {"id": int(key)}
+
+
+def _delta_export_members(user_id: int, manifest: dict, changes: dict, batch_size: int):
+    """
+    增量包：data/<表>.json 为变更后的完整行，deleted/<表>.json 为墓碑，
+    attachments/ 只包含新增或修改过的附件记录对应的文件。派生表不导出。
     """
-    current_app.logger.info(f"Starting data export for user: {user.username}")
-    buffer = io.BytesIO()
+    yield "manifest.json", _manifest_json(manifest)
+    attachment_paths: list[str] = []
+    for model in MODELS_TO_HANDLE:
+        table_name = model.__tablename__
+        if table_name not in TRACKED_TABLES:
+            continue
+        ops = changes.get(table_name, {})
+        upserts = _sorted_row_keys(
+            table_name, [key for key, op in ops.items() if op == "upsert"]
+        )
+        deleted = _sorted_row_keys(
+            table_name, [key for key, op in ops.items() if op == "delete"]
+        )
+
+        def _rows(model=model, upserts=upserts):
+            for record in _iter_records_by_keys(model, user_id, upserts, batch_size):
+                if model is MilestoneAttachment:
+                    attachment_paths.append(record.file_path)
+                yield record.to_dict()
 
+        yield f"data/{table_name}.json", _json_array_fragments(_rows())
+        yield f"deleted/{table_name}.json", _json_array_fragments(
+            _tombstone(table_name, key) for key in deleted
+        )
+
+    upload_folder = current_app.config.get("UPLOAD_FOLDER")
+    for file_path in attachment_paths if upload_folder else []:
+        source = os.path.join(upload_folder, file_path)
+        if os.path.isfile(source):
+            yield _attachment_arcname(file_path), source
+
+
+def stream_export_for_user(user, since: int | None = None):
+    """
+    以生成器方式导出指定用户的数据为 ZIP。
+
+    数据表按批读取并逐条写入压缩条目，附件按块从磁盘读取；
+    每积累 EXPORT_STREAM_CHUNK_SIZE 字节交出一块，内存占用与账户数据量无关。
+    manifest.json 记录本次导出的数据版本；传入 since（上次导出的版本）时
+    只导出此后变更的行、附件与删除墓碑，水位线无效时立即抛出 ValueError。
+    需在应用上下文内迭代（响应中用 stream_with_context 包装）。
+    返回: (chunks_iterator, filename)
+    """
+    chunk_size = int(current_app.config.get("EXPORT_STREAM_CHUNK_SIZE", 64 * 1024))
+    batch_size = int(current_app.config.get("EXPORT_QUERY_BATCH_SIZE", 500))
+    user_id = user.id
+    username = user.username
+    exported_at = datetime.utcnow().isoformat()
+    # 导出包含 DailyData / WeeklyData，先落库写后队列里该用户的效率更新
+    flush_pending_efficiency(user_id)
+
+    # 版本号先于数据读取：导出期间提交的变更会在下一次增量中重复出现，但不会丢失
+    if since is None:
+        manifest = {
+            "format": "full",
+            "version": current_version(user_id),
+            "exported_at": exported_at,
+        }
+        members = _full_export_members(user_id, manifest, batch_size)
+        filename = f"yinghuoji_backup_{username}.zip"
+    else:
+        version, changes = changes_since(user_id, since)
+        manifest = {
+            "format": "delta",
+            "since": int(since),
+            "version": version,
+            "exported_at": exported_at,
+        }
+        members = _delta_export_members(user_id, manifest, changes, batch_size)
+        filename = f"yinghuoji_delta_{username}_{int(since)}-{version}.zip"
+
+    def _generate():
+        current_app.logger.info(
+            f"Starting {manifest['format']} data export for user: {username}"
+        )
+        try:
+            yield from _zip_stream(members, chunk_size)
+        except Exception as e:
+            # 响应头已发出，只能记录错误并中断传输，客户端会收到不完整的压缩包
+            current_app.logger.error(
+                f"Data export failed for user {username}: {e}", exc_info=True
+            )
+            raise
+
+    return _generate(), filename
+
+
+# 列式导出包含的表：学习记录、效率统计，以及关联它们所需的阶段与分类维表
+COLUMNAR_EXPORT_MODELS = [Stage, Category, SubCategory, LogEntry, DailyData, WeeklyData]
+COLUMNAR_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _load_pyarrow():
+    """按需导入 pyarrow（可选依赖），未安装时抛出 ValueError。"""
     try:
-        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for model in MODELS_TO_HANDLE:
-                records = _query_user_records(model, user.id)
-                data = [record.to_dict() for record in records]
-                json_data = json.dumps(data, indent=4, ensure_ascii=False)
-                zf.writestr(f"data/{model.__tablename__}.json", json_data)
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ValueError("列式导出需要服务器安装 pyarrow")
+    return pyarrow
+
+
+def _arrow_schema(pa, model):
+    """按数据库列类型生成 Arrow schema：日期为 date32，时间为微秒时间戳，整数为 int64。"""
+    fields = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, db.DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, db.Date):
+            arrow_type = pa.date32()
+        elif isinstance(column.type, db.Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, db.Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, db.Boolean):
+            arrow_type = pa.bool_()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=bool(column.nullable)))
+    return pa.schema(fields)
+
+
+def _iter_record_batches(pa, model, schema, user_id: int, row_group_size: int):
+    """按主键顺序每次读取 row_group_size 行，转成一个 RecordBatch。"""
+    query = _user_records_query(model, user_id)
+    if query is None:
+        return
+    columns = list(model.__table__.columns)
+    primary_key = list(model.__table__.primary_key.columns)
+    rows = iter(
+        query.with_entities(*columns).order_by(*primary_key).yield_per(row_group_size)
+    )
+    while True:
+        chunk = list(islice(rows, row_group_size))
+        if not chunk:
+            return
+        values = list(zip(*chunk))
+        yield pa.record_batch(
+            [
+                pa.array(column_values, type=field.type)
+                for column_values, field in zip(values, schema)
+            ],
+            schema=schema,
+        )
 
-            current_app.logger.info("Exported all database tables to JSON.")
 
-            upload_folder = current_app.config.get("UPLOAD_FOLDER")
-            current_app.logger.info(f"[导出附件] UPLOAD_FOLDER配置: {upload_folder}")
+def _columnar_fragments(pa, fmt: str, schema, batches):
+    """逐个行组写入 Parquet / Arrow IPC，每写完一组交出已生成的字节。"""
+    sink = _ZipChunkSink()
+    if fmt == "parquet":
+        # 每个 RecordBatch 成为一个行组
+        writer = pa.parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(
+            sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd")
+        )
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _columnar_export_members(pa, fmt: str, user_id: int, manifest: dict, row_group_size: int):
+    yield "manifest.json", _manifest_json(manifest)
+    for model in COLUMNAR_EXPORT_MODELS:
+        schema = _arrow_schema(pa, model)
+        zinfo = zipfile.ZipInfo(
+            f"data/{model.__tablename__}{COLUMNAR_FORMATS[fmt]}",
+            date_time=time.localtime()[:6],
+        )
+        # 文件内部已按列 zstd 压缩，外层不再 deflate
+        zinfo.compress_type = zipfile.ZIP_STORED
+        batches = _iter_record_batches(pa, model, schema, user_id, row_group_size)
+        yield zinfo, _columnar_fragments(pa, fmt, schema, batches)
 
-            if upload_folder:
-                user_upload_folder = os.path.join(upload_folder, str(user.id))
-                current_app.logger.info(
-                    f"[导出附件] 用户附件目录: {user_upload_folder}"
-                )
-                current_app.logger.info(
-                    f"[导出附件] 目录是否存在: {os.path.exists(user_upload_folder)}"
-                )
 
-                if os.path.exists(user_upload_folder):
-                    files = os.listdir(user_upload_folder)
-                    current_app.logger.info(f"[导出附件] 找到 {len(files)} 个文件")
-
-                    for filename in files:
-                        file_path = os.path.join(user_upload_folder, filename)
-                        current_app.logger.info(f"[导出附件] 正在添加文件: {filename}")
-                        zf.write(file_path, arcname=f"attachments/{filename}")
-                    current_app.logger.info("Exported all milestone attachments.")
-                else:
-                    current_app.logger.warning(
-                        f"[导出附件] 用户附件目录不存在: {user_upload_folder}"
-                    )
-            else:
-                current_app.logger.warning(
-                    "UPLOAD_FOLDER not configured, skipping attachments export."
-                )
+def stream_columnar_export_for_user(user, fmt: str = "parquet"):
+    """
+    以 Parquet 或 Arrow IPC 格式流式导出学习记录与统计表，打包为 ZIP。
 
+    每张表一个文件（data/<表名>.parquet|.arrow），按 EXPORT_ROW_GROUP_SIZE 行
+    一个行组从数据库读取并写出，列保留日期 / 整数等原始类型，供分析工具直接加载。
+    格式无效或未安装 pyarrow 时立即抛出 ValueError。
+    返回: (chunks_iterator, filename)
+    """
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    pa = _load_pyarrow()
+    chunk_size = int(current_app.config.get("EXPORT_STREAM_CHUNK_SIZE", 64 * 1024))
+    row_group_size = max(int(current_app.config.get("EXPORT_ROW_GROUP_SIZE", 50000)), 1)
+    user_id = user.id
+    username = user.username
+    flush_pending_efficiency(user_id)
+    manifest = {
+        "format": fmt,
+        "version": current_version(user_id),
+        "exported_at": datetime.utcnow().isoformat(),
+        "tables": [model.__tablename__ for model in COLUMNAR_EXPORT_MODELS],
+    }
+    members = _columnar_export_members(pa, fmt, user_id, manifest, row_group_size)
+
+    def _generate():
+        current_app.logger.info(f"Starting {fmt} data export for user: {username}")
+        try:
+            yield from _zip_stream(members, chunk_size)
+        except Exception as e:
+            current_app.logger.error(
+                f"Data export failed for user {username}: {e}", exc_info=True
+            )
+            raise
+
+    return _generate(), f"yinghuoji_{fmt}_{username}.zip"
+
+
+def export_data_for_user(user):
+    """
+    将指定用户的所有数据导出到一个ZIP压缩包的内存缓冲区中。
+    仅用于需要完整文件的场景（脚本、测试）；HTTP 导出使用 stream_export_for_user。
+    返回: (success_bool, buffer, filename)
+    """
+    try:
+        chunks, filename = stream_export_for_user(user)
+        buffer = io.BytesIO()
+        for chunk in chunks:
+            buffer.write(chunk)
         buffer.seek(0)
-        filename = f"yinghuoji_backup_{user.username}.zip"
         return True, buffer, filename
-    except Exception as e:
-        current_app.logger.error(
-            f"Data export failed for user {user.username}: {e}", exc_info=True
-        )
+    except Exception:
         return False, None, None
 
 
-def import_data_for_user(user, zip_stream):
+# 导入顺序：被引用的表在前，保证外键映射在子表写入前已就绪
+IMPORT_ORDER = [
+    Setting.__tablename__,
+    Stage.__tablename__,
+    Category.__tablename__,
+    SubCategory.__tablename__,
+    MilestoneCategory.__tablename__,
+    Milestone.__tablename__,
+    LogEntry.__tablename__,
+    DailyData.__tablename__,
+    WeeklyData.__tablename__,
+    MilestoneAttachment.__tablename__,
+    CountdownEvent.__tablename__,
+    Motto.__tablename__,
+]
+
+# 导入后需要记录 原id -> 新id 映射的表
+_MAPPED_TABLES = (
+    Stage.__tablename__,
+    Category.__tablename__,
+    SubCategory.__tablename__,
+    MilestoneCategory.__tablename__,
+    Milestone.__tablename__,
+)
+
+_JSON_READ_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_json_array(binary_file, chunk_size: int = _JSON_READ_CHUNK_SIZE):
     """
-    从 zip 流导入数据到指定用户，导入前会清空用户已有数据。
+    增量解析 JSON 数组，逐个产出元素。
+
+    按块读取并用 raw_decode 解析单个元素，内存中只保留当前块与未解析的尾部，
+    不会把整张表的 JSON 一次性载入。
     """
-    if not zip_stream:
-        return False, "未提供 zip 文件"
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(binary_file, encoding="utf-8-sig")
+    buffer, position, eof = "", 0, False
+    state = "start"  # start -> first -> (value -> next)*
 
+    # 调用方持有底层文件：结束时解除包装，避免 TextIOWrapper 回收时顺带关闭它
     try:
-        with zipfile.ZipFile(zip_stream) as zf:
-            _clear_user_data(user)
-
-            model_map = {model.__tablename__: model for model in MODELS_TO_HANDLE}
-            import_order = [
-                Setting.__tablename__,
-                Stage.__tablename__,
-                Category.__tablename__,
-                SubCategory.__tablename__,
-                MilestoneCategory.__tablename__,
-                Milestone.__tablename__,
-                LogEntry.__tablename__,
-                DailyData.__tablename__,
-                WeeklyData.__tablename__,
-                MilestoneAttachment.__tablename__,
-                CountdownEvent.__tablename__,
-                Motto.__tablename__,
-            ]
-
-            pending_records = {}
-            for table_name in import_order:
-                json_path = f"data/{table_name}.json"
-                if json_path in zf.namelist():
-                    with zf.open(json_path) as json_file:
-                        pending_records[table_name] = json.load(json_file)
-
-            id_maps: dict[str, dict[str, int]] = {
-                Stage.__tablename__: {},
-                Category.__tablename__: {},
-                SubCategory.__tablename__: {},
-                MilestoneCategory.__tablename__: {},
-                Milestone.__tablename__: {},
-            }
-
-            category_name_cache: dict[str, int] = {}
-            subcategory_name_cache: dict[str, int] = {}
-
-            def _store_mapping(bucket: str, original_id, new_id):
-                if original_id is None:
-                    return
-                id_maps[bucket][str(original_id)] = new_id
-
-            def _map_id(bucket: str, incoming_id):
-                if incoming_id is None:
-                    return None
-                return id_maps[bucket].get(str(incoming_id))
-
-            def _ensure_category_from_info(cat_info):
-                if not cat_info:
-                    return None
-
-                original_id = cat_info.get("id")
-                if original_id:
-                    mapped = _map_id(Category.__tablename__, original_id)
-                    if mapped:
-                        return mapped
-
-                name = cat_info.get("name")
-                if not name:
-                    return None
-
-                if name in category_name_cache:
-                    cat_id = category_name_cache[name]
-                    if original_id:
-                        _store_mapping(Category.__tablename__, original_id, cat_id)
-                    return cat_id
-
-                existing = Category.query.filter_by(name=name, user_id=user.id).first()
-                if existing:
-                    category_name_cache[name] = existing.id
-                    if original_id:
-                        _store_mapping(Category.__tablename__, original_id, existing.id)
-                    return existing.id
-
-                new_category = Category(name=name, user_id=user.id)
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position >= len(buffer):
+                if eof:
+                    raise ValueError("JSON 数据不完整")
+                chunk = reader.read(chunk_size)
+                buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+                continue
+
+            char = buffer[position]
+            if state == "start":
+                if char != "[":
+                    raise ValueError("数据文件不是 JSON 数组")
+                position += 1
+                state = "first"
+                continue
+            if state in ("first", "next") and char == "]":
+                return
+            if state == "next":
+                if char != ",":
+                    raise ValueError(f"JSON 数组格式错误：位置 {position} 处应为 ','")
+                position += 1
+                state = "value"
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                item, end = None, None
+            if end is None or (end == len(buffer) and not eof):
+                # 元素跨越了块边界（数字等标量也可能被截断），读入更多后重新解析
+                chunk = reader.read(chunk_size)
+                buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+                continue
+            position = end
+            state = "next"
+            yield item
+    finally:
+        if not reader.closed:
+            reader.detach()
+
+
+def _coerce_temporal_fields(record_data: dict) -> None:
+    """把导出时序列化为字符串的日期/时间字段还原为 date/datetime。"""
+    for key, value in list(record_data.items()):
+        if not isinstance(value, str) or not value:
+            continue
+        if "datetime" in key or key.endswith("_at") or key.endswith("_utc"):
+            try:
+                dt_obj = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                record_data[key] = dt_obj.replace(tzinfo=None)
+            except ValueError as ve:
+                current_app.logger.warning(
+                    f"Could not parse datetime string '{value}' for key '{key}': {ve}"
+                )
+        elif "date" in key:
+            try:
+                record_data[key] = date.fromisoformat(value)
+            except ValueError as ve:
+                current_app.logger.warning(
+                    f"Could not parse date string '{value}' for key '{key}': {ve}"
+                )
+
+
+def _insert_returning_ids(table, rows: list[dict]) -> list[int]:
+    """批量插入并按输入顺序返回新主键；方言不支持时逐行插入。"""
+    dialect = db.session.get_bind().dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+        )
+        return list(result.scalars())
+    return [
+        db.session.execute(table.insert(), row).inserted_primary_key[0] for row in rows
+    ]
+
+
+def _bulk_insert(table, rows: list[dict], returning: bool = False) -> list[int] | None:
+    """
+    以 executemany 批量插入；列集合不同的行分组执行，避免缺省列被写成 NULL。
+    returning=True 时返回与 rows 一一对应的新主键。
+    """
+    groups: dict[tuple, list[int]] = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(tuple(sorted(row)), []).append(index)
+
+    new_ids: list[Any] = [None] * len(rows)
+    for indices in groups.values():
+        params = [rows[index] for index in indices]
+        if not returning:
+            db.session.execute(table.insert(), params)
+            continue
+        for index, new_id in zip(indices, _insert_returning_ids(table, params)):
+            new_ids[index] = new_id
+    return new_ids if returning else None
+
+
+class _ImportIdMapper:
+    """导入过程中的 原id -> 新id 映射，以及缺失分类/子分类的按名重建。"""
+
+    def __init__(self, user_id: int) -> None:
+        self.user_id = user_id
+        self.id_maps: dict[str, dict[str, int]] = {name: {} for name in _MAPPED_TABLES}
+        self.category_names: dict[str, int] = {}
+        self.subcategory_names: dict[str, int] = {}
+
+    def store(self, bucket: str, original_ids, new_ids) -> None:
+        mapping = self.id_maps[bucket]
+        for original_id, new_id in zip(original_ids, new_ids):
+            if original_id is not None:
+                mapping[str(original_id)] = new_id
+
+    def map_id(self, bucket: str, incoming_id):
+        if incoming_id is None:
+            return None
+        return self.id_maps[bucket].get(str(incoming_id))
+
+    def ensure_category(self, cat_info):
+        if not cat_info:
+            return None
+
+        original_id = cat_info.get("id")
+        if original_id:
+            mapped = self.map_id(Category.__tablename__, original_id)
+            if mapped:
+                return mapped
+
+        name = cat_info.get("name")
+        if not name:
+            return None
+
+        if name in self.category_names:
+            cat_id = self.category_names[name]
+        else:
+            existing = Category.query.filter_by(name=name, user_id=self.user_id).first()
+            if existing:
+                cat_id = existing.id
+            else:
+                new_category = Category(name=name, user_id=self.user_id)
                 db.session.add(new_category)
                 db.session.flush()
-                category_name_cache[name] = new_category.id
-                if original_id:
-                    _store_mapping(Category.__tablename__, original_id, new_category.id)
+                cat_id = new_category.id
                 current_app.logger.info(
-                    "Reconstructed missing category '%s' (new id=%s)",
-                    name,
-                    new_category.id,
+                    "Reconstructed missing category '%s' (new id=%s)", name, cat_id
                 )
-                return new_category.id
-
-            def _ensure_subcategory_from_info(sub_info, fallback_original_id=None):
-                if not sub_info and not fallback_original_id:
-                    return None
-
-                original_id = sub_info.get("id") if sub_info else fallback_original_id
-                if original_id:
-                    mapped = _map_id(SubCategory.__tablename__, original_id)
-                    if mapped:
-                        return mapped
-
-                name = (sub_info or {}).get("name")
-                category_id_hint = (sub_info or {}).get("category_id")
-                category_info = (sub_info or {}).get("category")
-
-                mapped_category = _map_id(Category.__tablename__, category_id_hint)
-                if mapped_category is None:
-                    mapped_category = _ensure_category_from_info(category_info)
-                if mapped_category is None and category_id_hint is not None:
-                    mapped_category = _map_id(
-                        MilestoneCategory.__tablename__, category_id_hint
-                    )
+            self.category_names[name] = cat_id
+        if original_id:
+            self.store(Category.__tablename__, [original_id], [cat_id])
+        return cat_id
+
+    def ensure_subcategory(self, sub_info, fallback_original_id=None):
+        if not sub_info and not fallback_original_id:
+            return None
+
+        original_id = sub_info.get("id") if sub_info else fallback_original_id
+        if original_id:
+            mapped = self.map_id(SubCategory.__tablename__, original_id)
+            if mapped:
+                return mapped
+
+        name = (sub_info or {}).get("name")
+        category_id_hint = (sub_info or {}).get("category_id")
+        category_info = (sub_info or {}).get("category")
+
+        mapped_category = self.map_id(Category.__tablename__, category_id_hint)
+        if mapped_category is None:
+            mapped_category = self.ensure_category(category_info)
+        if mapped_category is None and category_id_hint is not None:
+            mapped_category = self.map_id(
+                MilestoneCategory.__tablename__, category_id_hint
+            )
+
+        if mapped_category is None:
+            current_app.logger.warning(
+                "Unable to recreate subcategory '%s' because category mapping is missing.",
+                name or original_id,
+            )
+            return None
+
+        cache_key = f"{mapped_category}:{name}"
+        if cache_key in self.subcategory_names:
+            sub_id = self.subcategory_names[cache_key]
+        else:
+            new_name = name or f"未命名标签-{original_id or mapped_category}"
+            new_sub = SubCategory(name=new_name, category_id=mapped_category)
+            db.session.add(new_sub)
+            db.session.flush()
+            sub_id = new_sub.id
+            self.subcategory_names[cache_key] = sub_id
+            current_app.logger.info(
+                "Reconstructed missing subcategory '%s' (new id=%s, category_id=%s)",
+                new_name,
+                sub_id,
+                mapped_category,
+            )
+        if original_id:
+            self.store(SubCategory.__tablename__, [original_id], [sub_id])
+        return sub_id
+
+
+def _remap_stage_rows(table_name: str, mapper: _ImportIdMapper, batch: list) -> list:
+    kept = []
+    for original_id, row, extra in batch:
+        mapped_stage = mapper.map_id(Stage.__tablename__, row.get("stage_id"))
+        if mapped_stage is None:
+            current_app.logger.warning(
+                "Skipping %s record dated %s due to missing stage mapping",
+                table_name,
+                row.get("log_date"),
+            )
+            continue
+        row["stage_id"] = mapped_stage
+        kept.append((original_id, row, extra))
+    return kept
+
+
+def _write_import_batch(table_name: str, mapper: _ImportIdMapper, batch: list) -> int:
+    """
+    写入一批已解析的记录：(原id, 列值, 附加信息)。
 
-                if mapped_category is None:
-                    current_app.logger.warning(
-                        "Unable to recreate subcategory '%s' because category mapping is missing.",
-                        name or original_id,
-                    )
-                    return None
-
-                cache_key = f"{mapped_category}:{name}"
-                if cache_key in subcategory_name_cache:
-                    sub_id = subcategory_name_cache[cache_key]
-                    if original_id:
-                        _store_mapping(SubCategory.__tablename__, original_id, sub_id)
-                    return sub_id
-
-                new_name = name or f"未命名标签-{original_id or mapped_category}"
-                new_sub = SubCategory(name=new_name, category_id=mapped_category)
-                db.session.add(new_sub)
-                db.session.flush()
-                subcategory_name_cache[cache_key] = new_sub.id
-                if original_id:
-                    _store_mapping(SubCategory.__tablename__, original_id, new_sub.id)
-                current_app.logger.info(
-                    "Reconstructed missing subcategory '%s' (new id=%s, category_id=%s)",
-                    new_name,
-                    new_sub.id,
-                    mapped_category,
+    外键先按映射表整体替换，再一次 executemany 写入；
+    需要被子表引用的表用 RETURNING 取回新主键并记录映射。返回写入行数。
+    """
+    model = next(m for m in MODELS_TO_HANDLE if m.__tablename__ == table_name)
+    table = model.__table__
+
+    if table_name == SubCategory.__tablename__:
+        kept = []
+        for original_id, row, extra in batch:
+            parent_id = mapper.map_id(Category.__tablename__, row.get("category_id"))
+            if parent_id is None:
+                current_app.logger.warning(
+                    "Skipping sub_category %s due to missing category mapping",
+                    row.get("name"),
+                )
+                continue
+            row["category_id"] = parent_id
+            kept.append((original_id, row, extra))
+        batch = kept
+    elif table_name == Milestone.__tablename__:
+        for _original_id, row, _extra in batch:
+            if row.get("category_id") is not None:
+                row["category_id"] = mapper.map_id(
+                    MilestoneCategory.__tablename__, row["category_id"]
+                )
+    elif table_name == LogEntry.__tablename__:
+        batch = _remap_stage_rows(table_name, mapper, batch)
+        for _original_id, row, sub_info in batch:
+            sub_old = row.get("subcategory_id")
+            mapped_sub = mapper.map_id(SubCategory.__tablename__, sub_old)
+            if not mapped_sub:
+                mapped_sub = mapper.ensure_subcategory(sub_info, sub_old)
+            row["subcategory_id"] = mapped_sub
+    elif table_name in (DailyData.__tablename__, WeeklyData.__tablename__):
+        batch = _remap_stage_rows(table_name, mapper, batch)
+    elif table_name == MilestoneAttachment.__tablename__:
+        kept = []
+        for original_id, row, extra in batch:
+            milestone_id = mapper.map_id(Milestone.__tablename__, row.get("milestone_id"))
+            if milestone_id is None:
+                current_app.logger.warning(
+                    "Skipping milestone attachment because parent milestone was not imported."
                 )
-                return new_sub.id
+                continue
+            row["milestone_id"] = milestone_id
+            if row.get("file_path"):
+                filename = os.path.basename(row["file_path"])
+                row["file_path"] = f"{mapper.user_id}/{filename}"
+            kept.append((original_id, row, extra))
+        batch = kept
+
+    if not batch:
+        return 0
+    rows = [row for _original_id, row, _extra in batch]
+    if table_name not in _MAPPED_TABLES:
+        _bulk_insert(table, rows)
+        return len(rows)
+
+    new_ids = _bulk_insert(table, rows, returning=True) or []
+    mapper.store(table_name, [original_id for original_id, _row, _extra in batch], new_ids)
+    if table_name == Category.__tablename__:
+        for row, new_id in zip(rows, new_ids):
+            mapper.category_names[row["name"]] = new_id
+    elif table_name == SubCategory.__tablename__:
+        for row, new_id in zip(rows, new_ids):
+            mapper.subcategory_names[f"{row['category_id']}:{row['name']}"] = new_id
+    return len(rows)
+
+
+def _prepare_import_record(table_name: str, record: dict, user_id: int) -> tuple:
+    """把备份中的一条记录整理为 (原id, 列值, 附加信息)。"""
+    model = next(m for m in MODELS_TO_HANDLE if m.__tablename__ == table_name)
+    record_data = dict(record)
+    original_id = record_data.pop("id", None)
+    sub_info = (
+        record_data.pop("subcategory", None)
+        if table_name == LogEntry.__tablename__
+        else None
+    )
+    if "user_id" in model.__table__.columns:
+        record_data["user_id"] = user_id
+    _coerce_temporal_fields(record_data)
+    return original_id, _prune_unknown_fields(table_name, record_data), sub_info
+
+
+def _write_import_records(
+    table_name: str, records, mapper: _ImportIdMapper, batch_size: int
+) -> int:
+    """把一张表的原始记录分批整理并写入，返回写入行数。"""
+    written = 0
+    batch: list = []
+    for record in records:
+        batch.append(_prepare_import_record(table_name, record, mapper.user_id))
+        if len(batch) >= batch_size:
+            written += _write_import_batch(table_name, mapper, batch)
+            batch = []
+    if batch:
+        written += _write_import_batch(table_name, mapper, batch)
+    return written
+
+
+def _import_table(zf, table_name: str, mapper: _ImportIdMapper, batch_size: int) -> int:
+    """流式解析一张表的 JSON 并分批写入，返回写入行数。"""
+    json_path = f"data/{table_name}.json"
+    if json_path not in zf.namelist():
+        return 0
+    with zf.open(json_path) as json_file:
+        return _write_import_records(
+            table_name, _iter_json_array(json_file), mapper, batch_size
+        )
 
-            for table_name in import_order:
-                model = model_map.get(table_name)
-                if not model:
-                    continue
 
-                records = pending_records.get(table_name, [])
-                if not records:
-                    continue
+def _user_upload_folder(user_id: int) -> str | None:
+    upload_folder = current_app.config.get("UPLOAD_FOLDER")
+    if not upload_folder:
+        current_app.logger.warning(
+            "UPLOAD_FOLDER not configured, skipping attachments import."
+        )
+        return None
+    return os.path.join(upload_folder, str(user_id))
+
+
+def _replace_folder(staged: str, target: str) -> None:
+    """用暂存目录整体替换目标目录（旧目录先移开再删除）；暂存目录不存在时不做任何事。"""
+    if not os.path.isdir(staged):
+        return
+    previous = f"{target}.replaced"
+    if os.path.isdir(target):
+        shutil.rmtree(previous, ignore_errors=True)
+        os.replace(target, previous)
+    os.replace(staged, target)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def _extract_attachments(zf, user_upload_folder: str) -> None:
+    """把压缩包 attachments/ 下的文件平铺解压到目标目录，重名时追加序号。"""
+    os.makedirs(user_upload_folder, exist_ok=True)
+    for file_info in zf.infolist():
+        if file_info.filename.startswith("attachments/"):
+            zf.extract(file_info, path=user_upload_folder)
+
+            source_path = os.path.join(user_upload_folder, file_info.filename)
+            target_name = os.path.basename(file_info.filename)
+            base, ext = os.path.splitext(target_name)
+            dest_path = os.path.join(user_upload_folder, target_name)
+            counter = 1
+            while os.path.exists(dest_path):
+                dest_path = os.path.join(user_upload_folder, f"{base}_{counter}{ext}")
+                counter += 1
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            os.rename(source_path, dest_path)
+
+    attachments_dir = os.path.join(user_upload_folder, "attachments")
+    if os.path.isdir(attachments_dir):
+        for root, dirs, files in os.walk(attachments_dir, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            for name in dirs:
+                os.rmdir(os.path.join(root, name))
+        try:
+            os.rmdir(attachments_dir)
+        except OSError:
+            pass
+    current_app.logger.info("Extracted all attachments.")
+
+
+def import_data_for_user(user, zip_stream, report: dict | None = None):
+    """
+    从 zip 流导入数据到指定用户，导入前会清空用户已有数据。
 
-                for record in records:
-                    record_data = dict(record)
-                    original_id = record_data.pop("id", None)
-                    sub_info = (
-                        record_data.get("subcategory")
-                        if table_name == LogEntry.__tablename__
-                        else None
-                    )
-                    if table_name == LogEntry.__tablename__:
-                        record_data.pop("subcategory", None)
-
-                    if "user_id" in model.__table__.columns:
-                        record_data["user_id"] = user.id
-
-                    for key, value in list(record_data.items()):
-                        if isinstance(value, str) and value:
-                            if (
-                                "datetime" in key
-                                or key.endswith("_at")
-                                or key.endswith("_utc")
-                            ):
-                                try:
-                                    dt_obj = datetime.fromisoformat(
-                                        value.replace("Z", "+00:00")
-                                    )
-                                    record_data[key] = dt_obj.replace(tzinfo=None)
-                                except ValueError as ve:
-                                    current_app.logger.warning(
-                                        f"Could not parse datetime string '{value}' for key '{key}': {ve}"
-                                    )
-                            elif "date" in key and not key.endswith("_at"):
-                                try:
-                                    record_data[key] = date.fromisoformat(value)
-                                except ValueError as ve:
-                                    current_app.logger.warning(
-                                        f"Could not parse date string '{value}' for key '{key}': {ve}"
-                                    )
-
-                    record_data = _prune_unknown_fields(table_name, record_data)
-
-                    try:
-                        if table_name == Stage.__tablename__:
-                            new_stage = model(**record_data)
-                            db.session.add(new_stage)
-                            db.session.flush()
-                            _store_mapping(table_name, original_id, new_stage.id)
-                            continue
-
-                        if table_name == Category.__tablename__:
-                            new_category = model(**record_data)
-                            db.session.add(new_category)
-                            db.session.flush()
-                            _store_mapping(table_name, original_id, new_category.id)
-                            category_name_cache[new_category.name] = new_category.id
-                            continue
-
-                        if table_name == MilestoneCategory.__tablename__:
-                            new_mc = model(**record_data)
-                            db.session.add(new_mc)
-                            db.session.flush()
-                            _store_mapping(table_name, original_id, new_mc.id)
-                            continue
-
-                        if table_name == SubCategory.__tablename__:
-                            parent_id = _map_id(
-                                Category.__tablename__, record_data.get("category_id")
-                            )
-                            if parent_id is None:
-                                current_app.logger.warning(
-                                    "Skipping sub_category %s due to missing category mapping",
-                                    record_data.get("name"),
-                                )
-                                continue
-                            record_data["category_id"] = parent_id
-                            new_sub = model(**record_data)
-                            db.session.add(new_sub)
-                            db.session.flush()
-                            _store_mapping(table_name, original_id, new_sub.id)
-                            sub_key = f"{parent_id}:{new_sub.name}"
-                            subcategory_name_cache[sub_key] = new_sub.id
-                            continue
-
-                        if table_name == Milestone.__tablename__:
-                            category_id = record_data.get("category_id")
-                            if category_id is not None:
-                                record_data["category_id"] = _map_id(
-                                    MilestoneCategory.__tablename__, category_id
-                                )
-                            new_milestone = model(**record_data)
-                            db.session.add(new_milestone)
-                            db.session.flush()
-                            _store_mapping(table_name, original_id, new_milestone.id)
-                            continue
-
-                        if table_name == LogEntry.__tablename__:
-                            mapped_stage = _map_id(
-                                Stage.__tablename__, record_data.get("stage_id")
-                            )
-                            if mapped_stage is None:
-                                current_app.logger.warning(
-                                    "Skipping log entry dated %s due to missing stage mapping",
-                                    record_data.get("log_date"),
-                                )
-                                continue
-                            record_data["stage_id"] = mapped_stage
-                            sub_old = record_data.get("subcategory_id")
-                            mapped_sub = _map_id(SubCategory.__tablename__, sub_old)
-                            if not mapped_sub:
-                                mapped_sub = _ensure_subcategory_from_info(
-                                    sub_info, sub_old
-                                )
-                            record_data["subcategory_id"] = mapped_sub
-                            db.session.add(model(**record_data))
-                            continue
-
-                        if table_name in {
-                            DailyData.__tablename__,
-                            WeeklyData.__tablename__,
-                        }:
-                            mapped_stage = _map_id(
-                                Stage.__tablename__, record_data.get("stage_id")
-                            )
-                            if mapped_stage is None:
-                                current_app.logger.warning(
-                                    "Skipping %s record due to missing stage mapping",
-                                    table_name,
-                                )
-                                continue
-                            record_data["stage_id"] = mapped_stage
-                            db.session.add(model(**record_data))
-                            continue
-
-                        if table_name == MilestoneAttachment.__tablename__:
-                            milestone_id = _map_id(
-                                Milestone.__tablename__, record_data.get("milestone_id")
-                            )
-                            if milestone_id is None:
-                                current_app.logger.warning(
-                                    "Skipping milestone attachment because parent milestone was not imported."
-                                )
-                                continue
-                            record_data["milestone_id"] = milestone_id
-                            original_path = record_data.get("file_path")
-                            if original_path:
-                                filename = os.path.basename(original_path)
-                                record_data["file_path"] = f"{user.id}/{filename}"
-                            db.session.add(model(**record_data))
-                            continue
-
-                        db.session.add(model(**record_data))
-                    except Exception as e:  # pragma: no cover - defensive logging
-                        current_app.logger.error(
-                            f"Failed to add {model.__name__} record: {e}, data: {record_data}"
-                        )
-                        raise
+    各表 JSON 增量解析、按 IMPORT_BATCH_SIZE 分批 executemany 写入；
+    写完后在同一事务内一次性重建日汇总与全部阶段的效率，再统一提交。
+    传入 report 时写入各阶段耗时（秒）与各表写入行数：
+    {"phases": {...}, "rows": {...}}。
+    """
+    if not zip_stream:
+        return False, "未提供 zip 文件"
 
+    phases: dict[str, float] = {}
+    rows: dict[str, int] = {}
+    if report is not None:
+        report["phases"] = phases
+        report["rows"] = rows
+    batch_size = int(current_app.config.get("IMPORT_BATCH_SIZE", 1000))
+    started = time.perf_counter()
+    phase_started = started
+
+    def _phase_done(name: str) -> None:
+        nonlocal phase_started
+        now = time.perf_counter()
+        phases[name] = round(now - phase_started, 4)
+        phase_started = now
+
+    user_upload_folder = _user_upload_folder(user.id)
+    staged_attachments = (
+        f"{user_upload_folder}.importing" if user_upload_folder else None
+    )
+    try:
+        with zipfile.ZipFile(zip_stream) as zf:
+            # 清空与写入在同一事务内：任何一条记录失败都整体回滚，旧数据保持原样
+            _clear_user_data(user, commit=False, remove_files=False)
+            _phase_done("clear")
+
+            mapper = _ImportIdMapper(user.id)
+            for table_name in IMPORT_ORDER:
+                rows[table_name] = _import_table(zf, table_name, mapper, batch_size)
+                if table_name == Stage.__tablename__:
+                    # 阶段绕过 ORM 写入，手动让阶段索引失效
+                    mark_stage_index_stale([user.id])
+            _phase_done("tables")
             current_app.logger.info("Imported all JSON data to database session.")
 
-            upload_folder = current_app.config.get("UPLOAD_FOLDER")
-            if upload_folder:
-                user_upload_folder = os.path.join(upload_folder, str(user.id))
-                os.makedirs(user_upload_folder, exist_ok=True)
-                for file_info in zf.infolist():
-                    if file_info.filename.startswith("attachments/"):
-                        zf.extract(file_info, path=user_upload_folder)
-
-                        source_path = os.path.join(user_upload_folder, file_info.filename)
-                        target_name = os.path.basename(file_info.filename)
-                        base, ext = os.path.splitext(target_name)
-                        dest_path = os.path.join(user_upload_folder, target_name)
-                        counter = 1
-                        while os.path.exists(dest_path):
-                            dest_path = os.path.join(
-                                user_upload_folder, f"{base}_{counter}{ext}"
-                            )
-                            counter += 1
-                        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                        os.rename(source_path, dest_path)
-
-                attachments_dir = os.path.join(user_upload_folder, "attachments")
-                if os.path.isdir(attachments_dir):
-                    for root, dirs, files in os.walk(attachments_dir, topdown=False):
-                        for name in files:
-                            os.remove(os.path.join(root, name))
-                        for name in dirs:
-                            os.rmdir(os.path.join(root, name))
-                    try:
-                        os.rmdir(attachments_dir)
-                    except OSError:
-                        pass
-                current_app.logger.info("Extracted all attachments.")
-            else:
-                current_app.logger.warning(
-                    "UPLOAD_FOLDER not configured, skipping attachments import."
-                )
+            # 附件先解压到暂存目录，提交后再替换用户目录
+            if staged_attachments:
+                shutil.rmtree(staged_attachments, ignore_errors=True)
+                _extract_attachments(zf, staged_attachments)
+            _phase_done("attachments")
+
+        # 批量写入不经过 ORM 钩子，统一重建派生数据
+        rebuild_daily_rollup(user.id, commit=False)
+        _phase_done("daily_rollup")
+        rebuild_efficiency_for_user(user.id)
+        _phase_done("efficiency")
 
         db.session.commit()
-        current_app.logger.info("Data import committed successfully.")
+        _phase_done("commit")
+        if staged_attachments:
+            _replace_folder(staged_attachments, user_upload_folder)
+        phases["total"] = round(time.perf_counter() - started, 4)
+        current_app.logger.info(
+            "Data import committed successfully: phases=%s rows=%s", phases, rows
+        )
         return True, "导入成功"
 
     except Exception as e:
         db.session.rollback()
+        if staged_attachments:
+            shutil.rmtree(staged_attachments, ignore_errors=True)
         current_app.logger.error(
             f"Data import failed for user {user.username}: {e}", exc_info=True
         )
         return False, f"导入失败: {e}"
 
 
+def _read_manifest(zf) -> dict:
+    try:
+        return json.loads(zf.read("manifest.json"))
+    except KeyError:
+        raise ValueError("备份缺少 manifest.json（版本信息），无法应用增量")
+
+
+def _copy_zip_entry(source_zip, info, target_zip, arcname: str | None = None) -> None:
+    zinfo = zipfile.ZipInfo(arcname or info.filename, date_time=info.date_time)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    with source_zip.open(info) as source, target_zip.open(
+        zinfo, "w", force_zip64=True
+    ) as target:
+        shutil.copyfileobj(source, target, _JSON_READ_CHUNK_SIZE)
+
+
+def _merged_table_records(base, table_name: str, table_ops: dict, removed_files: set):
+    """基础表逐条流过：被增量覆盖的行替换、被删除的行跳过，最后追加新增行。"""
+    json_path = f"data/{table_name}.json"
+    if json_path in base.namelist():
+        with base.open(json_path) as json_file:
+            for record in _iter_json_array(json_file):
+                key = row_key(table_name, record)
+                if key not in table_ops:
+                    yield record
+                    continue
+                replacement = table_ops.pop(key)
+                if replacement is None:
+                    if table_name == MilestoneAttachment.__tablename__:
+                        removed_files.add(_attachment_arcname(record.get("file_path")))
+                    continue
+                yield replacement
+    for key in _sorted_row_keys(table_name, table_ops):
+        if table_ops[key] is not None:
+            yield table_ops[key]
+
+
+def merge_backup_chain(base_stream, delta_streams, output) -> dict:
+    """
+    把全量备份与按顺序排列的增量包合并成一个新的全量备份，写入 output。
+
+    每个增量包的 since 必须等于前一个包的 version，否则抛出 ValueError。
+    增量内容（变更行与墓碑）按主键保存在内存中，基础备份逐条流式处理，
+    内存占用与变更量而非账户数据量相关。返回合并结果的 manifest。
+    """
+    with contextlib.ExitStack() as stack:
+        base = stack.enter_context(zipfile.ZipFile(base_stream))
+        base_manifest = _read_manifest(base)
+        if base_manifest.get("format") != "full":
+            raise ValueError("增量链的第一个文件必须是全量备份")
+        version = int(base_manifest.get("version", 0))
+
+        ops: dict[str, dict] = {table_name: {} for table_name in TRACKED_TABLES}
+        removed_files: set[str] = set()
+        delta_files: dict[str, tuple] = {}
+        for index, stream in enumerate(delta_streams, start=1):
+            delta = stack.enter_context(zipfile.ZipFile(stream))
+            manifest = _read_manifest(delta)
+            if manifest.get("format") != "delta":
+                raise ValueError(f"第 {index} 个增量文件不是增量备份")
+            since = int(manifest.get("since", -1))
+            if since != version:
+                raise ValueError(
+                    f"增量链不连续：第 {index} 个增量起点为 {since}，上一个版本为 {version}"
+                )
+            version = int(manifest["version"])
+            names = set(delta.namelist())
+            for table_name, table_ops in ops.items():
+                for prefix in ("data", "deleted"):
+                    json_path = f"{prefix}/{table_name}.json"
+                    if json_path not in names:
+                        continue
+                    with delta.open(json_path) as json_file:
+                        for record in _iter_json_array(json_file):
+                            key = row_key(table_name, record)
+                            previous = table_ops.get(key)
+                            if prefix == "data":
+                                table_ops[key] = record
+                                continue
+                            table_ops[key] = None
+                            if previous and table_name == MilestoneAttachment.__tablename__:
+                                arcname = _attachment_arcname(previous.get("file_path"))
+                                delta_files.pop(arcname, None)
+                                removed_files.add(arcname)
+            for info in delta.infolist():
+                if info.filename.startswith("attachments/"):
+                    delta_files[info.filename] = (delta, info)
+                    removed_files.discard(info.filename)
+
+        merged_manifest = {
+            "format": "full",
+            "version": version,
+            "exported_at": base_manifest.get("exported_at"),
+            "merged_at": datetime.utcnow().isoformat(),
+        }
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as out:
+            out.writestr("manifest.json", _manifest_json(merged_manifest)[0])
+            for model in MODELS_TO_HANDLE:
+                table_name = model.__tablename__
+                records = _merged_table_records(
+                    base, table_name, dict(ops.get(table_name, {})), removed_files
+                )
+                with out.open(f"data/{table_name}.json", "w", force_zip64=True) as entry:
+                    for fragment in _json_array_fragments(records):
+                        entry.write(fragment.encode("utf-8"))
+            for info in base.infolist():
+                name = info.filename
+                if (
+                    name.startswith("attachments/")
+                    and name not in removed_files
+                    and name not in delta_files
+                ):
+                    _copy_zip_entry(base, info, out)
+            for delta, info in delta_files.values():
+                _copy_zip_entry(delta, info, out)
+    return merged_manifest
+
+
+def import_backup_chain(user, base_stream, delta_streams, report: dict | None = None):
+    """
+    把全量备份与其后的增量链合并后导入（覆盖用户现有数据）。
+
+    合并结果写入临时文件，再走与全量导入相同的批量写入路径。
+    返回: (success_bool, message)
+    """
+    with tempfile.TemporaryFile() as merged:
+        try:
+            merge_backup_chain(base_stream, delta_streams, merged)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            current_app.logger.warning(f"Backup chain merge failed: {e}")
+            return False, f"增量合并失败: {e}"
+        merged.seek(0)
+        return import_data_for_user(user, merged, report=report)
+
+
 def clear_all_user_data(user):
     """
     清空用户的所有数据(包括附件)
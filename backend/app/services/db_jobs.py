@@ -0,0 +1,231 @@
+"""
+数据库任务队列的公共部分
+
+AI 生成任务（ai_planner.jobs）与后台数据导入（import_jobs）都把任务持久化在表中，
+由进程内的工作线程池或独立的 flask 命令领取执行，共用这里的机制：
+- 领取是带条件的 UPDATE，多个进程的工作线程可以共用同一张表；
+- 持有租约时写入任务状态同样带条件（locked_by 仍是自己），顺带续约；
+  租约已被回收或被其他工作线程接管时抛出 JobLeaseLost，当前执行应放弃结果；
+- 可重试的失败按指数退避重新入队，次数用尽后置为失败（或死信）状态；
+- DBJobWorkerPool：有新任务时被唤醒，否则按间隔轮询数据库。
+
+任务表需要 id / state / attempts / locked_by / locked_at / updated_at 列，
+运行中的状态统一为 running。
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import update
+
+from app import db
+
+
+class JobLeaseLost(RuntimeError):
+    """任务租约已被回收或被其他工作线程接管，当前执行应立即停止。"""
+
+
+def config_value(key: str, default: float) -> float:
+    value = current_app.config.get(key)
+    return float(default if value is None else value)
+
+
+def sync_mode(key: str) -> bool:
+    """显式配置优先，否则测试环境默认在提交时于当前线程同步执行。"""
+    explicit = current_app.config.get(key)
+    if explicit is not None:
+        return bool(explicit)
+    return bool(current_app.config.get("TESTING"))
+
+
+def default_worker_id(suffix: Any = 0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{suffix}"
+
+
+def claim_first(
+    model,
+    candidates: Iterable[str],
+    claimable,
+    worker_id: str,
+    now: datetime,
+    **values,
+) -> Optional[str]:
+    """按顺序尝试领取候选任务（仍满足 claimable 才能改为 running），返回领取到的任务 id。"""
+    for candidate in candidates:
+        claimed = db.session.execute(
+            update(model)
+            .where(model.id == candidate, claimable)
+            .values(
+                state="running",
+                attempts=model.attempts + 1,
+                locked_by=worker_id,
+                locked_at=now,
+                updated_at=now,
+                **values,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return candidate
+    return None
+
+
+def write_leased(model, job_id: str, worker_id: str, *, commit: bool = True, **values) -> None:
+    """
+    持有租约时写入任务状态并续约。
+
+    commit=False 时随当前事务提交：更新同时锁住任务行，其他进程的领取要等本事务
+    结束后才能判断租约。租约已丢失时回滚当前事务并抛出 JobLeaseLost。
+    """
+    now = datetime.utcnow()
+    values.setdefault("locked_at", now)
+    written = db.session.execute(
+        update(model)
+        .where(
+            model.id == job_id,
+            model.state == "running",
+            model.locked_by == worker_id,
+        )
+        .values(updated_at=now, **values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not written:
+        db.session.rollback()
+        raise JobLeaseLost(job_id)
+    if commit:
+        db.session.commit()
+
+
+def finished_values(state: str, now: datetime, **values) -> Dict[str, Any]:
+    """任务结束时的字段：释放租约并记录结束时间。"""
+    return {
+        "state": state,
+        "locked_by": None,
+        "locked_at": None,
+        "finished_at": now,
+        **values,
+    }
+
+
+def retry_values(
+    attempts: int,
+    max_attempts: int,
+    error: str,
+    now: datetime,
+    *,
+    exhausted_state: str = "failed",
+    backoff_seconds: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    一次可重试失败之后的字段：释放租约重新入队，次数用尽时置为 exhausted_state。
+
+    传入 backoff_seconds 时按尝试次数指数退避，写入 available_at。
+    """
+    if attempts >= max_attempts:
+        return finished_values(exhausted_state, now, error=error)
+    values: Dict[str, Any] = {
+        "state": "queued",
+        "error": error,
+        "locked_by": None,
+        "locked_at": None,
+    }
+    if backoff_seconds is not None:
+        values["available_at"] = now + timedelta(
+            seconds=backoff_seconds * (2 ** max(attempts - 1, 0))
+        )
+    return values
+
+
+class DBJobWorkerPool:
+    """进程内的任务执行线程：有新任务时被唤醒，否则按间隔轮询数据库。"""
+
+    def __init__(
+        self,
+        app,
+        workers: int,
+        poll_seconds: float,
+        run_once: Callable[[str], int],
+        *,
+        name: str,
+        worker_id_prefix: str = "",
+    ) -> None:
+        self.app = app
+        self.workers = workers
+        self.poll_seconds = max(float(poll_seconds), 0.05)
+        self.name = name
+        self._run_once = run_once
+        self._worker_id_prefix = worker_id_prefix
+        self._condition = threading.Condition()
+        self._pending_wakeups = 0
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+    def ensure_started(self) -> None:
+        with self._condition:
+            if self._threads or self._closed:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._loop,
+                    args=(default_worker_id(f"{self._worker_id_prefix}{index}"),),
+                    name=f"{self.name}-{index}",
+                    daemon=True,
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def wake(self) -> None:
+        with self._condition:
+            self._pending_wakeups += 1
+            self._condition.notify()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _loop(self, worker_id: str) -> None:
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+            try:
+                with self.app.app_context():
+                    executed = self._run_once(worker_id)
+            except Exception as exc:  # noqa: BLE001 - 保持工作线程存活
+                self.app.logger.error(
+                    "%s %s error: %s", self.name, worker_id, exc, exc_info=exc
+                )
+                executed = 0
+            if executed:
+                continue
+            with self._condition:
+                if not self._pending_wakeups and not self._closed:
+                    self._condition.wait(timeout=self.poll_seconds)
+                self._pending_wakeups = max(self._pending_wakeups - 1, 0)
+
+
+def ensure_worker_pool(
+    app,
+    extension_key: str,
+    workers: int,
+    factory: Callable[[], DBJobWorkerPool],
+) -> Optional[DBJobWorkerPool]:
+    """取得（必要时创建并启动）挂在 app.extensions 上的线程池；workers<=0 时返回 None。"""
+    if workers <= 0:
+        return None
+    pool = app.extensions.get(extension_key)
+    if pool is None or pool.workers != workers:
+        if pool is not None:
+            pool.close()
+        pool = factory()
+        app.extensions[extension_key] = pool
+    pool.ensure_started()
+    return pool
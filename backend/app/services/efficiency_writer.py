@@ -0,0 +1,412 @@
+"""
+效率分写后（write-behind）队列
+
+日志增删改不再同步重算效率，而是在写日志的同一事务内把脏的 (stage_id, log_date)
+登记到 efficiency_dirty_key 表：
+- 脏键随日志一起提交或回滚，进程被强杀（SIGKILL、OOM）也不会丢失；
+- 后台线程在某用户最后一次登记静默 delay_seconds 后合并重算，同一天连续录入多条只算一次；
+  持续有写入时最多推迟 max_delay_seconds；线程同时按间隔轮询，接手其他进程留下的键；
+- 读取 DailyData / WeeklyData 之前调用 flush_pending_efficiency(user_id)，
+  同步处理表中该用户的全部脏键（无论由哪个进程登记），保证读到自己的写入；
+- 重算在独立的应用上下文（独立的数据库会话）中进行，删除脏键与写入效率分同一事务提交，
+  不会提交或回滚调用方的会话；
+- delay_seconds <= 0 时登记所在的事务提交后立即同步重算（测试环境使用）；
+- 重算失败（例如 SQLite "database is locked"）时键留在表中，按指数退避重试，
+  连续失败 max_retries 次后才放弃；进程退出时（atexit）落库剩余的键。
+"""
+
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, func, tuple_, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import EfficiencyDirtyKey
+
+EfficiencyKey = tuple[int, date]
+
+_SESSION_INFO_KEY = "efficiency_dirty_users"
+
+
+class EfficiencyWriteBehind:
+    """按用户合并脏键、延迟批量落库的效率更新器。"""
+
+    def __init__(
+        self,
+        app,
+        apply_keys: Callable[[Iterable[EfficiencyKey]], None],
+        *,
+        delay_seconds: float,
+        max_delay_seconds: float,
+        retry_backoff_seconds: float = 1.0,
+        max_retries: int = 5,
+    ) -> None:
+        self.app = app
+        self.delay_seconds = max(float(delay_seconds), 0.0)
+        self.max_delay_seconds = max(float(max_delay_seconds), self.delay_seconds)
+        self.retry_backoff_seconds = max(float(retry_backoff_seconds), 0.0)
+        self.max_retries = max(int(max_retries), 0)
+        # 没有本进程的登记时，按最长推迟间隔轮询其他进程留下的键
+        self.poll_seconds = max(self.max_delay_seconds, 0.05)
+        self._apply_keys = apply_keys
+        self._condition = threading.Condition()
+        # 下一次查询脏键表的时间（monotonic）；只在本进程的登记到期或轮询时查询
+        self._check_at: float | None = None
+        self._user_locks: dict[int, threading.Lock] = {}
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def mark(self, user_id: int, stage_id: int, log_date: date) -> None:
+        """在调用方的事务内登记一个需要重算的 (阶段, 日期)，随该事务提交生效。"""
+        now = datetime.utcnow()
+        values = {
+            "user_id": user_id,
+            "stage_id": stage_id,
+            "log_date": log_date,
+            "first_marked_at": now,
+            "last_marked_at": now,
+            "attempts": 0,
+        }
+        # 延迟导入：record_service 依赖本模块
+        from app.services.record_service import _upsert_insert
+
+        statement = _upsert_insert(EfficiencyDirtyKey)
+        if statement is None:
+            existing = EfficiencyDirtyKey.query.filter_by(
+                user_id=user_id, stage_id=stage_id, log_date=log_date
+            ).first()
+            if existing is None:
+                db.session.add(EfficiencyDirtyKey(**values))
+            else:
+                existing.last_marked_at = now
+        else:
+            db.session.execute(
+                statement.values(**values).on_conflict_do_update(
+                    index_elements=["user_id", "stage_id", "log_date"],
+                    set_={"last_marked_at": now},
+                )
+            )
+        db.session.info.setdefault(_SESSION_INFO_KEY, {}).setdefault(self, set()).add(
+            user_id
+        )
+
+    def notify(self, user_ids: Iterable[int]) -> None:
+        """登记所在的事务提交后调用：同步模式立即落库，否则唤醒后台线程。"""
+        if self.delay_seconds <= 0:
+            # 调用方的会话正处于提交收尾阶段，不能再用它查询
+            self._drain_users(sorted(user_ids))
+            return
+        with self._condition:
+            due_at = time.monotonic() + self.delay_seconds
+            self._check_at = due_at if self._check_at is None else min(self._check_at, due_at)
+            self.ensure_started()
+            self._condition.notify_all()
+
+    def flush(self, user_id: int | None = None) -> None:
+        """落库指定用户（None 表示全部用户）的待处理键，忽略延迟与退避。
+
+        已在应用上下文中时，先用当前会话只读地查询有无脏键（不触发 autoflush，
+        不提交也不回滚）；重算总是在独立的应用上下文中进行。
+        """
+        user_ids = None
+        if has_app_context():
+            with db.session.no_autoflush:
+                user_ids = self._dirty_user_ids(user_id)
+            if not user_ids:
+                return
+        self._drain_users(user_ids, user_id=user_id)
+
+    def pending_count(self, user_id: int | None = None) -> int:
+        with self.app.app_context():
+            query = EfficiencyDirtyKey.query
+            if user_id is not None:
+                query = query.filter_by(user_id=user_id)
+            return query.count()
+
+    def shutdown(self) -> None:
+        """停止后台线程；线程退出前会立即处理完剩余的键（忽略延迟与退避）。"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def ensure_started(self) -> None:
+        with self._condition:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name="efficiency-write-behind",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _user_lock(self, user_id: int) -> threading.Lock:
+        with self._condition:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    def _drain_users(
+        self, user_ids: list[int] | None, *, user_id: int | None = None
+    ) -> None:
+        """在独立的应用上下文中逐个用户重算；user_ids 为 None 时按 user_id 查询。"""
+        with self.app.app_context():
+            if user_ids is None:
+                user_ids = self._dirty_user_ids(user_id)
+            for pending_user_id in user_ids:
+                self._drain_user(pending_user_id)
+
+    def _dirty_user_ids(self, user_id: int | None = None) -> list[int]:
+        query = db.session.query(EfficiencyDirtyKey.user_id)
+        if user_id is not None:
+            query = query.filter(EfficiencyDirtyKey.user_id == user_id)
+        return sorted({row[0] for row in query.distinct()})
+
+    def _due_user_ids(self, now: datetime) -> tuple[list[int], float]:
+        """返回已到期的用户，以及距离下一个用户到期的秒数（不超过轮询间隔）。"""
+        rows = (
+            db.session.query(
+                EfficiencyDirtyKey.user_id,
+                func.min(EfficiencyDirtyKey.first_marked_at),
+                func.max(EfficiencyDirtyKey.last_marked_at),
+                func.max(EfficiencyDirtyKey.available_at),
+            )
+            .group_by(EfficiencyDirtyKey.user_id)
+            .all()
+        )
+        due: list[int] = []
+        wait_seconds = self.poll_seconds
+        for user_id, first_marked_at, last_marked_at, available_at in rows:
+            due_at = min(
+                last_marked_at + timedelta(seconds=self.delay_seconds),
+                first_marked_at + timedelta(seconds=self.max_delay_seconds),
+            )
+            if available_at is not None:
+                due_at = max(due_at, available_at)
+            remaining = (due_at - now).total_seconds()
+            if remaining <= 0:
+                due.append(user_id)
+            else:
+                wait_seconds = min(wait_seconds, remaining)
+        return due, wait_seconds
+
+    def _wait_for_check(self) -> bool:
+        """等到下一次检查时间，返回是否已关闭；检查期间的新登记会重新排期。"""
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                if self._check_at is None:
+                    self._check_at = now + self.poll_seconds
+                if now >= self._check_at:
+                    self._check_at = None
+                    return False
+                self._condition.wait(self._check_at - now)
+            return True
+
+    def _schedule_check(self, wait_seconds: float) -> None:
+        with self._condition:
+            check_at = time.monotonic() + wait_seconds
+            if self._check_at is None or check_at < self._check_at:
+                self._check_at = check_at
+
+    def _run(self) -> None:
+        while True:
+            closed = self._wait_for_check()
+            if closed:
+                try:
+                    self.flush()
+                except Exception as exc:  # noqa: BLE001 - 剩余的键留在表中
+                    self.app.logger.error(
+                        f"Flushing efficiency keys on shutdown failed: {exc}", exc_info=exc
+                    )
+                return
+            due: list[int] = []
+            wait_seconds = self.poll_seconds
+            try:
+                with self.app.app_context():
+                    due, wait_seconds = self._due_user_ids(datetime.utcnow())
+                    for user_id in due:
+                        self._drain_user(user_id)
+            except Exception as exc:  # noqa: BLE001 - 保持后台线程存活
+                self.app.logger.error(
+                    f"Efficiency write-behind loop error: {exc}", exc_info=exc
+                )
+                due = []
+            # 刚处理过到期的用户时立即再查一次，其余按最近的到期时间排期
+            self._schedule_check(0 if due else wait_seconds)
+
+    def _drain_user(self, user_id: int) -> None:
+        """在当前上下文的会话中重算该用户的脏键，删除脏键与写入效率分同一事务提交。"""
+        # 同一进程内读者会等待后台线程正在处理的同一用户
+        with self._user_lock(user_id):
+            rows = (
+                db.session.query(
+                    EfficiencyDirtyKey.id,
+                    EfficiencyDirtyKey.stage_id,
+                    EfficiencyDirtyKey.log_date,
+                    EfficiencyDirtyKey.last_marked_at,
+                    EfficiencyDirtyKey.attempts,
+                )
+                .filter(EfficiencyDirtyKey.user_id == user_id)
+                .all()
+            )
+            if not rows:
+                return
+            try:
+                # 读取之后又被登记的键（last_marked_at 变了）保留，下一轮再算
+                db.session.execute(
+                    delete(EfficiencyDirtyKey)
+                    .where(
+                        tuple_(
+                            EfficiencyDirtyKey.id, EfficiencyDirtyKey.last_marked_at
+                        ).in_([(row.id, row.last_marked_at) for row in rows])
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                self._apply_keys([(row.stage_id, row.log_date) for row in rows])
+                db.session.commit()
+            except Exception as exc:
+                db.session.rollback()
+                self._record_failure(rows, exc)
+
+    def _record_failure(self, rows, exc: Exception) -> None:
+        """失败的键按连续失败次数指数退避；超过 max_retries 次的键放弃。"""
+        now = datetime.utcnow()
+        dropped = [row for row in rows if row.attempts + 1 > self.max_retries]
+        retried = [row for row in rows if row.attempts + 1 <= self.max_retries]
+        try:
+            if dropped:
+                db.session.execute(
+                    delete(EfficiencyDirtyKey)
+                    .where(EfficiencyDirtyKey.id.in_([row.id for row in dropped]))
+                    .execution_options(synchronize_session=False)
+                )
+            for row in retried:
+                attempts = row.attempts + 1
+                db.session.execute(
+                    update(EfficiencyDirtyKey)
+                    .where(EfficiencyDirtyKey.id == row.id)
+                    .values(
+                        attempts=attempts,
+                        available_at=now
+                        + timedelta(
+                            seconds=self.retry_backoff_seconds * 2 ** (attempts - 1)
+                        ),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+        except Exception as record_exc:
+            db.session.rollback()
+            self.app.logger.error(
+                f"Recording efficiency update failure failed: {record_exc}",
+                exc_info=record_exc,
+            )
+            return
+        if retried:
+            attempts = max(row.attempts + 1 for row in retried)
+            self.app.logger.warning(
+                f"Batched efficiency update failed (attempt {attempts}), "
+                f"will retry: {exc}"
+            )
+        if dropped:
+            self.app.logger.error(
+                f"Giving up efficiency update for {len(dropped)} keys after "
+                f"{self.max_retries} retries: {exc}",
+                exc_info=exc,
+            )
+
+
+_writer_lock = threading.Lock()
+_writer: EfficiencyWriteBehind | None = None
+
+
+def _apply_efficiency_keys(keys: Iterable[EfficiencyKey]) -> None:
+    from app.services.record_service import update_efficiency_for_keys
+
+    update_efficiency_for_keys(list(keys))
+
+
+def get_efficiency_writer(app=None) -> EfficiencyWriteBehind:
+    """按应用配置获取（必要时重建）写后队列。"""
+    global _writer
+    app = app or current_app._get_current_object()
+    delay_seconds = float(app.config.get("EFFICIENCY_WRITE_BEHIND_SECONDS", 0.5))
+    max_delay_seconds = float(
+        app.config.get("EFFICIENCY_WRITE_BEHIND_MAX_SECONDS", 5.0)
+    )
+    with _writer_lock:
+        writer = _writer
+        if (
+            writer is None
+            or writer.app is not app
+            or writer.delay_seconds != max(delay_seconds, 0.0)
+        ):
+            if writer is not None:
+                writer.shutdown()
+            writer = EfficiencyWriteBehind(
+                app,
+                _apply_efficiency_keys,
+                delay_seconds=delay_seconds,
+                max_delay_seconds=max_delay_seconds,
+                retry_backoff_seconds=float(
+                    app.config.get("EFFICIENCY_WRITE_BEHIND_RETRY_SECONDS", 1.0)
+                ),
+                max_retries=int(app.config.get("EFFICIENCY_WRITE_BEHIND_MAX_RETRIES", 5)),
+            )
+            if writer.delay_seconds > 0:
+                # 启动即轮询，接手重启前或其他进程留下的键
+                writer.ensure_started()
+            _writer = writer
+        return writer
+
+
+def _shutdown_writer_at_exit() -> None:
+    """进程退出（含 worker 回收）时落库尚未处理的键。"""
+    with _writer_lock:
+        writer = _writer
+    if writer is not None:
+        writer.shutdown()
+
+
+atexit.register(_shutdown_writer_at_exit)
+
+
+def _after_commit(session: Session) -> None:
+    pending = session.info.pop(_SESSION_INFO_KEY, None)
+    if not pending:
+        return
+    for writer, user_ids in pending.items():
+        writer.notify(user_ids)
+
+
+def _after_rollback(session: Session) -> None:
+    # 登记随事务回滚，无需处理
+    session.info.pop(_SESSION_INFO_KEY, None)
+
+
+def register_efficiency_writer_listeners() -> None:
+    """注册事务提交后唤醒写后队列的 ORM 钩子（可重复调用）。"""
+    if not event.contains(Session, "after_commit", _after_commit):
+        event.listen(Session, "after_commit", _after_commit)
+    if not event.contains(Session, "after_rollback", _after_rollback):
+        event.listen(Session, "after_rollback", _after_rollback)
+
+
+def mark_efficiency_dirty(user_id: int, stage_id: int, log_date: date) -> None:
+    """写日志的事务提交前调用：登记需要重算效率的 (阶段, 日期)，随该事务提交。"""
+    get_efficiency_writer().mark(int(user_id), int(stage_id), log_date)
+
+
+def flush_pending_efficiency(user_id: int | None = None) -> None:
+    """读取效率数据前调用：同步落库该用户尚未处理的脏键（含其他进程登记的）。"""
+    if not has_app_context():
+        return
+    get_efficiency_writer().flush(None if user_id is None else int(user_id))
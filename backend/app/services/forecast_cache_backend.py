@@ -0,0 +1,586 @@
+"""
+趋势预测共享缓存后端
+
+多个 gunicorn worker 各自持有进程内缓存时，会重复读取 JSON 文件，甚至同时
+为同一用户训练模型。这里提供可插拔的跨进程缓存接口：
+- get / put / delete：按用户存取已就绪的预测结果，带 TTL（墙钟时间）；
+- compare_and_set：仅当当前签名与预期一致时写入，避免旧结果覆盖新结果；
+- claim / release：训练租约，同一时刻只有持有租约的进程训练该用户。
+
+提供两种实现：
+- SQLiteForecastCacheBackend：WAL 模式的 SQLite 文件，适合同机多进程；
+- MmapForecastCacheBackend：mmap 固定槽位索引 + 每用户结果文件，
+  读路径只在版本变化时才解析 JSON。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import copy
+import json
+import mmap
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows 下仅保证进程内互斥
+    fcntl = None
+
+CACHE_BACKEND_NONE = "none"
+CACHE_BACKEND_SQLITE = "sqlite"
+CACHE_BACKEND_MMAP = "mmap"
+
+SQLITE_FILENAME = "forecast_cache.sqlite3"
+MMAP_INDEX_FILENAME = "forecast_cache.idx"
+
+
+def default_lease_owner() -> str:
+    """当前进程的租约持有者标识。"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass(frozen=True)
+class ForecastLease:
+    """某个用户当前的训练租约。"""
+
+    owner: str
+    signature: str | None
+    expires_at: float
+
+
+class ForecastCacheBackend:
+    """共享缓存后端接口，所有时间均为 time.time() 墙钟秒数。"""
+
+    def get(self, user_id: int) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    def put(self, user_id: int, entry: dict[str, Any], *, ttl_seconds: float) -> bool:
+        raise NotImplementedError
+
+    def compare_and_set(
+        self,
+        user_id: int,
+        entry: dict[str, Any],
+        *,
+        expected_signature: str | None,
+        ttl_seconds: float,
+    ) -> bool:
+        """当前未过期条目的签名等于 expected_signature（None 表示不存在）时写入。"""
+        raise NotImplementedError
+
+    def delete(self, user_id: int) -> None:
+        raise NotImplementedError
+
+    def claim(
+        self,
+        user_id: int,
+        *,
+        signature: str,
+        owner: str,
+        lease_seconds: float,
+    ) -> bool:
+        """获取（或续期）训练租约；他人持有未过期租约时返回 False。"""
+        raise NotImplementedError
+
+    def release(self, user_id: int, *, owner: str) -> None:
+        raise NotImplementedError
+
+    def get_lease(self, user_id: int) -> ForecastLease | None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        return None
+
+
+def _dump_entry(entry: dict[str, Any]) -> str:
+    serializable = copy.deepcopy(entry)
+    # expires_at 是进程内 monotonic 时间，跨进程没有意义
+    serializable.pop("expires_at", None)
+    return json.dumps(serializable, ensure_ascii=False)
+
+
+class SQLiteForecastCacheBackend(ForecastCacheBackend):
+    """基于 SQLite WAL 的共享缓存，写操作使用 BEGIN IMMEDIATE 保证原子性。"""
+
+    def __init__(self, path: str, *, busy_timeout: float = 5.0) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS forecast_cache (
+                    user_id INTEGER PRIMARY KEY,
+                    signature TEXT,
+                    payload TEXT,
+                    expires_at REAL,
+                    lease_owner TEXT,
+                    lease_signature TEXT,
+                    lease_expires_at REAL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _live_signature(conn: sqlite3.Connection, user_id: int, now: float) -> str | None:
+        row = conn.execute(
+            "SELECT signature, expires_at FROM forecast_cache "
+            "WHERE user_id = ? AND payload IS NOT NULL",
+            (user_id,),
+        ).fetchone()
+        if row is None or (row[1] or 0) <= now:
+            return None
+        return row[0]
+
+    @staticmethod
+    def _upsert_entry(
+        conn: sqlite3.Connection,
+        user_id: int,
+        entry: dict[str, Any],
+        expires_at: float,
+    ) -> None:
+        conn.execute(
+            """
+            INSERT INTO forecast_cache (user_id, signature, payload, expires_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                signature = excluded.signature,
+                payload = excluded.payload,
+                expires_at = excluded.expires_at
+            """,
+            (user_id, entry.get("signature"), _dump_entry(entry), expires_at),
+        )
+
+    def get(self, user_id: int) -> dict[str, Any] | None:
+        row = self._connect().execute(
+            "SELECT payload, expires_at FROM forecast_cache WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if row is None or row[0] is None or (row[1] or 0) <= time.time():
+            return None
+        try:
+            payload = json.loads(row[0])
+        except json.JSONDecodeError:
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    def put(self, user_id: int, entry: dict[str, Any], *, ttl_seconds: float) -> bool:
+        with self._transaction() as conn:
+            self._upsert_entry(conn, user_id, entry, time.time() + ttl_seconds)
+        return True
+
+    def compare_and_set(
+        self,
+        user_id: int,
+        entry: dict[str, Any],
+        *,
+        expected_signature: str | None,
+        ttl_seconds: float,
+    ) -> bool:
+        with self._transaction() as conn:
+            now = time.time()
+            if self._live_signature(conn, user_id, now) != expected_signature:
+                return False
+            self._upsert_entry(conn, user_id, entry, now + ttl_seconds)
+        return True
+
+    def delete(self, user_id: int) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE forecast_cache SET signature = NULL, payload = NULL, "
+                "expires_at = NULL WHERE user_id = ?",
+                (user_id,),
+            )
+
+    def claim(
+        self,
+        user_id: int,
+        *,
+        signature: str,
+        owner: str,
+        lease_seconds: float,
+    ) -> bool:
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute(
+                "SELECT lease_owner, lease_expires_at FROM forecast_cache WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            if row is not None and row[0] and row[0] != owner and (row[1] or 0) > now:
+                return False
+            conn.execute(
+                """
+                INSERT INTO forecast_cache (
+                    user_id, lease_owner, lease_signature, lease_expires_at
+                ) VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    lease_owner = excluded.lease_owner,
+                    lease_signature = excluded.lease_signature,
+                    lease_expires_at = excluded.lease_expires_at
+                """,
+                (user_id, owner, signature, now + lease_seconds),
+            )
+        return True
+
+    def release(self, user_id: int, *, owner: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE forecast_cache SET lease_owner = NULL, lease_signature = NULL, "
+                "lease_expires_at = NULL WHERE user_id = ? AND lease_owner = ?",
+                (user_id, owner),
+            )
+
+    def get_lease(self, user_id: int) -> ForecastLease | None:
+        row = self._connect().execute(
+            "SELECT lease_owner, lease_signature, lease_expires_at "
+            "FROM forecast_cache WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if row is None or not row[0] or (row[2] or 0) <= time.time():
+            return None
+        return ForecastLease(owner=row[0], signature=row[1], expires_at=row[2])
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            with contextlib.suppress(sqlite3.Error):
+                conn.close()
+        self._local = threading.local()
+
+
+# 槽位：user_id, version, expires_at, lease_expires_at, signature, lease_owner, lease_signature
+_MMAP_MAGIC = b"FCSTIDX1"
+_MMAP_HEADER = struct.Struct("<8sI4x")
+_MMAP_SLOT = struct.Struct("<qQdd40s64s40s")
+_MMAP_MAX_PROBES = 8
+
+
+def _pack_text(value: str | None, size: int) -> bytes:
+    return (value or "").encode("utf-8")[:size]
+
+
+def _unpack_text(raw: bytes) -> str | None:
+    text = raw.rstrip(b"\x00").decode("utf-8", errors="ignore")
+    return text or None
+
+
+@dataclass
+class _MmapSlot:
+    user_id: int = 0
+    version: int = 0
+    expires_at: float = 0.0
+    lease_expires_at: float = 0.0
+    signature: str | None = None
+    lease_owner: str | None = None
+    lease_signature: str | None = None
+
+    def has_live_entry(self, now: float) -> bool:
+        return self.version > 0 and self.expires_at > now
+
+    def has_live_lease(self, now: float) -> bool:
+        return bool(self.lease_owner) and self.lease_expires_at > now
+
+
+class MmapForecastCacheBackend(ForecastCacheBackend):
+    """mmap 固定槽位索引 + 每用户结果文件的本机共享缓存。
+
+    索引记录签名、版本、TTL 与租约，读写都在 flock 排他锁内完成；
+    结果 JSON 以原子替换方式写入，进程内按版本缓存已解析结果。
+    槽位按 user_id 线性探测，满时淘汰最早过期且未被租用的条目。
+    """
+
+    def __init__(self, directory: str, *, slot_count: int = 4096) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.slot_count = max(int(slot_count), _MMAP_MAX_PROBES)
+        self._thread_lock = threading.Lock()
+        self._parsed: dict[int, tuple[int, dict[str, Any]]] = {}
+        index_path = os.path.join(directory, MMAP_INDEX_FILENAME)
+        size = _MMAP_HEADER.size + self.slot_count * _MMAP_SLOT.size
+        fd = os.open(index_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, "r+b")
+        with self._file_lock():
+            self._file.seek(0, os.SEEK_END)
+            current_size = self._file.tell()
+            if current_size >= _MMAP_HEADER.size:
+                self._file.seek(0)
+                magic, existing_slots = _MMAP_HEADER.unpack(
+                    self._file.read(_MMAP_HEADER.size)
+                )
+                if magic == _MMAP_MAGIC and current_size == (
+                    _MMAP_HEADER.size + existing_slots * _MMAP_SLOT.size
+                ):
+                    self.slot_count = existing_slots
+                    size = current_size
+                else:
+                    current_size = 0
+            if current_size != size:
+                self._file.seek(0)
+                self._file.truncate(0)
+                self._file.write(_MMAP_HEADER.pack(_MMAP_MAGIC, self.slot_count))
+                self._file.write(b"\x00" * (self.slot_count * _MMAP_SLOT.size))
+                self._file.flush()
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        # flock 只在进程间互斥，同进程内的线程还需要额外的锁
+        with self._thread_lock:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _slot_offset(self, index: int) -> int:
+        return _MMAP_HEADER.size + index * _MMAP_SLOT.size
+
+    def _read_slot(self, index: int) -> _MmapSlot:
+        fields = _MMAP_SLOT.unpack_from(self._map, self._slot_offset(index))
+        return _MmapSlot(
+            user_id=fields[0],
+            version=fields[1],
+            expires_at=fields[2],
+            lease_expires_at=fields[3],
+            signature=_unpack_text(fields[4]),
+            lease_owner=_unpack_text(fields[5]),
+            lease_signature=_unpack_text(fields[6]),
+        )
+
+    def _write_slot(self, index: int, slot: _MmapSlot) -> None:
+        _MMAP_SLOT.pack_into(
+            self._map,
+            self._slot_offset(index),
+            slot.user_id,
+            slot.version,
+            slot.expires_at,
+            slot.lease_expires_at,
+            _pack_text(slot.signature, 40),
+            _pack_text(slot.lease_owner, 64),
+            _pack_text(slot.lease_signature, 40),
+        )
+
+    def _probe(self, user_id: int) -> Iterator[int]:
+        start = int(user_id) % self.slot_count
+        for step in range(_MMAP_MAX_PROBES):
+            yield (start + step) % self.slot_count
+
+    def _find_slot(self, user_id: int) -> tuple[int, _MmapSlot] | None:
+        for index in self._probe(user_id):
+            slot = self._read_slot(index)
+            if slot.user_id == user_id:
+                return index, slot
+        return None
+
+    def _allocate_slot(self, user_id: int, now: float) -> tuple[int, _MmapSlot] | None:
+        found = self._find_slot(user_id)
+        if found is not None:
+            return found
+        victim: tuple[int, _MmapSlot] | None = None
+        for index in self._probe(user_id):
+            slot = self._read_slot(index)
+            if slot.user_id == 0:
+                return index, _MmapSlot(user_id=user_id)
+            if slot.has_live_lease(now):
+                continue
+            if victim is None or slot.expires_at < victim[1].expires_at:
+                victim = (index, slot)
+        if victim is None:
+            return None
+        self._remove_payload(victim[1].user_id)
+        return victim[0], _MmapSlot(user_id=user_id)
+
+    def _payload_path(self, user_id: int) -> str:
+        return os.path.join(self.directory, f"user_{user_id}.json")
+
+    def _remove_payload(self, user_id: int) -> None:
+        self._parsed.pop(user_id, None)
+        with contextlib.suppress(OSError):
+            os.remove(self._payload_path(user_id))
+
+    def _store(
+        self,
+        index: int,
+        slot: _MmapSlot,
+        entry: dict[str, Any],
+        ttl_seconds: float,
+    ) -> None:
+        version = time.time_ns()
+        path = self._payload_path(slot.user_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            fp.write('{"version": %d, "entry": %s}' % (version, _dump_entry(entry)))
+        os.replace(tmp_path, path)
+        slot.version = version
+        slot.signature = entry.get("signature")
+        slot.expires_at = time.time() + ttl_seconds
+        self._write_slot(index, slot)
+        self._parsed.pop(slot.user_id, None)
+
+    def get(self, user_id: int) -> dict[str, Any] | None:
+        with self._file_lock():
+            found = self._find_slot(user_id)
+            if found is None or not found[1].has_live_entry(time.time()):
+                return None
+            version = found[1].version
+            parsed = self._parsed.get(user_id)
+            if parsed is not None and parsed[0] == version:
+                return copy.deepcopy(parsed[1])
+            try:
+                with open(self._payload_path(user_id), "r", encoding="utf-8") as fp:
+                    payload = json.load(fp)
+            except (OSError, json.JSONDecodeError):
+                return None
+            if not isinstance(payload, dict) or payload.get("version") != version:
+                return None
+            entry = payload.get("entry")
+            if not isinstance(entry, dict):
+                return None
+            self._parsed[user_id] = (version, entry)
+            return copy.deepcopy(entry)
+
+    def put(self, user_id: int, entry: dict[str, Any], *, ttl_seconds: float) -> bool:
+        with self._file_lock():
+            allocated = self._allocate_slot(user_id, time.time())
+            if allocated is None:
+                return False
+            self._store(allocated[0], allocated[1], entry, ttl_seconds)
+        return True
+
+    def compare_and_set(
+        self,
+        user_id: int,
+        entry: dict[str, Any],
+        *,
+        expected_signature: str | None,
+        ttl_seconds: float,
+    ) -> bool:
+        with self._file_lock():
+            now = time.time()
+            found = self._find_slot(user_id)
+            current = None
+            if found is not None and found[1].has_live_entry(now):
+                current = found[1].signature
+            if current != expected_signature:
+                return False
+            allocated = found or self._allocate_slot(user_id, now)
+            if allocated is None:
+                return False
+            self._store(allocated[0], allocated[1], entry, ttl_seconds)
+        return True
+
+    def delete(self, user_id: int) -> None:
+        with self._file_lock():
+            found = self._find_slot(user_id)
+            if found is None:
+                return
+            index, slot = found
+            slot.version = 0
+            slot.signature = None
+            slot.expires_at = 0.0
+            self._write_slot(index, slot)
+            self._remove_payload(user_id)
+
+    def claim(
+        self,
+        user_id: int,
+        *,
+        signature: str,
+        owner: str,
+        lease_seconds: float,
+    ) -> bool:
+        with self._file_lock():
+            now = time.time()
+            allocated = self._allocate_slot(user_id, now)
+            if allocated is None:
+                return False
+            index, slot = allocated
+            if slot.has_live_lease(now) and slot.lease_owner != owner:
+                return False
+            slot.lease_owner = owner
+            slot.lease_signature = signature
+            slot.lease_expires_at = now + lease_seconds
+            self._write_slot(index, slot)
+        return True
+
+    def release(self, user_id: int, *, owner: str) -> None:
+        with self._file_lock():
+            found = self._find_slot(user_id)
+            if found is None or found[1].lease_owner != owner:
+                return
+            index, slot = found
+            slot.lease_owner = None
+            slot.lease_signature = None
+            slot.lease_expires_at = 0.0
+            self._write_slot(index, slot)
+
+    def get_lease(self, user_id: int) -> ForecastLease | None:
+        with self._file_lock():
+            found = self._find_slot(user_id)
+        if found is None or not found[1].has_live_lease(time.time()):
+            return None
+        slot = found[1]
+        return ForecastLease(
+            owner=slot.lease_owner or "",
+            signature=slot.lease_signature,
+            expires_at=slot.lease_expires_at,
+        )
+
+    def close(self) -> None:
+        with self._thread_lock:
+            with contextlib.suppress(ValueError, BufferError):
+                self._map.close()
+            self._file.close()
+
+
+def create_forecast_cache_backend(kind: str | None, directory: str) -> ForecastCacheBackend | None:
+    """按配置创建共享缓存后端；kind 为 none 时返回 None（仅使用进程内缓存）。"""
+    normalized = (kind or CACHE_BACKEND_NONE).strip().lower()
+    if normalized == CACHE_BACKEND_NONE:
+        return None
+    if normalized == CACHE_BACKEND_SQLITE:
+        return SQLiteForecastCacheBackend(os.path.join(directory, SQLITE_FILENAME))
+    if normalized == CACHE_BACKEND_MMAP:
+        return MmapForecastCacheBackend(directory)
+    raise ValueError(f"unknown forecast cache backend: {kind}")
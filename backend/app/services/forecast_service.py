@@ -4,41 +4,63 @@
 - 候选模型回测选优
 - 点预测
 - 基于残差分位数的 80% 置信区间
+- 按用户保留的热启动状态：新增一天数据时只重训受影响的回测起点
 """
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import hashlib
+import importlib
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, replace
 from datetime import date, timedelta
-from typing import Callable, Sequence
+from typing import Any, Callable, Sequence
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from .helpers import get_custom_week_info
 
-try:
-    from sklearn.ensemble import HistGradientBoostingClassifier
-    from sklearn.ensemble import HistGradientBoostingRegressor
-    from sklearn.linear_model import Ridge
-    from sklearn.pipeline import Pipeline
-    from sklearn.preprocessing import StandardScaler
+# sklearn / statsmodels 导入耗时且占内存，在预测器首次用到时才加载，
+# 未安装时对应模型不参与候选；gunicorn 预加载时可调用 load_model_dependencies
+_optional_modules: dict[str, Any] = {}
+_optional_modules_lock = threading.Lock()
 
-    SKLEARN_AVAILABLE = True
-except Exception:  # pragma: no cover - 由运行环境决定
-    HistGradientBoostingClassifier = None
-    HistGradientBoostingRegressor = None
-    Ridge = None
-    Pipeline = None
-    StandardScaler = None
-    SKLEARN_AVAILABLE = False
 
-try:
-    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+def _optional_module(name: str) -> Any:
+    """按需导入可选依赖，未安装时返回 None；结果按模块名缓存。"""
+    try:
+        return _optional_modules[name]
+    except KeyError:
+        pass
+    with _optional_modules_lock:
+        if name not in _optional_modules:
+            try:
+                _optional_modules[name] = importlib.import_module(name)
+            except Exception:  # pragma: no cover - 由运行环境决定
+                _optional_modules[name] = None
+        return _optional_modules[name]
+
+
+def _sklearn_ensemble() -> Any:
+    return _optional_module("sklearn.ensemble")
+
 
-    STATSMODELS_AVAILABLE = True
-except Exception:  # pragma: no cover - 由运行环境决定
-    ExponentialSmoothing = None
-    STATSMODELS_AVAILABLE = False
+def _holt_winters() -> Any:
+    return _optional_module("statsmodels.tsa.holtwinters")
+
+
+def load_model_dependencies() -> dict[str, bool]:
+    """预先导入预测模型依赖，返回各依赖是否可用。"""
+    return {
+        "sklearn": _sklearn_ensemble() is not None,
+        "statsmodels": _holt_winters() is not None,
+    }
 
 
 UNAVAILABLE_REASON = "历史数据不足，暂不提供预测"
@@ -97,6 +119,7 @@ def _empty_forecast(
     baseline_wape: float | None = None,
     baseline_rmse: float | None = None,
     model_candidates: Sequence[dict] | None = None,
+    backtest_timing: dict | None = None,
 ) -> dict:
     return {
         "labels": list(labels or []),
@@ -115,6 +138,7 @@ def _empty_forecast(
         "baseline_wape": _round_metric(baseline_wape),
         "baseline_rmse": _round_metric(baseline_rmse),
         "model_candidates": list(model_candidates or []),
+        "backtest_timing": backtest_timing,
         "available": False,
         "reason": reason,
     }
@@ -292,26 +316,103 @@ def _build_feature_row(
     return np.asarray(feature_row, dtype=float)
 
 
+def _max_lookback(config: ForecastConfig) -> int:
+    return max(
+        max(config.lag_features),
+        max(config.rolling_windows),
+        config.slope_window,
+    )
+
+
+def _window_rows(values: np.ndarray, indices: np.ndarray, window: int) -> np.ndarray:
+    """返回每个 index 之前长度为 window 的切片（stride 视图，不复制数据）。"""
+    return sliding_window_view(values, window)[indices - window]
+
+
+def _build_feature_matrix(
+    target_history: Sequence[float],
+    indices: Sequence[int],
+    config: ForecastConfig,
+    exog_values=None,
+) -> np.ndarray:
+    """一次性构建多个 index 的特征行，与逐行调用 _build_feature_row 结果一致。"""
+    target_array = np.asarray(target_history, dtype=float)
+    index_array = np.asarray(indices, dtype=int)
+    columns: list[np.ndarray] = []
+
+    for lag in config.lag_features:
+        columns.append(target_array[index_array - lag])
+
+    for window in config.rolling_windows:
+        window_slices = _window_rows(target_array, index_array, window)
+        columns.append(np.mean(window_slices, axis=1))
+        columns.append(np.std(window_slices, axis=1))
+        columns.append(np.max(window_slices, axis=1))
+        columns.append(np.min(window_slices, axis=1))
+
+    slope_slices = _window_rows(target_array, index_array, config.slope_window)
+    if config.slope_window <= 1:
+        columns.append(np.zeros(len(index_array), dtype=float))
+    else:
+        x_axis = np.arange(config.slope_window, dtype=float)
+        x_centered = x_axis - float(np.mean(x_axis))
+        denominator = float(np.sum(x_centered**2))
+        y_centered = slope_slices - np.mean(slope_slices, axis=1, keepdims=True)
+        columns.append(np.sum(x_centered * y_centered, axis=1) / denominator)
+
+    season = config.season_length
+    seasonal_mean = np.zeros(len(index_array), dtype=float)
+    seasonal_std = np.zeros(len(index_array), dtype=float)
+    seasonal_first = np.zeros(len(index_array), dtype=float)
+    available_periods = np.minimum(index_array // season, 4)
+    for periods in np.unique(available_periods):
+        if periods <= 0:
+            continue
+        mask = available_periods == periods
+        offsets = season * np.arange(1, periods + 1)
+        references = target_array[index_array[mask, None] - offsets[None, :]]
+        seasonal_mean[mask] = np.mean(references, axis=1)
+        seasonal_std[mask] = np.std(references, axis=1)
+        seasonal_first[mask] = references[:, 0]
+    columns.extend([seasonal_mean, seasonal_std, seasonal_first])
+
+    active_threshold = 0.25 if config.frequency == "daily" else 1.0
+    activity_slices = _window_rows(target_array, index_array, season)
+    columns.append(np.mean((activity_slices > active_threshold).astype(float), axis=1))
+
+    calendar_period = 7 if config.frequency == "daily" else season
+    calendar_slots = index_array % calendar_period
+    for slot in range(calendar_period):
+        columns.append((calendar_slots == slot).astype(float))
+
+    if exog_values is not None:
+        exog_array = _normalize_exog_matrix(exog_values)
+        if exog_array is not None:
+            for column_index in range(exog_array.shape[1]):
+                column = np.ascontiguousarray(exog_array[:, column_index])
+                columns.append(column[index_array])
+                columns.append(column[index_array - 1])
+                for window in config.rolling_windows:
+                    window_slices = _window_rows(column, index_array, window)
+                    columns.append(np.mean(window_slices, axis=1))
+                    columns.append(np.std(window_slices, axis=1))
+
+    return np.column_stack(columns).astype(float, copy=False)
+
+
 def _build_supervised_dataset(
     series: Sequence[float],
     config: ForecastConfig,
     exog_values=None,
 ) -> tuple[np.ndarray, np.ndarray]:
     history = np.asarray(series, dtype=float)
-    max_lookback = max(
-        max(config.lag_features),
-        max(config.rolling_windows),
-        config.slope_window,
-    )
-    rows: list[np.ndarray] = []
-    targets: list[float] = []
-    for index in range(max_lookback, len(history)):
-        rows.append(_build_feature_row(history, index, config, exog_values))
-        targets.append(float(history[index]))
-
-    if not rows:
+    indices = np.arange(_max_lookback(config), len(history))
+    if not len(indices):
         return np.empty((0, 0), dtype=float), np.empty((0,), dtype=float)
-    return np.vstack(rows), np.asarray(targets, dtype=float)
+    return (
+        _build_feature_matrix(history, indices, config, exog_values),
+        history[indices].copy(),
+    )
 
 
 def _build_sample_weights(size: int) -> np.ndarray:
@@ -365,85 +466,363 @@ def _sanitize_exog_values(exog_values):
     return np.nan_to_num(exog_array, nan=0.0).tolist()
 
 
-def _predict_holt_winters(
-    series: Sequence[float],
-    config: ForecastConfig,
-    horizon: int,
-    _future_exog: Sequence[float] | None = None,
-    *,
-    exog_history: Sequence[float] | None = None,
-) -> np.ndarray:
-    del exog_history
-    if not STATSMODELS_AVAILABLE:
-        raise RuntimeError(DEPENDENCY_REASON)
-    history = np.asarray(series, dtype=float)
-    if len(history) < max(config.min_history, config.season_length * 2):
-        raise ValueError("insufficient history for holt-winters")
-
-    model = ExponentialSmoothing(
-        history,
-        trend="add",
-        seasonal="add",
-        seasonal_periods=config.season_length,
-        initialization_method="estimated",
-    )
-    fitted = model.fit(optimized=True, use_brute=False)
-    return np.asarray(fitted.forecast(horizon), dtype=float)
+def _digest_training_inputs(series: Sequence[float], exog_history=None) -> str:
+    digest = hashlib.sha1(np.asarray(series, dtype=float).tobytes())
+    exog_matrix = _normalize_exog_matrix(exog_history)
+    if exog_matrix is not None:
+        digest.update(np.ascontiguousarray(exog_matrix, dtype=float).tobytes())
+    return digest.hexdigest()
 
 
-def _predict_ridge_autoregression(
+def _slice_recent_window(
+    series: Sequence[float],
+    exog_history,
+    window_size: int | None,
+):
+    if window_size is None or len(series) <= window_size:
+        return series, exog_history
+    sliced_exog = None
+    if exog_history is not None:
+        exog_matrix = _normalize_exog_matrix(exog_history)
+        if exog_matrix is not None:
+            sliced_exog = exog_matrix[-window_size:].tolist()
+    return list(series[-window_size:]), sliced_exog
+
+
+def _recursive_forecast(
+    predict_row: Callable[[np.ndarray], float],
     series: Sequence[float],
     config: ForecastConfig,
     horizon: int,
     future_exog: Sequence[float] | None = None,
+    *,
     exog_history: Sequence[float] | None = None,
+    prior_predictions: Sequence[float] = (),
 ) -> np.ndarray:
-    if not SKLEARN_AVAILABLE:
-        raise RuntimeError(DEPENDENCY_REASON)
-
-    x_train, y_train = _build_supervised_dataset(series, config, exog_history)
-    if len(y_train) < max(config.min_history // 2, 8):
-        raise ValueError("insufficient training rows for ridge autoregression")
-
-    model = Pipeline(
-        steps=[
-            ("scaler", StandardScaler()),
-            ("ridge", Ridge(alpha=1.2)),
-        ]
-    )
-    sample_weights = _build_sample_weights(len(y_train))
-    model.fit(x_train, y_train, ridge__sample_weight=sample_weights)
-
+    """逐步递推预测；prior_predictions 为已算出的前几步，可从中途续算。"""
     history = [float(v) for v in series]
     exog_extended = _extend_exog_matrix(exog_history, future_exog, horizon)
 
-    predictions: list[float] = []
-    for _ in range(horizon):
+    predictions: list[float] = [float(v) for v in prior_predictions[:horizon]]
+    history.extend(predictions)
+    while len(predictions) < horizon:
         target_index = len(history)
         feature_row = _build_feature_row(history, target_index, config, exog_extended)
-        predicted = float(model.predict(feature_row.reshape(1, -1))[0])
-        predicted = max(predicted, 0.0)
+        predicted = max(float(predict_row(feature_row.reshape(1, -1))), 0.0)
         predictions.append(predicted)
         history.append(predicted)
     return np.asarray(predictions, dtype=float)
 
 
-def _predict_hist_gradient_boosting_autoregression(
-    series: Sequence[float],
-    config: ForecastConfig,
-    horizon: int,
-    future_exog: Sequence[float] | None = None,
+@dataclass(frozen=True)
+class _FittedAutoregression:
+    """已训练的自回归模型：保留训练序列，可在不重新训练的情况下继续递推。"""
+
+    predict_row: Callable[[np.ndarray], float]
+    history: Sequence[float]
+    exog_history: Sequence[float] | None
+
+    def forecast(
+        self,
+        config: ForecastConfig,
+        horizon: int,
+        future_exog: Sequence[float] | None = None,
+        *,
+        prior_predictions: Sequence[float] = (),
+    ) -> np.ndarray:
+        return _recursive_forecast(
+            self.predict_row,
+            self.history,
+            config,
+            horizon,
+            future_exog,
+            exog_history=self.exog_history,
+            prior_predictions=prior_predictions,
+        )
+
+
+@dataclass(frozen=True)
+class _AutoregressiveModel:
+    """拆分为“训练 + 递推”两步的自回归候选模型。
+
+    直接调用时与普通预测函数等价；热启动时可单独调用 ``train`` 保存训练结果。
+    回测时通过 ``train_batch`` 一次性准备所有起点的训练矩阵，
+    提供 ``batch_fit`` 的模型（如 Ridge）还能对所有起点一次求解。
+    """
+
+    fit: Callable[..., Callable[[np.ndarray], float]]
+    window_size: int | None = None
+    batch_fit: Callable[..., list[Callable[[np.ndarray], float]]] | None = None
+
+    def train(
+        self,
+        series: Sequence[float],
+        config: ForecastConfig,
+        *,
+        exog_history: Sequence[float] | None = None,
+        previous: Any = None,
+    ) -> _FittedAutoregression:
+        del previous
+        train_series, train_exog = _slice_recent_window(
+            series,
+            exog_history,
+            self.window_size,
+        )
+        x_train, y_train = _build_supervised_dataset(train_series, config, train_exog)
+        predict_row = self.fit(x_train, y_train, config)
+        return _FittedAutoregression(predict_row, train_series, train_exog)
+
+    def train_batch(
+        self,
+        series: Sequence[float],
+        config: ForecastConfig,
+        origins: Sequence[int],
+        *,
+        exog_history: Sequence[float] | None = None,
+    ) -> dict[int, _FittedAutoregression]:
+        """为多个回测起点训练模型，训练集均为 ``series[:origin]``。
+
+        未截取窗口时，各起点的训练矩阵是整段特征矩阵的前缀，只需构建一次。
+        """
+        target = np.asarray(series, dtype=float)
+        full_dataset: tuple[np.ndarray, np.ndarray] | None = None
+        frames: list[tuple[Sequence[float], Any, np.ndarray, np.ndarray]] = []
+        for origin in origins:
+            train_series, train_exog = _slice_recent_window(
+                target[:origin],
+                None if exog_history is None else exog_history[:origin],
+                self.window_size,
+            )
+            if len(train_series) == origin:
+                if full_dataset is None:
+                    full_dataset = _build_supervised_dataset(target, config, exog_history)
+                row_count = max(origin - _max_lookback(config), 0)
+                x_train = full_dataset[0][:row_count]
+                y_train = full_dataset[1][:row_count]
+            else:
+                x_train, y_train = _build_supervised_dataset(
+                    train_series,
+                    config,
+                    train_exog,
+                )
+            frames.append((train_series, train_exog, x_train, y_train))
+
+        if self.batch_fit is not None:
+            predict_rows = self.batch_fit(
+                [frame[2] for frame in frames],
+                [frame[3] for frame in frames],
+                config,
+            )
+        else:
+            predict_rows = [self.fit(frame[2], frame[3], config) for frame in frames]
+        return {
+            origin: _FittedAutoregression(predict_row, frame[0], frame[1])
+            for origin, frame, predict_row in zip(origins, frames, predict_rows)
+        }
+
+    def __call__(
+        self,
+        series: Sequence[float],
+        config: ForecastConfig,
+        horizon: int,
+        future_exog: Sequence[float] | None = None,
+        *,
+        exog_history: Sequence[float] | None = None,
+    ) -> np.ndarray:
+        fitted = self.train(series, config, exog_history=exog_history)
+        return fitted.forecast(config, horizon, future_exog)
+
+
+@dataclass(frozen=True)
+class _FittedHoltWinters:
+    results: Any
+
+    @property
+    def start_params(self) -> np.ndarray:
+        params = self.results.params
+        return np.r_[
+            params["smoothing_level"],
+            params["smoothing_trend"],
+            params["smoothing_seasonal"],
+            params["initial_level"],
+            params["initial_trend"],
+            params["initial_seasons"],
+        ]
+
+    def forecast(
+        self,
+        config: ForecastConfig,
+        horizon: int,
+        future_exog: Sequence[float] | None = None,
+        *,
+        prior_predictions: Sequence[float] = (),
+    ) -> np.ndarray:
+        del config, future_exog, prior_predictions
+        return np.asarray(self.results.forecast(horizon), dtype=float)
+
+
+@dataclass(frozen=True)
+class _HoltWintersModel:
+    """Holt-Winters 候选模型；热启动时以上一次的参数作为优化初值。"""
+
+    def train(
+        self,
+        series: Sequence[float],
+        config: ForecastConfig,
+        *,
+        exog_history: Sequence[float] | None = None,
+        previous: Any = None,
+    ) -> _FittedHoltWinters:
+        del exog_history
+        holt_winters = _holt_winters()
+        if holt_winters is None:
+            raise RuntimeError(DEPENDENCY_REASON)
+        history = np.asarray(series, dtype=float)
+        if len(history) < max(config.min_history, config.season_length * 2):
+            raise ValueError("insufficient history for holt-winters")
+
+        model = holt_winters.ExponentialSmoothing(
+            history,
+            trend="add",
+            seasonal="add",
+            seasonal_periods=config.season_length,
+            initialization_method="estimated",
+        )
+        start_params = None
+        if isinstance(previous, _FittedHoltWinters):
+            start_params = previous.start_params
+        fitted = model.fit(optimized=True, use_brute=False, start_params=start_params)
+        return _FittedHoltWinters(fitted)
+
+    def __call__(
+        self,
+        series: Sequence[float],
+        config: ForecastConfig,
+        horizon: int,
+        _future_exog: Sequence[float] | None = None,
+        *,
+        exog_history: Sequence[float] | None = None,
+    ) -> np.ndarray:
+        fitted = self.train(series, config, exog_history=exog_history)
+        return fitted.forecast(config, horizon)
+
+
+_TRAINABLE_MODEL_TYPES = (_AutoregressiveModel, _HoltWintersModel)
+
+_predict_holt_winters = _HoltWintersModel()
+
+
+RIDGE_ALPHA = 1.2
+
+
+def _solve_standardized_ridge_batch(
+    x_batches: Sequence[np.ndarray],
+    y_batches: Sequence[np.ndarray],
     *,
-    exog_history: Sequence[float] | None = None,
-) -> np.ndarray:
-    if not SKLEARN_AVAILABLE:
+    alpha: float = RIDGE_ALPHA,
+) -> list[Callable[[np.ndarray], float]]:
+    """对多组训练数据一次性求解“标准化 + 加权 Ridge”的闭式解。
+
+    与 ``Pipeline(StandardScaler(), Ridge(alpha))`` 配合
+    ``_build_sample_weights`` 的结果一致（仅有浮点舍入差异）：
+    - 各组补零到相同行数，用掩码屏蔽补齐的行；
+    - 正规方程 ``(ZᵀWZ + αI)β = ZᵀWy`` 按批做 Cholesky 分解求解。
+    """
+    batch_size = len(x_batches)
+    row_counts = np.asarray([len(y) for y in y_batches], dtype=int)
+    max_rows = int(row_counts.max())
+    feature_count = x_batches[0].shape[1]
+
+    x_stack = np.zeros((batch_size, max_rows, feature_count), dtype=float)
+    y_stack = np.zeros((batch_size, max_rows), dtype=float)
+    weights = np.zeros((batch_size, max_rows), dtype=float)
+    for batch_index, (x_train, y_train) in enumerate(zip(x_batches, y_batches)):
+        rows = len(y_train)
+        x_stack[batch_index, :rows] = x_train
+        y_stack[batch_index, :rows] = y_train
+        weights[batch_index, :rows] = _build_sample_weights(rows)
+    mask = (np.arange(max_rows)[None, :] < row_counts[:, None]).astype(float)
+    counts = row_counts.astype(float)[:, None]
+
+    # StandardScaler：未加权的均值与方差，近似常数列的缩放置为 1
+    feature_mean = np.einsum("br,brp->bp", mask, x_stack) / counts
+    deviations = (x_stack - feature_mean[:, None, :]) * mask[:, :, None]
+    feature_var = np.einsum("brp,brp->bp", deviations, deviations) / counts
+    eps = np.finfo(float).eps
+    constant_mask = feature_var <= (
+        counts * eps * feature_var + (counts * feature_mean * eps) ** 2
+    )
+    feature_scale = np.sqrt(feature_var)
+    feature_scale[constant_mask] = 1.0
+
+    # Ridge：按样本权重居中后求解正规方程
+    weight_sum = weights.sum(axis=1)
+    x_offset = np.einsum("br,brp->bp", weights, x_stack) / weight_sum[:, None]
+    y_offset = np.einsum("br,br->b", weights, y_stack) / weight_sum
+    root_weights = np.sqrt(weights)[:, :, None]
+    z_weighted = (x_stack - x_offset[:, None, :]) / feature_scale[:, None, :] * root_weights
+    y_weighted = (y_stack - y_offset[:, None])[:, :, None] * root_weights
+    gram = np.matmul(np.swapaxes(z_weighted, 1, 2), z_weighted)
+    gram += alpha * np.eye(feature_count)[None, :, :]
+    rhs = np.matmul(np.swapaxes(z_weighted, 1, 2), y_weighted)
+    cholesky = np.linalg.cholesky(gram)
+    coef = np.linalg.solve(
+        np.swapaxes(cholesky, 1, 2),
+        np.linalg.solve(cholesky, rhs),
+    )[:, :, 0]
+
+    def _make_predict_row(batch_index: int) -> Callable[[np.ndarray], float]:
+        row_offset = x_offset[batch_index]
+        row_scale = feature_scale[batch_index]
+        row_coef = coef[batch_index]
+        intercept = float(y_offset[batch_index])
+
+        def _predict_row(feature_matrix: np.ndarray) -> float:
+            standardized = (feature_matrix[0] - row_offset) / row_scale
+            return intercept + float(standardized @ row_coef)
+
+        return _predict_row
+
+    return [_make_predict_row(batch_index) for batch_index in range(batch_size)]
+
+
+def _batch_fit_ridge_autoregression(
+    x_batches: Sequence[np.ndarray],
+    y_batches: Sequence[np.ndarray],
+    config: ForecastConfig,
+) -> list[Callable[[np.ndarray], float]]:
+    if any(len(y_train) < max(config.min_history // 2, 8) for y_train in y_batches):
+        raise ValueError("insufficient training rows for ridge autoregression")
+    return _solve_standardized_ridge_batch(x_batches, y_batches)
+
+
+def _fit_ridge_autoregression(
+    x_train: np.ndarray,
+    y_train: np.ndarray,
+    config: ForecastConfig,
+) -> Callable[[np.ndarray], float]:
+    return _batch_fit_ridge_autoregression([x_train], [y_train], config)[0]
+
+
+_predict_ridge_autoregression = _AutoregressiveModel(
+    _fit_ridge_autoregression,
+    batch_fit=_batch_fit_ridge_autoregression,
+)
+
+
+def _fit_hist_gradient_boosting_autoregression(
+    x_train: np.ndarray,
+    y_train: np.ndarray,
+    config: ForecastConfig,
+) -> Callable[[np.ndarray], float]:
+    ensemble = _sklearn_ensemble()
+    if ensemble is None:
         raise RuntimeError(DEPENDENCY_REASON)
 
-    x_train, y_train = _build_supervised_dataset(series, config, exog_history)
     if len(y_train) < max(config.min_history // 2, 10):
         raise ValueError("insufficient training rows for gradient boosting autoregression")
 
-    model = HistGradientBoostingRegressor(
+    model = ensemble.HistGradientBoostingRegressor(
         loss="squared_error",
         learning_rate=0.08,
         max_depth=3,
@@ -455,17 +834,15 @@ def _predict_hist_gradient_boosting_autoregression(
     sample_weights = _build_sample_weights(len(y_train))
     model.fit(x_train, y_train, sample_weight=sample_weights)
 
-    history = [float(v) for v in series]
-    exog_extended = _extend_exog_matrix(exog_history, future_exog, horizon)
+    def _predict_row(feature_matrix: np.ndarray) -> float:
+        return float(model.predict(feature_matrix)[0])
 
-    predictions: list[float] = []
-    for _ in range(horizon):
-        target_index = len(history)
-        feature_row = _build_feature_row(history, target_index, config, exog_extended)
-        predicted = float(model.predict(feature_row.reshape(1, -1))[0])
-        predictions.append(max(predicted, 0.0))
-        history.append(max(predicted, 0.0))
-    return np.asarray(predictions, dtype=float)
+    return _predict_row
+
+
+_predict_hist_gradient_boosting_autoregression = _AutoregressiveModel(
+    _fit_hist_gradient_boosting_autoregression
+)
 
 
 def _compute_duration_activity_threshold(
@@ -486,18 +863,15 @@ def _compute_duration_activity_threshold(
     return max(7.0, float(np.quantile(reference, 0.45)))
 
 
-def _predict_two_stage_duration_autoregression(
-    series: Sequence[float],
+def _fit_two_stage_duration_autoregression(
+    x_train: np.ndarray,
+    y_train: np.ndarray,
     config: ForecastConfig,
-    horizon: int,
-    future_exog: Sequence[float] | None = None,
-    *,
-    exog_history: Sequence[float] | None = None,
-) -> np.ndarray:
-    if not SKLEARN_AVAILABLE:
+) -> Callable[[np.ndarray], float]:
+    ensemble = _sklearn_ensemble()
+    if ensemble is None:
         raise RuntimeError(DEPENDENCY_REASON)
 
-    x_train, y_train = _build_supervised_dataset(series, config, exog_history)
     if len(y_train) < max(config.min_history // 2, 10):
         raise ValueError("insufficient training rows for two-stage duration autoregression")
 
@@ -508,7 +882,7 @@ def _predict_two_stage_duration_autoregression(
 
     classifier = None
     if len(np.unique(active_labels)) > 1:
-        classifier = HistGradientBoostingClassifier(
+        classifier = ensemble.HistGradientBoostingClassifier(
             learning_rate=0.08,
             max_depth=3,
             max_iter=70,
@@ -527,7 +901,7 @@ def _predict_two_stage_duration_autoregression(
         regressor_y = y_train
         regressor_weights = sample_weights
 
-    intensity_regressor = HistGradientBoostingRegressor(
+    intensity_regressor = ensemble.HistGradientBoostingRegressor(
         loss="squared_error",
         learning_rate=0.07,
         max_depth=3,
@@ -549,14 +923,7 @@ def _predict_two_stage_duration_autoregression(
         else min(threshold * 0.5, float(np.median(y_train)))
     )
 
-    history = [float(v) for v in series]
-    exog_extended = _extend_exog_matrix(exog_history, future_exog, horizon)
-
-    predictions: list[float] = []
-    for _ in range(horizon):
-        target_index = len(history)
-        feature_row = _build_feature_row(history, target_index, config, exog_extended)
-        feature_matrix = feature_row.reshape(1, -1)
+    def _predict_row(feature_matrix: np.ndarray) -> float:
         if classifier is None:
             active_prob = active_rate
         else:
@@ -566,34 +933,31 @@ def _predict_two_stage_duration_autoregression(
             float(np.expm1(intensity_regressor.predict(feature_matrix)[0])),
             0.0,
         )
-        predicted = (active_prob * active_prediction) + (
-            (1.0 - active_prob) * inactive_level
-        )
-        predicted = max(predicted, 0.0)
-        predictions.append(predicted)
-        history.append(predicted)
+        return (active_prob * active_prediction) + ((1.0 - active_prob) * inactive_level)
 
-    return np.asarray(predictions, dtype=float)
+    return _predict_row
 
 
-def _predict_poisson_hist_gradient_boosting_autoregression(
-    series: Sequence[float],
+_predict_two_stage_duration_autoregression = _AutoregressiveModel(
+    _fit_two_stage_duration_autoregression
+)
+
+
+def _fit_poisson_hist_gradient_boosting_autoregression(
+    x_train: np.ndarray,
+    y_train: np.ndarray,
     config: ForecastConfig,
-    horizon: int,
-    future_exog: Sequence[float] | None = None,
-    *,
-    exog_history: Sequence[float] | None = None,
-) -> np.ndarray:
-    if not SKLEARN_AVAILABLE:
+) -> Callable[[np.ndarray], float]:
+    ensemble = _sklearn_ensemble()
+    if ensemble is None:
         raise RuntimeError(DEPENDENCY_REASON)
 
-    x_train, y_train = _build_supervised_dataset(series, config, exog_history)
     if len(y_train) < max(config.min_history // 2, 10):
         raise ValueError(
             "insufficient training rows for poisson gradient boosting autoregression"
         )
 
-    model = HistGradientBoostingRegressor(
+    model = ensemble.HistGradientBoostingRegressor(
         loss="poisson",
         learning_rate=0.06,
         max_depth=3,
@@ -606,38 +970,32 @@ def _predict_poisson_hist_gradient_boosting_autoregression(
     strictly_positive_y = np.maximum(y_train, 1e-4)
     model.fit(x_train, strictly_positive_y, sample_weight=sample_weights)
 
-    history = [float(v) for v in series]
-    exog_extended = _extend_exog_matrix(exog_history, future_exog, horizon)
+    def _predict_row(feature_matrix: np.ndarray) -> float:
+        return float(model.predict(feature_matrix)[0])
 
-    predictions: list[float] = []
-    for _ in range(horizon):
-        target_index = len(history)
-        feature_row = _build_feature_row(history, target_index, config, exog_extended)
-        predicted = float(model.predict(feature_row.reshape(1, -1))[0])
-        predicted = max(predicted, 0.0)
-        predictions.append(predicted)
-        history.append(predicted)
-    return np.asarray(predictions, dtype=float)
+    return _predict_row
 
 
-def _predict_log_hist_gradient_boosting_autoregression(
-    series: Sequence[float],
+_predict_poisson_hist_gradient_boosting_autoregression = _AutoregressiveModel(
+    _fit_poisson_hist_gradient_boosting_autoregression
+)
+
+
+def _fit_log_hist_gradient_boosting_autoregression(
+    x_train: np.ndarray,
+    y_train: np.ndarray,
     config: ForecastConfig,
-    horizon: int,
-    future_exog: Sequence[float] | None = None,
-    *,
-    exog_history: Sequence[float] | None = None,
-) -> np.ndarray:
-    if not SKLEARN_AVAILABLE:
+) -> Callable[[np.ndarray], float]:
+    ensemble = _sklearn_ensemble()
+    if ensemble is None:
         raise RuntimeError(DEPENDENCY_REASON)
 
-    x_train, y_train = _build_supervised_dataset(series, config, exog_history)
     if len(y_train) < max(config.min_history // 2, 10):
         raise ValueError(
             "insufficient training rows for log gradient boosting autoregression"
         )
 
-    model = HistGradientBoostingRegressor(
+    model = ensemble.HistGradientBoostingRegressor(
         loss="squared_error",
         learning_rate=0.08,
         max_depth=3,
@@ -650,18 +1008,15 @@ def _predict_log_hist_gradient_boosting_autoregression(
     transformed_y = np.log1p(np.maximum(y_train, 0.0))
     model.fit(x_train, transformed_y, sample_weight=sample_weights)
 
-    history = [float(v) for v in series]
-    exog_extended = _extend_exog_matrix(exog_history, future_exog, horizon)
+    def _predict_row(feature_matrix: np.ndarray) -> float:
+        return float(np.expm1(model.predict(feature_matrix)[0]))
 
-    predictions: list[float] = []
-    for _ in range(horizon):
-        target_index = len(history)
-        feature_row = _build_feature_row(history, target_index, config, exog_extended)
-        predicted_log = float(model.predict(feature_row.reshape(1, -1))[0])
-        predicted = max(float(np.expm1(predicted_log)), 0.0)
-        predictions.append(predicted)
-        history.append(predicted)
-    return np.asarray(predictions, dtype=float)
+    return _predict_row
+
+
+_predict_log_hist_gradient_boosting_autoregression = _AutoregressiveModel(
+    _fit_log_hist_gradient_boosting_autoregression
+)
 
 
 def _available_model_predictors(
@@ -673,59 +1028,343 @@ def _available_model_predictors(
     predictors: list[tuple[str, Callable[..., np.ndarray]]] = [
         ("Seasonal Naive", _predict_seasonal_naive),
     ]
-    if SKLEARN_AVAILABLE:
-        predictors.append(("Ridge Autoregression", _predict_ridge_autoregression))
-        predictors.append(
-            (
-                "Recent Ridge Autoregression",
-                _build_recent_window_predictor(
-                    _predict_ridge_autoregression,
-                    window_size=recent_window_size,
-                ),
-            )
+    # Ridge 用 numpy 闭式求解，不依赖 sklearn；只有非线性模型需要 sklearn
+    predictors.append(("Ridge Autoregression", _predict_ridge_autoregression))
+    predictors.append(
+        (
+            "Recent Ridge Autoregression",
+            _build_recent_window_predictor(
+                _predict_ridge_autoregression,
+                window_size=recent_window_size,
+            ),
         )
-        if include_nonlinear:
-            if target_kind == "duration":
-                predictors.append(
-                    (
-                        "Two-Stage Duration Autoregression",
-                        _predict_two_stage_duration_autoregression,
-                    )
+    )
+    if include_nonlinear and _sklearn_ensemble() is not None:
+        if target_kind == "duration":
+            predictors.append(
+                (
+                    "Two-Stage Duration Autoregression",
+                    _predict_two_stage_duration_autoregression,
                 )
-                predictors.append(
-                    (
-                        "Poisson-HistGradientBoosting Autoregression",
+            )
+            predictors.append(
+                (
+                    "Poisson-HistGradientBoosting Autoregression",
+                    _predict_poisson_hist_gradient_boosting_autoregression,
+                )
+            )
+            predictors.append(
+                (
+                    "Recent Poisson-HistGradientBoosting Autoregression",
+                    _build_recent_window_predictor(
                         _predict_poisson_hist_gradient_boosting_autoregression,
-                    )
+                        window_size=recent_window_size,
+                    ),
                 )
-                predictors.append(
-                    (
-                        "Recent Poisson-HistGradientBoosting Autoregression",
-                        _build_recent_window_predictor(
-                            _predict_poisson_hist_gradient_boosting_autoregression,
-                            window_size=recent_window_size,
-                        ),
-                    )
+            )
+        else:
+            predictors.append(
+                (
+                    "Log-HistGradientBoosting Autoregression",
+                    _predict_log_hist_gradient_boosting_autoregression,
                 )
-            else:
-                predictors.append(
-                    (
-                        "Log-HistGradientBoosting Autoregression",
+            )
+            predictors.append(
+                (
+                    "Recent Log-HistGradientBoosting Autoregression",
+                    _build_recent_window_predictor(
                         _predict_log_hist_gradient_boosting_autoregression,
-                    )
-                )
-                predictors.append(
-                    (
-                        "Recent Log-HistGradientBoosting Autoregression",
-                        _build_recent_window_predictor(
-                            _predict_log_hist_gradient_boosting_autoregression,
-                            window_size=recent_window_size,
-                        ),
-                    )
+                        window_size=recent_window_size,
+                    ),
                 )
+            )
     return tuple(predictors)
 
 
+@dataclass(frozen=True)
+class _WarmFit:
+    train_digest: str
+    fitted: Any
+    future_rows: np.ndarray | None
+    predictions: np.ndarray
+
+
+def _future_exog_rows(
+    exog_history,
+    future_exog,
+    horizon: int,
+) -> np.ndarray | None:
+    extended = _extend_exog_matrix(exog_history, future_exog, horizon)
+    if extended is None or horizon <= 0:
+        return None
+    return extended[-horizon:]
+
+
+def _matching_prefix_length(
+    previous_rows: np.ndarray | None,
+    current_rows: np.ndarray | None,
+    limit: int,
+) -> int:
+    if previous_rows is None or current_rows is None:
+        return limit if previous_rows is None and current_rows is None else 0
+    limit = min(limit, len(previous_rows), len(current_rows))
+    for index in range(limit):
+        if not np.array_equal(previous_rows[index], current_rows[index]):
+            return index
+    return limit
+
+
+class _SeriesWarmState:
+    """单条序列的热启动缓存。
+
+    以 (模型名, 回测起点) 为键保存训练结果与已算出的预测：
+    - 训练数据摘要不变时直接复用模型，只把递推补到新的步数；
+    - 训练数据变化时才重新训练，并把旧参数作为初值（Holt-Winters）。
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, int], _WarmFit] = {}
+        self._lock = threading.Lock()
+        self.fit_count = 0
+        self.reuse_count = 0
+
+    def _store(self, key: tuple[str, int], entry: _WarmFit, *, trained: bool) -> None:
+        # 并行回测时多个候选会同时写入（键不同），计数需要加锁
+        with self._lock:
+            self._entries[key] = entry
+            if trained:
+                self.fit_count += 1
+            else:
+                self.reuse_count += 1
+
+    def export_entries(self, model_name: str | None = None) -> dict[tuple[str, int], _WarmFit]:
+        with self._lock:
+            return {
+                key: entry
+                for key, entry in self._entries.items()
+                if model_name is None or key[0] == model_name
+            }
+
+    def merge(
+        self,
+        entries: dict[tuple[str, int], _WarmFit],
+        *,
+        fit_count: int = 0,
+        reuse_count: int = 0,
+    ) -> None:
+        """合并在其他进程中得到的训练结果（进程池并行回测时使用）。"""
+        with self._lock:
+            self._entries.update(entries)
+            self.fit_count += fit_count
+            self.reuse_count += reuse_count
+
+    def needs_training(
+        self,
+        model_name: str,
+        series: Sequence[float],
+        horizon: int,
+        *,
+        exog_history: Sequence[float] | None = None,
+        future_exog: Sequence[float] | None = None,
+    ) -> bool:
+        entry = self._entries.get((model_name, len(series)))
+        if entry is None or entry.train_digest != _digest_training_inputs(series, exog_history):
+            return True
+        if entry.fitted is not None:
+            return False
+        reusable = _matching_prefix_length(
+            entry.future_rows,
+            _future_exog_rows(exog_history, future_exog, horizon),
+            min(len(entry.predictions), horizon),
+        )
+        return reusable < horizon
+
+    def run(
+        self,
+        model_name: str,
+        predictor: Callable[..., np.ndarray],
+        series: Sequence[float],
+        config: ForecastConfig,
+        horizon: int,
+        *,
+        exog_history: Sequence[float] | None = None,
+        future_exog: Sequence[float] | None = None,
+        fitted: Any = None,
+    ) -> np.ndarray:
+        """运行单个候选；``fitted`` 为批量训练好的模型，需要重训时直接使用。"""
+        if not isinstance(predictor, _TRAINABLE_MODEL_TYPES):
+            return predictor(
+                series,
+                config,
+                horizon,
+                future_exog,
+                exog_history=exog_history,
+            )
+
+        origin = len(series)
+        key = (model_name, origin)
+        train_digest = _digest_training_inputs(series, exog_history)
+        future_rows = _future_exog_rows(exog_history, future_exog, horizon)
+        entry = self._entries.get(key)
+
+        if entry is not None and entry.train_digest == train_digest:
+            reusable = _matching_prefix_length(
+                entry.future_rows,
+                future_rows,
+                min(len(entry.predictions), horizon),
+            )
+            if reusable >= horizon:
+                with self._lock:
+                    self.reuse_count += 1
+                return entry.predictions[:horizon].copy()
+            if entry.fitted is not None:
+                predictions = entry.fitted.forecast(
+                    config,
+                    horizon,
+                    future_exog,
+                    prior_predictions=entry.predictions[:reusable],
+                )
+                self._store(
+                    key,
+                    _WarmFit(train_digest, entry.fitted, future_rows, predictions),
+                    trained=False,
+                )
+                return predictions.copy()
+
+        if fitted is None:
+            previous = entry if entry is not None else self._entries.get((model_name, origin - 1))
+            fitted = predictor.train(
+                series,
+                config,
+                exog_history=exog_history,
+                previous=None if previous is None else previous.fitted,
+            )
+        predictions = fitted.forecast(config, horizon, future_exog)
+        self._store(
+            key,
+            _WarmFit(train_digest, fitted, future_rows, predictions),
+            trained=True,
+        )
+        return predictions.copy()
+
+    def prune(self, series_length: int, config: ForecastConfig) -> None:
+        """丢弃不会再用到的起点；已完整预测的回测起点只保留预测值，释放模型。"""
+        min_origin = max(config.min_history, series_length - config.validation_window)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                _model_name, origin = key
+                if origin < min_origin:
+                    del self._entries[key]
+                elif (
+                    origin < series_length
+                    and entry.fitted is not None
+                    and len(entry.predictions) >= config.horizon
+                ):
+                    self._entries[key] = replace(entry, fitted=None)
+
+
+class ForecastWarmState:
+    """某个用户（或任意调用方给定的键）在各条序列上的热启动状态。"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._series: dict[str, _SeriesWarmState] = {}
+
+    def series(self, name: str) -> _SeriesWarmState:
+        state = self._series.get(name)
+        if state is None:
+            state = self._series.setdefault(name, _SeriesWarmState())
+        return state
+
+    def prune(self, name: str, series_length: int, config: ForecastConfig) -> None:
+        state = self._series.get(name)
+        if state is not None:
+            state.prune(series_length, config)
+
+    @property
+    def fit_count(self) -> int:
+        return sum(state.fit_count for state in self._series.values())
+
+    @property
+    def reuse_count(self) -> int:
+        return sum(state.reuse_count for state in self._series.values())
+
+
+WARM_STATE_MAX_ENTRIES = 8
+_warm_states: OrderedDict[Any, ForecastWarmState] = OrderedDict()
+_warm_states_lock = threading.Lock()
+
+
+def _get_forecast_warm_state(key: Any) -> ForecastWarmState:
+    with _warm_states_lock:
+        state = _warm_states.get(key)
+        if state is None:
+            state = ForecastWarmState()
+            _warm_states[key] = state
+        _warm_states.move_to_end(key)
+        while len(_warm_states) > WARM_STATE_MAX_ENTRIES:
+            _warm_states.popitem(last=False)
+        return state
+
+
+def discard_forecast_warm_state(key: Any) -> None:
+    """丢弃指定键的热启动状态，下次预测将从头训练。"""
+    with _warm_states_lock:
+        _warm_states.pop(key, None)
+
+
+@dataclass
+class _BacktestTiming:
+    """回测耗时统计；batch_saved_seconds 为批量求解相对逐起点重训节省的估计时间。"""
+
+    elapsed_seconds: float = 0.0
+    batch_saved_seconds: float = 0.0
+
+    def add(self, other: _BacktestTiming) -> None:
+        self.elapsed_seconds += other.elapsed_seconds
+        self.batch_saved_seconds += other.batch_saved_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "batch_saved_seconds": round(self.batch_saved_seconds, 3),
+        }
+
+
+CANDIDATE_EXECUTOR_PROCESS = "process"
+CANDIDATE_EXECUTOR_THREAD = "thread"
+_candidate_executors: dict[tuple[str, int], Executor] = {}
+_candidate_executors_lock = threading.Lock()
+
+
+def get_candidate_executor(
+    workers: int,
+    kind: str = CANDIDATE_EXECUTOR_PROCESS,
+) -> Executor | None:
+    """返回按 (类型, 并发数) 共享的候选回测执行器；workers <= 1 时不并行。"""
+    workers = int(workers or 0)
+    if workers <= 1:
+        return None
+    if kind not in {CANDIDATE_EXECUTOR_PROCESS, CANDIDATE_EXECUTOR_THREAD}:
+        raise ValueError(f"unknown candidate executor: {kind}")
+    key = (kind, workers)
+    with _candidate_executors_lock:
+        executor = _candidate_executors.get(key)
+        if executor is None:
+            if kind == CANDIDATE_EXECUTOR_THREAD:
+                executor = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix="forecast-candidate",
+                )
+            else:
+                executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            _candidate_executors[key] = executor
+        return executor
+
+
 def _run_predictor(
     model_name: str,
     predictor: Callable[..., np.ndarray],
@@ -735,7 +1374,22 @@ def _run_predictor(
     *,
     exog_history: Sequence[float] | None = None,
     future_exog: Sequence[float] | None = None,
+    warm_state: _SeriesWarmState | None = None,
+    fitted: Any = None,
 ) -> np.ndarray:
+    if warm_state is not None:
+        return warm_state.run(
+            model_name,
+            predictor,
+            series,
+            config,
+            horizon,
+            exog_history=exog_history,
+            future_exog=future_exog,
+            fitted=fitted,
+        )
+    if fitted is not None:
+        return fitted.forecast(config, horizon, future_exog)
     return predictor(
         series,
         config,
@@ -745,6 +1399,48 @@ def _run_predictor(
     )
 
 
+def _train_backtest_origins(
+    predictor: _AutoregressiveModel,
+    target: np.ndarray,
+    config: ForecastConfig,
+    origins: Sequence[int],
+    *,
+    exog_history: Sequence[float] | None,
+    timing: _BacktestTiming | None,
+) -> dict[int, _FittedAutoregression]:
+    """批量训练需要重训的回测起点。
+
+    可闭式求解的模型会额外单独训练最后一个起点，用它的耗时估算逐起点重训的成本。
+    """
+    if not origins:
+        return {}
+    if predictor.batch_fit is None or len(origins) < 2:
+        return predictor.train_batch(target, config, origins, exog_history=exog_history)
+
+    last_origin = origins[-1]
+    started_at = time.perf_counter()
+    last_fitted = predictor.train(
+        target[:last_origin],
+        config,
+        exog_history=None if exog_history is None else exog_history[:last_origin],
+    )
+    single_seconds = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    fitted_by_origin = predictor.train_batch(
+        target,
+        config,
+        origins[:-1],
+        exog_history=exog_history,
+    )
+    batch_seconds = time.perf_counter() - started_at
+    fitted_by_origin[last_origin] = last_fitted
+
+    if timing is not None:
+        timing.batch_saved_seconds += single_seconds * (len(origins) - 1) - batch_seconds
+    return fitted_by_origin
+
+
 def _backtest_candidate(
     model_name: str,
     predictor: Callable[..., np.ndarray],
@@ -752,43 +1448,76 @@ def _backtest_candidate(
     config: ForecastConfig,
     *,
     exog_history: Sequence[float] | None = None,
+    warm_state: _SeriesWarmState | None = None,
+    timing: _BacktestTiming | None = None,
 ) -> tuple[float, float, dict[int, list[float]]]:
+    started_at = time.perf_counter()
     target = np.asarray(series, dtype=float)
     if len(target) < config.min_history:
         raise ValueError("insufficient history for backtest")
 
     start_origin = max(config.min_history, len(target) - config.validation_window)
-    actual_points: list[float] = []
-    predicted_points: list[float] = []
-    residuals_by_horizon: dict[int, list[float]] = {
-        step: [] for step in range(1, config.horizon + 1)
-    }
-
+    origin_inputs = []
     for origin in range(start_origin, len(target)):
-        train_series = target[:origin]
         steps = min(config.horizon, len(target) - origin)
         if steps <= 0:
             continue
-
         train_exog = None if exog_history is None else exog_history[:origin]
         future_exog = None if exog_history is None else exog_history[origin : origin + steps]
+        origin_inputs.append((origin, steps, train_exog, future_exog))
 
-        prediction = _run_predictor(
-            model_name,
-            predictor,
-            train_series,
-            config,
-            steps,
-            exog_history=train_exog,
-            future_exog=future_exog,
-        )
+    actual_points: list[float] = []
+    predicted_points: list[float] = []
+    residuals_by_horizon: dict[int, list[float]] = {
+        step: [] for step in range(1, config.horizon + 1)
+    }
 
-        actual_slice = target[origin : origin + steps]
-        actual_points.extend(actual_slice.tolist())
-        predicted_points.extend(prediction.tolist())
+    fitted_by_origin: dict[int, _FittedAutoregression] = {}
+    try:
+        if isinstance(predictor, _AutoregressiveModel):
+            pending_origins = [
+                origin
+                for origin, steps, train_exog, future_exog in origin_inputs
+                if warm_state is None
+                or warm_state.needs_training(
+                    model_name,
+                    target[:origin],
+                    steps,
+                    exog_history=train_exog,
+                    future_exog=future_exog,
+                )
+            ]
+            fitted_by_origin = _train_backtest_origins(
+                predictor,
+                target,
+                config,
+                pending_origins,
+                exog_history=exog_history,
+                timing=timing,
+            )
+
+        for origin, steps, train_exog, future_exog in origin_inputs:
+            prediction = _run_predictor(
+                model_name,
+                predictor,
+                target[:origin],
+                config,
+                steps,
+                exog_history=train_exog,
+                future_exog=future_exog,
+                warm_state=warm_state,
+                fitted=fitted_by_origin.get(origin),
+            )
+
+            actual_slice = target[origin : origin + steps]
+            actual_points.extend(actual_slice.tolist())
+            predicted_points.extend(prediction.tolist())
 
-        for step, (predicted, actual) in enumerate(zip(prediction, actual_slice), start=1):
-            residuals_by_horizon[step].append(float(actual - predicted))
+            for step, (predicted, actual) in enumerate(zip(prediction, actual_slice), start=1):
+                residuals_by_horizon[step].append(float(actual - predicted))
+    finally:
+        if timing is not None:
+            timing.elapsed_seconds += time.perf_counter() - started_at
 
     if not actual_points:
         raise ValueError("backtest produced no predictions")
@@ -802,6 +1531,150 @@ def _backtest_candidate(
     )
 
 
+def _backtest_candidate_outcome(
+    model_name: str,
+    predictor: Callable[..., np.ndarray],
+    series: Sequence[float],
+    config: ForecastConfig,
+    exog_history: Sequence[float] | None,
+    warm_state: _SeriesWarmState | None,
+) -> tuple[tuple[float, float, dict[int, list[float]]] | None, _BacktestTiming]:
+    timing = _BacktestTiming()
+    try:
+        metrics = _backtest_candidate(
+            model_name,
+            predictor,
+            series,
+            config,
+            exog_history=exog_history,
+            warm_state=warm_state,
+            timing=timing,
+        )
+    except Exception:
+        metrics = None
+    return metrics, timing
+
+
+def _backtest_candidate_in_isolation(
+    model_name: str,
+    predictor: Callable[..., np.ndarray],
+    series: Sequence[float],
+    config: ForecastConfig,
+    exog_history: Sequence[float] | None,
+    warm_entries: dict[tuple[str, int], _WarmFit],
+):
+    """在独立进程中回测单个候选，并带回训练结果供父进程合并。"""
+    warm_state = _SeriesWarmState()
+    warm_state.merge(warm_entries)
+    metrics, timing = _backtest_candidate_outcome(
+        model_name,
+        predictor,
+        series,
+        config,
+        exog_history,
+        warm_state,
+    )
+    warm_state.prune(len(series), config)
+    return (
+        metrics,
+        timing,
+        warm_state.export_entries(),
+        warm_state.fit_count,
+        warm_state.reuse_count,
+    )
+
+
+def _evaluate_candidates(
+    predictors: Sequence[tuple[str, Callable[..., np.ndarray]]],
+    series: Sequence[float],
+    config: ForecastConfig,
+    *,
+    exog_history: Sequence[float] | None,
+    warm_state: _SeriesWarmState,
+    timing: _BacktestTiming,
+    executor: Executor | None = None,
+) -> list[tuple[str, Callable[..., np.ndarray], float, float, dict[int, list[float]]]]:
+    """回测全部候选。
+
+    传入 executor 时并行回测：线程池直接共享热启动状态；进程池（或 loky 等）
+    在子进程中回测，再把训练结果合并回来。结果始终按候选顺序汇总，与串行一致。
+    """
+    outcomes = []
+    if executor is None or len(predictors) < 2:
+        for model_name, predictor in predictors:
+            outcomes.append(
+                _backtest_candidate_outcome(
+                    model_name,
+                    predictor,
+                    series,
+                    config,
+                    exog_history,
+                    warm_state,
+                )
+            )
+    elif isinstance(executor, ThreadPoolExecutor):
+        futures = [
+            executor.submit(
+                _backtest_candidate_outcome,
+                model_name,
+                predictor,
+                series,
+                config,
+                exog_history,
+                warm_state,
+            )
+            for model_name, predictor in predictors
+        ]
+        outcomes = [future.result() for future in futures]
+    else:
+        futures = []
+        for model_name, predictor in predictors:
+            try:
+                future = executor.submit(
+                    _backtest_candidate_in_isolation,
+                    model_name,
+                    predictor,
+                    series,
+                    config,
+                    exog_history,
+                    warm_state.export_entries(model_name),
+                )
+            except Exception:
+                future = None
+            futures.append(future)
+        for (model_name, predictor), future in zip(predictors, futures):
+            try:
+                if future is None:
+                    raise RuntimeError("candidate was not submitted")
+                metrics, candidate_timing, entries, fit_count, reuse_count = future.result()
+            except Exception:
+                # 无法序列化的候选（如测试中的闭包）回退到本进程执行
+                outcomes.append(
+                    _backtest_candidate_outcome(
+                        model_name,
+                        predictor,
+                        series,
+                        config,
+                        exog_history,
+                        warm_state,
+                    )
+                )
+                continue
+            warm_state.merge(entries, fit_count=fit_count, reuse_count=reuse_count)
+            outcomes.append((metrics, candidate_timing))
+
+    candidate_results = []
+    for (model_name, predictor), (metrics, candidate_timing) in zip(predictors, outcomes):
+        timing.add(candidate_timing)
+        if metrics is None:
+            continue
+        wape_value, rmse_value, residuals = metrics
+        if not _is_finite_metric(wape_value) or not _is_finite_metric(rmse_value):
+            continue
+        candidate_results.append((model_name, predictor, wape_value, rmse_value, residuals))
+    return candidate_results
+
+
 def _build_intervals(
     prediction: Sequence[float],
     residuals_by_horizon: dict[int, list[float]],
@@ -852,6 +1725,7 @@ def _serialize_candidates(
 
 def _build_weighted_blend_predictor(
     components: Sequence[tuple[str, Callable[..., np.ndarray], float]],
+    warm_state: _SeriesWarmState | None = None,
 ) -> Callable[..., np.ndarray]:
     normalized_components = [
         (model_name, predictor, float(weight))
@@ -884,6 +1758,7 @@ def _build_weighted_blend_predictor(
                 horizon,
                 exog_history=exog_history,
                 future_exog=future_exog,
+                warm_state=warm_state,
             )
             weighted_predictions.append(np.asarray(model_prediction, dtype=float) * weight)
         return np.sum(weighted_predictions, axis=0, dtype=float)
@@ -896,6 +1771,9 @@ def _build_recent_window_predictor(
     *,
     window_size: int,
 ) -> Callable[..., np.ndarray]:
+    if isinstance(predictor, _AutoregressiveModel):
+        return replace(predictor, window_size=window_size)
+
     def _predict_recent_window(
         series: Sequence[float],
         config: ForecastConfig,
@@ -904,22 +1782,11 @@ def _build_recent_window_predictor(
         *,
         exog_history: Sequence[float] | None = None,
     ) -> np.ndarray:
-        if len(series) <= window_size:
-            return predictor(
-                series,
-                config,
-                horizon,
-                future_exog,
-                exog_history=exog_history,
-            )
-
-        sliced_series = list(series[-window_size:])
-        sliced_exog = None
-        if exog_history is not None:
-            exog_matrix = _normalize_exog_matrix(exog_history)
-            if exog_matrix is not None:
-                sliced_exog = exog_matrix[-window_size:].tolist()
-
+        sliced_series, sliced_exog = _slice_recent_window(
+            series,
+            exog_history,
+            window_size,
+        )
         return predictor(
             sliced_series,
             config,
@@ -979,6 +1846,8 @@ def _create_forecast(
     future_exog: Sequence[float] | None = None,
     display_divisor: float = 1.0,
     target_kind: str = "duration",
+    warm_state: _SeriesWarmState | None = None,
+    candidate_executor: Executor | None = None,
 ) -> dict:
     history_points = len(series)
     future_labels = _build_future_labels(
@@ -989,6 +1858,9 @@ def _create_forecast(
         current_label=current_label,
     )
 
+    # 未传入热启动状态时也使用本次调用内的缓存，使加权融合复用各分量的回测训练结果
+    warm_state = warm_state if warm_state is not None else _SeriesWarmState()
+    backtest_timing = _BacktestTiming()
     numeric_series = [0.0 if value is None else float(value) for value in series]
     numeric_exog = _sanitize_exog_values(exog_history)
     available_predictors = _available_model_predictors(
@@ -1004,23 +1876,15 @@ def _create_forecast(
             reason=UNAVAILABLE_REASON,
         )
 
-    candidate_results: list[tuple[str, Callable[..., np.ndarray], float, float, dict[int, list[float]]]] = []
-    for model_name, predictor in available_predictors:
-        try:
-            wape_value, rmse_value, residuals = _backtest_candidate(
-                model_name,
-                predictor,
-                numeric_series,
-                config,
-                exog_history=numeric_exog,
-            )
-        except Exception:
-            continue
-        if not _is_finite_metric(wape_value) or not _is_finite_metric(rmse_value):
-            continue
-        candidate_results.append(
-            (model_name, predictor, wape_value, rmse_value, residuals)
-        )
+    candidate_results = _evaluate_candidates(
+        available_predictors,
+        numeric_series,
+        config,
+        exog_history=numeric_exog,
+        warm_state=warm_state,
+        timing=backtest_timing,
+        executor=candidate_executor,
+    )
 
     ranked_candidates = sorted(candidate_results, key=lambda item: (item[2], item[3], item[0]))
     if len(ranked_candidates) >= 2:
@@ -1033,7 +1897,10 @@ def _create_forecast(
             )
             for model_name, predictor, wape_value, _rmse_value, _residuals in top_candidates
         ]
-        blend_predictor = _build_weighted_blend_predictor(blend_components)
+        blend_predictor = _build_weighted_blend_predictor(
+            blend_components,
+            warm_state=warm_state,
+        )
         try:
             blend_wape, blend_rmse, blend_residuals = _backtest_candidate(
                 "Weighted Blend",
@@ -1041,6 +1908,7 @@ def _create_forecast(
                 numeric_series,
                 config,
                 exog_history=numeric_exog,
+                timing=backtest_timing,
             )
         except Exception:
             blend_wape = None
@@ -1069,6 +1937,7 @@ def _create_forecast(
             reason=DEPENDENCY_REASON
             if not available_predictors
             else MODEL_FAILURE_REASON,
+            backtest_timing=backtest_timing.to_dict(),
         )
 
     selected_name, selected_predictor, best_wape, best_rmse, residuals = min(
@@ -1098,6 +1967,7 @@ def _create_forecast(
             baseline_wape=baseline_wape,
             baseline_rmse=baseline_rmse,
             model_candidates=serialized_candidates,
+            backtest_timing=backtest_timing.to_dict(),
         )
 
     try:
@@ -1109,6 +1979,7 @@ def _create_forecast(
             config.horizon,
             exog_history=numeric_exog,
             future_exog=future_exog,
+            warm_state=warm_state,
         )
     except Exception:
         return _empty_forecast(
@@ -1122,6 +1993,7 @@ def _create_forecast(
             baseline_wape=baseline_wape,
             baseline_rmse=baseline_rmse,
             model_candidates=serialized_candidates,
+            backtest_timing=backtest_timing.to_dict(),
         )
     if not np.all(np.isfinite(prediction)):
         return _empty_forecast(
@@ -1135,6 +2007,7 @@ def _create_forecast(
             baseline_wape=baseline_wape,
             baseline_rmse=baseline_rmse,
             model_candidates=serialized_candidates,
+            backtest_timing=backtest_timing.to_dict(),
         )
 
     lower, upper = _build_intervals(prediction, residuals)
@@ -1160,6 +2033,7 @@ def _create_forecast(
             None if baseline_rmse is None else baseline_rmse / max(display_divisor, 1.0)
         ),
         "model_candidates": serialized_candidates,
+        "backtest_timing": backtest_timing.to_dict(),
         "available": True,
         "reason": "",
     }
@@ -1182,105 +2056,149 @@ def build_trend_forecasts(
     daily_current_label: str | None = None,
     weekly_current_label: str | None = None,
     weekly_duration_display_divisor: float = 1.0,
+    warm_start_key: Any = None,
+    reset_warm_state: bool = False,
+    candidate_workers: int = 0,
+    candidate_executor_kind: str = CANDIDATE_EXECUTOR_PROCESS,
 ) -> dict[str, dict]:
-    daily_efficiency_future_seed = _build_seed_forecast(
-        daily_efficiency_values,
-        DAILY_CONFIG,
-        DAILY_CONFIG.horizon,
-    )
-    daily_duration_exog_history = _combine_exog_columns(
-        daily_efficiency_values,
-        daily_stage_features,
-    )
-    daily_duration_future_exog = _combine_exog_columns(
-        daily_efficiency_future_seed,
-        daily_future_stage_features,
-    )
-    daily_duration_forecast = _create_forecast(
-        daily_labels,
-        daily_duration_values,
-        DAILY_CONFIG,
-        global_start_date=global_start_date,
-        last_log_date=last_log_date,
-        current_label=daily_current_label,
-        exog_history=daily_duration_exog_history,
-        future_exog=daily_duration_future_exog,
-        target_kind="duration",
-    )
-    daily_efficiency_exog_history = _combine_exog_columns(
-        daily_duration_values,
-        daily_stage_features,
+    """生成日/周时长与效率四条序列的预测。
+
+    传入 ``warm_start_key``（通常为用户 ID）时，会复用该键上一次运行留下的
+    训练结果：历史只追加了少量数据时，大部分回测起点无需重新训练。
+    ``reset_warm_state`` 为真时先丢弃该键的热启动状态再训练；热启动状态只存在于
+    执行本函数的进程（预测分片的子进程）中，手动重训必须经由任务本身清除。
+
+    ``candidate_workers`` 大于 1 时，候选模型的回测分发到共享执行器并行执行，
+    日、周两条预测链也同时进行（时长 → 效率 的依赖保持串行）。
+    """
+    if warm_start_key is not None and reset_warm_state:
+        discard_forecast_warm_state(warm_start_key)
+    warm_state = (
+        None if warm_start_key is None else _get_forecast_warm_state(warm_start_key)
     )
-    daily_efficiency_future_exog = _combine_exog_columns(
-        daily_duration_forecast["prediction"]
-        if daily_duration_forecast.get("available")
-        else None,
-        daily_future_stage_features,
-    )
-    daily_efficiency_forecast = _create_forecast(
-        daily_labels,
-        daily_efficiency_values,
-        DAILY_CONFIG,
-        global_start_date=global_start_date,
-        last_log_date=last_log_date,
-        current_label=daily_current_label,
-        exog_history=daily_efficiency_exog_history,
-        future_exog=daily_efficiency_future_exog,
-        target_kind="efficiency",
-    )
-    weekly_efficiency_future_seed = _build_seed_forecast(
-        weekly_efficiency_values,
-        WEEKLY_CONFIG,
-        WEEKLY_CONFIG.horizon,
-    )
-    weekly_duration_exog_history = _combine_exog_columns(
-        weekly_efficiency_values,
-        weekly_stage_features,
-    )
-    weekly_duration_future_exog = _combine_exog_columns(
-        weekly_efficiency_future_seed,
-        weekly_future_stage_features,
+    executor = get_candidate_executor(candidate_workers, candidate_executor_kind)
+
+    def _series_state(name: str) -> _SeriesWarmState | None:
+        return None if warm_state is None else warm_state.series(name)
+
+    def _daily_chain() -> tuple[dict, dict]:
+        return _build_forecast_chain(
+            DAILY_CONFIG,
+            labels=daily_labels,
+            duration_values=daily_duration_values,
+            efficiency_values=daily_efficiency_values,
+            stage_features=daily_stage_features,
+            future_stage_features=daily_future_stage_features,
+            global_start_date=global_start_date,
+            last_log_date=last_log_date,
+            current_label=daily_current_label,
+            duration_display_divisor=1.0,
+            duration_warm_state=_series_state("daily_duration"),
+            efficiency_warm_state=_series_state("daily_efficiency"),
+            candidate_executor=executor,
+        )
+
+    def _weekly_chain() -> tuple[dict, dict]:
+        return _build_forecast_chain(
+            WEEKLY_CONFIG,
+            labels=weekly_labels,
+            duration_values=weekly_duration_values,
+            efficiency_values=weekly_efficiency_values,
+            stage_features=weekly_stage_features,
+            future_stage_features=weekly_future_stage_features,
+            global_start_date=global_start_date,
+            last_log_date=last_log_date,
+            current_label=weekly_current_label,
+            duration_display_divisor=weekly_duration_display_divisor,
+            duration_warm_state=_series_state("weekly_duration"),
+            efficiency_warm_state=_series_state("weekly_efficiency"),
+            candidate_executor=executor,
+        )
+
+    with warm_state.lock if warm_state is not None else nullcontext():
+        if executor is None:
+            daily_duration_forecast, daily_efficiency_forecast = _daily_chain()
+            weekly_duration_forecast, weekly_efficiency_forecast = _weekly_chain()
+        else:
+            # 周预测链在辅助线程中运行，与日预测链共享同一个候选执行器
+            with ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="forecast-weekly-chain",
+            ) as chain_executor:
+                weekly_future = chain_executor.submit(_weekly_chain)
+                daily_duration_forecast, daily_efficiency_forecast = _daily_chain()
+                weekly_duration_forecast, weekly_efficiency_forecast = weekly_future.result()
+
+        if warm_state is not None:
+            warm_state.prune("daily_duration", len(daily_duration_values), DAILY_CONFIG)
+            warm_state.prune("daily_efficiency", len(daily_efficiency_values), DAILY_CONFIG)
+            warm_state.prune("weekly_duration", len(weekly_duration_values), WEEKLY_CONFIG)
+            warm_state.prune("weekly_efficiency", len(weekly_efficiency_values), WEEKLY_CONFIG)
+
+    return {
+        "daily_duration_data": daily_duration_forecast,
+        "daily_efficiency_data": daily_efficiency_forecast,
+        "weekly_duration_data": weekly_duration_forecast,
+        "weekly_efficiency_data": weekly_efficiency_forecast,
+    }
+
+
+def _build_forecast_chain(
+    config: ForecastConfig,
+    *,
+    labels: Sequence[str],
+    duration_values: Sequence[float | None],
+    efficiency_values: Sequence[float | None],
+    stage_features: Sequence[Sequence[float]] | None,
+    future_stage_features: Sequence[Sequence[float]] | None,
+    global_start_date: date,
+    last_log_date: date,
+    current_label: str | None,
+    duration_display_divisor: float,
+    duration_warm_state: _SeriesWarmState | None,
+    efficiency_warm_state: _SeriesWarmState | None,
+    candidate_executor: Executor | None,
+) -> tuple[dict, dict]:
+    """同一频率下先预测时长，再以时长预测作为外生变量预测效率。"""
+    efficiency_future_seed = _build_seed_forecast(
+        efficiency_values,
+        config,
+        config.horizon,
     )
-    weekly_duration_forecast = _create_forecast(
-        weekly_labels,
-        weekly_duration_values,
-        WEEKLY_CONFIG,
+    duration_forecast = _create_forecast(
+        labels,
+        duration_values,
+        config,
         global_start_date=global_start_date,
         last_log_date=last_log_date,
-        current_label=weekly_current_label,
-        exog_history=weekly_duration_exog_history,
-        future_exog=weekly_duration_future_exog,
-        display_divisor=weekly_duration_display_divisor,
+        current_label=current_label,
+        exog_history=_combine_exog_columns(efficiency_values, stage_features),
+        future_exog=_combine_exog_columns(efficiency_future_seed, future_stage_features),
+        display_divisor=duration_display_divisor,
         target_kind="duration",
+        warm_state=duration_warm_state,
+        candidate_executor=candidate_executor,
     )
-    weekly_efficiency_exog_history = _combine_exog_columns(
-        weekly_duration_values,
-        weekly_stage_features,
-    )
-    weekly_efficiency_future_exog = _combine_exog_columns(
+    efficiency_future_exog = _combine_exog_columns(
         [
-            round(value * max(weekly_duration_display_divisor, 1.0), 2)
-            for value in weekly_duration_forecast["prediction"]
+            round(value * max(duration_display_divisor, 1.0), 2)
+            for value in duration_forecast["prediction"]
         ]
-        if weekly_duration_forecast.get("available")
+        if duration_forecast.get("available")
         else None,
-        weekly_future_stage_features,
+        future_stage_features,
     )
-    weekly_efficiency_forecast = _create_forecast(
-        weekly_labels,
-        weekly_efficiency_values,
-        WEEKLY_CONFIG,
+    efficiency_forecast = _create_forecast(
+        labels,
+        efficiency_values,
+        config,
         global_start_date=global_start_date,
         last_log_date=last_log_date,
-        current_label=weekly_current_label,
-        exog_history=weekly_efficiency_exog_history,
-        future_exog=weekly_efficiency_future_exog,
+        current_label=current_label,
+        exog_history=_combine_exog_columns(duration_values, stage_features),
+        future_exog=efficiency_future_exog,
         target_kind="efficiency",
+        warm_state=efficiency_warm_state,
+        candidate_executor=candidate_executor,
     )
-
-    return {
-        "daily_duration_data": daily_duration_forecast,
-        "daily_efficiency_data": daily_efficiency_forecast,
-        "weekly_duration_data": weekly_duration_forecast,
-        "weekly_efficiency_data": weekly_efficiency_forecast,
-    }
+    return duration_forecast, efficiency_forecast
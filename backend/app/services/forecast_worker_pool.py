@@ -0,0 +1,222 @@
+"""
+趋势预测后台任务池
+
+替代“每个用户一个守护线程”的做法：
+- 固定数量的分片，每个分片一个调度线程 + 一个单进程的 ProcessPoolExecutor，
+  模型训练在子进程中进行，不再与 Flask 请求线程争抢 GIL；
+- 同一用户总是路由到同一分片，子进程内的热启动状态可以跨任务复用；
+- 同一用户排队中的任务会去重：签名相同直接复用（参数以最新提交为准），签名更新则替换旧任务；
+- 正在运行的任务被新签名取代时无法中途打断，其结果会被丢弃。
+"""
+
+from __future__ import annotations
+
+import collections
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+EXECUTOR_PROCESS = "process"
+EXECUTOR_THREAD = "thread"
+
+
+@dataclass
+class ForecastJob:
+    """一次排队中的预测任务。"""
+
+    user_id: int
+    signature: str
+    func: Callable[..., Any]
+    kwargs: dict[str, Any]
+    on_success: Callable[[Any], None]
+    on_error: Callable[[BaseException], None]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: float | None = None
+    cancelled: bool = False
+
+    @property
+    def wait_seconds(self) -> float:
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return max(end - self.enqueued_at, 0.0)
+
+
+class _Shard:
+    def __init__(self, index: int, executor_kind: str) -> None:
+        self.index = index
+        self.executor_kind = executor_kind
+        self.condition = threading.Condition()
+        self.queue: collections.deque[ForecastJob] = collections.deque()
+        self.running: ForecastJob | None = None
+        self._executor: ProcessPoolExecutor | None = None
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._dispatch_loop,
+            name=f"chart-forecast-worker-{self.index}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _execute(self, job: ForecastJob) -> Any:
+        if self.executor_kind != EXECUTOR_PROCESS:
+            return job.func(**job.kwargs)
+        return self._get_executor().submit(job.func, **job.kwargs).result()
+
+    def _respawn_executor(self) -> None:
+        """子进程异常退出（OOM、被杀）后丢弃损坏的执行器，下一个任务启动新的子进程。"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue and not self._closed:
+                    self.condition.wait()
+                if self._closed:
+                    return
+                job = self.queue.popleft()
+                job.started_at = time.monotonic()
+                self.running = job
+
+            try:
+                result = self._execute(job)
+            except BrokenProcessPool as exc:
+                # 当前任务按失败处理，分片换一个新的子进程继续服务
+                self._respawn_executor()
+                if not job.cancelled:
+                    job.on_error(exc)
+            except Exception as exc:  # noqa: BLE001 - 交由回调记录
+                if not job.cancelled:
+                    job.on_error(exc)
+            else:
+                if not job.cancelled:
+                    job.on_success(result)
+            finally:
+                with self.condition:
+                    self.running = None
+
+    def close(self) -> None:
+        with self.condition:
+            self._closed = True
+            for job in self.queue:
+                job.cancelled = True
+            self.queue.clear()
+            self.condition.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class ForecastWorkerPool:
+    """按用户分片的预测任务池。"""
+
+    def __init__(self, max_workers: int, *, executor_kind: str = EXECUTOR_PROCESS) -> None:
+        if executor_kind not in {EXECUTOR_PROCESS, EXECUTOR_THREAD}:
+            raise ValueError(f"unknown forecast executor: {executor_kind}")
+        self.max_workers = max(int(max_workers), 1)
+        self.executor_kind = executor_kind
+        self._shards = [_Shard(index, executor_kind) for index in range(self.max_workers)]
+
+    def _shard_for(self, user_id: int) -> _Shard:
+        return self._shards[hash(user_id) % self.max_workers]
+
+    def submit(
+        self,
+        user_id: int,
+        signature: str,
+        func: Callable[..., Any],
+        kwargs: dict[str, Any],
+        *,
+        on_success: Callable[[Any], None],
+        on_error: Callable[[BaseException], None],
+    ) -> tuple[ForecastJob, bool]:
+        """提交任务，返回 (任务, 是否新建)。
+
+        同一用户相同签名的任务已在排队或运行时直接复用（排队中的任务改用本次参数）；
+        签名不同时取消排队中的旧任务，运行中的旧任务结果作废。
+        """
+        shard = self._shard_for(user_id)
+        with shard.condition:
+            running = shard.running
+            if running is not None and running.user_id == user_id and not running.cancelled:
+                if running.signature == signature:
+                    return running, False
+                running.cancelled = True
+
+            for queued in list(shard.queue):
+                if queued.user_id != user_id:
+                    continue
+                if queued.signature == signature:
+                    # 数据相同，但参数以最新提交为准（例如手动重训要求清除热启动状态）
+                    queued.kwargs = kwargs
+                    return queued, False
+                queued.cancelled = True
+                shard.queue.remove(queued)
+
+            job = ForecastJob(
+                user_id=user_id,
+                signature=signature,
+                func=func,
+                kwargs=kwargs,
+                on_success=on_success,
+                on_error=on_error,
+            )
+            shard.queue.append(job)
+            shard.ensure_started()
+            shard.condition.notify()
+        return job, True
+
+    def queue_depth(self) -> int:
+        depth = 0
+        for shard in self._shards:
+            with shard.condition:
+                depth += len(shard.queue)
+        return depth
+
+    def get_status(self, user_id: int) -> dict[str, Any]:
+        """返回用户任务的排队情况，供状态接口展示。"""
+        shard = self._shard_for(user_id)
+        state = "idle"
+        position = None
+        wait_seconds = None
+        with shard.condition:
+            running = shard.running
+            if running is not None and running.user_id == user_id and not running.cancelled:
+                state = "running"
+                wait_seconds = running.wait_seconds
+            else:
+                for index, queued in enumerate(shard.queue, start=1):
+                    if queued.user_id == user_id:
+                        state = "queued"
+                        position = index
+                        wait_seconds = queued.wait_seconds
+                        break
+        return {
+            "state": state,
+            "position": position,
+            "wait_seconds": None if wait_seconds is None else round(wait_seconds, 3),
+            "queue_depth": self.queue_depth(),
+            "workers": self.max_workers,
+            "executor": self.executor_kind,
+        }
+
+    def shutdown(self) -> None:
+        for shard in self._shards:
+            shard.close()
@@ -0,0 +1,435 @@
+"""
+后台数据导入任务
+
+大备份包的导入不在 HTTP 请求内完成，任务持久化在 data_import_job 表中：
+- submit_import_job 把上传文件写到 IMPORT_STAGING_FOLDER 后入队，立即返回任务；
+- staging：按 IMPORT_ORDER 逐表增量解析 JSON，每 IMPORT_CHUNK_SIZE 条原始记录
+  写入 data_import_row 暂存表，并在同一事务里推进断点（当前表、已暂存条数、已处理字节）；
+- attachments：附件解压到任务自己的暂存目录；
+- swapping：在一个事务内清空用户旧数据、按暂存行写入全部记录并重建派生数据，
+  同时把任务推进到 finalizing——读者要么看到旧数据，要么看到完整的新数据；
+- finalizing：用暂存目录替换用户附件目录，清理暂存行与上传文件。
+
+领取与续约都是带条件的 UPDATE（与 AI 任务队列共用 db_jobs 中的机制）：工作进程退出后，运行中的任务在
+IMPORT_JOB_LEASE_SECONDS 租约过期后被重新领取，从最后一次提交的断点继续；
+异常时重新入队，超过 IMPORT_JOB_MAX_ATTEMPTS 次后置为 failed 并清理暂存数据。
+
+IMPORT_JOB_WORKERS=0 时本进程不启动工作线程，交由 flask run-import-jobs 执行；
+测试环境默认在提交时于当前线程同步执行。
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models import DataImportJob, DataImportRow, Stage, User
+from app.services.data_service import (
+    IMPORT_ORDER,
+    _ImportIdMapper,
+    _clear_user_data,
+    _extract_attachments,
+    _iter_json_array,
+    _replace_folder,
+    _user_upload_folder,
+    _write_import_records,
+)
+from app.services.db_jobs import (
+    DBJobWorkerPool,
+    JobLeaseLost,
+    claim_first,
+    config_value,
+    default_worker_id,
+    ensure_worker_pool,
+    finished_values,
+    retry_values,
+    sync_mode,
+    write_leased,
+)
+from app.services.record_service import rebuild_efficiency_for_user
+from app.services.rollup_service import rebuild_daily_rollup
+from app.services.stage_index import mark_stage_index_stale
+
+TERMINAL_STATES = ("succeeded", "failed")
+
+_DEFAULT_IMPORT_JOB_WORKERS = 1
+_DEFAULT_IMPORT_JOB_MAX_ATTEMPTS = 3
+_DEFAULT_IMPORT_JOB_LEASE_SECONDS = 600.0
+_DEFAULT_IMPORT_JOB_POLL_SECONDS = 2.0
+_DEFAULT_IMPORT_CHUNK_SIZE = 2000
+_EXTENSION_KEY = "data_import_worker"
+
+
+def _sync_mode() -> bool:
+    return sync_mode("IMPORT_JOB_SYNC_MODE")
+
+
+def _staging_folder() -> str:
+    folder = current_app.config.get("IMPORT_STAGING_FOLDER") or os.path.join(
+        current_app.instance_path, "imports"
+    )
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _attachments_staging_path(job: DataImportJob) -> str:
+    return os.path.join(os.path.dirname(job.file_path), f"{job.id}_attachments")
+
+
+def _archive_sizes(zf: zipfile.ZipFile) -> Dict[str, int]:
+    """各表 JSON 与附件的解压后字节数，作为进度与 ETA 的分母。"""
+    sizes = {}
+    for table_name in IMPORT_ORDER:
+        try:
+            sizes[table_name] = zf.getinfo(f"data/{table_name}.json").file_size
+        except KeyError:
+            sizes[table_name] = 0
+    sizes["attachments"] = sum(
+        info.file_size
+        for info in zf.infolist()
+        if info.filename.startswith("attachments/")
+    )
+    return sizes
+
+
+def submit_import_job(user_id: int, file_storage) -> Dict[str, Any]:
+    """
+    把上传的备份包写到磁盘并入队，返回任务状态（同步模式下已执行完毕）。
+
+    文件不是有效的 zip 时抛出 ValueError。
+    """
+    job_id = uuid.uuid4().hex
+    file_path = os.path.join(_staging_folder(), f"{job_id}.zip")
+    # FileStorage.save 按块复制，上传内容不会整体读入内存
+    file_storage.save(file_path)
+    if not zipfile.is_zipfile(file_path):
+        os.remove(file_path)
+        raise ValueError("上传的文件不是有效的 zip 压缩包")
+    with zipfile.ZipFile(file_path) as zf:
+        bytes_total = sum(_archive_sizes(zf).values())
+
+    now = datetime.utcnow()
+    job = DataImportJob(
+        id=job_id,
+        user_id=int(user_id),
+        state="queued",
+        phase="staging",
+        filename=getattr(file_storage, "filename", None),
+        file_path=file_path,
+        bytes_total=bytes_total,
+        bytes_processed=0,
+        checkpoint={},
+        rows={},
+        attempts=0,
+        created_at=now,
+        updated_at=now,
+    )
+    db.session.add(job)
+    db.session.commit()
+    if _sync_mode():
+        run_import_jobs(job_id=job_id)
+    else:
+        _wake_worker()
+    return _load_job(job_id).to_dict()
+
+
+def _load_job(job_id: str) -> Optional[DataImportJob]:
+    return db.session.get(DataImportJob, job_id, populate_existing=True)
+
+
+def get_import_job(user_id: int, job_id: str) -> Optional[Dict[str, Any]]:
+    """查询任务进度；不存在或不属于该用户时返回 None。"""
+    job = _load_job(job_id)
+    if job is None or job.user_id != int(user_id):
+        return None
+    if job.state not in TERMINAL_STATES and not _sync_mode():
+        # 进程重启后由轮询进度的请求把工作线程重新拉起，续跑过期任务
+        _wake_worker()
+    return job.to_dict()
+
+
+def list_import_jobs(user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    jobs = (
+        DataImportJob.query.filter(DataImportJob.user_id == int(user_id))
+        .order_by(DataImportJob.created_at.desc())
+        .limit(max(1, limit))
+        .all()
+    )
+    return [job.to_dict() for job in jobs]
+
+
+def _claim_next_job(worker_id: str, now: datetime, job_id: Optional[str] = None) -> Optional[str]:
+    lease_cutoff = now - timedelta(
+        seconds=config_value("IMPORT_JOB_LEASE_SECONDS", _DEFAULT_IMPORT_JOB_LEASE_SECONDS)
+    )
+    claimable = or_(
+        DataImportJob.state == "queued",
+        and_(DataImportJob.state == "running", DataImportJob.locked_at < lease_cutoff),
+    )
+    query = db.session.query(DataImportJob.id).filter(claimable)
+    if job_id is not None:
+        query = query.filter(DataImportJob.id == job_id)
+    candidates = [
+        row.id for row in query.order_by(DataImportJob.created_at.asc()).limit(10).all()
+    ]
+    return claim_first(DataImportJob, candidates, claimable, worker_id, now)
+
+
+def _renew_lease(job_id: str, worker_id: str, *, commit: bool = True, **values) -> None:
+    """
+    续约并写入进度，随当前事务（含本块暂存行）一起提交。
+
+    租约已被接管时回滚本块并抛出 JobLeaseLost。
+    """
+    write_leased(DataImportJob, job_id, worker_id, commit=commit, **values)
+
+
+def _stage_tables(job: DataImportJob, worker_id: str) -> None:
+    """逐表把原始记录分块写入暂存表，每块与断点一起提交。"""
+    chunk_size = max(int(config_value("IMPORT_CHUNK_SIZE", _DEFAULT_IMPORT_CHUNK_SIZE)), 1)
+    checkpoint = dict(job.checkpoint or {})
+    done = list(checkpoint.get("done", []))
+    rows = dict(job.rows or {})
+    staging_rows = DataImportRow.__table__
+
+    with zipfile.ZipFile(job.file_path) as zf:
+        sizes = _archive_sizes(zf)
+        names = set(zf.namelist())
+        for table_name in IMPORT_ORDER:
+            if table_name in done:
+                continue
+            staged = (
+                int(checkpoint.get("records", 0))
+                if checkpoint.get("table") == table_name
+                else 0
+            )
+            finished_bytes = sum(sizes[name] for name in done)
+            json_path = f"data/{table_name}.json"
+            if json_path in names:
+                with zf.open(json_path) as json_file:
+                    records = _iter_json_array(json_file)
+                    # 断点续跑：跳过已随上一块提交的记录
+                    for _ in islice(records, staged):
+                        pass
+                    while True:
+                        chunk = list(islice(records, chunk_size))
+                        if not chunk:
+                            break
+                        db.session.execute(
+                            staging_rows.insert(),
+                            [
+                                {
+                                    "job_id": job.id,
+                                    "table_name": table_name,
+                                    "seq": staged + offset,
+                                    "payload": record,
+                                }
+                                for offset, record in enumerate(chunk)
+                            ],
+                        )
+                        staged += len(chunk)
+                        rows[table_name] = staged
+                        _renew_lease(
+                            job.id,
+                            worker_id,
+                            checkpoint={"table": table_name, "records": staged, "done": done},
+                            rows=dict(rows),
+                            bytes_processed=finished_bytes
+                            + min(json_file.tell(), sizes[table_name]),
+                        )
+            done = done + [table_name]
+            rows.setdefault(table_name, staged)
+            _renew_lease(
+                job.id,
+                worker_id,
+                checkpoint={"table": None, "records": 0, "done": done},
+                rows=dict(rows),
+                bytes_processed=finished_bytes + sizes[table_name],
+            )
+    _renew_lease(job.id, worker_id, phase="attachments")
+
+
+def _stage_attachments(job: DataImportJob, worker_id: str) -> None:
+    """附件解压到任务暂存目录（重跑时整体重来），替换阶段提交后再换入用户目录。"""
+    target = _attachments_staging_path(job)
+    shutil.rmtree(target, ignore_errors=True)
+    if _user_upload_folder(job.user_id):
+        with zipfile.ZipFile(job.file_path) as zf:
+            _extract_attachments(zf, target)
+    _renew_lease(job.id, worker_id, phase="swapping", bytes_processed=job.bytes_total)
+
+
+def _iter_staged_records(job_id: str, table_name: str, batch_size: int):
+    """按 seq 分页读取暂存记录，不依赖服务端游标。"""
+    start = 0
+    while True:
+        payloads = [
+            row.payload
+            for row in db.session.query(DataImportRow.payload)
+            .filter(
+                DataImportRow.job_id == job_id,
+                DataImportRow.table_name == table_name,
+                DataImportRow.seq >= start,
+                DataImportRow.seq < start + batch_size,
+            )
+            .order_by(DataImportRow.seq.asc())
+            .all()
+        ]
+        if not payloads:
+            return
+        yield from payloads
+        start += batch_size
+
+
+def _swap_user_data(job: DataImportJob, worker_id: str) -> None:
+    """在一个事务内用暂存记录替换用户全部数据，并把任务推进到 finalizing。"""
+    user = db.session.get(User, job.user_id)
+    if user is None:
+        raise ValueError("用户不存在")
+    batch_size = max(int(config_value("IMPORT_BATCH_SIZE", 1000)), 1)
+
+    # 替换在一个事务内完成，续约不能提前提交：更新任务行的同时锁住它，
+    # 其他进程的领取要等本事务结束后才能判断租约，也就不会重复执行替换
+    _renew_lease(job.id, worker_id, commit=False)
+    _clear_user_data(user, commit=False, remove_files=False)
+    mapper = _ImportIdMapper(user.id)
+    for table_name in IMPORT_ORDER:
+        _renew_lease(job.id, worker_id, commit=False)
+        _write_import_records(
+            table_name,
+            _iter_staged_records(job.id, table_name, batch_size),
+            mapper,
+            batch_size,
+        )
+        if table_name == Stage.__tablename__:
+            mark_stage_index_stale([user.id])
+    rebuild_daily_rollup(user.id, commit=False)
+    rebuild_efficiency_for_user(user.id)
+    _renew_lease(job.id, worker_id, phase="finalizing")
+    current_app.logger.info("Data import job %s swapped user %s data", job.id, user.id)
+
+
+def _replace_attachments(job: DataImportJob) -> None:
+    """用暂存目录替换用户附件目录；重复执行是安全的。"""
+    user_folder = _user_upload_folder(job.user_id)
+    if user_folder:
+        _replace_folder(_attachments_staging_path(job), user_folder)
+
+
+def _cleanup_staging(job: DataImportJob) -> None:
+    DataImportRow.query.filter_by(job_id=job.id).delete(synchronize_session=False)
+    db.session.commit()
+    shutil.rmtree(_attachments_staging_path(job), ignore_errors=True)
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+
+
+def _finish(job_id: str, worker_id: str, state: str, error: Optional[str] = None) -> None:
+    values = finished_values(state, datetime.utcnow(), error=error)
+    if state == "succeeded":
+        values.update(phase="done", bytes_processed=DataImportJob.bytes_total)
+    _renew_lease(job_id, worker_id, **values)
+
+
+def _execute_job(job_id: str, worker_id: str) -> None:
+    try:
+        job = _load_job(job_id)
+        if job.started_at is None:
+            _renew_lease(job_id, worker_id, started_at=datetime.utcnow())
+            job = _load_job(job_id)
+        try:
+            if job.phase == "staging":
+                _stage_tables(job, worker_id)
+                job = _load_job(job_id)
+            if job.phase == "attachments":
+                _stage_attachments(job, worker_id)
+                job = _load_job(job_id)
+            if job.phase == "swapping":
+                _swap_user_data(job, worker_id)
+                job = _load_job(job_id)
+            if job.phase == "finalizing":
+                _replace_attachments(job)
+                _cleanup_staging(job)
+        except JobLeaseLost:
+            raise
+        except ValueError as exc:
+            # 备份内容本身有问题（JSON 损坏、用户不存在），重试也不会成功
+            db.session.rollback()
+            _renew_lease(job_id, worker_id)
+            _cleanup_staging(_load_job(job_id))
+            _finish(job_id, worker_id, "failed", error=str(exc))
+        except Exception as exc:  # noqa: BLE001 - 记录后按重试策略处理
+            db.session.rollback()
+            job = _load_job(job_id)
+            current_app.logger.error(
+                "Data import job %s failed on attempt %s: %s",
+                job_id,
+                job.attempts,
+                exc,
+                exc_info=exc,
+            )
+            values = retry_values(
+                job.attempts,
+                int(config_value("IMPORT_JOB_MAX_ATTEMPTS", _DEFAULT_IMPORT_JOB_MAX_ATTEMPTS)),
+                f"{type(exc).__name__}: {exc}",
+                datetime.utcnow(),
+            )
+            # 次数用尽时清理暂存数据；finalizing 阶段数据已替换完成，保留暂存附件供人工处理
+            if values["state"] == "failed" and job.phase != "finalizing":
+                _renew_lease(job_id, worker_id)
+                _cleanup_staging(job)
+            _renew_lease(job_id, worker_id, **values)
+        else:
+            _finish(job_id, worker_id, "succeeded")
+    except JobLeaseLost:
+        current_app.logger.warning("Data import job %s was taken over by another worker", job_id)
+
+
+def run_import_jobs(
+    max_jobs: Optional[int] = None,
+    *,
+    worker_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> int:
+    """在当前线程中领取并执行导入任务（含租约过期的任务），返回执行的任务数。"""
+    worker_id = worker_id or default_worker_id("import")
+    executed = 0
+    while max_jobs is None or executed < max_jobs:
+        claimed = _claim_next_job(worker_id, now or datetime.utcnow(), job_id=job_id)
+        if claimed is None:
+            break
+        _execute_job(claimed, worker_id)
+        executed += 1
+    return executed
+
+
+def _wake_worker() -> None:
+    app = current_app._get_current_object()
+    workers = int(config_value("IMPORT_JOB_WORKERS", _DEFAULT_IMPORT_JOB_WORKERS))
+    pool = ensure_worker_pool(
+        app,
+        _EXTENSION_KEY,
+        workers,
+        lambda: DBJobWorkerPool(
+            app,
+            workers,
+            config_value("IMPORT_JOB_POLL_SECONDS", _DEFAULT_IMPORT_JOB_POLL_SECONDS),
+            lambda worker_id: run_import_jobs(1, worker_id=worker_id),
+            name="data-import-worker",
+            worker_id_prefix="import:",
+        ),
+    )
+    if pool is not None:
+        pool.wake()
@@ -5,33 +5,36 @@ Handles cross-user rankings and public statistics for shared data.
 
 from __future__ import annotations
 
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from typing import Dict, List, Tuple, Optional
 
-from sqlalchemy import func, desc
+from flask import current_app
+from sqlalchemy import func
 
 from app import db
-from app.models import User, Stage, LogEntry, DailyData, Setting
+from app.models import User, Stage, DailyData, DailyRollup, LeaderboardSnapshot, Setting
 from app.services.chart_service import get_category_chart_data
-
-_OPT_IN_KEY = "leaderboard_opt_in"
-_ALLOWED_PERIODS = {"day", "week", "month"}
-_ALLOWED_METRICS = {"duration", "efficiency"}
+from app.services.efficiency_writer import flush_pending_efficiency
+from app.services.leaderboard_snapshot import (
+    ALLOWED_METRICS,
+    ALLOWED_PERIODS,
+    OPT_IN_KEY as _OPT_IN_KEY,
+    current_period_range,
+    ensure_leaderboard_snapshot,
+    ranked_leaderboard_subquery,
+    ranked_snapshot_subquery,
+    refresh_leaderboard_for_users,
+    snapshot_rank,
+)
+
+_ALLOWED_PERIODS = set(ALLOWED_PERIODS)
+_ALLOWED_METRICS = set(ALLOWED_METRICS)
+# snapshot：读取预先聚合好得分的快照；live：每次实时聚合并由数据库窗口函数排名
+_QUERY_MODES = ("snapshot", "live")
 
 
 def _current_period_range(period: str) -> Tuple[date, date]:
-    today = date.today()
-    if period == "day":
-        return today, today
-    if period == "week":
-        start = today - timedelta(days=6)
-        end = today
-        return start, end
-    if period == "month":
-        start = today - timedelta(days=29)
-        end = today
-        return start, end
-    raise ValueError(f"Unsupported period: {period}")
+    return current_period_range(period)
 
 
 def is_user_opted_in(user_id: int) -> bool:
@@ -53,6 +56,8 @@ def set_leaderboard_opt_in(user_id: int, opt_in: bool) -> None:
     else:
         setting.value = value
         db.session.add(setting)
+    db.session.flush()
+    refresh_leaderboard_for_users([user_id])
     db.session.commit()
 
 
@@ -81,13 +86,109 @@ def _build_rank_record(
     }
 
 
+def _row_record(row, rank: Optional[int] = None) -> Dict[str, object]:
+    """快照行与排名子查询行字段同名，统一转换为响应记录；快照行需另传名次。"""
+    return _build_rank_record(
+        row.user_id,
+        row.username,
+        row.total_duration,
+        row.avg_efficiency,
+        row.sessions,
+        row.last_activity,
+        int(row.rank if rank is None else rank),
+    )
+
+
+def _query_mode() -> str:
+    mode = str(current_app.config.get("LEADERBOARD_QUERY_MODE", "snapshot")).lower()
+    return mode if mode in _QUERY_MODES else "snapshot"
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    """游标即上一页最后一行的名次。"""
+    if cursor is None or cursor == "":
+        return None
+    try:
+        value = int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor parameter")
+    if value < 0:
+        raise ValueError("Invalid cursor parameter")
+    return value
+
+
+def _snapshot_page(
+    requesting_user_id: int, period: str, metric: str, after_rank: int, page_size: int
+) -> Tuple[int, List[Dict[str, object]], Optional[Dict[str, object]]]:
+    ensure_leaderboard_snapshot(period)
+    snapshot_query = LeaderboardSnapshot.query.filter_by(period=period, metric=metric)
+    total = snapshot_query.count()
+    ranked = ranked_snapshot_subquery(period, metric)
+    page_rows = (
+        db.session.query(ranked)
+        .filter(ranked.c.rank > after_rank)
+        .order_by(ranked.c.rank.asc())
+        .limit(page_size)
+        .all()
+    )
+    me_row = snapshot_query.filter_by(user_id=requesting_user_id).first()
+    return (
+        total,
+        [_row_record(row) for row in page_rows],
+        _row_record(me_row, snapshot_rank(me_row)) if me_row else None,
+    )
+
+
+def _live_page(
+    requesting_user_id: int,
+    metric: str,
+    start_date: date,
+    end_date: date,
+    after_rank: int,
+    page_size: int,
+) -> Tuple[int, List[Dict[str, object]], Optional[Dict[str, object]]]:
+    """不依赖快照，由数据库窗口函数排名，只取回一页和请求者自己的一行。"""
+    total = (
+        db.session.query(func.count(User.id))
+        .join(Setting, Setting.user_id == User.id)
+        .filter(Setting.key == _OPT_IN_KEY, Setting.value == "true")
+        .scalar()
+        or 0
+    )
+    ranked = ranked_leaderboard_subquery(start_date, end_date, metric)
+    page_rows = (
+        db.session.query(ranked)
+        .filter(ranked.c.rank > after_rank)
+        .order_by(ranked.c.rank.asc())
+        .limit(page_size)
+        .all()
+    )
+    me_row = (
+        db.session.query(ranked)
+        .filter(ranked.c.user_id == requesting_user_id)
+        .first()
+    )
+    return (
+        int(total),
+        [_row_record(row) for row in page_rows],
+        _row_record(me_row) if me_row else None,
+    )
+
+
 def get_leaderboard_rankings(
     requesting_user_id: int,
     period: str = "week",
     metric: str = "duration",
     page: int = 1,
     page_size: int = 20,
+    cursor: Optional[str] = None,
 ) -> Dict[str, object]:
+    """
+    分页获取排行榜。
+
+    page 走 OFFSET 语义；cursor（上一页返回的 next_cursor）走键集语义，
+    两者都换算成「名次大于 N」的过滤加 LIMIT，任何一页的开销都与总人数无关。
+    """
     if period not in _ALLOWED_PERIODS:
         raise ValueError("Invalid period parameter")
     if metric not in _ALLOWED_METRICS:
@@ -95,90 +196,26 @@ def get_leaderboard_rankings(
 
     page = max(page, 1)
     page_size = min(max(page_size, 1), 100)
+    after_rank = _parse_cursor(cursor)
+    if after_rank is None:
+        after_rank = (page - 1) * page_size
 
     start_date, end_date = _current_period_range(period)
+    # 其他用户的效率分最多延迟一个写后批次，请求者自己的写入需要立即可见
+    flush_pending_efficiency(requesting_user_id)
 
-    opted_in_subquery = (
-        db.session.query(Setting.user_id)
-        .filter(Setting.key == _OPT_IN_KEY, Setting.value == "true")
-        .subquery()
-    )
-
-    duration_subquery = (
-        db.session.query(
-            Stage.user_id.label("user_id"),
-            func.coalesce(func.sum(LogEntry.actual_duration), 0).label("total_duration"),
-            func.count(LogEntry.id).label("sessions"),
-            func.max(LogEntry.log_date).label("last_activity"),
-        )
-        .join(LogEntry, Stage.id == LogEntry.stage_id)
-        .filter(LogEntry.log_date >= start_date, LogEntry.log_date <= end_date)
-        .group_by(Stage.user_id)
-        .subquery()
-    )
-
-    efficiency_subquery = (
-        db.session.query(
-            Stage.user_id.label("user_id"),
-            func.avg(DailyData.efficiency).label("avg_efficiency"),
-        )
-        .join(DailyData, Stage.id == DailyData.stage_id)
-        .filter(
-            DailyData.log_date >= start_date,
-            DailyData.log_date <= end_date,
-            DailyData.efficiency.isnot(None),
-        )
-        .group_by(Stage.user_id)
-        .subquery()
-    )
-
-    base_query = (
-        db.session.query(
-            User.id.label("user_id"),
-            User.username,
-            duration_subquery.c.total_duration,
-            efficiency_subquery.c.avg_efficiency,
-            duration_subquery.c.sessions,
-            duration_subquery.c.last_activity,
+    if _query_mode() == "live":
+        total, paged_items, me_record = _live_page(
+            requesting_user_id, metric, start_date, end_date, after_rank, page_size
         )
-        .join(opted_in_subquery, opted_in_subquery.c.user_id == User.id)
-        .outerjoin(duration_subquery, duration_subquery.c.user_id == User.id)
-        .outerjoin(efficiency_subquery, efficiency_subquery.c.user_id == User.id)
-    )
-
-    order_clauses = []
-    if metric == "duration":
-        order_clauses.append(desc(func.coalesce(duration_subquery.c.total_duration, 0)))
-        order_clauses.append(desc(func.coalesce(efficiency_subquery.c.avg_efficiency, 0)))
     else:
-        order_clauses.append(desc(func.coalesce(efficiency_subquery.c.avg_efficiency, 0)))
-        order_clauses.append(desc(func.coalesce(duration_subquery.c.total_duration, 0)))
-    order_clauses.append(User.username.asc())
-
-    rows = base_query.order_by(*order_clauses).all()
-    total = len(rows)
-
-    ranking_records: List[Dict[str, object]] = []
-    for position, row in enumerate(rows, start=1):
-        record = _build_rank_record(
-            row.user_id,
-            row.username,
-            row.total_duration,
-            row.avg_efficiency,
-            row.sessions,
-            row.last_activity,
-            position,
+        total, paged_items, me_record = _snapshot_page(
+            requesting_user_id, period, metric, after_rank, page_size
         )
-        ranking_records.append(record)
 
-    start_idx = (page - 1) * page_size
-    end_idx = start_idx + page_size
-    paged_items = ranking_records[start_idx:end_idx]
-
-    me_record = next(
-        (record for record in ranking_records if record["user_id"] == requesting_user_id),
-        None,
-    )
+    next_cursor = None
+    if len(paged_items) == page_size and paged_items[-1]["rank"] < total:
+        next_cursor = str(paged_items[-1]["rank"])
 
     return {
         "success": True,
@@ -194,6 +231,7 @@ def get_leaderboard_rankings(
             "page_size": page_size,
             "total": total,
             "items": paged_items,
+            "next_cursor": next_cursor,
             "me": me_record,
             "opted_in": is_user_opted_in(requesting_user_id),
         },
@@ -209,21 +247,21 @@ def get_user_public_stats(target_user_id: int, period: str) -> Optional[Dict[str
         return None
 
     start_date, end_date = _current_period_range(period)
+    flush_pending_efficiency(target_user_id)
 
     duration_rows = (
         db.session.query(
-            LogEntry.log_date.label("log_date"),
-            func.coalesce(func.sum(LogEntry.actual_duration), 0).label("total_duration"),
-            func.count(LogEntry.id).label("sessions"),
+            DailyRollup.log_date.label("log_date"),
+            func.coalesce(func.sum(DailyRollup.minutes), 0).label("total_duration"),
+            func.sum(DailyRollup.session_count).label("sessions"),
         )
-        .join(Stage, Stage.id == LogEntry.stage_id)
         .filter(
-            Stage.user_id == target_user_id,
-            LogEntry.log_date >= start_date,
-            LogEntry.log_date <= end_date,
+            DailyRollup.user_id == target_user_id,
+            DailyRollup.log_date >= start_date,
+            DailyRollup.log_date <= end_date,
         )
-        .group_by(LogEntry.log_date)
-        .order_by(LogEntry.log_date)
+        .group_by(DailyRollup.log_date)
+        .order_by(DailyRollup.log_date)
         .all()
     )
 
@@ -0,0 +1,323 @@
+"""
+排行榜快照维护
+
+leaderboard_snapshot 按 (周期, 指标) 保存每个用户聚合好的得分与排序键：
+- 读取时若快照不存在或 range_end 不是今天（滚动窗口已前移），整体重建该周期的快照；
+- 单个用户的时长/效率/参与状态变化时，只改写（或删除）该用户自己的一行，
+  不会重新聚合其他用户，也不会改动其他用户的行；
+- 快照不存名次：分页由 RANK() OVER 沿排序索引得出，“我的名次”是排在前面的行数加一，
+  并发刷新不同用户时互不影响，不存在名次错乱；
+- 刷新函数不提交事务，由调用方与触发它的写入一起提交。
+"""
+
+from __future__ import annotations
+
+import threading
+from datetime import date, timedelta
+from typing import Iterable, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import DailyData, DailyRollup, LeaderboardSnapshot, Setting, Stage, User
+
+OPT_IN_KEY = "leaderboard_opt_in"
+ALLOWED_PERIODS = ("day", "week", "month")
+ALLOWED_METRICS = ("duration", "efficiency")
+
+_rebuild_lock = threading.Lock()
+
+
+def current_period_range(period: str, today: date | None = None) -> Tuple[date, date]:
+    today = today or date.today()
+    if period == "day":
+        return today, today
+    if period == "week":
+        return today - timedelta(days=6), today
+    if period == "month":
+        return today - timedelta(days=29), today
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def _aggregate_query(
+    start_date: date,
+    end_date: date,
+    user_ids: Iterable[int] | None = None,
+):
+    """
+    已加入排行榜用户在区间内的时长、效率、学习次数与最后活跃日。
+
+    返回 (query, 时长得分表达式, 效率得分表达式)，得分表达式已把缺失值折算为 0，
+    供排序与窗口函数复用。
+    """
+    opted_in_subquery = (
+        db.session.query(Setting.user_id)
+        .filter(Setting.key == OPT_IN_KEY, Setting.value == "true")
+        .subquery()
+    )
+
+    duration_query = db.session.query(
+        DailyRollup.user_id.label("user_id"),
+        func.coalesce(func.sum(DailyRollup.minutes), 0).label("total_duration"),
+        func.sum(DailyRollup.session_count).label("sessions"),
+        func.max(DailyRollup.log_date).label("last_activity"),
+    ).filter(DailyRollup.log_date >= start_date, DailyRollup.log_date <= end_date)
+
+    efficiency_query = (
+        db.session.query(
+            Stage.user_id.label("user_id"),
+            func.avg(DailyData.efficiency).label("avg_efficiency"),
+        )
+        .join(DailyData, Stage.id == DailyData.stage_id)
+        .filter(
+            DailyData.log_date >= start_date,
+            DailyData.log_date <= end_date,
+            DailyData.efficiency.isnot(None),
+        )
+    )
+
+    base_query = db.session.query(User.id.label("user_id"), User.username)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        duration_query = duration_query.filter(DailyRollup.user_id.in_(user_ids))
+        efficiency_query = efficiency_query.filter(Stage.user_id.in_(user_ids))
+        base_query = base_query.filter(User.id.in_(user_ids))
+
+    duration_subquery = duration_query.group_by(DailyRollup.user_id).subquery()
+    efficiency_subquery = efficiency_query.group_by(Stage.user_id).subquery()
+
+    query = (
+        base_query.add_columns(
+            duration_subquery.c.total_duration,
+            efficiency_subquery.c.avg_efficiency,
+            duration_subquery.c.sessions,
+            duration_subquery.c.last_activity,
+        )
+        .join(opted_in_subquery, opted_in_subquery.c.user_id == User.id)
+        .outerjoin(duration_subquery, duration_subquery.c.user_id == User.id)
+        .outerjoin(efficiency_subquery, efficiency_subquery.c.user_id == User.id)
+    )
+    duration_score = func.coalesce(duration_subquery.c.total_duration, 0)
+    efficiency_score = func.coalesce(efficiency_subquery.c.avg_efficiency, 0)
+    return query, duration_score, efficiency_score
+
+
+def _ordering(metric: str, duration_score, efficiency_score) -> list:
+    if metric == "duration":
+        return [duration_score.desc(), efficiency_score.desc(), User.username.asc()]
+    return [efficiency_score.desc(), duration_score.desc(), User.username.asc()]
+
+
+def _aggregate_rows(
+    start_date: date,
+    end_date: date,
+    user_ids: Iterable[int] | None = None,
+    order_metric: str | None = None,
+):
+    """
+    聚合结果行；指定 order_metric 时按榜单顺序返回。
+
+    排序在数据库中完成，与增量插入时按数据库比较规则数名次保持一致。
+    """
+    query, duration_score, efficiency_score = _aggregate_query(
+        start_date, end_date, user_ids
+    )
+    if order_metric is not None:
+        query = query.order_by(*_ordering(order_metric, duration_score, efficiency_score))
+    return query.all()
+
+
+def ranked_leaderboard_subquery(start_date: date, end_date: date, metric: str):
+    """
+    带 RANK() OVER 名次列的实时榜单子查询。
+
+    排序键末尾带上唯一的用户名，名次连续且与快照一致；
+    调用方在子查询上按 rank 过滤、LIMIT，只取回需要的那一页。
+    """
+    query, duration_score, efficiency_score = _aggregate_query(start_date, end_date)
+    rank_column = func.rank().over(
+        order_by=_ordering(metric, duration_score, efficiency_score)
+    )
+    return query.add_columns(rank_column.label("rank")).subquery()
+
+
+def _snapshot_values(row, period: str, metric: str, range_end: date) -> dict:
+    total_duration = int(row.total_duration or 0)
+    avg_efficiency = (
+        float(row.avg_efficiency) if row.avg_efficiency is not None else None
+    )
+    duration_score = float(total_duration)
+    efficiency_score = avg_efficiency or 0.0
+    if metric == "duration":
+        primary_score, secondary_score = duration_score, efficiency_score
+    else:
+        primary_score, secondary_score = efficiency_score, duration_score
+    return {
+        "period": period,
+        "metric": metric,
+        "range_end": range_end,
+        "user_id": row.user_id,
+        "username": row.username,
+        "total_duration": total_duration,
+        "avg_efficiency": avg_efficiency,
+        "sessions": int(row.sessions or 0),
+        "last_activity": row.last_activity,
+        "primary_score": primary_score,
+        "secondary_score": secondary_score,
+    }
+
+
+def rebuild_leaderboard_snapshot(period: str, today: date | None = None) -> int:
+    """整体重建某个周期两个指标的快照，返回写入的行数（不提交）。"""
+    start_date, end_date = current_period_range(period, today)
+    LeaderboardSnapshot.query.filter_by(period=period).delete(
+        synchronize_session=False
+    )
+    rows = _aggregate_rows(start_date, end_date)
+    payload = [
+        _snapshot_values(row, period, metric, end_date)
+        for metric in ALLOWED_METRICS
+        for row in rows
+    ]
+    if payload:
+        db.session.execute(LeaderboardSnapshot.__table__.insert(), payload)
+    return len(payload)
+
+
+def ensure_leaderboard_snapshot(period: str, today: date | None = None) -> None:
+    """快照缺失或已跨天时重建并提交；并发重建冲突时以先提交者为准。"""
+    _, end_date = current_period_range(period, today)
+    current_end = (
+        db.session.query(func.min(LeaderboardSnapshot.range_end))
+        .filter(LeaderboardSnapshot.period == period)
+        .scalar()
+    )
+    if current_end == end_date:
+        return
+    with _rebuild_lock:
+        try:
+            rebuild_leaderboard_snapshot(period, today)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+
+
+def _snapshot_ordering() -> list:
+    """快照的榜单顺序，与 _ordering 一致：主/次指标降序，同分按用户名升序。"""
+    snapshot = LeaderboardSnapshot
+    return [
+        snapshot.primary_score.desc(),
+        snapshot.secondary_score.desc(),
+        snapshot.username.asc(),
+    ]
+
+
+def ranked_snapshot_subquery(period: str, metric: str):
+    """快照上带 RANK() OVER 名次列的子查询，列名与实时榜单子查询一致。"""
+    snapshot = LeaderboardSnapshot
+    return (
+        db.session.query(
+            snapshot.user_id,
+            snapshot.username,
+            snapshot.total_duration,
+            snapshot.avg_efficiency,
+            snapshot.sessions,
+            snapshot.last_activity,
+            func.rank().over(order_by=_snapshot_ordering()).label("rank"),
+        )
+        .filter(snapshot.period == period, snapshot.metric == metric)
+        .subquery()
+    )
+
+
+def snapshot_rank(row: LeaderboardSnapshot) -> int:
+    """快照行在其榜单中的名次：排序上严格排在它之前的行数加一。"""
+    snapshot = LeaderboardSnapshot
+    ahead = (
+        db.session.query(func.count(snapshot.id))
+        .filter(
+            snapshot.period == row.period,
+            snapshot.metric == row.metric,
+            or_(
+                snapshot.primary_score > row.primary_score,
+                and_(
+                    snapshot.primary_score == row.primary_score,
+                    snapshot.secondary_score > row.secondary_score,
+                ),
+                and_(
+                    snapshot.primary_score == row.primary_score,
+                    snapshot.secondary_score == row.secondary_score,
+                    snapshot.username < row.username,
+                ),
+            ),
+        )
+        .scalar()
+    )
+    return int(ahead or 0) + 1
+
+
+def refresh_leaderboard_for_users(user_ids: Iterable[int], today: date | None = None) -> None:
+    """
+    用户数据变化后增量更新其在各个快照中的名次（不提交）。
+
+    只处理 range_end 仍然有效的快照；过期的快照留给下一次读取时整体重建。
+    """
+    user_ids = sorted({int(user_id) for user_id in user_ids})
+    if not user_ids:
+        return
+    for period in ALLOWED_PERIODS:
+        start_date, end_date = current_period_range(period, today)
+        current_end = (
+            db.session.query(func.min(LeaderboardSnapshot.range_end))
+            .filter(LeaderboardSnapshot.period == period)
+            .scalar()
+        )
+        if current_end != end_date:
+            continue
+        rows_by_user = {
+            row.user_id: row for row in _aggregate_rows(start_date, end_date, user_ids)
+        }
+        for metric in ALLOWED_METRICS:
+            for user_id in user_ids:
+                _store_user_scores(
+                    period, metric, user_id, rows_by_user.get(user_id), end_date
+                )
+
+
+def _store_user_scores(
+    period: str, metric: str, user_id: int, row, range_end: date
+) -> None:
+    """改写（或删除）单个用户在某张榜单上的一行，不涉及其他用户。"""
+    snapshot = LeaderboardSnapshot
+    if row is None:
+        snapshot.query.filter_by(period=period, metric=metric, user_id=user_id).delete(
+            synchronize_session=False
+        )
+        return
+    values = _snapshot_values(row, period, metric, range_end)
+    # 延迟导入：record_service 依赖本模块
+    from app.services.record_service import _upsert_insert
+
+    statement = _upsert_insert(snapshot)
+    if statement is None:
+        existing = snapshot.query.filter_by(
+            period=period, metric=metric, user_id=user_id
+        ).first()
+        if existing is None:
+            db.session.add(snapshot(**values))
+        else:
+            for key, value in values.items():
+                setattr(existing, key, value)
+        db.session.flush()
+        return
+    db.session.execute(
+        statement.values(**values).on_conflict_do_update(
+            index_elements=["period", "metric", "user_id"],
+            set_={
+                key: value
+                for key, value in values.items()
+                if key not in {"period", "metric", "user_id"}
+            },
+        )
+    )
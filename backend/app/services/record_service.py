@@ -11,19 +11,33 @@ from sqlalchemy.orm import joinedload
 
 from app import db
 from app.models import Stage, LogEntry, WeeklyData, DailyData, Category, SubCategory
+from .ai_context_cache import mark_ai_context_stale
+from .efficiency_writer import flush_pending_efficiency, mark_efficiency_dirty
 from .helpers import get_custom_week_info, get_custom_week_window
+from .leaderboard_snapshot import refresh_leaderboard_for_users
+from .stage_index import StageIndex, get_stage_index
 
 
-def get_stage_for_date(user_id, log_date):
-    """根据日期选择所属阶段：start_date <= log_date 的最新阶段。"""
-    return (
-        Stage.query.filter(
-            Stage.user_id == user_id,
-            Stage.start_date <= log_date,
+def get_stage_for_date(user_id, log_date, fresh=False):
+    """
+    根据日期选择所属阶段：start_date <= log_date 的最新阶段。
+
+    只读场景走进程内的阶段索引（其他进程的修改最多滞后 TTL）；
+    写入记录时传 fresh=True 直接查库，避免把记录挂到已过期的阶段上。
+    """
+    if fresh:
+        return (
+            Stage.query.filter(Stage.user_id == user_id, Stage.start_date <= log_date)
+            .order_by(Stage.start_date.desc(), Stage.id.desc())
+            .first()
         )
-        .order_by(Stage.start_date.desc())
-        .first()
-    )
+    stage_id = get_stage_index(user_id).stage_id_for_date(log_date)
+    return db.session.get(Stage, stage_id) if stage_id is not None else None
+
+
+def get_stage_end_date(stage):
+    """阶段的最后一天（下一阶段开始前一天）；最后一个阶段返回 None。"""
+    return get_stage_index(stage.user_id).end_date_for(stage.id)
 
 
 def ensure_log_stage_consistency(user_id):
@@ -34,9 +48,15 @@ def ensure_log_stage_consistency(user_id):
     try:
         current_app.logger.info(f"Starting stage consistency check for user {user_id}")
         
-        # Performance optimization: Fetch all stages and sort them once
         stages = Stage.query.filter_by(user_id=user_id).order_by(Stage.start_date.desc()).all()
-        
+        # 会改写 stage_id，用刚查出的阶段建索引，不用可能过期的进程内缓存
+        ordered = sorted(stages, key=lambda stage: (stage.start_date, stage.id))
+        stage_index = StageIndex(
+            user_id=user_id,
+            start_dates=tuple(stage.start_date for stage in ordered),
+            stage_ids=tuple(stage.id for stage in ordered),
+        )
+
         if not stages:
             current_app.logger.warning(f"No stages found for user {user_id}, skipping consistency check")
             return
@@ -48,15 +68,10 @@ def ensure_log_stage_consistency(user_id):
         
         for log in logs:
             # Find correct stage in memory
-            correct_stage = None
-            for stage in stages:
-                if stage.start_date <= log.log_date:
-                    correct_stage = stage
-                    break
-            
-            if correct_stage and log.stage_id != correct_stage.id:
-                old_stage_id = log.stage_id
-                log.stage_id = correct_stage.id
+            correct_stage_id = stage_index.stage_id_for_date(log.log_date)
+
+            if correct_stage_id is not None and log.stage_id != correct_stage_id:
+                log.stage_id = correct_stage_id
                 updates_count += 1
                 # Note: We might want to update efficiency stats here too if we want to be 100% correct,
                 # but recalculating everything might be heavy. 
@@ -153,6 +168,16 @@ def format_record_for_response(record, stage=None):
     return data
 
 
+def _efficiency_score(total_duration_minutes, weighted_mood_duration_sum):
+    """由当日总分钟数与 Σ(分钟 × 心情) 得到效率分，心情缺省按 3 计。"""
+    if total_duration_minutes == 0:
+        return 0.0
+
+    average_mood = weighted_mood_duration_sum / total_duration_minutes
+    total_hours = total_duration_minutes / 60.0
+    return average_mood * math.log1p(total_hours)
+
+
 def _calculate_daily_efficiency_score(log_date, stage_id):
     """
     按"方案C:对数加权模型"计算每日效率分。
@@ -164,37 +189,39 @@ def _calculate_daily_efficiency_score(log_date, stage_id):
         return 0.0
 
     durations = [_normalize_duration_minutes(log.actual_duration) for log in logs_for_day]
-    total_duration_minutes = sum(durations)
-
-    if total_duration_minutes == 0:
-        return 0.0
-
     weighted_mood_duration_sum = sum(
         duration * (log.mood or 3) for duration, log in zip(durations, logs_for_day)
     )
-    average_mood = weighted_mood_duration_sum / total_duration_minutes
-    total_hours = total_duration_minutes / 60.0
-    final_score = average_mood * math.log1p(total_hours)
+    return _efficiency_score(sum(durations), weighted_mood_duration_sum)
 
-    return final_score
 
+def _calculate_stage_daily_efficiency_scores(stage_id):
+    """
+    一次查询取回阶段内所有日志的 (日期, 时长, 心情)，单遍累加出每个学习日的效率分。
 
-def _get_or_create_daily_data(log_date, stage_id, score):
-    daily_data = DailyData.query.filter_by(log_date=log_date, stage_id=stage_id).first()
-    if not daily_data:
-        daily_data = DailyData(log_date=log_date, stage_id=stage_id)
-        db.session.add(daily_data)
-    daily_data.efficiency = score
+    返回按日期升序的 {log_date: score}，结果与逐日调用
+    _calculate_daily_efficiency_score 完全一致。
+    """
+    rows = (
+        db.session.query(LogEntry.log_date, LogEntry.actual_duration, LogEntry.mood)
+        .filter(LogEntry.stage_id == stage_id)
+        .all()
+    )
+    return _daily_efficiency_scores(rows)
 
 
-def _get_or_create_weekly_data(year, week_num, stage_id, score):
-    weekly_data = WeeklyData.query.filter_by(
-        year=year, week_num=week_num, stage_id=stage_id
-    ).first()
-    if not weekly_data:
-        weekly_data = WeeklyData(year=year, week_num=week_num, stage_id=stage_id)
-        db.session.add(weekly_data)
-    weekly_data.efficiency = score
+def _daily_efficiency_scores(rows):
+    """由 (日期, 时长, 心情) 行累加出按日期升序的 {log_date: score}。"""
+    totals: dict[date, list[int]] = {}
+    for log_date, actual_duration, mood in rows:
+        minutes = _normalize_duration_minutes(actual_duration)
+        bucket = totals.setdefault(log_date, [0, 0])
+        bucket[0] += minutes
+        bucket[1] += minutes * (mood or 3)
+    return {
+        log_date: _efficiency_score(total, weighted)
+        for log_date, (total, weighted) in sorted(totals.items())
+    }
 
 
 def update_efficiency_for_date(log_date, stage):
@@ -203,112 +230,226 @@ def update_efficiency_for_date(log_date, stage):
     This is much faster than recalculating the entire stage.
     """
     try:
-        daily_score = _calculate_daily_efficiency_score(log_date, stage.id)
-        _get_or_create_daily_data(log_date, stage.id, daily_score)
+        update_efficiency_for_keys([(stage.id, log_date)])
+        current_app.logger.info(
+            f"Incrementally updated efficiency for date: {log_date} in stage '{stage.name}'."
+        )
 
-        week_start_date, week_end_date, year, week_num = get_custom_week_window(
-            log_date, stage.start_date
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(
+            f"Error in update_efficiency_for_date for date '{log_date}': {e}",
+            exc_info=True,
         )
 
-        next_stage = (
-            Stage.query.filter(
-                Stage.user_id == stage.user_id, Stage.start_date > stage.start_date
-            )
-            .order_by(Stage.start_date.asc())
-            .first()
+
+def update_efficiency_for_keys(keys):
+    """
+    批量重算一组 (stage_id, log_date) 的日效率及其所在周的周效率，并在一个事务内提交。
+
+    日志、阶段、周窗口内的日效率各只查询一次；已被删除的阶段直接跳过。
+    没有日志的日期写入 0 分，与逐日更新的行为一致。
+    """
+    keys = {(int(stage_id), log_date) for stage_id, log_date in keys}
+    if not keys:
+        return
+
+    stage_ids = {stage_id for stage_id, _ in keys}
+    stages_by_id = {
+        stage.id: stage for stage in Stage.query.filter(Stage.id.in_(stage_ids)).all()
+    }
+    keys = {key for key in keys if key[0] in stages_by_id}
+    if not keys:
+        return
+
+    today = date.today()
+    stage_end_dates = {
+        stage.id: get_stage_end_date(stage) or today for stage in stages_by_id.values()
+    }
+
+    log_rows = (
+        db.session.query(
+            LogEntry.stage_id, LogEntry.log_date, LogEntry.actual_duration, LogEntry.mood
+        )
+        .filter(tuple_(LogEntry.stage_id, LogEntry.log_date).in_(list(keys)))
+        .all()
+    )
+    totals = {key: [0, 0] for key in keys}
+    for stage_id, log_date, actual_duration, mood in log_rows:
+        minutes = _normalize_duration_minutes(actual_duration)
+        bucket = totals[(stage_id, log_date)]
+        bucket[0] += minutes
+        bucket[1] += minutes * (mood or 3)
+
+    daily_rows = [
+        {
+            "log_date": log_date,
+            "stage_id": stage_id,
+            "efficiency": _efficiency_score(total, weighted),
+        }
+        for (stage_id, log_date), (total, weighted) in sorted(totals.items())
+    ]
+    _bulk_upsert_efficiency(DailyData, daily_rows, ("log_date", "stage_id"))
+
+    week_windows = {}
+    for stage_id, log_date in keys:
+        stage = stages_by_id[stage_id]
+        week_start, week_end, year, week_num = get_custom_week_window(
+            log_date, stage.start_date
         )
-        stage_end_date = (
-            (next_stage.start_date - timedelta(days=1)) if next_stage else date.today()
+        effective_start = max(week_start, stage.start_date)
+        effective_end = min(week_end, stage_end_dates[stage_id], today)
+        week_windows[(stage_id, year, week_num)] = (effective_start, effective_end)
+
+    window_starts = [window[0] for window in week_windows.values()]
+    window_ends = [window[1] for window in week_windows.values()]
+    daily_scores = (
+        db.session.query(DailyData.stage_id, DailyData.log_date, DailyData.efficiency)
+        .filter(
+            DailyData.stage_id.in_({key[0] for key in week_windows}),
+            DailyData.log_date.between(min(window_starts), max(window_ends)),
+            DailyData.efficiency.isnot(None),
         )
-        effective_start = max(week_start_date, stage.start_date)
-        effective_end = min(week_end_date, stage_end_date, date.today())
+        .all()
+    )
+
+    weekly_rows = []
+    for (stage_id, year, week_num), (effective_start, effective_end) in sorted(
+        week_windows.items()
+    ):
         days_in_week = (
             (effective_end - effective_start).days + 1
             if effective_end >= effective_start
             else 0
         )
-
-        daily_scores_for_week = (
-            db.session.query(DailyData.efficiency)
-            .filter(
-                DailyData.stage_id == stage.id,
-                DailyData.log_date.between(effective_start, effective_end),
-            )
-            .all()
-        )
-
         total_score = sum(
-            item[0] for item in daily_scores_for_week if item[0] is not None
+            efficiency
+            for score_stage_id, log_date, efficiency in daily_scores
+            if score_stage_id == stage_id
+            and effective_start <= log_date <= effective_end
         )
-        average_score = total_score / days_in_week if days_in_week > 0 else 0.0
-
-        _get_or_create_weekly_data(year, week_num, stage.id, average_score)
-
-        db.session.commit()
-        current_app.logger.info(
-            f"Incrementally updated efficiency for date: {log_date} in stage '{stage.name}'."
+        weekly_rows.append(
+            {
+                "year": year,
+                "week_num": week_num,
+                "stage_id": stage_id,
+                "efficiency": total_score / days_in_week if days_in_week > 0 else 0.0,
+            }
         )
+    _bulk_upsert_efficiency(WeeklyData, weekly_rows, ("year", "week_num", "stage_id"))
+    affected_user_ids = {stage.user_id for stage in stages_by_id.values()}
+    refresh_leaderboard_for_users(affected_user_ids)
+    mark_ai_context_stale(affected_user_ids)
 
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(
-            f"Error in update_efficiency_for_date for date '{log_date}': {e}",
-            exc_info=True,
-        )
+    db.session.commit()
 
 
-def recalculate_efficiency_for_stage(stage):
-    try:
-        all_logs = stage.log_entries.all()
-        DailyData.query.filter_by(stage_id=stage.id).delete()
-        WeeklyData.query.filter_by(stage_id=stage.id).delete()
-        db.session.commit()
+def _upsert_insert(model):
+    """返回当前方言支持 ON CONFLICT 的 insert 构造；其他方言返回 None。"""
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
+
+
+def _bulk_upsert_efficiency(model, rows, conflict_columns):
+    """按唯一约束批量写入 efficiency，冲突时只更新分数。"""
+    if not rows:
+        return
+    statement = _upsert_insert(model)
+    if statement is None:
+        key_columns = [getattr(model, column) for column in conflict_columns]
+        db.session.query(model).filter(
+            tuple_(*key_columns).in_(
+                [tuple(row[column] for column in conflict_columns) for row in rows]
+            )
+        ).delete(synchronize_session=False)
+        db.session.execute(model.__table__.insert(), rows)
+        return
+    statement = statement.on_conflict_do_update(
+        index_elements=list(conflict_columns),
+        set_={"efficiency": statement.excluded.efficiency},
+    )
+    db.session.execute(statement, rows)
 
-        if not all_logs:
-            return
 
-        unique_log_dates = sorted(list(set(log.log_date for log in all_logs)))
-        daily_efficiencies_map = {}
-        for log_date in unique_log_dates:
-            score = _calculate_daily_efficiency_score(log_date, stage.id)
-            _get_or_create_daily_data(log_date, stage.id, score)
-            daily_efficiencies_map[log_date] = score
+def _stage_efficiency_rows(stage, daily_efficiencies_map):
+    """由阶段内各日效率分得到待写入的日/周 efficiency 行：(daily_rows, weekly_rows)。"""
+    stage_end_date = get_stage_end_date(stage) or date.today()
 
-        db.session.commit()
+    week_windows = {}
+    for log_date in daily_efficiencies_map:
+        week_start, week_end, year, week_num = get_custom_week_window(
+            log_date, stage.start_date
+        )
+        week_windows[(year, week_num)] = (week_start, week_end)
 
-        next_stage = (
-            Stage.query.filter(
-                Stage.user_id == stage.user_id, Stage.start_date > stage.start_date
-            )
-            .order_by(Stage.start_date.asc())
-            .first()
+    weekly_rows = []
+    for (year, week_num), (week_start, week_end) in sorted(week_windows.items()):
+        effective_start = max(week_start, stage.start_date)
+        effective_end = min(week_end, stage_end_date, date.today())
+        days_in_week = (
+            (effective_end - effective_start).days + 1
+            if effective_end >= effective_start
+            else 0
+        )
+
+        total_score = sum(
+            daily_efficiencies_map.get(effective_start + timedelta(days=i), 0)
+            for i in range(days_in_week)
         )
-        stage_end_date = (
-            (next_stage.start_date - timedelta(days=1)) if next_stage else date.today()
+        average_score = total_score / days_in_week if days_in_week > 0 else 0
+        weekly_rows.append(
+            {
+                "year": year,
+                "week_num": week_num,
+                "stage_id": stage.id,
+                "efficiency": average_score,
+            }
         )
 
-        week_windows = {}
-        for log_date in unique_log_dates:
-            week_start, week_end, year, week_num = get_custom_week_window(
-                log_date, stage.start_date
+    daily_rows = [
+        {"log_date": log_date, "stage_id": stage.id, "efficiency": score}
+        for log_date, score in daily_efficiencies_map.items()
+    ]
+    return daily_rows, weekly_rows
+
+
+def recalculate_efficiency_for_stage(stage):
+    """
+    重算阶段内全部日/周效率。
+
+    所有日志只读取一次，日分与周分在内存中算好后批量 upsert，
+    再删掉已无日志对应的旧行，整个过程在同一个事务内提交。
+    """
+    try:
+        daily_efficiencies_map = _calculate_stage_daily_efficiency_scores(stage.id)
+        daily_rows, weekly_rows = _stage_efficiency_rows(stage, daily_efficiencies_map)
+
+        stale_daily = DailyData.query.filter(DailyData.stage_id == stage.id)
+        stale_weekly = WeeklyData.query.filter(WeeklyData.stage_id == stage.id)
+        if daily_rows:
+            stale_daily = stale_daily.filter(
+                DailyData.log_date.notin_(list(daily_efficiencies_map))
             )
-            week_windows[(year, week_num)] = (week_start, week_end)
-
-        for (year, week_num), (week_start, week_end) in sorted(week_windows.items()):
-            effective_start = max(week_start, stage.start_date)
-            effective_end = min(week_end, stage_end_date, date.today())
-            days_in_week = (
-                (effective_end - effective_start).days + 1
-                if effective_end >= effective_start
-                else 0
+            stale_weekly = stale_weekly.filter(
+                tuple_(WeeklyData.year, WeeklyData.week_num).notin_(
+                    [(row["year"], row["week_num"]) for row in weekly_rows]
+                )
             )
+        stale_daily.delete(synchronize_session=False)
+        stale_weekly.delete(synchronize_session=False)
 
-            total_score = sum(
-                daily_efficiencies_map.get(effective_start + timedelta(days=i), 0)
-                for i in range(days_in_week)
-            )
-            average_score = total_score / days_in_week if days_in_week > 0 else 0
-            _get_or_create_weekly_data(year, week_num, stage.id, average_score)
+        _bulk_upsert_efficiency(DailyData, daily_rows, ("log_date", "stage_id"))
+        _bulk_upsert_efficiency(
+            WeeklyData, weekly_rows, ("year", "week_num", "stage_id")
+        )
+        refresh_leaderboard_for_users([stage.user_id])
+        mark_ai_context_stale([stage.user_id])
 
         db.session.commit()
         current_app.logger.info(
@@ -322,19 +463,58 @@ def recalculate_efficiency_for_stage(stage):
         )
 
 
-def get_structured_logs_for_stage(stage, sort_order="desc"):
-    is_reverse = sort_order == "desc"
+def rebuild_efficiency_for_user(user_id):
+    """
+    一次性重建用户全部阶段的日/周效率（不提交，由调用方提交）。
 
-    next_stage = (
-        Stage.query.filter(
-            Stage.user_id == stage.user_id, Stage.start_date > stage.start_date
+    全部日志一次查询读出，按阶段在内存中算分，删除旧行后批量插入；
+    用于数据导入这类整体替换数据的场景，代替逐阶段调用 recalculate_efficiency_for_stage。
+    返回写入的 (日效率行数, 周效率行数)。
+    """
+    stages = Stage.query.filter_by(user_id=user_id).all()
+    stage_ids = [stage.id for stage in stages]
+    rows_by_stage: dict[int, list] = {stage_id: [] for stage_id in stage_ids}
+    log_rows = (
+        db.session.query(
+            LogEntry.stage_id, LogEntry.log_date, LogEntry.actual_duration, LogEntry.mood
         )
-        .order_by(Stage.start_date.asc())
-        .first()
-    )
-    stage_end_date = (
-        (next_stage.start_date - timedelta(days=1)) if next_stage else None
+        .join(Stage, Stage.id == LogEntry.stage_id)
+        .filter(Stage.user_id == user_id)
+        .all()
     )
+    for stage_id, log_date, actual_duration, mood in log_rows:
+        rows_by_stage[stage_id].append((log_date, actual_duration, mood))
+
+    daily_rows: list[dict] = []
+    weekly_rows: list[dict] = []
+    for stage in stages:
+        stage_daily, stage_weekly = _stage_efficiency_rows(
+            stage, _daily_efficiency_scores(rows_by_stage[stage.id])
+        )
+        daily_rows.extend(stage_daily)
+        weekly_rows.extend(stage_weekly)
+
+    if stage_ids:
+        DailyData.query.filter(DailyData.stage_id.in_(stage_ids)).delete(
+            synchronize_session=False
+        )
+        WeeklyData.query.filter(WeeklyData.stage_id.in_(stage_ids)).delete(
+            synchronize_session=False
+        )
+    if daily_rows:
+        db.session.execute(DailyData.__table__.insert(), daily_rows)
+    if weekly_rows:
+        db.session.execute(WeeklyData.__table__.insert(), weekly_rows)
+    refresh_leaderboard_for_users([user_id])
+    mark_ai_context_stale([user_id])
+    return len(daily_rows), len(weekly_rows)
+
+
+def get_structured_logs_for_stage(stage, sort_order="desc"):
+    is_reverse = sort_order == "desc"
+    flush_pending_efficiency(stage.user_id)
+
+    stage_end_date = get_stage_end_date(stage)
 
     log_query = (
         LogEntry.query.join(Stage)
@@ -474,7 +654,7 @@ def calculate_record_statistics(records):
 def add_log_for_stage(stage_id, user, form_data):
     # Auto-assign stage based on date
     log_date_obj = date.fromisoformat(form_data["log_date"])
-    stage = get_stage_for_date(user.id, log_date_obj)
+    stage = get_stage_for_date(user.id, log_date_obj, fresh=True)
 
     if not stage:
         return False, "无法找到匹配日期的学习阶段，请检查日期或先创建对应阶段。", None
@@ -510,10 +690,9 @@ def add_log_for_stage(stage_id, user, form_data):
 
         db.session.flush()
         new_log_id = new_log.id
+        mark_efficiency_dirty(user.id, stage.id, new_log.log_date)
         db.session.commit()
 
-        update_efficiency_for_date(new_log.log_date, stage)
-
         return True, "新纪录添加成功!", new_log_id
 
     except Exception as e:
@@ -529,10 +708,11 @@ def update_log_for_user(log_id, user, form_data):
         return False, "未找到要编辑的记录或无权访问。"
     try:
         old_date = log.log_date
+        old_stage_id = log.stage_id
         new_date = date.fromisoformat(form_data.get("log_date"))
         
         # Recalculate stage if date changed or just to be safe
-        new_stage = get_stage_for_date(user.id, new_date)
+        new_stage = get_stage_for_date(user.id, new_date, fresh=True)
         if not new_stage:
              return False, "无法找到匹配新日期的学习阶段。"
              
@@ -563,15 +743,11 @@ def update_log_for_user(log_id, user, form_data):
         log.mood = form_data.get("mood", type=int)
         log.subcategory_id = subcategory_id
 
+        mark_efficiency_dirty(user.id, stage.id, new_date)
+        if (old_stage_id, old_date) != (stage.id, new_date):
+            mark_efficiency_dirty(user.id, old_stage_id, old_date)
         db.session.commit()
 
-        update_efficiency_for_date(new_date, stage)
-
-        if old_date != new_date:
-            old_stage = get_stage_for_date(user.id, old_date)
-            if old_stage:
-                update_efficiency_for_date(old_date, old_stage)
-
         return True, "记录更新成功!"
     except Exception as e:
         db.session.rollback()
@@ -589,9 +765,8 @@ def delete_log_for_user(log_id, user):
         date_to_update = log.log_date
 
         db.session.delete(log)
+        mark_efficiency_dirty(user.id, stage.id, date_to_update)
         db.session.commit()
-
-        update_efficiency_for_date(date_to_update, stage)
         return True, "记录已删除。"
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,230 @@
+"""
+日汇总表（daily_rollup）维护服务
+
+daily_rollup 按 (用户, 日期, 阶段, 子分类) 保存时长、记录数与心情加权时长，
+图表、KPI、排行榜等读路径直接扫描它，不再每次对 log_entry 做 GROUP BY。
+
+维护方式：
+- ORM 对 LogEntry 的增删改在 after_flush 中收集受影响的 (阶段, 日期)，
+  在同一事务内按天重算这些桶，新增/编辑/删除记录都走这条路径；
+- 绕过 ORM 的批量 UPDATE/DELETE（合并标签、清空数据）需显式调用
+  refresh_daily_rollup / clear_daily_rollup_for_user；
+- 每个桶由唯一索引 uq_daily_rollup_bucket 约束，重算时 upsert，
+  并发事务同时写入同一新桶也不会重复计数；
+- rebuild_daily_rollup 用于全量修复（flask rebuild-daily-rollup），
+  数据导入批量写入日志后也用它按用户重建。
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date
+from typing import Iterable
+
+from sqlalchemy import event, func, inspect, literal_column, select, true
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import DailyRollup, LogEntry, Stage
+from app.services.record_service import _upsert_insert
+
+_ROLLUP_SOURCE_FIELDS = (
+    "stage_id",
+    "log_date",
+    "subcategory_id",
+    "actual_duration",
+    "mood",
+)
+_REFRESH_CHUNK_SIZE = 500
+
+
+def _aggregate_select():
+    logs = LogEntry.__table__
+    stages = Stage.__table__
+    return (
+        select(
+            stages.c.user_id,
+            logs.c.log_date,
+            logs.c.stage_id,
+            logs.c.subcategory_id,
+            func.coalesce(func.sum(logs.c.actual_duration), 0),
+            func.count(logs.c.id),
+            func.coalesce(
+                func.sum(logs.c.actual_duration * func.coalesce(logs.c.mood, 3)), 0
+            ),
+        )
+        .select_from(logs.join(stages, stages.c.id == logs.c.stage_id))
+        .group_by(
+            stages.c.user_id,
+            logs.c.log_date,
+            logs.c.stage_id,
+            logs.c.subcategory_id,
+        )
+    )
+
+
+def _bucket_key_elements(rollup) -> list:
+    """与 uq_daily_rollup_bucket 唯一索引一致的冲突目标。"""
+    return [
+        rollup.c.user_id,
+        rollup.c.stage_id,
+        rollup.c.log_date,
+        func.coalesce(rollup.c.subcategory_id, literal_column("0")),
+    ]
+
+
+def _insert_from_aggregate(connection, aggregate) -> None:
+    """
+    把聚合结果写入汇总表。
+
+    调用方已删除同一批桶；并发事务可能都没删到行而各自插入，
+    因此按桶唯一索引 upsert，以聚合值覆盖而不是重复累加。
+    """
+    rollup = DailyRollup.__table__
+    columns = [
+        rollup.c.user_id,
+        rollup.c.log_date,
+        rollup.c.stage_id,
+        rollup.c.subcategory_id,
+        rollup.c.minutes,
+        rollup.c.session_count,
+        rollup.c.mood_minutes,
+    ]
+    statement = _upsert_insert(DailyRollup)
+    if statement is None:
+        # 其他方言没有 ON CONFLICT，由唯一索引拒绝重复的桶
+        connection.execute(rollup.insert().from_select(columns, aggregate))
+        return
+    # SQLite 要求 INSERT ... SELECT ... ON CONFLICT 的 SELECT 带 WHERE 以消除语法歧义
+    statement = statement.from_select(columns, aggregate.where(true()))
+    statement = statement.on_conflict_do_update(
+        index_elements=_bucket_key_elements(rollup),
+        set_={
+            "minutes": statement.excluded.minutes,
+            "session_count": statement.excluded.session_count,
+            "mood_minutes": statement.excluded.mood_minutes,
+        },
+    )
+    connection.execute(statement)
+
+
+def _refresh_buckets(connection, keys: Iterable[tuple[int, date]]) -> None:
+    dates_by_stage: dict[int, set[date]] = defaultdict(set)
+    for stage_id, log_date in keys:
+        if stage_id is not None and log_date is not None:
+            dates_by_stage[stage_id].add(log_date)
+
+    rollup = DailyRollup.__table__
+    logs = LogEntry.__table__
+    for stage_id, dates in dates_by_stage.items():
+        ordered = sorted(dates)
+        for offset in range(0, len(ordered), _REFRESH_CHUNK_SIZE):
+            chunk = ordered[offset : offset + _REFRESH_CHUNK_SIZE]
+            connection.execute(
+                rollup.delete().where(
+                    rollup.c.stage_id == stage_id,
+                    rollup.c.log_date.in_(chunk),
+                )
+            )
+            _insert_from_aggregate(
+                connection,
+                _aggregate_select().where(
+                    logs.c.stage_id == stage_id,
+                    logs.c.log_date.in_(chunk),
+                ),
+            )
+
+
+def refresh_daily_rollup(keys: Iterable[tuple[int, date]]) -> None:
+    """按 (stage_id, log_date) 重算汇总桶，随当前事务提交。"""
+    _refresh_buckets(db.session.connection(), keys)
+
+
+def clear_daily_rollup_for_user(user_id: int) -> None:
+    DailyRollup.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+
+def rebuild_daily_rollup(user_id: int | None = None, commit: bool = True) -> int:
+    """
+    从 log_entry 全量重建汇总表（可限定用户），返回重建后的行数。
+
+    commit=False 时随调用方的事务提交（数据导入批量写入日志后使用）。
+    """
+    rollup_query = DailyRollup.query
+    aggregate = _aggregate_select()
+    if user_id is not None:
+        rollup_query = rollup_query.filter_by(user_id=user_id)
+        aggregate = aggregate.where(Stage.__table__.c.user_id == user_id)
+    rollup_query.delete(synchronize_session=False)
+    _insert_from_aggregate(db.session.connection(), aggregate)
+    if commit:
+        db.session.commit()
+
+    count_query = DailyRollup.query
+    if user_id is not None:
+        count_query = count_query.filter_by(user_id=user_id)
+    return count_query.count()
+
+
+def _loaded_values(state, field: str) -> set:
+    """当前值与 flush 前的旧值，只读取已加载的属性，避免对已删除行触发懒加载。"""
+    values = set()
+    if field in state.dict:
+        values.add(state.dict[field])
+    history = state.attrs[field].history
+    values.update(history.deleted or ())
+    return values
+
+
+def _collect_touched_buckets(session: Session) -> tuple[set[tuple[int, date]], set[int]]:
+    touched: set[tuple[int, date]] = set()
+    deleted_stage_ids: set[int] = set()
+
+    for obj in session.deleted:
+        if isinstance(obj, Stage) and obj.id is not None:
+            deleted_stage_ids.add(obj.id)
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, LogEntry):
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(
+            state.attrs[field].history.has_changes() for field in _ROLLUP_SOURCE_FIELDS
+        ):
+            continue
+        for stage_id in _loaded_values(state, "stage_id"):
+            for log_date in _loaded_values(state, "log_date"):
+                touched.add((stage_id, log_date))
+    return touched, deleted_stage_ids
+
+
+def _after_flush(session: Session, _flush_context) -> None:
+    touched, deleted_stage_ids = _collect_touched_buckets(session)
+    if not touched and not deleted_stage_ids:
+        return
+    connection = session.connection()
+    if deleted_stage_ids:
+        rollup = DailyRollup.__table__
+        connection.execute(
+            rollup.delete().where(rollup.c.stage_id.in_(sorted(deleted_stage_ids)))
+        )
+    _refresh_buckets(connection, touched)
+
+
+def _keep_previous_value(target, value, oldvalue, initiator) -> None:
+    return None
+
+
+def register_daily_rollup_listeners() -> None:
+    """注册 LogEntry 写入时维护 daily_rollup 的 ORM 钩子（可重复调用）。"""
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+    # 提交后属性已过期，改日期/阶段时需要先加载旧值，旧日期的桶才能被重算
+    for attribute in (LogEntry.stage_id, LogEntry.log_date):
+        if not event.contains(attribute, "set", _keep_previous_value):
+            event.listen(
+                attribute,
+                "set",
+                _keep_previous_value,
+                active_history=True,
+            )
@@ -0,0 +1,178 @@
+"""
+阶段区间索引
+
+每个用户的阶段按开始日期排序后构成一组首尾相接的区间：
+阶段 i 覆盖 [start_i, start_{i+1} - 1]，最后一个阶段向后无限延伸。
+日期 → 阶段、阶段 → 结束日期 都通过 bisect 在内存中完成，不再每次查询数据库。
+
+缓存失效：
+- ORM 对 Stage 的增删改在 after_flush / after_commit / after_rollback 中清除对应用户的索引；
+- 绕过 ORM 的批量删除（清空数据）需显式调用 invalidate_stage_index；
+- 其他进程的修改无法感知，索引另带 STAGE_INDEX_TTL_SECONDS 的过期时间兜底；
+  因此只供只读场景使用，新增 / 修改记录时按日期定阶段要直接查库。
+
+缓存挂在 app.extensions 上，不同应用实例（例如各个测试用例）之间互不干扰。
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Stage
+
+_DEFAULT_STAGE_INDEX_TTL_SECONDS = 60.0
+_EXTENSION_KEY = "stage_index_cache"
+_SESSION_INFO_KEY = "stage_index_dirty_users"
+_stage_index_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class StageIndex:
+    """单个用户按开始日期升序排列的阶段区间。"""
+
+    user_id: int
+    start_dates: tuple[date, ...]
+    stage_ids: tuple[int, ...]
+    _positions: dict[int, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "_positions",
+            {stage_id: pos for pos, stage_id in enumerate(self.stage_ids)},
+        )
+
+    def __contains__(self, stage_id: int) -> bool:
+        return stage_id in self._positions
+
+    def stage_id_for_date(self, target_date: date) -> int | None:
+        """start_date <= target_date 的最新阶段；日期早于所有阶段时返回 None。"""
+        pos = bisect.bisect_right(self.start_dates, target_date) - 1
+        return self.stage_ids[pos] if pos >= 0 else None
+
+    def start_date_for(self, stage_id: int) -> date | None:
+        pos = self._positions.get(stage_id)
+        return self.start_dates[pos] if pos is not None else None
+
+    def next_stage_id(self, stage_id: int) -> int | None:
+        """开始日期严格晚于该阶段的第一个阶段。"""
+        start_date = self.start_date_for(stage_id)
+        if start_date is None:
+            return None
+        pos = bisect.bisect_right(self.start_dates, start_date)
+        return self.stage_ids[pos] if pos < len(self.stage_ids) else None
+
+    def end_date_for(self, stage_id: int) -> date | None:
+        """阶段的最后一天（下一阶段开始前一天）；最后一个阶段返回 None。"""
+        next_stage_id = self.next_stage_id(stage_id)
+        if next_stage_id is None:
+            return None
+        return self.start_date_for(next_stage_id) - timedelta(days=1)
+
+
+def _load_stage_index(user_id: int) -> StageIndex:
+    rows = (
+        db.session.query(Stage.id, Stage.start_date)
+        .filter(Stage.user_id == user_id)
+        .order_by(Stage.start_date.asc(), Stage.id.asc())
+        .all()
+    )
+    return StageIndex(
+        user_id=user_id,
+        start_dates=tuple(row.start_date for row in rows),
+        stage_ids=tuple(row.id for row in rows),
+    )
+
+
+def _stage_index_cache() -> dict[int, tuple[float, StageIndex]]:
+    return current_app.extensions.setdefault(_EXTENSION_KEY, {})
+
+
+def get_stage_index(user_id: int) -> StageIndex:
+    """获取（必要时重建）用户的阶段区间索引。"""
+    user_id = int(user_id)
+    now = time.monotonic()
+    cache = _stage_index_cache()
+    with _stage_index_lock:
+        cached = cache.get(user_id)
+        if cached and cached[0] > now:
+            return cached[1]
+    index = _load_stage_index(user_id)
+    ttl_seconds = float(
+        current_app.config.get(
+            "STAGE_INDEX_TTL_SECONDS", _DEFAULT_STAGE_INDEX_TTL_SECONDS
+        )
+    )
+    with _stage_index_lock:
+        cache[user_id] = (now + ttl_seconds, index)
+    return index
+
+
+def invalidate_stage_index(user_id: int | None = None) -> None:
+    """清除指定用户（None 表示全部）的阶段索引缓存。"""
+    if not has_app_context():
+        return
+    cache = _stage_index_cache()
+    with _stage_index_lock:
+        if user_id is None:
+            cache.clear()
+        else:
+            cache.pop(int(user_id), None)
+
+
+def mark_stage_index_stale(user_ids) -> None:
+    """绕过 ORM 写入 Stage 后调用：立即失效，并在当前事务结束时再失效一次。"""
+    user_ids = {int(user_id) for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    db.session.info.setdefault(_SESSION_INFO_KEY, set()).update(user_ids)
+    _invalidate_users(user_ids)
+
+
+def _invalidate_users(user_ids) -> None:
+    for user_id in user_ids:
+        invalidate_stage_index(user_id)
+
+
+def _after_flush(session: Session, _flush_context) -> None:
+    user_ids: set[int] = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Stage):
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(
+            state.attrs[attr].history.has_changes() for attr in ("start_date", "user_id")
+        ):
+            continue
+        if obj.user_id is not None:
+            user_ids.add(obj.user_id)
+    if not user_ids:
+        return
+    # 本事务内立即失效，提交或回滚后再失效一次，
+    # 避免其他线程在提交前用旧数据重建的索引残留下来
+    session.info.setdefault(_SESSION_INFO_KEY, set()).update(user_ids)
+    _invalidate_users(user_ids)
+
+
+def _after_transaction_end(session: Session) -> None:
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if user_ids:
+        _invalidate_users(user_ids)
+
+
+def register_stage_index_listeners() -> None:
+    """注册 Stage 变更时清除阶段索引缓存的 ORM 钩子（可重复调用）。"""
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+    for event_name in ("after_commit", "after_rollback"):
+        if not event.contains(Session, event_name, _after_transaction_end):
+            event.listen(Session, event_name, _after_transaction_end)
@@ -164,6 +164,27 @@ class Config:
     AI_ENABLE_FALLBACK = os.environ.get("AI_ENABLE_FALLBACK", "1") not in {"0", "false", "False"}
     AI_MAX_RETRIES = int(os.environ.get("AI_MAX_RETRIES", "2"))
     AI_RETRY_BACKOFF = float(os.environ.get("AI_RETRY_BACKOFF", "1.25"))
+    # 对话规划轮只需返回一小段 JSON，限制其输出长度以缩短首字延迟
+    AI_PLANNER_MAX_TOKENS = int(os.environ.get("AI_PLANNER_MAX_TOKENS", "256"))
+    # 模型调用走专用事件循环上的异步客户端；同时在途的上游请求数与保持的长连接数
+    AI_ASYNC_CLIENT = os.environ.get("AI_ASYNC_CLIENT", "1") not in {"0", "false", "False"}
+    AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", "8"))
+    AI_HTTP_KEEPALIVE_CONNECTIONS = int(os.environ.get("AI_HTTP_KEEPALIVE_CONNECTIONS", "8"))
+    # 请求线程等待一次模型调用（含重试）的最长秒数
+    AI_REQUEST_TIMEOUT = float(os.environ.get("AI_REQUEST_TIMEOUT", "90"))
+    # 输入未变时复用已生成简报的时长（秒），0 表示每次都重新调用模型
+    AI_RESPONSE_CACHE_TTL_SECONDS = float(
+        os.environ.get("AI_RESPONSE_CACHE_TTL_SECONDS", str(6 * 3600))
+    )
+    # AI 任务队列：本进程工作线程数（0 表示交给 flask run-ai-jobs）、单用户并发上限、
+    # 最大尝试次数与指数退避基数、运行租约、已完成任务的保留时长、轮询间隔（秒）
+    AI_JOB_WORKERS = int(os.environ.get("AI_JOB_WORKERS", "2"))
+    AI_JOB_PER_USER_LIMIT = int(os.environ.get("AI_JOB_PER_USER_LIMIT", "2"))
+    AI_JOB_MAX_ATTEMPTS = int(os.environ.get("AI_JOB_MAX_ATTEMPTS", "3"))
+    AI_JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get("AI_JOB_RETRY_BACKOFF_SECONDS", "2"))
+    AI_JOB_LEASE_SECONDS = float(os.environ.get("AI_JOB_LEASE_SECONDS", "300"))
+    AI_JOB_RETENTION_SECONDS = float(os.environ.get("AI_JOB_RETENTION_SECONDS", "86400"))
+    AI_JOB_POLL_SECONDS = float(os.environ.get("AI_JOB_POLL_SECONDS", "1"))
 
     # 数据库配置
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -189,11 +210,75 @@ class Config:
     MAX_CONTENT_LENGTH = resolve_max_content_length()  # default 64MB, env overridable
     ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 
+    # 数据导出：流式压缩包每次发送的字节数与数据表分批读取的行数
+    EXPORT_STREAM_CHUNK_SIZE = int(os.environ.get("EXPORT_STREAM_CHUNK_SIZE", str(64 * 1024)))
+    EXPORT_QUERY_BATCH_SIZE = int(os.environ.get("EXPORT_QUERY_BATCH_SIZE", "500"))
+    # 列式导出（Parquet / Arrow IPC）每个行组的行数
+    EXPORT_ROW_GROUP_SIZE = int(os.environ.get("EXPORT_ROW_GROUP_SIZE", "50000"))
+    # 数据导入：每批 executemany 写入的行数
+    IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+    # 后台导入任务：上传文件暂存目录（默认 instance/imports）、每个断点块的记录数、
+    # 工作线程数（0 表示交给 flask run-import-jobs）、租约与失败重试次数
+    IMPORT_STAGING_FOLDER = os.environ.get("IMPORT_STAGING_FOLDER") or None
+    IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", "2000"))
+    IMPORT_JOB_WORKERS = int(os.environ.get("IMPORT_JOB_WORKERS", "1"))
+    IMPORT_JOB_LEASE_SECONDS = float(os.environ.get("IMPORT_JOB_LEASE_SECONDS", "600"))
+    IMPORT_JOB_MAX_ATTEMPTS = int(os.environ.get("IMPORT_JOB_MAX_ATTEMPTS", "3"))
+    IMPORT_JOB_POLL_SECONDS = float(os.environ.get("IMPORT_JOB_POLL_SECONDS", "2"))
+
     # 日志配置
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
     # Matplotlib后端
     MATPLOTLIB_BACKEND = "Agg"
+    # 启动时预先导入绘图与预测依赖（配合 gunicorn --preload 在 fork 前加载），默认首次使用时加载
+    PRELOAD_HEAVY_MODULES = os.environ.get("PRELOAD_HEAVY_MODULES", "0") in {
+        "1",
+        "true",
+        "True",
+    }
+
+    # 趋势预测任务池：process 在子进程中训练模型，thread 在调度线程内直接执行
+    CHART_FORECAST_WORKERS = max(int(os.environ.get("CHART_FORECAST_WORKERS", "2")), 1)
+    CHART_FORECAST_EXECUTOR = os.environ.get("CHART_FORECAST_EXECUTOR", "process")
+    # 单次预测内候选模型并行回测的并发数，<=1 表示串行
+    CHART_FORECAST_CANDIDATE_WORKERS = int(
+        os.environ.get("CHART_FORECAST_CANDIDATE_WORKERS", "0")
+    )
+    CHART_FORECAST_CANDIDATE_EXECUTOR = os.environ.get(
+        "CHART_FORECAST_CANDIDATE_EXECUTOR", "process"
+    )
+    # 跨进程共享的预测缓存：sqlite（WAL）、mmap 或 none（仅进程内缓存）
+    CHART_FORECAST_CACHE_BACKEND = os.environ.get("CHART_FORECAST_CACHE_BACKEND", "sqlite")
+    # 共享缓存目录，默认 instance/chart_forecasts
+    CHART_FORECAST_CACHE_DIR = os.environ.get("CHART_FORECAST_CACHE_DIR")
+    # 训练租约时长（秒），持有者异常退出后其他进程最多等待这么久再接手
+    CHART_FORECAST_LEASE_SECONDS = float(
+        os.environ.get("CHART_FORECAST_LEASE_SECONDS", "300")
+    )
+
+    # 日志写入后效率分的写后合并：静默多少秒后批量重算、持续写入时最长推迟多少秒
+    EFFICIENCY_WRITE_BEHIND_SECONDS = float(
+        os.environ.get("EFFICIENCY_WRITE_BEHIND_SECONDS", "0.5")
+    )
+    EFFICIENCY_WRITE_BEHIND_MAX_SECONDS = float(
+        os.environ.get("EFFICIENCY_WRITE_BEHIND_MAX_SECONDS", "5")
+    )
+    # 批次失败后的首次重试间隔（秒，之后指数退避）与最多重试次数
+    EFFICIENCY_WRITE_BEHIND_RETRY_SECONDS = float(
+        os.environ.get("EFFICIENCY_WRITE_BEHIND_RETRY_SECONDS", "1")
+    )
+    EFFICIENCY_WRITE_BEHIND_MAX_RETRIES = int(
+        os.environ.get("EFFICIENCY_WRITE_BEHIND_MAX_RETRIES", "5")
+    )
+
+    # AI 上下文聚合的跨请求备忘时长（秒），0 表示只在单个请求内复用
+    AI_CONTEXT_CACHE_TTL_SECONDS = float(
+        os.environ.get("AI_CONTEXT_CACHE_TTL_SECONDS", "30")
+    )
+
+    # 排行榜查询模式：snapshot 读取预计算快照，live 由数据库窗口函数实时排名
+    LEADERBOARD_QUERY_MODE = os.environ.get("LEADERBOARD_QUERY_MODE", "snapshot")
 
     @staticmethod
     def init_app(app):
@@ -260,6 +345,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=5)
+    CHART_FORECAST_EXECUTOR = "thread"
+    CHART_FORECAST_CACHE_BACKEND = "none"
+    EFFICIENCY_WRITE_BEHIND_SECONDS = 0
 
 
 config = {
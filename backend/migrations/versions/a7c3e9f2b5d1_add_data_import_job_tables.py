@@ -0,0 +1,75 @@
+"""add data import job tables
+
+Revision ID: a7c3e9f2b5d1
+Revises: f4b7d1e8a3c6
+Create Date: 2026-10-17 20:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "a7c3e9f2b5d1"
+down_revision = "f4b7d1e8a3c6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "data_import_job",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("state", sa.String(length=20), nullable=False),
+        sa.Column("phase", sa.String(length=20), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=True),
+        sa.Column("file_path", sa.String(length=512), nullable=False),
+        sa.Column("bytes_total", sa.BigInteger(), nullable=False),
+        sa.Column("bytes_processed", sa.BigInteger(), nullable=False),
+        sa.Column("checkpoint", sa.JSON(), nullable=False),
+        sa.Column("rows", sa.JSON(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("locked_by", sa.String(length=64), nullable=True),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["user.id"], name="fk_data_import_job_user_id"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_data_import_job_user_id", "data_import_job", ["user_id"], unique=False
+    )
+    op.create_index(
+        "ix_data_import_job_state", "data_import_job", ["state", "locked_at"], unique=False
+    )
+    op.create_table(
+        "data_import_row",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("job_id", sa.String(length=32), nullable=False),
+        sa.Column("table_name", sa.String(length=50), nullable=False),
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["job_id"], ["data_import_job.id"], name="fk_data_import_row_job_id"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_data_import_row_job_table_seq",
+        "data_import_row",
+        ["job_id", "table_name", "seq"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_data_import_row_job_table_seq", table_name="data_import_row")
+    op.drop_table("data_import_row")
+    op.drop_index("ix_data_import_job_state", table_name="data_import_job")
+    op.drop_index("ix_data_import_job_user_id", table_name="data_import_job")
+    op.drop_table("data_import_job")
@@ -0,0 +1,84 @@
+"""add daily rollup table
+
+Revision ID: a7c4e2d91b35
+Revises: c3f7d4a9b112
+Create Date: 2026-10-17 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "a7c4e2d91b35"
+down_revision = "c3f7d4a9b112"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "daily_rollup",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("log_date", sa.Date(), nullable=False),
+        sa.Column("stage_id", sa.Integer(), nullable=False),
+        sa.Column("subcategory_id", sa.Integer(), nullable=True),
+        sa.Column("minutes", sa.Integer(), nullable=False),
+        sa.Column("session_count", sa.Integer(), nullable=False),
+        sa.Column("mood_minutes", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_daily_rollup_user_date",
+        "daily_rollup",
+        ["user_id", "log_date"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_daily_rollup_stage_date",
+        "daily_rollup",
+        ["stage_id", "log_date"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_daily_rollup_subcategory_id"),
+        "daily_rollup",
+        ["subcategory_id"],
+        unique=False,
+    )
+
+    # 从现有日志回填
+    op.execute(
+        """
+        INSERT INTO daily_rollup (
+            user_id, log_date, stage_id, subcategory_id,
+            minutes, session_count, mood_minutes
+        )
+        SELECT
+            stage.user_id,
+            log_entry.log_date,
+            log_entry.stage_id,
+            log_entry.subcategory_id,
+            COALESCE(SUM(log_entry.actual_duration), 0),
+            COUNT(log_entry.id),
+            COALESCE(SUM(log_entry.actual_duration * COALESCE(log_entry.mood, 3)), 0)
+        FROM log_entry
+        JOIN stage ON stage.id = log_entry.stage_id
+        GROUP BY stage.user_id, log_entry.log_date, log_entry.stage_id, log_entry.subcategory_id
+        """
+    )
+    # 每个桶只有一行（子分类为空的桶也唯一），写入时据此 upsert
+    op.create_index(
+        "uq_daily_rollup_bucket",
+        "daily_rollup",
+        ["user_id", "stage_id", "log_date", sa.text("coalesce(subcategory_id, 0)")],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("uq_daily_rollup_bucket", table_name="daily_rollup")
+    op.drop_index(op.f("ix_daily_rollup_subcategory_id"), table_name="daily_rollup")
+    op.drop_index("ix_daily_rollup_stage_date", table_name="daily_rollup")
+    op.drop_index("ix_daily_rollup_user_date", table_name="daily_rollup")
+    op.drop_table("daily_rollup")
@@ -0,0 +1,36 @@
+"""add data change log for incremental export
+
+Revision ID: b8d4f1a6c2e9
+Revises: a7c3e9f2b5d1
+Create Date: 2026-10-17 22:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "b8d4f1a6c2e9"
+down_revision = "a7c3e9f2b5d1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "data_change",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("table_name", sa.String(length=50), nullable=False),
+        sa.Column("row_key", sa.String(length=100), nullable=False),
+        sa.Column("op", sa.String(length=10), nullable=False),
+        sa.Column("changed_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_data_change_user_version", "data_change", ["user_id", "id"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_data_change_user_version", table_name="data_change")
+    op.drop_table("data_change")
@@ -0,0 +1,37 @@
+"""add efficiency dirty key table for write-behind recalculation
+
+Revision ID: c6e1f9a4d7b2
+Revises: b8d4f1a6c2e9
+Create Date: 2026-10-17 23:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "c6e1f9a4d7b2"
+down_revision = "b8d4f1a6c2e9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "efficiency_dirty_key",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("stage_id", sa.Integer(), nullable=False),
+        sa.Column("log_date", sa.Date(), nullable=False),
+        sa.Column("first_marked_at", sa.DateTime(), nullable=False),
+        sa.Column("last_marked_at", sa.DateTime(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("available_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "user_id", "stage_id", "log_date", name="uq_efficiency_dirty_key"
+        ),
+    )
+
+
+def downgrade():
+    op.drop_table("efficiency_dirty_key")
@@ -0,0 +1,50 @@
+"""add leaderboard snapshot table
+
+Revision ID: d5b8e3f1a2c7
+Revises: a7c4e2d91b35
+Create Date: 2026-10-17 14:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "d5b8e3f1a2c7"
+down_revision = "a7c4e2d91b35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 快照在首次读取排行榜时按需生成，无需回填
+    op.create_table(
+        "leaderboard_snapshot",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("period", sa.String(length=16), nullable=False),
+        sa.Column("metric", sa.String(length=16), nullable=False),
+        sa.Column("range_end", sa.Date(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=64), nullable=False),
+        sa.Column("total_duration", sa.Integer(), nullable=False),
+        sa.Column("avg_efficiency", sa.Float(), nullable=True),
+        sa.Column("sessions", sa.Integer(), nullable=False),
+        sa.Column("last_activity", sa.Date(), nullable=True),
+        sa.Column("primary_score", sa.Float(), nullable=False),
+        sa.Column("secondary_score", sa.Float(), nullable=False),
+        sa.Column("rank", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "period", "metric", "user_id", name="uq_leaderboard_snapshot_user"
+        ),
+    )
+    op.create_index(
+        "ix_leaderboard_snapshot_rank",
+        "leaderboard_snapshot",
+        ["period", "metric", "rank"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_leaderboard_snapshot_rank", table_name="leaderboard_snapshot")
+    op.drop_table("leaderboard_snapshot")
@@ -0,0 +1,30 @@
+"""add prompt hash to ai insight
+
+Revision ID: e2a9c6d4f1b8
+Revises: d5b8e3f1a2c7
+Create Date: 2026-10-17 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "e2a9c6d4f1b8"
+down_revision = "d5b8e3f1a2c7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 旧记录没有摘要，不参与缓存复用
+    with op.batch_alter_table("ai_insight", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("prompt_hash", sa.String(length=64), nullable=True))
+        batch_op.create_index(
+            batch_op.f("ix_ai_insight_prompt_hash"), ["prompt_hash"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("ai_insight", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_ai_insight_prompt_hash"))
+        batch_op.drop_column("prompt_hash")
@@ -0,0 +1,38 @@
+"""derive leaderboard rank at read time instead of storing it
+
+Revision ID: e7d2a5c8f3b1
+Revises: c6e1f9a4d7b2
+Create Date: 2026-10-18 09:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "e7d2a5c8f3b1"
+down_revision = "c6e1f9a4d7b2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 名次改为读取时计算；旧快照的得分仍然有效，无需重建
+    with op.batch_alter_table("leaderboard_snapshot", schema=None) as batch_op:
+        batch_op.drop_index("ix_leaderboard_snapshot_rank")
+        batch_op.drop_column("rank")
+        batch_op.create_index(
+            "ix_leaderboard_snapshot_order",
+            ["period", "metric", "primary_score", "secondary_score", "username"],
+            unique=False,
+        )
+
+
+def downgrade():
+    # 旧版本按名次读取，清空快照让其在下次读取时整体重建
+    op.execute("DELETE FROM leaderboard_snapshot")
+    with op.batch_alter_table("leaderboard_snapshot", schema=None) as batch_op:
+        batch_op.drop_index("ix_leaderboard_snapshot_order")
+        batch_op.add_column(sa.Column("rank", sa.Integer(), nullable=False))
+        batch_op.create_index(
+            "ix_leaderboard_snapshot_rank", ["period", "metric", "rank"], unique=False
+        )
@@ -0,0 +1,49 @@
+"""add ai job table
+
+Revision ID: f4b7d1e8a3c6
+Revises: e2a9c6d4f1b8
+Create Date: 2026-10-17 18:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "f4b7d1e8a3c6"
+down_revision = "e2a9c6d4f1b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ai_job",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("params", sa.JSON(), nullable=False),
+        sa.Column("state", sa.String(length=20), nullable=False),
+        sa.Column("stage", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("available_at", sa.DateTime(), nullable=False),
+        sa.Column("locked_by", sa.String(length=64), nullable=True),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], name="fk_ai_job_user_id"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_ai_job_state_available", "ai_job", ["state", "available_at"], unique=False
+    )
+    op.create_index("ix_ai_job_user_state", "ai_job", ["user_id", "state"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_ai_job_user_state", table_name="ai_job")
+    op.drop_index("ix_ai_job_state_available", table_name="ai_job")
+    op.drop_table("ai_job")
@@ -1,6 +1,12 @@
 
+import io
+import json
+import zipfile
+from datetime import date, timedelta
+
 import pytest
 from app import create_app, db
+from app.models import LogEntry, Stage
 
 @pytest.fixture(scope="function")
 def app():
@@ -37,3 +43,48 @@ def register_and_login(client):
         data = r.get_json()
         return data["access_token"], data["user"]["id"]
     return _action
+
+@pytest.fixture
+def seed_study_logs(db_session):
+    """一个近 20 天的阶段加三条算法 / 科研记录，返回该阶段。"""
+    def _seed(user_id):
+        stage = Stage(name="冲刺", start_date=date.today() - timedelta(days=20), user_id=user_id)
+        db_session.session.add(stage)
+        db_session.session.commit()
+        for offset, duration, task in [(0, 180, "算法冲刺"), (1, 150, "算法冲刺"), (2, 90, "科研阅读")]:
+            db_session.session.add(
+                LogEntry(
+                    log_date=date.today() - timedelta(days=offset),
+                    task=task,
+                    actual_duration=duration,
+                    legacy_category="算法" if "算法" in task else "科研",
+                    mood=4,
+                    stage_id=stage.id,
+                )
+            )
+        db_session.session.commit()
+        return stage
+    return _seed
+
+@pytest.fixture
+def parse_sse():
+    """把 SSE 响应体解析为 [(event, data), ...]。"""
+    def _parse(body):
+        events = []
+        for block in body.strip().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines())
+            events.append((lines["event"], json.loads(lines["data"])))
+        return events
+    return _parse
+
+@pytest.fixture
+def backup_zip():
+    """按 {表名: 记录列表} 生成与导出格式相同的备份 zip（BytesIO）。"""
+    def _build(tables):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            for name, rows in tables.items():
+                zf.writestr(f"data/{name}.json", json.dumps(rows, indent=4, ensure_ascii=False))
+        buffer.seek(0)
+        return buffer
+    return _build
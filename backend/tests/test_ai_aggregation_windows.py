@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+
+from app import db
+from app.models import DailyData, LogEntry, Stage, User
+from app.services.ai_planner.aggregation import (
+    _aggregate_learning_data,
+    _aggregate_learning_windows,
+)
+
+
+def _seed():
+    user = User(username="agg-user", email="agg-user@test.com")
+    user.set_password("pw123")
+    db.session.add(user)
+    db.session.flush()
+    today = date.today()
+    old_stage = Stage(name="旧阶段", start_date=today - timedelta(days=60), user_id=user.id)
+    new_stage = Stage(name="新阶段", start_date=today - timedelta(days=5), user_id=user.id)
+    db.session.add_all([old_stage, new_stage])
+    db.session.flush()
+    rows = [
+        (0, 30, "刷题", new_stage, 5),
+        (1, 30, "阅读", new_stage, None),
+        (2, 45, "刷题", new_stage, 3),
+        (2, 0, "整理", new_stage, 2),
+        (4, 45, "阅读", new_stage, 4),
+        (6, 0, "整理", old_stage, None),
+        (8, 60, "复习", old_stage, 1),
+        (9, 60, "复习", old_stage, 1),
+    ]
+    for offset, minutes, task, stage, mood in rows:
+        db.session.add(
+            LogEntry(
+                log_date=today - timedelta(days=offset),
+                task=task,
+                actual_duration=minutes,
+                legacy_category="算法",
+                mood=mood,
+                stage_id=stage.id,
+            )
+        )
+    db.session.add_all(
+        [
+            DailyData(log_date=today, stage_id=new_stage.id, efficiency=6.0),
+            DailyData(log_date=today - timedelta(days=8), stage_id=old_stage.id, efficiency=2.0),
+        ]
+    )
+    db.session.commit()
+    return user, old_stage, new_stage, today
+
+
+def test_window_stats_from_prefix_sums(app, db_session):
+    user, old_stage, new_stage, today = _seed()
+    week = _aggregate_learning_data(user.id, today - timedelta(days=6), today, None)
+
+    assert week["total_minutes"] == 150
+    assert week["total_sessions"] == 6
+    assert week["active_days"] == 5
+    assert week["idle_days"] == [
+        (today - timedelta(days=5)).isoformat(),
+        (today - timedelta(days=3)).isoformat(),
+    ]
+    assert week["streak_current"] == 3
+    assert week["streak_longest"] == 3
+    assert week["average_mood"] == 3.5
+    assert week["average_efficiency"] == 6.0
+    # 时长相同的任务按首次出现的先后排序
+    assert [(item["task"], item["minutes"]) for item in week["top_tasks"]] == [
+        ("[算法] 阅读", 75),
+        ("[算法] 刷题", 75),
+        ("[算法] 整理", 0),
+    ]
+    assert sum(item["minutes"] for item in week["weekday_stats"]) == 150
+
+    stage_stats = _aggregate_learning_data(user.id, old_stage.start_date, today, old_stage)
+    assert stage_stats["total_sessions"] == 3
+    assert stage_stats["average_efficiency"] == 2.0
+    assert stage_stats["streak_current"] == 0
+    assert stage_stats["streak_longest"] == 2
+
+
+def test_multi_window_results_match_standalone_windows(app, db_session):
+    user, old_stage, new_stage, today = _seed()
+    windows = [
+        (today, today, None),
+        (today - timedelta(days=6), today, None),
+        (today - timedelta(days=13), today - timedelta(days=7), None),
+        (old_stage.start_date, today, old_stage),
+        (new_stage.start_date, today, new_stage),
+        (None, None, None),
+    ]
+    combined = _aggregate_learning_windows(user.id, windows)
+
+    app.config["AI_CONTEXT_CACHE_TTL_SECONDS"] = 0
+    for window, expected in zip(windows, combined):
+        with app.app_context():
+            assert _aggregate_learning_data(user.id, *window) == expected
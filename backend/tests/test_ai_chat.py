@@ -1,7 +1,10 @@
+import json
 from datetime import date, timedelta
+from types import SimpleNamespace
 from unittest.mock import patch
 
 from app.models import AIChatMessage, AIChatSession, LogEntry, Stage
+from app.services.ai_planner import llm_client
 from app.services.ai_planner.errors import AIPlannerError
 
 
@@ -193,3 +196,96 @@ def test_chat_session_history_only_contains_visible_messages(
     messages = messages_resp.get_json()["data"]["messages"]
     assert len(messages) == 4
     assert all(message["role"] in {"user", "assistant"} for message in messages)
+
+
+def test_chat_stream_sends_answer_tokens_as_sse(
+    client, db_session, register_and_login, auth_headers, parse_sse
+):
+    token, user_id = register_and_login(username="u6", email="u6@test.com")
+    _seed_chat_data(db_session, user_id)
+
+    with patch("app.services.ai_planner.chat._call_qwen") as mock_planner, patch(
+        "app.services.ai_planner.chat._stream_qwen"
+    ) as mock_stream:
+        mock_planner.return_value = '{"decision":"answer_with_current_context","needed_modules":[],"focus":"节奏","answer_strategy":"直接回答"}'
+        mock_stream.return_value = iter(["先说结论：", "算法投入最多，", "科研需要补。"])
+        response = client.post(
+            "/api/ai/chat/messages/stream",
+            json={"scope": "week", "date": date.today().isoformat(), "content": "这周怎么样？"},
+            headers=auth_headers(token),
+        )
+        body = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = parse_sse(body)
+    assert [name for name, _data in events] == ["start", "delta", "delta", "delta", "done"]
+    assert "".join(data["content"] for name, data in events if name == "delta") == (
+        "先说结论：算法投入最多，科研需要补。"
+    )
+    done = events[-1][1]
+    assert done["assistant_message"]["content"] == "先说结论：算法投入最多，科研需要补。"
+    assert done["meta"]["generation_mode"] == "llm_enhanced"
+    assert AIChatMessage.query.count() == 2
+
+
+def test_chat_stream_falls_back_before_first_token_and_rejects_bad_payload(
+    client, db_session, register_and_login, auth_headers, parse_sse
+):
+    token, user_id = register_and_login(username="u7", email="u7@test.com")
+    _seed_chat_data(db_session, user_id)
+
+    bad = client.post(
+        "/api/ai/chat/messages/stream",
+        json={"content": ""},
+        headers=auth_headers(token),
+    )
+    assert bad.status_code == 400
+
+    def _failing_stream(_prompt):
+        raise AIPlannerError("model unavailable")
+        yield  # pragma: no cover
+
+    with patch("app.services.ai_planner.chat._call_qwen", side_effect=AIPlannerError("down")), patch(
+        "app.services.ai_planner.chat._stream_qwen", side_effect=_failing_stream
+    ):
+        response = client.post(
+            "/api/ai/chat/messages/stream",
+            json={"scope": "week", "date": date.today().isoformat(), "content": "问题在哪？"},
+            headers=auth_headers(token),
+        )
+        events = parse_sse(response.get_data(as_text=True))
+
+    assert [name for name, _data in events] == ["start", "delta", "done"]
+    assert events[-1][1]["assistant_message"]["generation_mode"] == "rule_fallback"
+
+
+def test_stream_qwen_yields_deltas_and_applies_token_budget(app):
+    class _Chunk:
+        def __init__(self, text):
+            self.choices = [SimpleNamespace(delta=SimpleNamespace(content=text))]
+
+    calls = []
+
+    class _Completions:
+        def create(self, **kwargs):
+            calls.append(kwargs)
+            if kwargs.get("stream"):
+                return iter([_Chunk("你"), SimpleNamespace(choices=[]), _Chunk(None), _Chunk("好")])
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=" ok "))]
+            )
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=_Completions()))
+    app.config["AI_ASYNC_CLIENT"] = False
+    with app.app_context(), patch.object(
+        llm_client, "_configure_qwen", return_value=(fake_client, "test-model")
+    ):
+        assert list(llm_client._stream_qwen("hi")) == ["你", "好"]
+        with llm_client._token_budget(64):
+            assert llm_client._call_qwen("plan") == "ok"
+        assert llm_client._call_qwen("answer") == "ok"
+
+    assert calls[0]["stream"] is True and "max_tokens" not in calls[0]
+    assert calls[1]["max_tokens"] == 64
+    assert "max_tokens" not in calls[2]
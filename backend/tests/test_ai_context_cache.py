@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app import db
+from app.models import CountdownEvent, DailyData, LogEntry, Stage, User
+from app.services.ai_context_cache import memoize_user_context
+from app.services.ai_planner.chat_context import build_global_chat_context
+from app.services.efficiency_writer import get_efficiency_writer, mark_efficiency_dirty
+
+
+def _seed_user(name="ctx-user"):
+    user = User(username=name, email=f"{name}@test.com")
+    user.set_password("pw123")
+    db.session.add(user)
+    db.session.flush()
+    stage = Stage(name="冲刺", start_date=date.today() - timedelta(days=40), user_id=user.id)
+    db.session.add(stage)
+    db.session.flush()
+    for offset, minutes in ((0, 60), (1, 90), (9, 30), (35, 45)):
+        db.session.add(
+            LogEntry(
+                log_date=date.today() - timedelta(days=offset),
+                task="刷题",
+                actual_duration=minutes,
+                legacy_category="算法",
+                mood=4,
+                stage_id=stage.id,
+            )
+        )
+    db.session.commit()
+    return user, stage
+
+
+def _capture_statements():
+    statements = []
+
+    def _record(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _record)
+    return statements, lambda: event.remove(db.engine, "before_cursor_execute", _record)
+
+
+def _log_scans(statements):
+    return [
+        sql
+        for sql in statements
+        if "FROM log_entry" in sql and "ORDER BY log_entry.log_date ASC" in sql
+    ]
+
+
+def test_global_chat_context_scans_each_window_once(db_session):
+    user, _stage = _seed_user()
+
+    statements, stop = _capture_statements()
+    try:
+        first = build_global_chat_context(user.id)
+    finally:
+        stop()
+    # 日/周/月/阶段 + 上一日/周/月共用一次日志扫描
+    assert len(_log_scans(statements)) == 1
+    assert sum("FROM countdown_event" in sql for sql in statements) == 1
+    assert sum("FROM daily_data" in sql and "efficiency IS NOT NULL" in sql for sql in statements) == 1
+
+    statements, stop = _capture_statements()
+    try:
+        second = build_global_chat_context(user.id)
+    finally:
+        stop()
+    assert _log_scans(statements) == []
+    assert second["default_context"]["overview"] == first["default_context"]["overview"]
+
+    # 调用方修改返回值不会污染缓存
+    first["stats"]["category_stats"].clear()
+    assert build_global_chat_context(user.id)["stats"]["category_stats"]
+
+
+def test_context_memo_is_invalidated_by_writes(db_session):
+    user, stage = _seed_user("ctx-writer")
+    before = build_global_chat_context(user.id)["default_context"]["overview"]["today"]
+
+    db.session.add(
+        LogEntry(
+            log_date=date.today(),
+            task="复盘",
+            actual_duration=120,
+            mood=5,
+            stage_id=stage.id,
+        )
+    )
+    db.session.add(
+        CountdownEvent(
+            title="期末考试",
+            target_datetime_utc=date.today() + timedelta(days=3),
+            user_id=user.id,
+        )
+    )
+    db.session.commit()
+
+    after = build_global_chat_context(user.id)["default_context"]["overview"]["today"]
+    assert after["overview_metrics"]["total_sessions"] == (
+        before["overview_metrics"]["total_sessions"] + 1
+    )
+    assert [item["title"] for item in after["countdown_context"]["timeline"]] == ["期末考试"]
+
+
+def test_context_memo_flushes_pending_efficiency_for_string_user_id(app, db_session):
+    user, stage = _seed_user("ctx-pending")
+    app.config["EFFICIENCY_WRITE_BEHIND_SECONDS"] = 60
+    try:
+        get_efficiency_writer(app)
+        mark_efficiency_dirty(user.id, stage.id, date.today())
+        db.session.commit()
+
+        def _load():
+            return DailyData.query.filter_by(stage_id=stage.id, log_date=date.today()).count()
+
+        # 路由传入的字符串 id 也要先落库该用户待写的效率分
+        assert memoize_user_context(str(user.id), "probe", "today", _load) == 1
+    finally:
+        app.config["EFFICIENCY_WRITE_BEHIND_SECONDS"] = 0
+        get_efficiency_writer(app)
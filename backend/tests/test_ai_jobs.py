@@ -0,0 +1,236 @@
+import time
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+from app.models import AIInsight, AIJob
+from app.services.ai_planner import jobs as jobs_module
+from app.services.ai_planner import main as planner_main
+from app.services.ai_planner.jobs import run_ai_jobs
+from app.services.ai_planner.errors import AIPlannerError
+
+
+def test_insight_job_generates_once_and_persists_all_outputs(
+    client, db_session, register_and_login, auth_headers, seed_study_logs, parse_sse
+):
+    token, user_id = register_and_login()
+    seed_study_logs(user_id)
+
+    with patch("app.services.ai_planner.llm_client._call_qwen") as mock_qwen:
+        mock_qwen.side_effect = AIPlannerError("offline")
+        resp = client.post(
+            "/api/ai/jobs",
+            json={"scope": "week", "date": date.today().isoformat()},
+            headers=auth_headers(token),
+        )
+    assert resp.status_code == 202
+    job = resp.get_json()["data"]
+    assert job["state"] == "succeeded"
+    assert mock_qwen.call_count == 1
+
+    result = job["result"]
+    assert result["analysis"]["text"].startswith("## 分析总结")
+    assert result["plan"]["text"].startswith("## 规划建议")
+    insights = {item.insight_type: item for item in AIInsight.query.filter_by(user_id=user_id)}
+    assert set(insights) == {"briefing", "analysis", "plan"}
+    assert result["briefing"]["insight_id"] == insights["briefing"].id
+    assert result["plan"]["insight_id"] == insights["plan"].id
+
+    status = client.get(f"/api/ai/jobs/{job['job_id']}", headers=auth_headers(token))
+    assert status.get_json()["data"]["result"] == result
+
+    events = parse_sse(
+        client.get(
+            f"/api/ai/jobs/{job['job_id']}/events", headers=auth_headers(token)
+        ).get_data(as_text=True)
+    )
+    assert [name for name, _data in events] == ["progress", "done"]
+    assert events[0][1]["stage"] == "succeeded"
+    assert events[1][1]["result"]["plan"]["insight_id"] == insights["plan"].id
+
+    other_token, _other_id = register_and_login(username="u2", email="u2@test.com")
+    missing = client.get(f"/api/ai/jobs/{job['job_id']}", headers=auth_headers(other_token))
+    assert missing.status_code == 404
+
+
+def test_insight_job_rolls_back_partial_writes(
+    client, db_session, register_and_login, auth_headers, seed_study_logs
+):
+    token, user_id = register_and_login()
+    seed_study_logs(user_id)
+    original = planner_main._persist_briefing_insight
+
+    def _fail_on_plan(**kwargs):
+        if kwargs["insight_type"] == "plan":
+            raise RuntimeError("disk full")
+        return original(**kwargs)
+
+    with patch(
+        "app.services.ai_planner.llm_client._call_qwen", side_effect=AIPlannerError("offline")
+    ), patch.object(planner_main, "_persist_briefing_insight", side_effect=_fail_on_plan):
+        job = client.post(
+            "/api/ai/jobs", json={"scope": "week"}, headers=auth_headers(token)
+        ).get_json()["data"]
+
+    # 意外异常不会留下部分记录，任务按退避稍后重试
+    assert (job["state"], job["stage"], job["attempts"]) == ("queued", "retrying", 1)
+    assert "disk full" in job["error"]
+    assert AIInsight.query.count() == 0
+
+
+def test_queued_jobs_run_in_process_with_user_limit_retries_and_dead_letter(
+    app, client, db_session, register_and_login, auth_headers, seed_study_logs,
+    parse_sse
+):
+    token, user_id = register_and_login()
+    seed_study_logs(user_id)
+    app.config.update(
+        AI_JOB_SYNC_MODE=False,
+        AI_JOB_WORKERS=0,
+        AI_JOB_PER_USER_LIMIT=1,
+        AI_JOB_MAX_ATTEMPTS=2,
+        AI_JOB_RETRY_BACKOFF_SECONDS=60,
+    )
+    headers = auth_headers(token)
+
+    queued = client.post(
+        "/api/ai/briefing", json={"scope": "week", "async": True}, headers=headers
+    )
+    assert queued.status_code == 202
+    briefing_job = queued.get_json()["data"]
+    assert (briefing_job["kind"], briefing_job["state"]) == ("briefing", "queued")
+    chat_job = client.post(
+        "/api/ai/chat/messages",
+        json={"scope": "week", "content": "这周怎么样？", "async": True},
+        headers=headers,
+    ).get_json()["data"]
+    assert chat_job["state"] == "queued"
+
+    # 该用户已有一个运行中的任务时，不再领取其其他任务
+    blocker = AIJob(id="blocker", user_id=user_id, kind="plan", params={}, state="running")
+    blocker.locked_at = datetime.utcnow()
+    db_session.session.add(blocker)
+    db_session.session.commit()
+    assert run_ai_jobs() == 0
+    db_session.session.delete(blocker)
+    db_session.session.commit()
+
+    with patch(
+        "app.services.ai_planner.llm_client._call_qwen", side_effect=AIPlannerError("offline")
+    ), patch("app.services.ai_planner.chat._call_qwen", side_effect=AIPlannerError("offline")):
+        assert run_ai_jobs() == 2
+
+    briefing = client.get(f"/api/ai/jobs/{briefing_job['job_id']}", headers=headers)
+    briefing_data = briefing.get_json()["data"]
+    assert briefing_data["state"] == "succeeded"
+    assert briefing_data["result"]["insight_id"] == AIInsight.query.one().id
+    chat_data = client.get(f"/api/ai/jobs/{chat_job['job_id']}", headers=headers).get_json()[
+        "data"
+    ]
+    assert chat_data["result"]["assistant_message"]["generation_mode"] == "rule_fallback"
+
+    # 意外异常按退避重试，次数用尽后进入死信
+    with patch.object(planner_main, "generate_plan", side_effect=RuntimeError("db glitch")):
+        plan_job = client.post(
+            "/api/ai/jobs", json={"kind": "plan", "scope": "week"}, headers=headers
+        ).get_json()["data"]
+        assert run_ai_jobs() == 1
+        job = db_session.session.get(AIJob, plan_job["job_id"])
+        assert (job.state, job.stage, job.attempts) == ("queued", "retrying", 1)
+        assert run_ai_jobs() == 0
+        assert run_ai_jobs(now=datetime.utcnow() + timedelta(minutes=5)) == 1
+    dead = client.get("/api/ai/jobs?state=dead", headers=headers).get_json()["data"]
+    assert [item["job_id"] for item in dead] == [plan_job["job_id"]]
+    assert "db glitch" in dead[0]["error"]
+
+    retried = client.post(f"/api/ai/jobs/{plan_job['job_id']}/retry", headers=headers)
+    assert retried.status_code == 202
+    assert retried.get_json()["data"]["attempts"] == 0
+    with patch(
+        "app.services.ai_planner.llm_client._call_qwen", side_effect=AIPlannerError("offline")
+    ):
+        assert run_ai_jobs() == 1
+
+    events = parse_sse(
+        client.get(
+            f"/api/ai/jobs/{plan_job['job_id']}/events", headers=headers
+        ).get_data(as_text=True)
+    )
+    assert [name for name, _data in events] == ["progress", "done"]
+    assert events[1][1]["result"]["text"].startswith("## 规划建议")
+
+
+def test_job_lease_is_renewed_while_running_and_lost_lease_discards_result(
+    app, client, db_session, register_and_login, auth_headers
+):
+    token, user_id = register_and_login()
+    app.config.update(AI_JOB_SYNC_MODE=False, AI_JOB_WORKERS=0, AI_JOB_LEASE_SECONDS=0.3)
+    headers = auth_headers(token)
+
+    def _slow_plan(*_args, **_kwargs):
+        # 超过租约时长的执行：心跳续约后不会被当作过期任务回收
+        time.sleep(0.5)
+        jobs_module._recover_expired(datetime.utcnow())
+        return {"text": "ok"}
+
+    with patch.object(planner_main, "generate_plan", side_effect=_slow_plan):
+        renewed = client.post(
+            "/api/ai/jobs", json={"kind": "plan", "scope": "week"}, headers=headers
+        ).get_json()["data"]
+        assert run_ai_jobs() == 1
+    job = db_session.session.get(AIJob, renewed["job_id"])
+    assert (job.state, job.attempts, job.result) == ("succeeded", 1, {"text": "ok"})
+
+    def _taken_over(*_args, **_kwargs):
+        db_session.session.execute(
+            AIJob.__table__.update()
+            .where(AIJob.id == taken["job_id"])
+            .values(locked_by="other-worker")
+        )
+        db_session.session.commit()
+        return {"text": "stale"}
+
+    with patch.object(planner_main, "generate_plan", side_effect=_taken_over):
+        taken = client.post(
+            "/api/ai/jobs", json={"kind": "plan", "scope": "week"}, headers=headers
+        ).get_json()["data"]
+        assert run_ai_jobs() == 1
+    job = db_session.session.get(AIJob, taken["job_id"], populate_existing=True)
+    assert (job.state, job.locked_by, job.result) == ("running", "other-worker", None)
+
+
+def test_worker_pool_starts_on_request_and_runs_jobs_left_from_before_restart(
+    app, client, db_session, register_and_login, auth_headers
+):
+    token, user_id = register_and_login()
+    # 重启前入队、尚未执行的任务
+    orphan = AIJob(
+        id="orphan",
+        user_id=user_id,
+        kind="plan",
+        params={"scope": "week"},
+        state="queued",
+        stage="queued",
+        attempts=0,
+        max_attempts=3,
+        available_at=datetime.utcnow(),
+    )
+    db_session.session.add(orphan)
+    db_session.session.commit()
+    app.config.update(AI_JOB_SYNC_MODE=False, AI_JOB_WORKERS=1, AI_JOB_POLL_SECONDS=0.05)
+
+    pool = None
+    try:
+        with patch.object(planner_main, "generate_plan", return_value={"text": "ok"}):
+            state = client.get("/api/ai/jobs/orphan", headers=auth_headers(token))
+            pool = app.extensions["ai_job_workers"]
+            deadline = time.monotonic() + 5
+            while state.get_json()["data"]["state"] != "succeeded":
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+                state = client.get("/api/ai/jobs/orphan", headers=auth_headers(token))
+    finally:
+        if pool is not None:
+            pool.close()
+            for thread in pool._threads:
+                thread.join(timeout=5)
+    assert state.get_json()["data"]["result"] == {"text": "ok"}
@@ -0,0 +1,166 @@
+import json
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.models import AIInsight, LogEntry
+
+_MODEL_BRIEFING = {
+    "diagnosis": {
+        "core_judgement": "算法主轴在推进，科研被挤压。",
+        "status_level": "yellow",
+        "key_signals": ["算法冲刺连续三天超过 150 分钟。"],
+        "risks": ["科研阅读只有 90 分钟，主线可能断档。"],
+        "opportunities": ["算法冲刺已形成连续投入，可以直接冲结果。"],
+        "strategy_bias": "算法保量，科研补到每天 1h。",
+    },
+    "battle_plan": {
+        "main_objective": "下周完成 12 道算法难题并读完 2 篇论文。",
+        "secondary_objectives": ["科研阅读每天至少 60 分钟。"],
+        "resource_allocation": [
+            {"target": "算法", "allocation_pct": 60, "reason": "结果最近"},
+            {"target": "科研", "allocation_pct": 40, "reason": "补主线"},
+        ],
+        "critical_tasks": [
+            {"task": "算法冲刺", "focus": "每天 2 道难题并复盘", "guardrail": "超过 90 分钟未解出就看题解"},
+            {"task": "科研阅读", "focus": "每天精读 1 节并记 3 条笔记", "guardrail": "周三前读完第 1 篇"},
+        ],
+        "execution_rhythm": ["上午算法，晚上科研。"],
+        "anti_patterns": ["不要只刷简单题。"],
+        "next_review_point": "周三晚检查论文进度",
+    },
+}
+
+
+class _MockQwenHandler(BaseHTTPRequestHandler):
+    requests: list = []
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        type(self).requests.append(body)
+        payload = json.dumps(
+            {
+                "id": f"mock-{len(type(self).requests)}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": json.dumps(_MODEL_BRIEFING, ensure_ascii=False),
+                        },
+                    }
+                ],
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *_args):
+        pass
+
+
+@pytest.fixture
+def mock_qwen_server(app):
+    handler = type("_Handler", (_MockQwenHandler,), {"requests": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    app.config.update(
+        QWEN_API_KEY="mock-key",
+        QWEN_BASE_URL=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        QWEN_MODEL="mock-model",
+    )
+    try:
+        yield handler.requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_unchanged_period_reuses_stored_briefing(
+    client, db_session, register_and_login, auth_headers, mock_qwen_server,
+    seed_study_logs
+):
+    token, user_id = register_and_login()
+    stage = seed_study_logs(user_id)
+    body = {"scope": "week", "date": date.today().isoformat()}
+
+    def _post(path, **extra):
+        resp = client.post(path, json={**body, **extra}, headers=auth_headers(token))
+        assert resp.status_code == 200
+        return resp.get_json()["data"]
+
+    first = _post("/api/ai/briefing")
+    assert first["meta"]["generation_mode"] == "llm_enhanced"
+    assert first["meta"]["cache_hit"] is False
+    upstream_calls = len(mock_qwen_server)
+    assert upstream_calls >= 1
+
+    # 数据未变：简报直接复用原记录，分析/规划复用同一份简报但各自落一条记录
+    second = _post("/api/ai/briefing")
+    assert second["meta"]["cache_hit"] is True
+    assert second["insight_id"] == first["insight_id"]
+    assert second["diagnosis"] == first["diagnosis"]
+    analysis = _post("/api/ai/analysis")
+    assert analysis["briefing"]["meta"]["cache_hit"] is True
+    assert analysis["briefing"]["battle_plan"] == first["battle_plan"]
+    assert len(mock_qwen_server) == upstream_calls
+    assert AIInsight.query.filter_by(user_id=user_id).count() == 2
+
+    # 显式跳过缓存
+    refreshed = _post("/api/ai/briefing", refresh=True)
+    assert refreshed["meta"]["cache_hit"] is False
+    assert refreshed["insight_id"] != first["insight_id"]
+    upstream_calls_after_refresh = len(mock_qwen_server)
+    assert upstream_calls_after_refresh > upstream_calls
+
+    # 新增日志改变了输入摘要，缓存自然失效
+    db_session.session.add(
+        LogEntry(
+            log_date=date.today(),
+            task="科研阅读",
+            actual_duration=120,
+            legacy_category="科研",
+            mood=4,
+            stage_id=stage.id,
+        )
+    )
+    db_session.session.commit()
+    changed = _post("/api/ai/plan")
+    assert changed["briefing"]["meta"]["cache_hit"] is False
+    assert len(mock_qwen_server) > upstream_calls_after_refresh
+
+
+def test_rule_fallback_is_not_cached_and_ttl_zero_disables_reuse(
+    app, client, db_session, register_and_login, auth_headers, mock_qwen_server,
+    seed_study_logs
+):
+    token, user_id = register_and_login()
+    seed_study_logs(user_id)
+    body = {"scope": "week", "date": date.today().isoformat()}
+
+    app.config["QWEN_API_KEY"] = None
+    fallback = client.post("/api/ai/briefing", json=body, headers=auth_headers(token))
+    assert fallback.get_json()["data"]["meta"]["generation_mode"] == "rule_fallback"
+    assert AIInsight.query.one().prompt_hash is None
+
+    app.config["QWEN_API_KEY"] = "mock-key"
+    app.config["AI_RESPONSE_CACHE_TTL_SECONDS"] = 0
+    for _ in range(2):
+        data = client.post("/api/ai/briefing", json=body, headers=auth_headers(token)).get_json()[
+            "data"
+        ]
+        assert data["meta"]["generation_mode"] == "llm_enhanced"
+        assert data["meta"]["cache_hit"] is False
+    assert len(mock_qwen_server) >= 2
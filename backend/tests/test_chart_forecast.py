@@ -3,11 +3,13 @@ import time
 from datetime import date, timedelta
 
 import numpy as np
+import pytest
 
 from app import db
 from app.models import DailyData, LogEntry, Stage
 from app.services import chart_service, forecast_service
 from app.services.chart_service import get_chart_data_for_user
+from app.services.forecast_cache_backend import create_forecast_cache_backend
 
 
 def _create_history(
@@ -229,6 +231,231 @@ def test_chart_forecast_skips_candidates_with_nan_metrics(monkeypatch):
     assert all(candidate["model_name"] != "Broken Nan" for candidate in forecast["model_candidates"])
 
 
+def test_ridge_candidates_do_not_require_sklearn(monkeypatch):
+    monkeypatch.setattr(forecast_service, "_sklearn_ensemble", lambda: None)
+
+    names = [
+        name
+        for name, _predictor in forecast_service._available_model_predictors(
+            include_nonlinear=True,
+            target_kind="duration",
+        )
+    ]
+
+    assert names == [
+        "Seasonal Naive",
+        "Ridge Autoregression",
+        "Recent Ridge Autoregression",
+    ]
+
+
+def test_chart_forecast_warm_start_matches_cold_run_after_appending_a_day(monkeypatch):
+    start_date = date(2025, 1, 1)
+    total_days = 71
+    base_pattern = [1.2, 1.5, 1.8, 1.6, 1.9, 2.1, 1.4]
+    series = [
+        base_pattern[offset % 7] + ((offset % 5) * 0.05)
+        for offset in range(total_days)
+    ]
+    efficiency = [55.0 + ((offset % 4) * 2.5) for offset in range(total_days)]
+    labels = [
+        (start_date + timedelta(days=offset)).isoformat()
+        for offset in range(total_days)
+    ]
+
+    monkeypatch.setattr(
+        forecast_service,
+        "_available_model_predictors",
+        lambda **kwargs: (
+            ("Seasonal Naive", forecast_service._predict_seasonal_naive),
+            ("Ridge Autoregression", forecast_service._predict_ridge_autoregression),
+            (
+                "Recent Ridge Autoregression",
+                forecast_service._build_recent_window_predictor(
+                    forecast_service._predict_ridge_autoregression,
+                    window_size=56,
+                ),
+            ),
+        ),
+    )
+
+    def run(days, warm_state=None):
+        return forecast_service._create_forecast(
+            labels[:days],
+            series[:days],
+            forecast_service.DAILY_CONFIG,
+            global_start_date=start_date,
+            last_log_date=start_date + timedelta(days=days - 1),
+            exog_history=efficiency[:days],
+            target_kind="duration",
+            warm_state=warm_state,
+        )
+
+    warm_state = forecast_service.ForecastWarmState()
+    series_state = warm_state.series("daily_duration")
+    run(total_days - 1, series_state)
+    warm_state.prune("daily_duration", total_days - 1, forecast_service.DAILY_CONFIG)
+    cold_fit_count = series_state.fit_count
+
+    warm_forecast = run(total_days, series_state)
+    cold_forecast = run(total_days)
+    warm_forecast.pop("backtest_timing")
+    cold_forecast.pop("backtest_timing")
+
+    assert warm_forecast == cold_forecast
+    assert warm_forecast["available"] is True
+    # 追加一天后，仅新的最终起点需要重新训练（两个 Ridge 候选各一次）
+    assert series_state.fit_count - cold_fit_count == 2
+    assert series_state.reuse_count > 0
+
+
+def test_batched_ridge_matches_standardized_sklearn_pipeline():
+    from sklearn.linear_model import Ridge
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    config = forecast_service.DAILY_CONFIG
+    rng = np.random.default_rng(7)
+    series = np.round(np.maximum(rng.normal(1.5, 0.6, 90), 0.0), 2)
+    exog = rng.normal(55.0, 4.0, (90, 2))
+    x_full, y_full = forecast_service._build_supervised_dataset(series, config, exog)
+
+    row_counts = [30, 45, 60]
+    predict_rows = forecast_service._batch_fit_ridge_autoregression(
+        [x_full[:rows] for rows in row_counts],
+        [y_full[:rows] for rows in row_counts],
+        config,
+    )
+
+    for rows, predict_row in zip(row_counts, predict_rows):
+        reference = Pipeline(
+            steps=[("scaler", StandardScaler()), ("ridge", Ridge(alpha=1.2))]
+        )
+        reference.fit(
+            x_full[:rows],
+            y_full[:rows],
+            ridge__sample_weight=forecast_service._build_sample_weights(rows),
+        )
+        probe = x_full[rows : rows + 1]
+        assert abs(predict_row(probe) - float(reference.predict(probe)[0])) < 1e-9
+
+
+def test_feature_matrix_matches_row_by_row_builder():
+    rng = np.random.default_rng(3)
+    for config in (forecast_service.DAILY_CONFIG, forecast_service.WEEKLY_CONFIG):
+        series = np.round(np.maximum(rng.normal(1.0, 1.0, 60), 0.0), 2)
+        exog = rng.normal(50.0, 5.0, (60, 2))
+        start = forecast_service._max_lookback(config)
+        expected = np.vstack(
+            [
+                forecast_service._build_feature_row(series, index, config, exog)
+                for index in range(start, len(series))
+            ]
+        )
+        x_train, y_train = forecast_service._build_supervised_dataset(series, config, exog)
+
+        assert np.array_equal(x_train, expected)
+        assert np.array_equal(y_train, series[start:])
+
+
+def test_backtest_reports_timing_for_batched_candidates():
+    config = forecast_service.DAILY_CONFIG
+    series = [1.2 + ((offset % 7) * 0.15) + ((offset % 3) * 0.05) for offset in range(70)]
+    timing = forecast_service._BacktestTiming()
+
+    batched = forecast_service._backtest_candidate(
+        "Ridge Autoregression",
+        forecast_service._predict_ridge_autoregression,
+        series,
+        config,
+        timing=timing,
+    )
+    sequential = forecast_service._backtest_candidate(
+        "Ridge Autoregression",
+        lambda *args, **kwargs: forecast_service._predict_ridge_autoregression(*args, **kwargs),
+        series,
+        config,
+    )
+
+    assert batched[0] == pytest.approx(sequential[0], abs=1e-9)
+    assert batched[1] == pytest.approx(sequential[1], abs=1e-9)
+    assert timing.elapsed_seconds > 0
+    assert set(timing.to_dict()) == {"elapsed_seconds", "batch_saved_seconds"}
+
+
+def test_parallel_candidate_backtests_match_sequential_result(monkeypatch):
+    from concurrent.futures import Executor, ThreadPoolExecutor
+
+    start_date = date(2025, 1, 1)
+    total_days = 70
+    series = [1.2 + ((offset % 7) * 0.15) + ((offset % 4) * 0.05) for offset in range(total_days)]
+    efficiency = [55.0 + ((offset % 5) * 2.0) for offset in range(total_days)]
+    labels = [(start_date + timedelta(days=offset)).isoformat() for offset in range(total_days)]
+
+    def shifted_naive(input_series, config, horizon, _future_exog=None, *, exog_history=None):
+        del exog_history
+        return np.asarray([input_series[-1]] * horizon, dtype=float)
+
+    monkeypatch.setattr(
+        forecast_service,
+        "_available_model_predictors",
+        lambda **kwargs: (
+            ("Seasonal Naive", forecast_service._predict_seasonal_naive),
+            ("Last Value", shifted_naive),
+            ("Ridge Autoregression", forecast_service._predict_ridge_autoregression),
+        ),
+    )
+
+    class RejectingExecutor(Executor):
+        """模拟无法序列化候选的进程池：提交即失败，应回退到本进程执行。"""
+
+        def submit(self, fn, *args, **kwargs):
+            raise TypeError("cannot pickle local function")
+
+    def run(executor=None):
+        forecast = forecast_service._create_forecast(
+            labels,
+            series,
+            forecast_service.DAILY_CONFIG,
+            global_start_date=start_date,
+            last_log_date=start_date + timedelta(days=total_days - 1),
+            exog_history=efficiency,
+            candidate_executor=executor,
+        )
+        forecast.pop("backtest_timing")
+        return forecast
+
+    sequential = run()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        threaded = run(executor)
+    fallback = run(RejectingExecutor())
+
+    assert threaded == sequential
+    assert fallback == sequential
+    assert [item["model_name"] for item in threaded["model_candidates"]] == [
+        item["model_name"] for item in sequential["model_candidates"]
+    ]
+
+
+def test_get_candidate_executor_is_shared_and_disabled_for_single_worker():
+    assert forecast_service.get_candidate_executor(0) is None
+    assert forecast_service.get_candidate_executor(1) is None
+
+    first = forecast_service.get_candidate_executor(2, forecast_service.CANDIDATE_EXECUTOR_THREAD)
+    second = forecast_service.get_candidate_executor(2, forecast_service.CANDIDATE_EXECUTOR_THREAD)
+    assert first is second
+
+
+def test_discard_forecast_warm_state_forgets_key():
+    first = forecast_service._get_forecast_warm_state("discard-me")
+    assert forecast_service._get_forecast_warm_state("discard-me") is first
+
+    forecast_service.discard_forecast_warm_state("discard-me")
+
+    assert forecast_service._get_forecast_warm_state("discard-me") is not first
+    forecast_service.discard_forecast_warm_state("discard-me")
+
+
 def test_chart_overview_forecast_status_can_be_polled_async(
     app,
     client,
@@ -593,3 +820,221 @@ def test_chart_forecast_manual_retrain_still_rebuilds_when_signature_unchanged(
         assert call_count["value"] >= 2
 
         app.config["CHART_FORECAST_SYNC_MODE"] = True
+
+
+def test_chart_forecast_waits_for_worker_holding_shared_lease(
+    app,
+    db_session,
+    register_and_login,
+    monkeypatch,
+    tmp_path,
+):
+    with app.app_context():
+        app.config["CHART_FORECAST_SYNC_MODE"] = False
+        app.config["CHART_FORECAST_CACHE_BACKEND"] = "sqlite"
+        app.config["CHART_FORECAST_CACHE_DIR"] = str(tmp_path)
+        chart_service._overview_cache.clear()
+        chart_service._overview_inflight.clear()
+        chart_service._forecast_cache.clear()
+        chart_service._forecast_inflight.clear()
+
+        _token, user_id = register_and_login(
+            "forecast-shared-lease",
+            "forecast-shared-lease@test.com",
+        )
+        _create_history(
+            user_id,
+            start_date=date.today() - timedelta(days=40),
+            days=40,
+        )
+
+        call_count = {"value": 0}
+
+        def counting_builder(**kwargs):
+            call_count["value"] += 1
+            return {}
+
+        monkeypatch.setattr(chart_service, "build_trend_forecasts", counting_builder)
+
+        # 另一个 worker 进程已经领取了该用户的训练租约
+        other_worker = create_forecast_cache_backend("sqlite", str(tmp_path))
+        try:
+            assert other_worker.claim(
+                user_id,
+                signature="any",
+                owner="other-host:1",
+                lease_seconds=60,
+            )
+
+            pending = chart_service.get_chart_forecast_status_for_user(user_id)
+            assert pending["status"] == "pending"
+            assert pending["queue"]["claimed_by"] == "other-host:1"
+            assert call_count["value"] == 0
+
+            ready_bundle = chart_service._mark_forecast_bundle_ready({})
+            other_worker.put(
+                user_id,
+                {
+                    "signature": pending["signature"],
+                    "state": "ready",
+                    "message": "预测结果已就绪",
+                    "updated_at": "2099-01-01T00:00:00Z",
+                    "trained_for_date": pending["trained_for_date"],
+                    "forecast_bundle": ready_bundle,
+                },
+                ttl_seconds=60,
+            )
+            other_worker.release(user_id, owner="other-host:1")
+
+            shared = chart_service.get_chart_forecast_status_for_user(user_id)
+            assert shared["status"] == "ready"
+            assert shared["updated_at"] == "2099-01-01T00:00:00Z"
+            assert call_count["value"] == 0
+        finally:
+            other_worker.close()
+            app.config["CHART_FORECAST_CACHE_BACKEND"] = "none"
+            app.config["CHART_FORECAST_SYNC_MODE"] = True
+
+
+def test_chart_base_payload_uses_two_queries_and_columnar_aggregates(
+    app, db_session, register_and_login
+):
+    from sqlalchemy import event
+
+    with app.app_context():
+        _token, user_id = register_and_login("columnar", "columnar@test.com")
+        start = date.today() - timedelta(days=30)
+        _create_history(user_id, start_date=start, days=21, gap_step=2)
+        later_stage = Stage(
+            name="后续阶段", start_date=start + timedelta(days=24), user_id=user_id
+        )
+        db.session.add(later_stage)
+        db.session.flush()
+        db.session.add_all(
+            [
+                LogEntry(
+                    log_date=start + timedelta(days=24),
+                    task="a",
+                    actual_duration=30,
+                    stage_id=later_stage.id,
+                ),
+                LogEntry(
+                    log_date=start + timedelta(days=24),
+                    task="b",
+                    actual_duration=None,
+                    stage_id=later_stage.id,
+                ),
+            ]
+        )
+        db.session.commit()
+        db.session.expire_all()
+
+        statements = []
+
+        def _count(_conn, _cursor, statement, *_args):
+            # 读前确认有无待重算效率分的探测不计入图表聚合查询
+            if "efficiency_dirty_key" not in statement:
+                statements.append(statement)
+
+        engine = db.engine
+        event.listen(engine, "before_cursor_execute", _count)
+        try:
+            payload, _context = chart_service._build_chart_base_payload(user_id)
+        finally:
+            event.remove(engine, "before_cursor_execute", _count)
+
+        assert len(statements) <= 2
+        daily = payload["daily_duration_data"]
+        assert daily["labels"][0] == start.isoformat()
+        assert daily["labels"][-1] == (start + timedelta(days=24)).isoformat()
+        assert daily["actuals"][:3] == [1.5, 0.0, round((90 + 24) / 60, 2)]
+        assert daily["actuals"][-1] == 0.5
+        efficiencies = payload["daily_efficiency_data"]["actuals"]
+        assert efficiencies[:2] == [55.0, None]
+        # 预测首日落在第二阶段内：序号归一化为 1，且不是阶段首日
+        assert daily["future_stage_features"][0][1:] == [1.0, 0.0]
+        assert payload["kpis"]["avg_daily_minutes"] == round(
+            (sum(90 + (o % 7) * 12 for o in range(0, 21, 2)) + 30) / 12, 1
+        )
+        assert [item["name"] for item in payload["stage_annotations"]] == [
+            "预测阶段",
+            "后续阶段",
+        ]
+
+
+def _tag_warm_state(key):
+    forecast_service._get_forecast_warm_state(key).probe_tag = True
+    return True
+
+
+def _warm_state_tagged(key):
+    state = forecast_service._warm_states.get(key)
+    return state is not None and getattr(state, "probe_tag", False)
+
+
+def _run_in_forecast_shard(app, func, kwargs):
+    results: list = []
+    done = threading.Event()
+
+    def _collect(value):
+        results.append(value)
+        done.set()
+
+    # 只有一个分片，借用其他用户 ID 提交，避免取消该用户的预测任务
+    chart_service._get_forecast_pool(app).submit(
+        -1, f"probe-{time.monotonic()}", func, kwargs, on_success=_collect, on_error=_collect
+    )
+    assert done.wait(timeout=60)
+    return results[0]
+
+
+def test_chart_forecast_retrain_discards_warm_state_in_process_shard(
+    app,
+    db_session,
+    register_and_login,
+):
+    with app.app_context():
+        previous_workers = app.config.get("CHART_FORECAST_WORKERS")
+        app.config["CHART_FORECAST_SYNC_MODE"] = False
+        app.config["CHART_FORECAST_EXECUTOR"] = "process"
+        app.config["CHART_FORECAST_WORKERS"] = 1
+        chart_service._overview_cache.clear()
+        chart_service._overview_inflight.clear()
+        chart_service._forecast_cache.clear()
+        chart_service._forecast_inflight.clear()
+        try:
+            _token, user_id = register_and_login(
+                "forecast-retrain-process",
+                "forecast-retrain-process@test.com",
+            )
+            _create_history(
+                user_id,
+                start_date=date.today() - timedelta(days=45),
+                days=45,
+            )
+
+            def _wait_ready(status):
+                for _ in range(600):
+                    if status["status"] == "ready":
+                        break
+                    time.sleep(0.1)
+                    status = chart_service.get_chart_forecast_status_for_user(user_id)
+                return status
+
+            status = _wait_ready(chart_service.get_chart_forecast_status_for_user(user_id))
+            assert status["status"] == "ready"
+            assert _run_in_forecast_shard(app, _tag_warm_state, {"key": user_id}) is True
+            assert _run_in_forecast_shard(app, _warm_state_tagged, {"key": user_id}) is True
+
+            status = _wait_ready(chart_service.retrain_chart_forecasts_for_user(user_id))
+            assert status["status"] == "ready"
+            # 重训在分片子进程中重建了热启动状态，旧对象上的标记随之消失
+            assert _run_in_forecast_shard(app, _warm_state_tagged, {"key": user_id}) is False
+        finally:
+            with chart_service._forecast_pool_lock:
+                if chart_service._forecast_pool is not None:
+                    chart_service._forecast_pool.shutdown()
+                chart_service._forecast_pool = None
+            app.config["CHART_FORECAST_EXECUTOR"] = "thread"
+            app.config["CHART_FORECAST_WORKERS"] = previous_workers
+            app.config["CHART_FORECAST_SYNC_MODE"] = True
@@ -0,0 +1,155 @@
+"""daily_rollup incremental maintenance tests."""
+
+from datetime import date, timedelta
+
+from app import db
+from app.models import Category, DailyRollup, LogEntry, Stage, SubCategory
+from app.services.rollup_service import (
+    _aggregate_select,
+    _insert_from_aggregate,
+    rebuild_daily_rollup,
+)
+
+
+def _rollup_snapshot(user_id: int):
+    rows = (
+        DailyRollup.query.filter_by(user_id=user_id)
+        .order_by(
+            DailyRollup.log_date,
+            DailyRollup.stage_id,
+            DailyRollup.subcategory_id,
+        )
+        .all()
+    )
+    return [
+        (
+            row.log_date,
+            row.stage_id,
+            row.subcategory_id,
+            row.minutes,
+            row.session_count,
+            row.mood_minutes,
+        )
+        for row in rows
+    ]
+
+
+def test_rollup_follows_log_insert_update_and_delete(app, db_session, register_and_login):
+    _token, user_id = register_and_login("rollup-u1", "rollup-u1@test.com")
+    day = date.today() - timedelta(days=3)
+    stage = Stage(name="阶段", start_date=day - timedelta(days=10), user_id=user_id)
+    db.session.add(stage)
+    db.session.flush()
+
+    first = LogEntry(log_date=day, task="a", actual_duration=60, mood=5, stage_id=stage.id)
+    second = LogEntry(log_date=day, task="b", actual_duration=30, stage_id=stage.id)
+    db.session.add_all([first, second])
+    db.session.commit()
+
+    assert _rollup_snapshot(user_id) == [(day, stage.id, None, 90, 2, 60 * 5 + 30 * 3)]
+
+    # 改日期时旧日期的桶也要同步重算
+    next_day = day + timedelta(days=1)
+    second.log_date = next_day
+    second.actual_duration = 45
+    db.session.commit()
+    assert _rollup_snapshot(user_id) == [
+        (day, stage.id, None, 60, 1, 300),
+        (next_day, stage.id, None, 45, 1, 135),
+    ]
+
+    db.session.delete(first)
+    db.session.commit()
+    assert _rollup_snapshot(user_id) == [(next_day, stage.id, None, 45, 1, 135)]
+
+    expected = _rollup_snapshot(user_id)
+    DailyRollup.query.delete()
+    db.session.commit()
+    assert rebuild_daily_rollup(user_id) == 1
+    assert _rollup_snapshot(user_id) == expected
+
+    db.session.delete(stage)
+    db.session.commit()
+    assert _rollup_snapshot(user_id) == []
+
+
+def test_rollup_follows_subcategory_merge(client, db_session, register_and_login, auth_headers):
+    token, user_id = register_and_login("rollup-u2", "rollup-u2@test.com")
+    category = Category(name="分类", user_id=user_id)
+    db.session.add(category)
+    db.session.flush()
+    source = SubCategory(name="源", category_id=category.id)
+    target = SubCategory(name="目标", category_id=category.id)
+    stage = Stage(name="阶段", start_date=date.today(), user_id=user_id)
+    db.session.add_all([source, target, stage])
+    db.session.flush()
+    db.session.add_all(
+        [
+            LogEntry(
+                log_date=date.today(),
+                task="源任务",
+                actual_duration=20,
+                stage_id=stage.id,
+                subcategory_id=source.id,
+            ),
+            LogEntry(
+                log_date=date.today(),
+                task="目标任务",
+                actual_duration=40,
+                mood=4,
+                stage_id=stage.id,
+                subcategory_id=target.id,
+            ),
+        ]
+    )
+    db.session.commit()
+    target_id = target.id
+
+    resp = client.post(
+        f"/api/categories/subcategories/{source.id}/merge",
+        json={"target_subcategory_id": target_id},
+        headers=auth_headers(token),
+    )
+    assert resp.status_code == 200
+
+    assert _rollup_snapshot(user_id) == [
+        (date.today(), stage.id, target_id, 60, 2, 20 * 3 + 40 * 4)
+    ]
+
+
+def test_rebuild_daily_rollup_cli(app, db_session, register_and_login):
+    _token, user_id = register_and_login("rollup-u3", "rollup-u3@test.com")
+    stage = Stage(name="阶段", start_date=date.today(), user_id=user_id)
+    db.session.add(stage)
+    db.session.flush()
+    db.session.add(
+        LogEntry(log_date=date.today(), task="t", actual_duration=25, stage_id=stage.id)
+    )
+    db.session.commit()
+    DailyRollup.query.delete()
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-daily-rollup"])
+
+    assert result.exit_code == 0
+    assert "1 rows" in result.output
+    assert _rollup_snapshot(user_id) == [(date.today(), stage.id, None, 25, 1, 75)]
+
+
+def test_rollup_bucket_written_twice_is_not_double_counted(app, db_session, register_and_login):
+    _token, user_id = register_and_login("rollup-u3", "rollup-u3@test.com")
+    day = date.today() - timedelta(days=2)
+    stage = Stage(name="阶段", start_date=day - timedelta(days=5), user_id=user_id)
+    db.session.add(stage)
+    db.session.flush()
+    db.session.add(LogEntry(log_date=day, task="a", actual_duration=40, stage_id=stage.id))
+    db.session.commit()
+    expected = _rollup_snapshot(user_id)
+
+    # 模拟两个并发事务都没删到旧行、各自插入同一个桶
+    _insert_from_aggregate(
+        db.session.connection(),
+        _aggregate_select().where(LogEntry.__table__.c.stage_id == stage.id),
+    )
+    db.session.commit()
+    assert _rollup_snapshot(user_id) == expected == [(day, stage.id, None, 40, 1, 120)]
@@ -0,0 +1,396 @@
+import io
+import json
+import os
+import zipfile
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func
+
+from app import db
+from app.models import (
+    DailyData,
+    DailyRollup,
+    LogEntry,
+    Milestone,
+    MilestoneAttachment,
+    Setting,
+    Stage,
+    User,
+    WeeklyData,
+)
+from app.services import data_service
+from app.services.record_service import (
+    get_stage_for_date,
+    recalculate_efficiency_for_stage,
+)
+
+
+def _seed_user_data(user_id, upload_folder):
+    stage = Stage(name="长阶段", start_date=date(2024, 1, 1), user_id=user_id)
+    db.session.add(stage)
+    db.session.flush()
+    for offset in range(120):
+        db.session.add(
+            LogEntry(
+                log_date=date(2024, 1, 1) + timedelta(days=offset),
+                task=f"任务 {offset}\n第二行",
+                actual_duration=30 + offset % 60,
+                mood=3,
+                stage_id=stage.id,
+            )
+        )
+    db.session.add(Setting(key="theme", value="dark", user_id=user_id))
+    milestone = Milestone(title="里程碑", event_date=date(2024, 3, 1), user_id=user_id)
+    db.session.add(milestone)
+    db.session.flush()
+
+    user_folder = os.path.join(upload_folder, str(user_id))
+    os.makedirs(user_folder, exist_ok=True)
+    payload = os.urandom(200 * 1024)
+    with open(os.path.join(user_folder, "photo.png"), "wb") as handle:
+        handle.write(payload)
+    db.session.add(
+        MilestoneAttachment(
+            milestone_id=milestone.id, file_path="photo.png", original_filename="photo.png"
+        )
+    )
+    db.session.commit()
+    return payload
+
+
+def test_export_streams_bounded_chunks_with_unchanged_contents(
+    app, client, db_session, register_and_login, auth_headers, tmp_path
+):
+    token, user_id = register_and_login()
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    app.config["EXPORT_STREAM_CHUNK_SIZE"] = 16 * 1024
+    app.config["EXPORT_QUERY_BATCH_SIZE"] = 25
+    attachment = _seed_user_data(user_id, str(tmp_path))
+
+    resp = client.get("/api/records/export", headers=auth_headers(token), buffered=False)
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == "application/zip"
+    assert not resp.is_sequence
+    chunks = list(resp.response)
+    resp.close()
+
+    assert len(chunks) > 10
+    # 单块大小受配置约束（附件块压缩前最多 chunk_size，压缩输出不会超过一个额外块）
+    assert max(len(chunk) for chunk in chunks) <= 2 * 16 * 1024 + 1024
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.read("attachments/photo.png") == attachment
+    for model in data_service.MODELS_TO_HANDLE:
+        records = data_service._query_user_records(model, user_id)
+        expected = json.dumps(
+            [record.to_dict() for record in records], indent=4, ensure_ascii=False
+        )
+        assert archive.read(f"data/{model.__tablename__}.json").decode("utf-8") == expected
+    assert len(json.loads(archive.read("data/log_entry.json"))) == 120
+
+    user = db.session.get(User, user_id)
+    ok, message = data_service.import_data_for_user(user, io.BytesIO(b"".join(chunks)))
+    assert ok, message
+    assert LogEntry.query.join(Stage).filter(Stage.user_id == user_id).count() == 120
+
+
+def _efficiency_rows(user_id):
+    daily = (
+        db.session.query(DailyData.stage_id, DailyData.log_date, DailyData.efficiency)
+        .join(Stage)
+        .filter(Stage.user_id == user_id)
+        .order_by(DailyData.stage_id, DailyData.log_date)
+        .all()
+    )
+    weekly = (
+        db.session.query(
+            WeeklyData.stage_id, WeeklyData.year, WeeklyData.week_num, WeeklyData.efficiency
+        )
+        .join(Stage)
+        .filter(Stage.user_id == user_id)
+        .order_by(WeeklyData.stage_id, WeeklyData.year, WeeklyData.week_num)
+        .all()
+    )
+    return [tuple(row) for row in daily], [tuple(row) for row in weekly]
+
+
+def test_bulk_import_remaps_ids_and_rebuilds_derived_data(
+    app, client, db_session, register_and_login, auth_headers, backup_zip
+):
+    token, user_id = register_and_login()
+    app.config["IMPORT_BATCH_SIZE"] = 7
+    logs = [
+        {
+            "id": 1000 + offset,
+            "log_date": (date(2024, 1, 1) + timedelta(days=offset // 2)).isoformat(),
+            "task": f"任务 {offset}",
+            "actual_duration": 20 + offset,
+            "duration_formatted": "ignored",
+            "mood": 1 + offset % 5,
+            "stage_id": 501 if offset < 40 else 502,
+            "subcategory_id": 801 if offset % 3 else 899,
+            "subcategory": None
+            if offset % 3
+            else {"id": 899, "name": "重建标签", "category": {"id": 999, "name": "重建分类"}},
+            "created_at": "2024-01-01T08:00:00Z",
+        }
+        for offset in range(60)
+    ]
+    backup = backup_zip(
+        {
+            "setting": [{"key": "theme", "value": "dark"}],
+            "stage": [
+                {"id": 501, "name": "一", "start_date": "2024-01-01", "user_id": 77},
+                {"id": 502, "name": "二", "start_date": "2024-01-21", "user_id": 77},
+            ],
+            "category": [{"id": 701, "name": "数学", "user_id": 77}],
+            "sub_category": [
+                {"id": 801, "name": "代数", "category_id": 701},
+                {"id": 802, "name": "孤儿", "category_id": 12345},
+            ],
+            "log_entry": logs,
+            "daily_data": [{"id": 1, "log_date": "2023-01-01", "efficiency": 9.0, "stage_id": 501}],
+            "motto": [{"id": 5, "content": "坚持", "user_id": 77}],
+        }
+    )
+
+    resp = client.post(
+        "/api/records/import",
+        headers=auth_headers(token),
+        data={"file": (backup, "backup.zip")},
+        content_type="multipart/form-data",
+    )
+    body = resp.get_json()
+    assert resp.status_code == 200, body
+    report = body["report"]
+    assert set(report["phases"]) >= {"clear", "tables", "daily_rollup", "efficiency", "commit", "total"}
+    assert report["rows"]["log_entry"] == 60
+    assert report["rows"]["sub_category"] == 1  # 父分类缺失的子分类被跳过
+
+    stages = Stage.query.filter_by(user_id=user_id).order_by(Stage.start_date).all()
+    assert [stage.name for stage in stages] == ["一", "二"]
+    entries = LogEntry.query.join(Stage).filter(Stage.user_id == user_id).all()
+    assert {entry.stage_id for entry in entries} == {stage.id for stage in stages}
+    assert sum(1 for entry in entries if entry.stage_id == stages[0].id) == 40
+    subcategories = {entry.subcategory.name for entry in entries}
+    assert subcategories == {"代数", "重建标签"}
+    assert all(entry.created_at == datetime(2024, 1, 1, 8) for entry in entries)
+    assert get_stage_for_date(user_id, date(2024, 1, 25)).id == stages[1].id
+
+    rollup_minutes = (
+        db.session.query(func.sum(DailyRollup.minutes)).filter_by(user_id=user_id).scalar()
+    )
+    assert rollup_minutes == sum(log["actual_duration"] for log in logs)
+
+    bulk_daily, bulk_weekly = _efficiency_rows(user_id)
+    assert date(2023, 1, 1) not in {row[1] for row in bulk_daily}
+    for stage in stages:
+        recalculate_efficiency_for_stage(stage)
+    assert _efficiency_rows(user_id) == (bulk_daily, bulk_weekly)
+
+
+def _export(client, token, auth_headers, since=None):
+    url = "/api/records/export" + (f"?since={since}" if since is not None else "")
+    resp = client.get(url, headers=auth_headers(token))
+    assert resp.status_code == 200, resp.get_data(as_text=True)[:200]
+    data = resp.get_data()
+    manifest = json.loads(zipfile.ZipFile(io.BytesIO(data)).read("manifest.json"))
+    return data, manifest
+
+
+def _user_snapshot(user_id):
+    logs = sorted(
+        (entry.task, entry.log_date, entry.actual_duration)
+        for entry in LogEntry.query.join(Stage).filter(Stage.user_id == user_id)
+    )
+    settings = {row.key: row.value for row in Setting.query.filter_by(user_id=user_id)}
+    attachments = sorted(
+        row.original_filename
+        for row in MilestoneAttachment.query.join(Milestone).filter(
+            Milestone.user_id == user_id
+        )
+    )
+    return logs, settings, attachments
+
+
+def test_delta_export_chain_applies_onto_full_base(
+    app, client, db_session, register_and_login, auth_headers, tmp_path
+):
+    token, user_id = register_and_login()
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    _seed_user_data(user_id, str(tmp_path))
+    base, base_manifest = _export(client, token, auth_headers)
+    assert base_manifest["format"] == "full" and base_manifest["version"] > 0
+
+    stage = Stage.query.filter_by(user_id=user_id).one()
+    milestone = Milestone.query.filter_by(user_id=user_id).one()
+    entries = LogEntry.query.filter_by(stage_id=stage.id).order_by(LogEntry.id).all()
+    entries[0].task = "修改后的任务"
+    db.session.delete(entries[1])
+    added = LogEntry(log_date=date(2024, 6, 1), task="新增", actual_duration=45, stage_id=stage.id)
+    db.session.add(added)
+    Setting.query.filter_by(user_id=user_id).one().value = "light"
+    db.session.delete(milestone.attachments[0])
+    with open(os.path.join(str(tmp_path), str(user_id), "scan.pdf"), "wb") as handle:
+        handle.write(b"%PDF new attachment")
+    db.session.add(
+        MilestoneAttachment(
+            milestone_id=milestone.id,
+            file_path=f"{user_id}/scan.pdf",
+            original_filename="scan.pdf",
+        )
+    )
+    db.session.commit()
+
+    delta1, manifest1 = _export(client, token, auth_headers, since=base_manifest["version"])
+    assert manifest1["format"] == "delta" and manifest1["since"] == base_manifest["version"]
+    archive = zipfile.ZipFile(io.BytesIO(delta1))
+    changed_logs = json.loads(archive.read("data/log_entry.json"))
+    assert sorted(row["task"] for row in changed_logs) == ["修改后的任务", "新增"]
+    assert json.loads(archive.read("deleted/log_entry.json")) == [{"id": entries[1].id}]
+    assert json.loads(archive.read("data/setting.json")) == [{"key": "theme", "value": "light"}]
+    assert json.loads(archive.read("data/stage.json")) == []
+    assert "data/daily_data.json" not in archive.namelist()
+    assert [name for name in archive.namelist() if name.startswith("attachments/")] == [
+        "attachments/scan.pdf"
+    ]
+    assert len(delta1) < len(base) // 10
+
+    # 第二个增量：删除上一个增量里新增的行
+    db.session.delete(db.session.get(LogEntry, added.id))
+    db.session.add(LogEntry(log_date=date(2024, 6, 2), task="再新增", stage_id=stage.id))
+    db.session.commit()
+    delta2, manifest2 = _export(client, token, auth_headers, since=manifest1["version"])
+    assert manifest2["since"] == manifest1["version"]
+
+    bad = client.get(
+        f"/api/records/export?since={manifest2['version'] + 100}", headers=auth_headers(token)
+    )
+    assert bad.status_code == 400
+
+    other_token, other_id = register_and_login(username="restore", email="restore@test.com")
+    broken = client.post(
+        "/api/records/import",
+        headers=auth_headers(other_token),
+        data={"file": (io.BytesIO(base), "base.zip"), "deltas": [(io.BytesIO(delta2), "d2.zip")]},
+        content_type="multipart/form-data",
+    )
+    assert broken.status_code == 400
+    assert "不连续" in broken.get_json()["message"]
+
+    resp = client.post(
+        "/api/records/import",
+        headers=auth_headers(other_token),
+        data={
+            "file": (io.BytesIO(base), "base.zip"),
+            "deltas": [(io.BytesIO(delta1), "d1.zip"), (io.BytesIO(delta2), "d2.zip")],
+        },
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200, resp.get_json()
+    assert _user_snapshot(other_id) == _user_snapshot(user_id)
+    restored = sorted(os.listdir(os.path.join(str(tmp_path), str(other_id))))
+    assert restored == ["scan.pdf"]
+
+    # 整体导入后旧水位线失效，需要重新全量导出
+    stale = client.get("/api/records/export?since=0", headers=auth_headers(other_token))
+    assert stale.status_code == 400
+
+
+def test_failed_import_keeps_existing_data_and_attachments(
+    app, db_session, register_and_login, tmp_path, backup_zip
+):
+    _token, user_id = register_and_login()
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    payload = _seed_user_data(user_id, str(tmp_path))
+    backup = backup_zip(
+        {
+            "stage": [{"id": 9, "name": "新阶段", "start_date": "2025-01-01"}],
+            "log_entry": [
+                {"id": 1, "log_date": "2025-01-02", "task": "好", "stage_id": 9},
+                {"id": 2, "log_date": "不是日期", "task": "坏", "stage_id": 9},
+            ],
+        }
+    )
+
+    user = db.session.get(User, user_id)
+    ok, _message = data_service.import_data_for_user(user, backup)
+
+    assert not ok
+    assert [stage.name for stage in Stage.query.filter_by(user_id=user_id)] == ["长阶段"]
+    assert LogEntry.query.join(Stage).filter(Stage.user_id == user_id).count() == 120
+    assert Setting.query.filter_by(user_id=user_id).one().value == "dark"
+    with open(os.path.join(str(tmp_path), str(user_id), "photo.png"), "rb") as handle:
+        assert handle.read() == payload
+
+
+def test_change_log_writes_lock_the_user_row_first(app, db_session):
+    user = User(username="change-lock", email="change-lock@test.com")
+    user.set_password("pw123")
+    db.session.add(user)
+    db.session.commit()
+
+    statements = []
+
+    def _capture(_conn, _cursor, statement, *_args):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(db.engine, "before_cursor_execute", _capture)
+    try:
+        db.session.add(Stage(name="加锁", start_date=date(2026, 1, 1), user_id=user.id))
+        db.session.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _capture)
+
+    # 先锁用户行再分配变更 id（PostgreSQL 上为 FOR UPDATE 行锁，SQLite 省略）
+    def _position(prefix):
+        return next(i for i, sql in enumerate(statements) if sql.startswith(prefix))
+
+    assert _position("SELECT user.id FROM user") < _position("INSERT INTO data_change")
+
+
+def test_columnar_export_writes_typed_row_groups(
+    app, client, db_session, register_and_login, auth_headers, tmp_path
+):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    token, user_id = register_and_login()
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    app.config["EXPORT_ROW_GROUP_SIZE"] = 50
+    _seed_user_data(user_id, str(tmp_path))
+    recalculate_efficiency_for_stage(Stage.query.filter_by(user_id=user_id).one())
+
+    resp = client.get("/api/records/export?format=parquet", headers=auth_headers(token))
+    assert resp.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(resp.get_data()))
+    assert json.loads(archive.read("manifest.json"))["format"] == "parquet"
+    assert "attachments/photo.png" not in archive.namelist()
+
+    log_file = pq.ParquetFile(io.BytesIO(archive.read("data/log_entry.parquet")))
+    assert log_file.metadata.num_rows == 120
+    assert log_file.num_row_groups == 3
+    logs = log_file.read()
+    assert logs.schema.field("id").type == pa.int64()
+    assert logs.schema.field("log_date").type == pa.date32()
+    assert logs.schema.field("created_at").type == pa.timestamp("us")
+    expected = LogEntry.query.join(Stage).filter(Stage.user_id == user_id).order_by(LogEntry.id)
+    assert logs.column("log_date").to_pylist() == [entry.log_date for entry in expected]
+    assert logs.column("actual_duration").to_pylist() == [
+        entry.actual_duration for entry in expected
+    ]
+
+    daily = pq.read_table(io.BytesIO(archive.read("data/daily_data.parquet")))
+    assert daily.num_rows == DailyData.query.join(Stage).filter(Stage.user_id == user_id).count()
+    assert pq.read_table(io.BytesIO(archive.read("data/sub_category.parquet"))).num_rows == 0
+
+    resp = client.get("/api/records/export?format=arrow", headers=auth_headers(token))
+    archive = zipfile.ZipFile(io.BytesIO(resp.get_data()))
+    weekly = pa.ipc.open_file(archive.read("data/weekly_data.arrow")).read_all()
+    assert weekly.schema.field("week_num").type == pa.int64()
+    assert weekly.num_rows == WeeklyData.query.join(Stage).filter(Stage.user_id == user_id).count()
+
+    for query in ("format=csv", "format=parquet&since=0"):
+        assert client.get(f"/api/records/export?{query}", headers=auth_headers(token)).status_code == 400
@@ -0,0 +1,251 @@
+import json
+import threading
+import time
+import zipfile
+from datetime import date, timedelta
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app import db
+from app.models import DailyData, EfficiencyDirtyKey, Stage, User, WeeklyData
+from app.services import efficiency_writer
+from app.services.efficiency_writer import (
+    EfficiencyWriteBehind,
+    flush_pending_efficiency,
+    get_efficiency_writer,
+)
+from app.services.record_service import (
+    add_log_for_stage,
+    recalculate_efficiency_for_stage,
+)
+
+
+def _mark(writer, user_id, stage_id, day):
+    """登记脏键并提交，模拟写日志的事务。"""
+    writer.mark(user_id, stage_id, day)
+    db.session.commit()
+
+
+def test_write_behind_coalesces_marks_and_flushes_per_user(app, db_session):
+    applied: list[set] = []
+    done = threading.Event()
+
+    def _apply(keys):
+        applied.append(set(keys))
+        done.set()
+
+    writer = EfficiencyWriteBehind(
+        app, _apply, delay_seconds=0.2, max_delay_seconds=1.0
+    )
+    try:
+        day = date(2026, 3, 2)
+        for _ in range(5):
+            _mark(writer, 1, 10, day)
+        _mark(writer, 2, 20, day)
+        assert writer.pending_count() == 2
+
+        # 读者只同步落库自己的键，其他用户留给后台批次
+        writer.flush(1)
+        assert applied == [{(10, day)}]
+        assert writer.pending_count(1) == 0
+        assert writer.pending_count(2) == 1
+
+        done.clear()
+        assert done.wait(timeout=2)
+        assert applied[-1] == {(20, day)}
+        assert writer.pending_count() == 0
+    finally:
+        writer.shutdown()
+
+
+def test_write_behind_respects_max_delay_under_continuous_writes(app, db_session):
+    applied: list[float] = []
+
+    writer = EfficiencyWriteBehind(
+        app,
+        lambda keys: applied.append(time.monotonic()),
+        delay_seconds=0.2,
+        max_delay_seconds=0.3,
+    )
+    try:
+        started = time.monotonic()
+        for offset in range(8):
+            _mark(writer, 1, 10, date(2026, 3, 1) + timedelta(days=offset))
+            time.sleep(0.08)
+        assert applied and applied[0] - started < 0.6
+    finally:
+        writer.shutdown()
+
+
+def test_write_behind_requeues_failed_batches_with_backoff(app, db_session):
+    applied: list[set] = []
+    done = threading.Event()
+    failures = {"left": 2}
+
+    def _apply(keys):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("database is locked")
+        applied.append(set(keys))
+        done.set()
+
+    writer = EfficiencyWriteBehind(
+        app,
+        _apply,
+        delay_seconds=0.05,
+        max_delay_seconds=0.1,
+        retry_backoff_seconds=0.05,
+    )
+    try:
+        day = date(2026, 3, 4)
+        _mark(writer, 1, 10, day)
+        assert done.wait(timeout=3)
+        assert applied == [{(10, day)}]
+        assert writer.pending_count() == 0
+    finally:
+        writer.shutdown()
+
+
+def test_write_behind_flushes_pending_keys_on_shutdown(app, db_session):
+    applied: list[set] = []
+    writer = EfficiencyWriteBehind(
+        app, lambda keys: applied.append(set(keys)), delay_seconds=30, max_delay_seconds=60
+    )
+    day = date(2026, 3, 5)
+    _mark(writer, 1, 10, day)
+    writer.shutdown()
+    assert applied == [{(10, day)}]
+    assert writer.pending_count() == 0
+
+
+def test_dirty_keys_are_persisted_with_the_write_transaction(app, db_session):
+    applied: list[set] = []
+    day = date(2026, 3, 6)
+    crashed = EfficiencyWriteBehind(
+        app, lambda keys: None, delay_seconds=60, max_delay_seconds=120
+    )
+    other = EfficiencyWriteBehind(
+        app, lambda keys: applied.append(set(keys)), delay_seconds=60, max_delay_seconds=120
+    )
+    try:
+        crashed.mark(1, 10, day)
+        db.session.commit()
+        crashed.mark(1, 11, day)
+        db.session.rollback()
+        assert EfficiencyDirtyKey.query.count() == 1
+
+        # 登记的进程没能落库（被强杀）：其他进程的读者仍能取出并重算这些键
+        other.flush(1)
+        assert applied == [{(10, day)}]
+        assert EfficiencyDirtyKey.query.count() == 0
+    finally:
+        crashed.shutdown()
+        other.shutdown()
+
+
+def test_flush_does_not_touch_the_callers_session(app, db_session):
+    def _apply(keys):
+        raise RuntimeError("database is locked")
+
+    writer = EfficiencyWriteBehind(
+        app, _apply, delay_seconds=60, max_delay_seconds=120
+    )
+    try:
+        _mark(writer, 1, 10, date(2026, 3, 7))
+        pending = Stage(name="未提交阶段", start_date=date(2026, 3, 1), user_id=1)
+        db.session.add(pending)
+
+        writer.flush(1)
+
+        # 失败的重算既没有回滚也没有提交调用方的会话
+        assert pending in db.session.new
+        assert writer.pending_count(1) == 1
+        assert EfficiencyDirtyKey.query.filter_by(user_id=1).one().attempts == 1
+        db.session.rollback()
+    finally:
+        writer.shutdown()
+
+
+def test_log_writes_are_deferred_until_reader_flushes(app, db_session):
+    user = User(username="writer-user", email="writer-user@test.com")
+    user.set_password("pw123")
+    db.session.add(user)
+    db.session.flush()
+    start = date.today() - timedelta(days=20)
+    stage = Stage(name="写后阶段", start_date=start, user_id=user.id)
+    db.session.add(stage)
+    db.session.commit()
+
+    app.config["EFFICIENCY_WRITE_BEHIND_SECONDS"] = 60
+    try:
+        writer = get_efficiency_writer(app)
+        day = start + timedelta(days=3)
+        for minutes, mood in ((30, "5"), (45, "2"), (20, "")):
+            ok, _message, _log_id = add_log_for_stage(
+                stage.id,
+                user,
+                ImmutableMultiDict(
+                    {
+                        "log_date": day.isoformat(),
+                        "task": "t",
+                        "duration_minutes": str(minutes),
+                        "mood": mood,
+                    }
+                ),
+            )
+            assert ok
+        assert writer.pending_count(user.id) == 1
+        assert DailyData.query.filter_by(stage_id=stage.id).count() == 0
+
+        flush_pending_efficiency(user.id)
+        assert writer.pending_count(user.id) == 0
+        batched_daily = DailyData.query.filter_by(stage_id=stage.id).one().efficiency
+        batched_weekly = [
+            (row.year, row.week_num, row.efficiency)
+            for row in WeeklyData.query.filter_by(stage_id=stage.id).all()
+        ]
+
+        recalculate_efficiency_for_stage(stage)
+        assert DailyData.query.filter_by(stage_id=stage.id).one().efficiency == batched_daily
+        assert [
+            (row.year, row.week_num, row.efficiency)
+            for row in WeeklyData.query.filter_by(stage_id=stage.id).all()
+        ] == batched_weekly
+    finally:
+        app.config["EFFICIENCY_WRITE_BEHIND_SECONDS"] = 0
+        get_efficiency_writer(app)
+        assert efficiency_writer._writer.delay_seconds == 0
+
+
+def test_export_flushes_pending_efficiency_first(app, db_session):
+    from app.services import data_service
+
+    user = User(username="export-writer", email="export-writer@test.com")
+    user.set_password("pw123")
+    db.session.add(user)
+    db.session.flush()
+    start = date.today() - timedelta(days=10)
+    stage = Stage(name="导出阶段", start_date=start, user_id=user.id)
+    db.session.add(stage)
+    db.session.commit()
+
+    app.config["EFFICIENCY_WRITE_BEHIND_SECONDS"] = 60
+    try:
+        writer = get_efficiency_writer(app)
+        ok, _message, _log_id = add_log_for_stage(
+            stage.id,
+            user,
+            ImmutableMultiDict(
+                {"log_date": (start + timedelta(days=1)).isoformat(), "task": "t", "duration_minutes": "40"}
+            ),
+        )
+        assert ok and writer.pending_count(user.id) == 1
+
+        ok, buffer, _filename = data_service.export_data_for_user(user)
+        assert ok
+        assert writer.pending_count(user.id) == 0
+        exported = json.loads(zipfile.ZipFile(buffer).read("data/daily_data.json"))
+        assert len(exported) == 1 and exported[0]["efficiency"] is not None
+    finally:
+        app.config["EFFICIENCY_WRITE_BEHIND_SECONDS"] = 0
+        get_efficiency_writer(app)
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from app.services.forecast_cache_backend import (
+    MmapForecastCacheBackend,
+    SQLiteForecastCacheBackend,
+    create_forecast_cache_backend,
+)
+
+
+def _open_pair(kind: str, directory: str):
+    """同一存储上的两个后端实例，模拟两个 worker 进程。"""
+    return (
+        create_forecast_cache_backend(kind, directory),
+        create_forecast_cache_backend(kind, directory),
+    )
+
+
+def _entry(signature: str, value: float = 1.0) -> dict:
+    return {
+        "signature": signature,
+        "state": "ready",
+        "trained_for_date": "2099-01-01",
+        "expires_at": 123.0,
+        "forecast_bundle": {"daily_duration_data": {"prediction": [value]}},
+    }
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "mmap"])
+def test_backend_shares_entries_and_compares_signature(kind, tmp_path):
+    first, second = _open_pair(kind, str(tmp_path))
+    try:
+        assert first.get(1) is None
+        assert first.compare_and_set(1, _entry("sig-a"), expected_signature=None, ttl_seconds=60)
+
+        shared = second.get(1)
+        assert shared["signature"] == "sig-a"
+        assert "expires_at" not in shared
+        assert shared["forecast_bundle"]["daily_duration_data"]["prediction"] == [1.0]
+
+        # 预期签名不一致时拒绝写入，旧结果不会覆盖别的进程刚写入的结果
+        assert not second.compare_and_set(
+            1, _entry("sig-b"), expected_signature=None, ttl_seconds=60
+        )
+        assert second.compare_and_set(
+            1, _entry("sig-b", 2.0), expected_signature="sig-a", ttl_seconds=60
+        )
+        assert first.get(1)["forecast_bundle"]["daily_duration_data"]["prediction"] == [2.0]
+
+        first.delete(1)
+        assert second.get(1) is None
+        assert first.put(2, _entry("sig-c"), ttl_seconds=0.05)
+        time.sleep(0.1)
+        assert second.get(2) is None
+    finally:
+        first.close()
+        second.close()
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "mmap"])
+def test_backend_lease_allows_single_owner_until_expiry(kind, tmp_path):
+    first, second = _open_pair(kind, str(tmp_path))
+    try:
+        assert first.claim(5, signature="sig", owner="worker-a", lease_seconds=60)
+        assert not second.claim(5, signature="sig", owner="worker-b", lease_seconds=60)
+        assert second.get_lease(5).owner == "worker-a"
+        # 同一持有者可以续期
+        assert first.claim(5, signature="sig-2", owner="worker-a", lease_seconds=60)
+
+        second.release(5, owner="worker-b")
+        assert first.get_lease(5).signature == "sig-2"
+        first.release(5, owner="worker-a")
+        assert second.get_lease(5) is None
+        assert second.claim(5, signature="sig", owner="worker-b", lease_seconds=0.05)
+
+        time.sleep(0.1)
+        assert first.claim(5, signature="sig", owner="worker-a", lease_seconds=60)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_mmap_backend_evicts_unleased_entries_when_probe_window_is_full(tmp_path):
+    backend = MmapForecastCacheBackend(str(tmp_path), slot_count=8)
+    try:
+        for user_id in range(1, 9):
+            assert backend.put(user_id, _entry(f"sig-{user_id}"), ttl_seconds=60)
+        assert backend.claim(9, signature="sig-9", owner="worker", lease_seconds=60)
+        assert backend.put(9, _entry("sig-9"), ttl_seconds=60)
+        assert backend.get(9)["signature"] == "sig-9"
+        assert sum(backend.get(user_id) is not None for user_id in range(1, 9)) == 7
+    finally:
+        backend.close()
+
+
+def test_create_backend_rejects_unknown_kind(tmp_path):
+    assert create_forecast_cache_backend("none", str(tmp_path)) is None
+    assert isinstance(
+        create_forecast_cache_backend("SQLite", str(tmp_path)),
+        SQLiteForecastCacheBackend,
+    )
+    with pytest.raises(ValueError):
+        create_forecast_cache_backend("redis", str(tmp_path))
@@ -0,0 +1,203 @@
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.services.forecast_worker_pool import (
+    EXECUTOR_PROCESS,
+    EXECUTOR_THREAD,
+    ForecastWorkerPool,
+)
+
+
+def _blocking_job(started: threading.Event, release: threading.Event, value: str):
+    def _run():
+        started.set()
+        release.wait(timeout=2)
+        return value
+
+    return _run
+
+
+def _collect(results: list, done: threading.Event):
+    def _on_success(result):
+        results.append(result)
+        done.set()
+
+    def _on_error(exc):
+        results.append(exc)
+        done.set()
+
+    return _on_success, _on_error
+
+
+def test_pool_dedups_queued_jobs_and_supersedes_older_signature():
+    pool = ForecastWorkerPool(1, executor_kind=EXECUTOR_THREAD)
+    try:
+        results: list = []
+        started = threading.Event()
+        release = threading.Event()
+        first_done = threading.Event()
+        on_success, on_error = _collect(results, first_done)
+        pool.submit(
+            1,
+            "sig-blocker",
+            _blocking_job(started, release, "blocker"),
+            {},
+            on_success=on_success,
+            on_error=on_error,
+        )
+        assert started.wait(timeout=1)
+
+        user_results: list = []
+        user_done = threading.Event()
+        user_success, user_error = _collect(user_results, user_done)
+        old_job, created = pool.submit(
+            2,
+            "sig-a",
+            lambda: "old",
+            {},
+            on_success=user_success,
+            on_error=user_error,
+        )
+        assert created is True
+        duplicate, created = pool.submit(
+            2,
+            "sig-a",
+            lambda: "duplicate",
+            {},
+            on_success=user_success,
+            on_error=user_error,
+        )
+        assert created is False
+        assert duplicate is old_job
+
+        queued_status = pool.get_status(2)
+        assert queued_status["state"] == "queued"
+        assert queued_status["position"] == 1
+        assert queued_status["queue_depth"] == 1
+        assert queued_status["wait_seconds"] >= 0
+
+        new_job, created = pool.submit(
+            2,
+            "sig-b",
+            lambda: "new",
+            {},
+            on_success=user_success,
+            on_error=user_error,
+        )
+        assert created is True
+        assert old_job.cancelled is True
+        assert pool.queue_depth() == 1
+
+        release.set()
+        assert user_done.wait(timeout=2)
+        assert user_results == ["new"]
+        assert new_job.started_at is not None
+        assert pool.get_status(2)["state"] in {"idle", "running"}
+    finally:
+        pool.shutdown()
+
+
+def test_pool_discards_result_of_running_job_superseded_by_new_signature():
+    pool = ForecastWorkerPool(1, executor_kind=EXECUTOR_THREAD)
+    try:
+        results: list = []
+        done = threading.Event()
+        on_success, on_error = _collect(results, done)
+        started = threading.Event()
+        release = threading.Event()
+
+        running_job, _created = pool.submit(
+            7,
+            "sig-old",
+            _blocking_job(started, release, "stale"),
+            {},
+            on_success=on_success,
+            on_error=on_error,
+        )
+        assert started.wait(timeout=1)
+        assert pool.get_status(7)["state"] == "running"
+
+        pool.submit(
+            7,
+            "sig-new",
+            lambda: "fresh",
+            {},
+            on_success=on_success,
+            on_error=on_error,
+        )
+        assert running_job.cancelled is True
+
+        release.set()
+        assert done.wait(timeout=2)
+        assert results == ["fresh"]
+    finally:
+        pool.shutdown()
+
+
+def test_pool_reports_errors_through_callback():
+    pool = ForecastWorkerPool(2, executor_kind=EXECUTOR_THREAD)
+    try:
+        results: list = []
+        done = threading.Event()
+        on_success, on_error = _collect(results, done)
+
+        def _boom():
+            raise RuntimeError("fit failed")
+
+        pool.submit(3, "sig", _boom, {}, on_success=on_success, on_error=on_error)
+
+        assert done.wait(timeout=2)
+        assert isinstance(results[0], RuntimeError)
+    finally:
+        pool.shutdown()
+
+
+def _crash_worker_process():
+    os._exit(1)
+
+
+def _child_pid():
+    return os.getpid()
+
+
+def test_pool_respawns_process_after_worker_crash():
+    pool = ForecastWorkerPool(1, executor_kind=EXECUTOR_PROCESS)
+    try:
+        results: list = []
+        done = threading.Event()
+        on_success, on_error = _collect(results, done)
+        pool.submit(
+            4, "sig-crash", _crash_worker_process, {}, on_success=on_success, on_error=on_error
+        )
+        assert done.wait(timeout=30)
+        assert isinstance(results[0], BrokenProcessPool)
+
+        done.clear()
+        pool.submit(4, "sig-next", _child_pid, {}, on_success=on_success, on_error=on_error)
+        assert done.wait(timeout=30)
+        assert isinstance(results[1], int) and results[1] != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_pool_does_not_swallow_interpreter_exit():
+    pool = ForecastWorkerPool(1, executor_kind=EXECUTOR_THREAD)
+    shard = pool._shard_for(5)
+    try:
+        results: list = []
+        done = threading.Event()
+        on_success, on_error = _collect(results, done)
+
+        def _exit():
+            raise SystemExit(0)
+
+        pool.submit(5, "sig", _exit, {}, on_success=on_success, on_error=on_error)
+        shard._thread.join(timeout=2)
+        assert not shard._thread.is_alive()
+        assert results == []
+    finally:
+        pool.shutdown()
@@ -0,0 +1,192 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import DataImportJob, DataImportRow, LogEntry, Stage
+from app.services import import_jobs
+from app.services.import_jobs import run_import_jobs
+
+
+class _WorkerCrashed(BaseException):
+    """模拟工作进程在两块之间被杀死（不走重试分支）。"""
+
+
+def _user_logs(user_id):
+    return (
+        LogEntry.query.join(Stage)
+        .filter(Stage.user_id == user_id)
+        .order_by(LogEntry.log_date, LogEntry.task)
+        .all()
+    )
+
+
+def test_background_import_resumes_from_checkpoint_and_swaps_atomically(
+    app,
+    client,
+    db_session,
+    register_and_login,
+    auth_headers,
+    monkeypatch,
+    tmp_path,
+    backup_zip,
+):
+    token, user_id = register_and_login()
+    app.config.update(
+        IMPORT_JOB_SYNC_MODE=False,
+        IMPORT_JOB_WORKERS=0,
+        IMPORT_CHUNK_SIZE=10,
+        IMPORT_STAGING_FOLDER=str(tmp_path),
+    )
+    old_stage = Stage(name="旧阶段", start_date=date(2023, 1, 1), user_id=user_id)
+    db.session.add(old_stage)
+    db.session.flush()
+    db.session.add(
+        LogEntry(log_date=date(2023, 1, 2), task="旧记录", actual_duration=10, stage_id=old_stage.id)
+    )
+    db.session.commit()
+
+    logs = [
+        {
+            "id": 100 + offset,
+            "log_date": (date(2024, 1, 1) + timedelta(days=offset)).isoformat(),
+            "task": f"新任务 {offset:02d}",
+            "actual_duration": 30,
+            "stage_id": 9,
+        }
+        for offset in range(45)
+    ]
+    backup = backup_zip(
+        {
+            "stage": [{"id": 9, "name": "新阶段", "start_date": "2024-01-01"}],
+            "log_entry": logs,
+        }
+    )
+    resp = client.post(
+        "/api/records/import?async=1",
+        headers=auth_headers(token),
+        data={"file": (backup, "backup.zip")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 202, resp.get_json()
+    job_id = resp.get_json()["data"]["job_id"]
+    assert resp.get_json()["data"]["state"] == "queued"
+
+    # 第 3 个 log_entry 块提交前“进程崩溃”
+    renew_lease = import_jobs._renew_lease
+    calls = {"log_entry": 0}
+
+    def crashing_renew(job_id, worker_id, **values):
+        checkpoint = values.get("checkpoint") or {}
+        if checkpoint.get("table") == "log_entry":
+            calls["log_entry"] += 1
+            if calls["log_entry"] == 3:
+                raise _WorkerCrashed()
+        return renew_lease(job_id, worker_id, **values)
+
+    monkeypatch.setattr(import_jobs, "_renew_lease", crashing_renew)
+    with pytest.raises(_WorkerCrashed):
+        run_import_jobs(worker_id="crashed")
+    db.session.rollback()
+    monkeypatch.setattr(import_jobs, "_renew_lease", renew_lease)
+
+    job = db.session.get(DataImportJob, job_id, populate_existing=True)
+    assert job.state == "running" and job.phase == "staging"
+    assert job.checkpoint["table"] == "log_entry" and job.checkpoint["records"] == 20
+    assert DataImportRow.query.filter_by(job_id=job_id, table_name="log_entry").count() == 20
+    # 替换前旧数据保持完整
+    assert [entry.task for entry in _user_logs(user_id)] == ["旧记录"]
+
+    progress = client.get(f"/api/records/import/jobs/{job_id}", headers=auth_headers(token))
+    data = progress.get_json()["data"]
+    assert data["rows"]["log_entry"] == 20
+    assert 0 < data["bytes_processed"] <= data["bytes_total"]
+    assert data["eta_seconds"] is not None
+
+    # 租约未过期时其他工作进程不能接管
+    assert run_import_jobs(worker_id="other") == 0
+    later = datetime.utcnow() + timedelta(hours=1)
+    assert run_import_jobs(worker_id="resumed", now=later) == 1
+
+    job = db.session.get(DataImportJob, job_id, populate_existing=True)
+    assert job.state == "succeeded" and job.phase == "done", job.error
+    assert job.attempts == 2
+    assert job.rows["log_entry"] == 45
+    assert DataImportRow.query.filter_by(job_id=job_id).count() == 0
+
+    entries = _user_logs(user_id)
+    assert [entry.task for entry in entries] == [log["task"] for log in logs]
+    assert {entry.stage.name for entry in entries} == {"新阶段"}
+
+    listing = client.get("/api/records/import/jobs", headers=auth_headers(token)).get_json()
+    assert listing["data"][0]["job_id"] == job_id
+    other_token, _ = register_and_login(username="other_user", email="other@example.com")
+    missing = client.get(f"/api/records/import/jobs/{job_id}", headers=auth_headers(other_token))
+    assert missing.status_code == 404
+
+
+def test_swap_renews_lease_between_tables_and_rolls_back_when_lost(
+    app,
+    client,
+    db_session,
+    register_and_login,
+    auth_headers,
+    monkeypatch,
+    tmp_path,
+    backup_zip,
+):
+    token, user_id = register_and_login()
+    app.config.update(
+        IMPORT_JOB_SYNC_MODE=False, IMPORT_JOB_WORKERS=0, IMPORT_STAGING_FOLDER=str(tmp_path)
+    )
+    old_stage = Stage(name="旧阶段", start_date=date(2023, 1, 1), user_id=user_id)
+    db.session.add(old_stage)
+    db.session.flush()
+    db.session.add(
+        LogEntry(log_date=date(2023, 1, 2), task="旧记录", actual_duration=10, stage_id=old_stage.id)
+    )
+    db.session.commit()
+    backup = backup_zip(
+        {
+            "stage": [{"id": 9, "name": "新阶段", "start_date": "2024-01-01"}],
+            "log_entry": [
+                {
+                    "id": 1,
+                    "log_date": "2024-01-02",
+                    "task": "新记录",
+                    "actual_duration": 30,
+                    "stage_id": 9,
+                }
+            ],
+        }
+    )
+    job_id = client.post(
+        "/api/records/import?async=1",
+        headers=auth_headers(token),
+        data={"file": (backup, "backup.zip")},
+        content_type="multipart/form-data",
+    ).get_json()["data"]["job_id"]
+
+    # 替换进行到一半时租约被其他工作进程接管：本次替换整体回滚
+    renew_lease = import_jobs._renew_lease
+    in_swap = []
+
+    def taken_over_renew(job_id, worker_id, *, commit=True, **values):
+        if not commit:
+            in_swap.append(worker_id)
+            if len(in_swap) == 3:
+                worker_id = "other"
+        return renew_lease(job_id, worker_id, commit=commit, **values)
+
+    monkeypatch.setattr(import_jobs, "_renew_lease", taken_over_renew)
+    assert run_import_jobs(worker_id="slow") == 1
+    job = db.session.get(DataImportJob, job_id, populate_existing=True)
+    assert (job.state, job.phase, job.locked_by) == ("running", "swapping", "slow")
+    assert [entry.task for entry in _user_logs(user_id)] == ["旧记录"]
+
+    monkeypatch.setattr(import_jobs, "_renew_lease", renew_lease)
+    later = datetime.utcnow() + timedelta(hours=1)
+    assert run_import_jobs(worker_id="resumed", now=later) == 1
+    job = db.session.get(DataImportJob, job_id, populate_existing=True)
+    assert job.state == "succeeded", job.error
+    assert [entry.task for entry in _user_logs(user_id)] == ["新记录"]
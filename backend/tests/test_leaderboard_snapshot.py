@@ -0,0 +1,247 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app import create_app, db
+from app.models import LeaderboardSnapshot, LogEntry, Stage, User
+from app.services import leaderboard_snapshot
+from app.services.leaderboard_service import (
+    get_leaderboard_rankings,
+    set_leaderboard_opt_in,
+)
+from app.services.record_service import add_log_for_stage
+from config import TestingConfig
+
+
+def _create_member(name: str, minutes: list[int], mood: int = 3) -> User:
+    user = User(username=name, email=f"{name}@test.com")
+    user.set_password("pw123")
+    db.session.add(user)
+    db.session.flush()
+    stage = Stage(name="阶段", start_date=date.today() - timedelta(days=40), user_id=user.id)
+    db.session.add(stage)
+    db.session.flush()
+    for offset, value in enumerate(minutes):
+        db.session.add(
+            LogEntry(
+                log_date=date.today() - timedelta(days=offset),
+                task="t",
+                actual_duration=value,
+                mood=mood,
+                stage_id=stage.id,
+            )
+        )
+    db.session.commit()
+    set_leaderboard_opt_in(user.id, True)
+    return user
+
+
+def _expected_order(period: str, metric: str) -> list[str]:
+    start_date, end_date = leaderboard_snapshot.current_period_range(period)
+    return [
+        row.username
+        for row in leaderboard_snapshot._aggregate_rows(
+            start_date, end_date, order_metric=metric
+        )
+    ]
+
+
+def _snapshot_order(period: str, metric: str) -> list[tuple[int, str]]:
+    ranked = leaderboard_snapshot.ranked_snapshot_subquery(period, metric)
+    rows = db.session.query(ranked).order_by(ranked.c.rank.asc()).all()
+    order = [(row.rank, row.username) for row in rows]
+    # “我的名次”按 COUNT 计算，必须与分页的窗口函数名次一致
+    for rank, username in order:
+        row = LeaderboardSnapshot.query.filter_by(
+            period=period, metric=metric, username=username
+        ).one()
+        assert leaderboard_snapshot.snapshot_rank(row) == rank
+    return order
+
+
+def test_leaderboard_pages_read_from_snapshot(db_session):
+    users = [
+        _create_member("alice", [30, 30]),
+        _create_member("bob", [120]),
+        _create_member("carol", [60, 10, 10], mood=5),
+        _create_member("dave", [45]),
+    ]
+
+    first_page = get_leaderboard_rankings(users[0].id, "week", "duration", 1, 2)["data"]
+    assert first_page["total"] == 4
+    assert [item["username"] for item in first_page["items"]] == ["bob", "carol"]
+    assert [item["rank"] for item in first_page["items"]] == [1, 2]
+    assert first_page["me"]["username"] == "alice"
+    assert first_page["me"]["rank"] == 3
+
+    second_page = get_leaderboard_rankings(users[0].id, "week", "duration", 2, 2)["data"]
+    assert [item["username"] for item in second_page["items"]] == ["alice", "dave"]
+
+    for metric in ("duration", "efficiency"):
+        assert [name for _rank, name in _snapshot_order("week", metric)] == (
+            _expected_order("week", metric)
+        )
+
+
+def test_log_write_repositions_only_the_changed_user(db_session, monkeypatch):
+    users = [
+        _create_member("erin", [30]),
+        _create_member("frank", [90]),
+        _create_member("grace", [60]),
+    ]
+    get_leaderboard_rankings(users[0].id, "week", "duration")
+    get_leaderboard_rankings(users[0].id, "day", "duration")
+    get_leaderboard_rankings(users[0].id, "month", "duration")
+
+    def _fail_rebuild(*_args, **_kwargs):
+        raise AssertionError("snapshot should be maintained incrementally")
+
+    monkeypatch.setattr(leaderboard_snapshot, "rebuild_leaderboard_snapshot", _fail_rebuild)
+
+    stage = Stage.query.filter_by(user_id=users[0].id).one()
+    ok, _message, _log_id = add_log_for_stage(
+        stage.id,
+        users[0],
+        ImmutableMultiDict(
+            {
+                "log_date": date.today().isoformat(),
+                "task": "extra",
+                "duration_minutes": "100",
+                "mood": "4",
+            }
+        ),
+    )
+    assert ok
+
+    for period in ("day", "week", "month"):
+        for metric in ("duration", "efficiency"):
+            order = _snapshot_order(period, metric)
+            assert [rank for rank, _name in order] == list(range(1, len(order) + 1))
+            assert [name for _rank, name in order] == _expected_order(period, metric)
+
+    result = get_leaderboard_rankings(users[1].id, "week", "duration")["data"]
+    assert [item["username"] for item in result["items"]] == ["erin", "frank", "grace"]
+
+    set_leaderboard_opt_in(users[1].id, False)
+    assert _snapshot_order("week", "duration") == [(1, "erin"), (2, "grace")]
+
+
+def test_concurrent_refreshes_keep_ranks_consistent(monkeypatch, tmp_path):
+    # 内存库的所有会话共用一个连接，并发事务要用文件库才能各自独立
+    monkeypatch.setattr(
+        TestingConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'board.db'}"
+    )
+    file_app = create_app("testing")
+    names = ["mia", "noah", "olga", "pete", "quin", "rita"]
+    with file_app.app_context():
+        db.create_all()
+        try:
+            users = [
+                _create_member(name, [20 + index * 10]) for index, name in enumerate(names)
+            ]
+            get_leaderboard_rankings(users[0].id, "week", "duration")
+            monkeypatch.setattr(
+                leaderboard_snapshot,
+                "rebuild_leaderboard_snapshot",
+                lambda *_args, **_kwargs: pytest.fail("snapshot should be refreshed per user"),
+            )
+
+            # 直接写日志绕过刷新，让名次整体反转后再由各用户并发刷新自己的一行
+            for index, user in enumerate(users):
+                stage = Stage.query.filter_by(user_id=user.id).one()
+                db.session.add(
+                    LogEntry(
+                        log_date=date.today(),
+                        task="burst",
+                        actual_duration=500 - index * 80,
+                        stage_id=stage.id,
+                    )
+                )
+            db.session.commit()
+
+            barrier = threading.Barrier(len(users))
+            errors: list[BaseException] = []
+
+            def _refresh(user_id):
+                try:
+                    with file_app.app_context():
+                        barrier.wait(timeout=5)
+                        for attempt in range(50):
+                            try:
+                                leaderboard_snapshot.refresh_leaderboard_for_users([user_id])
+                                db.session.commit()
+                                return
+                            except OperationalError:
+                                # SQLite 同一时刻只允许一个写事务，冲突的一方回滚重试
+                                db.session.rollback()
+                                time.sleep(0.01 * (attempt + 1))
+                        raise AssertionError(f"refresh for {user_id} never committed")
+                except BaseException as exc:  # noqa: BLE001 - 交给主线程断言
+                    errors.append(exc)
+
+            threads = [threading.Thread(target=_refresh, args=(user.id,)) for user in users]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=30)
+            assert not errors
+
+            db.session.expire_all()
+            for metric in ("duration", "efficiency"):
+                order = _snapshot_order("week", metric)
+                assert [rank for rank, _name in order] == list(range(1, len(users) + 1))
+                assert [name for _rank, name in order] == _expected_order("week", metric)
+            assert [name for _rank, name in _snapshot_order("week", "duration")] == names
+        finally:
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+
+def test_live_window_ranking_matches_snapshot_and_follows_cursors(app, db_session):
+    users = [
+        _create_member("hana", [30, 30]),
+        _create_member("ivan", [120]),
+        _create_member("jade", [60, 10, 10], mood=5),
+        _create_member("kim", [45]),
+        _create_member("lee", []),
+    ]
+    me = users[3].id
+
+    def _walk(metric):
+        pages, cursor = [], None
+        while True:
+            data = get_leaderboard_rankings(me, "month", metric, page_size=2, cursor=cursor)[
+                "data"
+            ]
+            pages.append([(item["rank"], item["username"]) for item in data["items"]])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return pages, data["total"], data["me"]
+
+    try:
+        for metric in ("duration", "efficiency"):
+            app.config["LEADERBOARD_QUERY_MODE"] = "snapshot"
+            snapshot_pages, snapshot_total, snapshot_me = _walk(metric)
+            app.config["LEADERBOARD_QUERY_MODE"] = "live"
+            live_pages, live_total, live_me = _walk(metric)
+
+            assert live_pages == snapshot_pages
+            assert [len(page) for page in live_pages] == [2, 2, 1]
+            assert live_total == snapshot_total == 5
+            assert live_me == snapshot_me
+            assert live_me["username"] == "kim"
+
+            offset_page = get_leaderboard_rankings(me, "month", metric, page=2, page_size=2)
+            assert [
+                (item["rank"], item["username"]) for item in offset_page["data"]["items"]
+            ] == live_pages[1]
+    finally:
+        app.config["LEADERBOARD_QUERY_MODE"] = "snapshot"
+
+    with pytest.raises(ValueError, match="cursor"):
+        get_leaderboard_rankings(me, "week", "duration", cursor="abc")
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app.services.ai_planner import llm_client
+from app.services.ai_planner.errors import AIPlannerError
+
+
+class _FakeAsyncCompletions:
+    def __init__(self, delay=0.2, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("Connection reset by peer")
+            text = kwargs["messages"][-1]["content"]
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=f" {text}! "))]
+            )
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def fake_async_qwen(app):
+    completions = _FakeAsyncCompletions()
+    app.config.update(QWEN_API_KEY="test-key", AI_ASYNC_CLIENT=True, AI_MAX_CONCURRENCY=2)
+    with patch.object(llm_client, "_async_runner", llm_client._AsyncQwenRunner()), patch.object(
+        llm_client,
+        "_build_async_qwen_client",
+        return_value=SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+    ):
+        yield completions
+
+
+def _call_in_threads(app, prompts):
+    results = [None] * len(prompts)
+
+    def _worker(index, prompt):
+        with app.app_context():
+            results[index] = llm_client._call_qwen(prompt)
+
+    threads = [
+        threading.Thread(target=_worker, args=(index, prompt))
+        for index, prompt in enumerate(prompts)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_identical_inflight_prompts_share_one_upstream_call(app, fake_async_qwen):
+    results = _call_in_threads(app, ["简报"] * 4)
+
+    assert results == ["简报!"] * 4
+    assert len(fake_async_qwen.calls) == 1
+
+    # 上一次调用结束后不再复用
+    with app.app_context():
+        assert llm_client._call_qwen("简报") == "简报!"
+    assert len(fake_async_qwen.calls) == 2
+
+
+def test_concurrency_is_bounded_and_retries_back_off_on_the_loop(app, fake_async_qwen):
+    results = _call_in_threads(app, [f"p{index}" for index in range(5)])
+
+    assert results == [f"p{index}!" for index in range(5)]
+    assert fake_async_qwen.peak == 2
+
+    fake_async_qwen.failures = 1
+    fake_async_qwen.delay = 0
+    with app.app_context():
+        with llm_client._token_budget(32):
+            assert llm_client._call_qwen("retry") == "retry!"
+    assert [call["max_tokens"] for call in fake_async_qwen.calls[-2:]] == [32, 32]
+
+    fake_async_qwen.failures = 5
+    app.config["AI_MAX_RETRIES"] = 0
+    with app.app_context(), pytest.raises(AIPlannerError):
+        llm_client._call_qwen("fail")
@@ -0,0 +1,137 @@
+from datetime import date
+
+from sqlalchemy import event
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app import db
+from app.models import LogEntry, Stage, User
+from app.services.record_service import (
+    add_log_for_stage,
+    ensure_log_stage_consistency,
+    get_stage_end_date,
+    get_stage_for_date,
+)
+from app.services.stage_index import StageIndex, get_stage_index
+
+
+def _create_user(name="stage-index"):
+    user = User(username=name, email=f"{name}@test.com")
+    user.set_password("pw123")
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def test_stage_index_resolves_dates_and_end_dates():
+    index = StageIndex(
+        user_id=1,
+        start_dates=(date(2026, 1, 1), date(2026, 2, 1), date(2026, 3, 1)),
+        stage_ids=(10, 20, 30),
+    )
+
+    assert index.stage_id_for_date(date(2025, 12, 31)) is None
+    assert index.stage_id_for_date(date(2026, 1, 1)) == 10
+    assert index.stage_id_for_date(date(2026, 2, 28)) == 20
+    assert index.stage_id_for_date(date(2027, 1, 1)) == 30
+    assert index.end_date_for(10) == date(2026, 1, 31)
+    assert index.end_date_for(30) is None
+    assert index.next_stage_id(20) == 30
+    assert index.end_date_for(99) is None
+
+
+def test_stage_lookup_is_cached_and_invalidated_on_stage_changes(db_session):
+    user = _create_user()
+    first = Stage(name="一", start_date=date(2026, 1, 1), user_id=user.id)
+    db.session.add(first)
+    db.session.commit()
+
+    assert get_stage_for_date(user.id, date(2026, 5, 1)).id == first.id
+    assert get_stage_end_date(first) is None
+
+    statements = []
+
+    def _count(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _count)
+    try:
+        assert get_stage_for_date(user.id, date(2026, 6, 1)).id == first.id
+        assert get_stage_for_date(user.id, date(2025, 1, 1)) is None
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _count)
+    assert statements == []
+
+    second = Stage(name="二", start_date=date(2026, 4, 1), user_id=user.id)
+    db.session.add(second)
+    db.session.commit()
+    assert get_stage_for_date(user.id, date(2026, 5, 1)).id == second.id
+    assert get_stage_end_date(first) == date(2026, 3, 31)
+
+    second.start_date = date(2026, 6, 1)
+    db.session.commit()
+    assert get_stage_for_date(user.id, date(2026, 5, 1)).id == first.id
+    assert get_stage_index(user.id).end_date_for(first.id) == date(2026, 5, 31)
+
+    db.session.delete(second)
+    db.session.commit()
+    assert get_stage_for_date(user.id, date(2026, 7, 1)).id == first.id
+    assert get_stage_end_date(first) is None
+
+    # 回滚的修改不应残留在索引里
+    third = Stage(name="三", start_date=date(2026, 2, 1), user_id=user.id)
+    db.session.add(third)
+    db.session.flush()
+    assert get_stage_for_date(user.id, date(2026, 2, 2)).id == third.id
+    db.session.rollback()
+    assert get_stage_for_date(user.id, date(2026, 2, 2)).id == first.id
+    assert get_stage_index(user.id).stage_ids == (first.id,)
+
+
+def test_log_writes_resolve_stage_from_database_not_stale_index(db_session):
+    user = _create_user("stage-index-write")
+    first = Stage(name="一", start_date=date(2026, 1, 1), user_id=user.id)
+    db.session.add(first)
+    db.session.commit()
+    assert get_stage_for_date(user.id, date(2026, 5, 1)).id == first.id
+
+    # 模拟另一个进程新建阶段：绕过 ORM 钩子，本进程的索引仍是旧的
+    db.session.execute(
+        Stage.__table__.insert().values(
+            name="二", start_date=date(2026, 4, 1), user_id=user.id
+        )
+    )
+    db.session.commit()
+    second_id = db.session.query(db.func.max(Stage.id)).scalar()
+    assert get_stage_for_date(user.id, date(2026, 5, 1)).id == first.id
+
+    ok, _message, log_id = add_log_for_stage(
+        first.id,
+        user,
+        ImmutableMultiDict({"log_date": "2026-05-01", "task": "t", "duration_minutes": "30"}),
+    )
+    assert ok
+    assert db.session.get(LogEntry, log_id).stage_id == second_id
+
+
+def test_stage_consistency_reassigns_logs_from_database_not_stale_index(db_session):
+    user = _create_user("stage-index-consistency")
+    first = Stage(name="一", start_date=date(2026, 1, 1), user_id=user.id)
+    db.session.add(first)
+    db.session.flush()
+    db.session.add(
+        LogEntry(log_date=date(2026, 5, 1), task="t", actual_duration=30, stage_id=first.id)
+    )
+    db.session.commit()
+    assert get_stage_for_date(user.id, date(2026, 5, 1)).id == first.id
+
+    # 另一个进程新建阶段：本进程的索引仍是旧的
+    db.session.execute(
+        Stage.__table__.insert().values(
+            name="二", start_date=date(2026, 4, 1), user_id=user.id
+        )
+    )
+    db.session.commit()
+    second_id = db.session.query(db.func.max(Stage.id)).scalar()
+
+    ensure_log_stage_consistency(user.id)
+    assert LogEntry.query.one().stage_id == second_id
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+HEAVY_MODULES = ("matplotlib", "sklearn", "statsmodels")
+# 导入 app 并创建应用的耗时上限（秒），较慢的环境可通过环境变量放宽
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_IMPORT_BUDGET_SECONDS", "3.0"))
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app, preload_heavy_modules
+app = create_app("testing")
+elapsed = time.perf_counter() - started
+heavy = {heavy!r}
+loaded = [name for name in heavy if name in sys.modules]
+preloaded = None
+if {preload!r}:
+    preloaded = preload_heavy_modules(app)
+    preloaded["loaded"] = [name for name in heavy if name in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded, "preloaded": preloaded}}))
+"""
+
+
+def _probe(preload=False):
+    env = dict(os.environ, FLASK_ENV="testing", PRELOAD_HEAVY_MODULES="0")
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(heavy=HEAVY_MODULES, preload=preload)],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_create_app_defers_heavy_imports_within_budget():
+    report = _probe()
+    assert report["loaded"] == []
+    assert report["elapsed"] < STARTUP_BUDGET_SECONDS, report
+
+
+def test_preload_hook_imports_plotting_and_forecast_dependencies():
+    report = _probe(preload=True)
+    assert report["loaded"] == []
+    preloaded = report["preloaded"]
+    assert "matplotlib" in preloaded["loaded"]
+    for name in ("sklearn", "statsmodels"):
+        assert (name in preloaded["loaded"]) == preloaded[name]
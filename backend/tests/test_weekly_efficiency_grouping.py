@@ -4,7 +4,10 @@ import math
 from app.models import User, Stage, LogEntry, DailyData, WeeklyData
 from app.services.chart_service import get_chart_data_for_user
 from app.services.helpers import get_custom_week_info
-from app.services.record_service import recalculate_efficiency_for_stage
+from app.services.record_service import (
+    _calculate_daily_efficiency_score,
+    recalculate_efficiency_for_stage,
+)
 
 
 def _create_user():
@@ -102,3 +105,49 @@ def test_weekly_efficiency_chart_aggregates_from_daily_data(db_session):
     assert math.isclose(
         payload["daily_efficiency_data"]["actuals"][0], 3.0, rel_tol=1e-9
     )
+
+
+def test_recalculate_efficiency_bulk_upserts_and_prunes_stale_rows(db_session):
+    user = _create_user()
+    db_session.session.add(user)
+    db_session.session.flush()
+
+    stage = Stage(name="阶段C", start_date=date(2026, 3, 5), user_id=user.id)
+    db_session.session.add(stage)
+    db_session.session.flush()
+
+    db_session.session.add_all(
+        [
+            LogEntry(log_date=date(2026, 3, 6), task="a", actual_duration=90, mood=5, stage_id=stage.id),
+            LogEntry(log_date=date(2026, 3, 6), task="b", actual_duration=30, stage_id=stage.id),
+            LogEntry(log_date=date(2026, 3, 11), task="c", actual_duration=None, mood=2, stage_id=stage.id),
+            LogEntry(log_date=date(2026, 3, 12), task="d", actual_duration=45, mood=1, stage_id=stage.id),
+            # 已存在的行应被原地更新，已无日志的日期/周应被清理
+            DailyData(log_date=date(2026, 3, 6), efficiency=-1.0, stage_id=stage.id),
+            DailyData(log_date=date(2026, 3, 20), efficiency=9.0, stage_id=stage.id),
+            WeeklyData(year=2026, week_num=4, efficiency=9.0, stage_id=stage.id),
+        ]
+    )
+    db_session.session.commit()
+
+    recalculate_efficiency_for_stage(stage)
+
+    daily_rows = (
+        DailyData.query.filter_by(stage_id=stage.id)
+        .order_by(DailyData.log_date.asc())
+        .all()
+    )
+    assert [row.log_date for row in daily_rows] == [
+        date(2026, 3, 6),
+        date(2026, 3, 11),
+        date(2026, 3, 12),
+    ]
+    for row in daily_rows:
+        assert row.efficiency == _calculate_daily_efficiency_score(row.log_date, stage.id)
+
+    weekly_rows = (
+        WeeklyData.query.filter_by(stage_id=stage.id)
+        .order_by(WeeklyData.week_num.asc())
+        .all()
+    )
+    assert [row.week_num for row in weekly_rows] == [1, 2]